@@ -27,7 +27,7 @@ if config.config_file_name is not None:
 # add your model's MetaData object here
 # for 'autogenerate' support
 # Import all models to ensure they're registered with the metadata
-from models.db_models import User, Message, UserSession
+from models.db_models import User, Message, UserSession, ReadCursor
 
 target_metadata = Base.metadata
 
@@ -68,6 +68,14 @@ def run_migrations_online() -> None:
     and associate a connection with the context.
 
     """
+    # The server upgrades at startup on a connection of its own engine
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
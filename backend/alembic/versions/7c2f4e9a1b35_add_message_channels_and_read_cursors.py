@@ -0,0 +1,41 @@
+"""Add message channels and per-user read cursors
+
+Revision ID: 7c2f4e9a1b35
+Revises: 1db304498d4a
+Create Date: 2026-10-18 10:12:41.503118
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7c2f4e9a1b35'
+down_revision: Union[str, Sequence[str], None] = '1db304498d4a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.add_column(sa.Column('channel', sa.String(length=64), server_default='general', nullable=False))
+    op.create_index('ix_messages_channel_id', 'messages', ['channel', 'id'], unique=False)
+    op.create_table('read_cursors',
+    sa.Column('user_id', sa.String(length=100), nullable=False),
+    sa.Column('channel', sa.String(length=64), nullable=False),
+    sa.Column('last_read_seq', sa.Integer(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('(CURRENT_TIMESTAMP)'), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], ['users.user_id'], name=op.f('fk_read_cursors_user_id_users')),
+    sa.PrimaryKeyConstraint('user_id', 'channel', name=op.f('pk_read_cursors'))
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('read_cursors')
+    op.drop_index('ix_messages_channel_id', table_name='messages')
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.drop_column('channel')
@@ -0,0 +1,34 @@
+"""Add attachment references to messages
+
+Revision ID: b5d0e3f86a21
+Revises: 7c2f4e9a1b35
+Create Date: 2026-10-18 15:40:07.281964
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d0e3f86a21'
+down_revision: Union[str, Sequence[str], None] = '7c2f4e9a1b35'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.add_column(sa.Column('attachment_sha256', sa.String(length=64), nullable=True))
+        batch_op.add_column(sa.Column('attachment_name', sa.String(length=255), nullable=True))
+    op.create_index(op.f('ix_messages_attachment_sha256'), 'messages', ['attachment_sha256'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_messages_attachment_sha256'), table_name='messages')
+    with op.batch_alter_table('messages') as batch_op:
+        batch_op.drop_column('attachment_name')
+        batch_op.drop_column('attachment_sha256')
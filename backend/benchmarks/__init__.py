@@ -0,0 +1,5 @@
+"""
+Performance benchmarks. Run from the backend directory, e.g.
+
+    python -m benchmarks.ws_load --clients 100 --duration 30
+"""
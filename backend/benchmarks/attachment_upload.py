@@ -0,0 +1,228 @@
+"""
+Attachment upload/download throughput and server memory under concurrent uploads.
+
+Starts the app on localhost, has N clients each upload a distinct file of
+--size-mb in --chunk-mb PATCH requests at the same time, then downloads
+every file back concurrently. Reports aggregate throughput, per-upload
+latency and the server's peak RSS, sampled throughout, against the 512 MB
+production VM.
+
+    python -m benchmarks.attachment_upload --clients 100 --size-mb 20
+    python -m benchmarks.attachment_upload --clients 10 --size-mb 5 --chunk-mb 1
+"""
+import argparse
+import asyncio
+import hashlib
+import os
+import sys
+import time
+from datetime import datetime
+from typing import AsyncIterator, List, Optional
+
+import httpx
+
+from benchmarks.ws_load import ServerProcess, percentiles, rss_bytes, save_result, _git_revision
+
+MB = 1024 * 1024
+# Production VM memory (fly.toml)
+VM_MEMORY_BYTES = 512 * MB
+# Shared filler; each file starts with its own header so no two files deduplicate
+_FILLER = os.urandom(MB)
+
+
+def _file_header(index: int) -> bytes:
+    return b"\x89PNG\r\n\x1a\n" + f"medchat-bench-{index:06d}".encode().ljust(56, b"\0")
+
+
+async def file_chunks(index: int, start: int, end: int, block: int = 64 * 1024) -> AsyncIterator[bytes]:
+    """Bytes [start, end) of client ``index``'s file, generated without holding it in memory"""
+    header = _file_header(index)
+    position = start
+    while position < end:
+        if position < len(header):
+            piece = header[position:min(end, len(header))]
+        else:
+            offset = (position - len(header)) % MB
+            piece = _FILLER[offset:offset + min(block, end - position, MB - offset)]
+        position += len(piece)
+        yield piece
+
+
+def expected_sha256(index: int, size: int) -> str:
+    hasher = hashlib.sha256()
+    header = _file_header(index)
+    hasher.update(header)
+    position = len(header)
+    while position < size:
+        take = min(MB, size - position)
+        hasher.update(_FILLER[:take])
+        position += take
+    return hasher.hexdigest()
+
+
+class MemorySampler:
+    """Peak RSS of a process, sampled every ``interval`` seconds"""
+
+    def __init__(self, pid: Optional[int], interval: float = 0.05):
+        self.pid = pid
+        self.interval = interval
+        self.peak = rss_bytes(pid)
+        self._task: Optional[asyncio.Task] = None
+
+    async def _run(self):
+        while True:
+            rss = rss_bytes(self.pid)
+            if rss is not None and (self.peak is None or rss > self.peak):
+                self.peak = rss
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+
+async def upload_file(client: httpx.AsyncClient, index: int, size: int, chunk: int) -> dict:
+    headers = {"X-User-Id": f"bench_uploader_{index}"}
+    started = time.perf_counter()
+    created = await client.post("/attachments/uploads", json={"size": size}, headers=headers)
+    created.raise_for_status()
+    location = created.headers["location"]
+
+    offset, body = 0, None
+    while offset < size:
+        end = min(offset + chunk, size)
+        response = await client.patch(
+            location, content=file_chunks(index, offset, end),
+            headers={**headers, "Upload-Offset": str(offset), "Content-Length": str(end - offset)}
+        )
+        response.raise_for_status()
+        body = response.json()
+        offset = body["offset"]
+    return {"seconds": time.perf_counter() - started, "attachment": body["attachment"]}
+
+
+async def download_file(client: httpx.AsyncClient, sha256: str) -> dict:
+    started = time.perf_counter()
+    received = 0
+    async with client.stream("GET", f"/attachments/{sha256}") as response:
+        response.raise_for_status()
+        async for data in response.aiter_raw():
+            received += len(data)
+    return {"seconds": time.perf_counter() - started, "bytes": received}
+
+
+async def run_benchmark(clients: int = 100, size_mb: float = 20.0, chunk_mb: float = 4.0,
+                        url: Optional[str] = None) -> dict:
+    """Upload ``clients`` files concurrently, then download them all, and return the result document"""
+    size, chunk = int(size_mb * MB), int(chunk_mb * MB)
+    server = None
+    if url:
+        base_url = url.rstrip("/")
+    else:
+        server = ServerProcess(env={"ATTACHMENT_MIN_FREE_BYTES": "0"})
+        server.extra_env["ATTACHMENT_DIR"] = os.path.join(server.workdir, "attachments")
+        await server.start()
+        base_url = server.base_url
+    sampler = MemorySampler(server.pid if server else None)
+    limits = httpx.Limits(max_connections=clients, max_keepalive_connections=clients)
+    errors: List[str] = []
+
+    try:
+        rss_idle = rss_bytes(sampler.pid)
+        sampler.start()
+        async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=300) as client:
+            started = time.perf_counter()
+            uploads = await asyncio.gather(
+                *(upload_file(client, index, size, chunk) for index in range(clients)), return_exceptions=True
+            )
+            upload_phase = time.perf_counter() - started
+            rss_after_uploads = rss_bytes(sampler.pid)
+            upload_peak, sampler.peak = sampler.peak, rss_after_uploads
+
+            stored = [result for result in uploads if isinstance(result, dict)]
+            errors += [repr(result) for result in uploads if not isinstance(result, dict)]
+            mismatched = sum(
+                result["attachment"]["sha256"] != expected_sha256(index, size)
+                for index, result in enumerate(uploads) if isinstance(result, dict)
+            )
+
+            started = time.perf_counter()
+            downloads = await asyncio.gather(
+                *(download_file(client, result["attachment"]["sha256"]) for result in stored),
+                return_exceptions=True
+            )
+            download_phase = time.perf_counter() - started
+        errors += [repr(result) for result in downloads if not isinstance(result, dict)]
+        downloads = [result for result in downloads if isinstance(result, dict)]
+        await sampler.stop()
+    finally:
+        if server:
+            server.stop()
+
+    uploaded_bytes = len(stored) * size
+    downloaded_bytes = sum(result["bytes"] for result in downloads)
+    return {
+        "benchmark": "attachment_upload",
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "config": {"clients": clients, "size_bytes": size, "chunk_bytes": chunk},
+        "upload": {
+            "completed": len(stored),
+            "hash_mismatches": mismatched,
+            "phase_seconds": round(upload_phase, 3),
+            "throughput_mb_per_second": round(uploaded_bytes / MB / upload_phase, 1),
+            "per_upload_ms": percentiles([result["seconds"] for result in stored]),
+        },
+        "download": {
+            "completed": len(downloads),
+            "phase_seconds": round(download_phase, 3),
+            "throughput_mb_per_second": round(downloaded_bytes / MB / download_phase, 1),
+            "per_download_ms": percentiles([result["seconds"] for result in downloads]),
+        },
+        "memory": {
+            "rss_idle_bytes": rss_idle,
+            "rss_after_uploads_bytes": rss_after_uploads,
+            "rss_peak_upload_bytes": upload_peak,
+            "rss_peak_download_bytes": sampler.peak,
+            "vm_bytes": VM_MEMORY_BYTES,
+            "fits_vm": upload_peak is not None and max(upload_peak, sampler.peak or 0) < VM_MEMORY_BYTES,
+        },
+        "errors": errors[:20],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent attachment upload/download benchmark")
+    parser.add_argument("--clients", type=int, default=100, help="concurrent uploads")
+    parser.add_argument("--size-mb", type=float, default=20.0, help="size of each file")
+    parser.add_argument("--chunk-mb", type=float, default=4.0, help="bytes per PATCH request")
+    parser.add_argument("--url", help="benchmark an already running server instead (no memory figures)")
+    parser.add_argument("--output", help="result JSON path (default: benchmarks/results/)")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run_benchmark(args.clients, args.size_mb, args.chunk_mb, args.url))
+    path = save_result(result, args.output)
+
+    upload, download, memory = result["upload"], result["download"], result["memory"]
+    print(f"uploads    {upload['completed']}/{args.clients} in {upload['phase_seconds']}s "
+          f"= {upload['throughput_mb_per_second']} MB/s, p50 {upload['per_upload_ms'].get('p50')} ms, "
+          f"p99 {upload['per_upload_ms'].get('p99')} ms, hash mismatches {upload['hash_mismatches']}")
+    print(f"downloads  {download['completed']} in {download['phase_seconds']}s "
+          f"= {download['throughput_mb_per_second']} MB/s")
+    print(f"server RSS idle {(memory['rss_idle_bytes'] or 0) // MB} MB, "
+          f"peak {(memory['rss_peak_upload_bytes'] or 0) // MB} MB uploading, "
+          f"{(memory['rss_peak_download_bytes'] or 0) // MB} MB downloading, of {VM_MEMORY_BYTES // MB} MB")
+    if result["errors"]:
+        print(f"errors     {len(result['errors'])}, first: {result['errors'][0]}")
+    print(f"saved      {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Audit log benchmark: group-commit append throughput and chain verification speed.
+
+Appends: --producers coroutines each append an event and wait for it to be
+fsynced, over and over, as a connect/message storm would. The same load is
+run with one fsync per event (the synchronous-write baseline) and with
+group commit; both report events/s, events per fsync and the time an event
+waits to become durable.
+
+Verify: writes --records records into rotated, gzipped segments and times
+the verifier over them with one process and with every core.
+
+    python -m benchmarks.audit_log
+    python -m benchmarks.audit_log --producers 200 --seconds 5 --records 2000000
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.ws_load import percentiles, save_result, _git_revision
+from services.audit import AuditLog, segment_paths, verify
+
+
+async def append_load(directory: str, producers: int, seconds: float, group_commit: bool) -> dict:
+    """Producers append and await durability until ``seconds`` have passed"""
+    log = AuditLog(directory, commit_interval=0.005)
+    latencies = []
+    deadline = time.perf_counter() + seconds
+
+    async def produce(index: int):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            log.append("message", f"bench_{index}", message_id=f"{index}-{len(latencies)}", channel="general")
+            if group_commit:
+                await log.flush()
+            else:
+                # Synchronous write per event: its own commit and fsync
+                await log.commit()
+            latencies.append(time.perf_counter() - started)
+
+    if group_commit:
+        await log.start()
+    started = time.perf_counter()
+    await asyncio.gather(*(produce(index) for index in range(producers)))
+    elapsed = time.perf_counter() - started
+    await log.stop()
+
+    return {
+        "events": log.seq,
+        "events_per_second": round(log.seq / elapsed),
+        "fsyncs": log.commits,
+        "events_per_fsync": round(log.seq / log.commits, 1),
+        "durable_after_ms": percentiles(latencies),
+    }
+
+
+async def fill(directory: str, records: int, batch: int = 20000):
+    log = AuditLog(directory)
+    for start in range(0, records, batch):
+        for index in range(start, min(records, start + batch)):
+            log.append("message", f"user_{index % 500}", message_id=f"m{index}", channel="general",
+                       text_sha256="ab" * 32)
+        await log.commit()
+    await log.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Audit log append and verification benchmark")
+    parser.add_argument("--producers", type=int, default=100, help="concurrent appenders")
+    parser.add_argument("--seconds", type=float, default=3.0, help="duration of each append run")
+    parser.add_argument("--records", type=int, default=1_000_000, help="records written for the verify run")
+    parser.add_argument("--output", help="result JSON path (default: benchmarks/results/)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="audit-bench-")
+    try:
+        appends = {}
+        for mode, group_commit in (("fsync_per_event", False), ("group_commit", True)):
+            directory = os.path.join(workdir, mode)
+            appends[mode] = asyncio.run(append_load(directory, args.producers, args.seconds, group_commit))
+
+        directory = os.path.join(workdir, "verify")
+        started = time.perf_counter()
+        asyncio.run(fill(directory, args.records))
+        fill_seconds = time.perf_counter() - started
+        segments = segment_paths(directory)
+        size = sum(os.path.getsize(path) for path in segments)
+        verifies = {}
+        for workers in sorted({1, os.cpu_count() or 1}):
+            result = verify(directory, workers=workers)
+            assert result["ok"] and result["records"] == args.records, result
+            verifies[f"workers_{workers}"] = {
+                "seconds": result["seconds"],
+                "records_per_second": round(args.records / result["seconds"]),
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "benchmark": "audit_log",
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "config": {"producers": args.producers, "seconds": args.seconds, "records": args.records},
+        "append": appends,
+        "verify": {
+            "records": args.records,
+            "segments": len(segments),
+            "compressed_bytes": size,
+            "fill_seconds": round(fill_seconds, 3),
+            **verifies,
+        },
+    }
+    path = save_result(result, args.output)
+
+    for mode, run in appends.items():
+        print(f"{mode:16} {run['events_per_second']:>8} events/s, {run['events_per_fsync']} per fsync, "
+              f"durable p50 {run['durable_after_ms'].get('p50')} ms p99 {run['durable_after_ms'].get('p99')} ms")
+    for name, run in verifies.items():
+        print(f"verify {name:10} {args.records} records in {run['seconds']}s = {run['records_per_second']} records/s")
+    print(f"saved            {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Cold-start benchmark: time from process spawn to the first delivered chat message.
+
+Each run starts `python main.py` in a fresh process, connects an observer
+socket as soon as the port accepts it, connects a sender, sends one chat
+message and stops the clock when the observer receives it. Runs cover the
+regular and FAST_START modes against a fresh database and an existing one
+(the scale-to-zero case, where the schema is already in place). Fast mode
+also gets a static asset cache filled beforehand, as the image build does.
+
+    python -m benchmarks.cold_start --runs 5
+    python -m benchmarks.cold_start --runs 3 --modes fast --databases existing
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+from typing import Dict, Iterable, Optional
+
+import websockets
+
+from benchmarks.ws_load import BACKEND_DIR, ServerProcess, percentiles, save_result, _git_revision
+from services.static_assets import StaticAssets
+
+MODES = {"full": {"FAST_START": "false", "STATIC_CACHE_DIR": ""}, "fast": {"FAST_START": "true"}}
+DATABASES = ("fresh", "existing")
+
+
+async def _connect_when_up(url: str, deadline: float):
+    """Retry until the server accepts the socket, then wait for its session frame"""
+    while True:
+        try:
+            websocket = await websockets.connect(url, max_queue=None, ping_interval=None)
+            break
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise RuntimeError("Server did not accept connections in time")
+            await asyncio.sleep(0.005)
+    while json.loads(await websocket.recv()).get("type") != "session":
+        pass
+    return websocket
+
+
+async def time_to_first_message(env: Dict[str, str], database_url: Optional[str] = None,
+                                timeout: float = 30.0) -> dict:
+    """Spawn the server and time its first session frame and first delivered message"""
+    server = ServerProcess(database_url=database_url, env=env)
+    ws_url = server.base_url.replace("http", "ws", 1)
+    observer = sender = None
+    started = time.perf_counter()
+    server.spawn()
+    try:
+        deadline = started + timeout
+        observer = await _connect_when_up(f"{ws_url}/ws/cold_observer", deadline)
+        session_seconds = time.perf_counter() - started
+
+        sender = await _connect_when_up(f"{ws_url}/ws/cold_sender", deadline)
+        await sender.send(json.dumps({"type": "message", "text": "first message"}))
+        while True:
+            frame = json.loads(await asyncio.wait_for(observer.recv(), timeout=deadline - time.perf_counter()))
+            if frame.get("type") == "message" and frame.get("text") == "first message":
+                break
+        first_message_seconds = time.perf_counter() - started
+
+        with urllib.request.urlopen(f"{server.base_url}/health", timeout=5) as response:
+            warmup = json.load(response).get("warmup")
+        return {
+            "session_seconds": session_seconds,
+            "first_message_seconds": first_message_seconds,
+            "warmup": warmup,
+        }
+    finally:
+        for websocket in (sender, observer):
+            if websocket is not None:
+                await websocket.close()
+        server.stop()
+
+
+async def run_benchmark(runs: int = 5, modes: Iterable[str] = tuple(MODES), databases: Iterable[str] = DATABASES,
+                        database_url: Optional[str] = None) -> dict:
+    """Time cold starts for every mode/database combination; ``database_url`` forces "existing" only"""
+    workdir = tempfile.mkdtemp(prefix="medchat-cold-")
+    static_cache = os.path.join(workdir, "static-cache")
+    StaticAssets(os.path.join(os.path.dirname(BACKEND_DIR), "frontend"), cache_dir=static_cache).build()
+    envs = {mode: dict(MODES[mode]) for mode in modes}
+    if "fast" in envs:
+        envs["fast"]["STATIC_CACHE_DIR"] = static_cache
+    scenarios = {}
+    try:
+        for database in (("existing",) if database_url else tuple(databases)):
+            existing_url = database_url or f"sqlite+aiosqlite:///{os.path.join(workdir, 'existing.db')}"
+            if database == "existing":
+                # Priming run creates (and stamps) the schema, as a previous deploy would have
+                await time_to_first_message(MODES["full"], existing_url)
+            for mode in modes:
+                samples = []
+                for _ in range(runs):
+                    # None: ServerProcess uses a new temporary SQLite file
+                    samples.append(await time_to_first_message(
+                        envs[mode], existing_url if database == "existing" else None
+                    ))
+                scenarios[f"{mode}/{database}"] = {
+                    "session_ms": percentiles([sample["session_seconds"] for sample in samples]),
+                    "first_message_ms": percentiles([sample["first_message_seconds"] for sample in samples]),
+                    "warmup": samples[-1]["warmup"],
+                }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "benchmark": "cold_start",
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "config": {
+            "runs": runs,
+            "database": (database_url or "sqlite").split("://")[0],
+        },
+        "scenarios": scenarios,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time to first WebSocket message after a cold start")
+    parser.add_argument("--runs", type=int, default=5, help="cold starts per scenario")
+    parser.add_argument("--modes", nargs="+", choices=list(MODES), default=list(MODES))
+    parser.add_argument("--databases", nargs="+", choices=list(DATABASES), default=list(DATABASES))
+    parser.add_argument("--database-url", help="existing database to start against (default: temporary SQLite)")
+    parser.add_argument("--output", help="result JSON path (default: benchmarks/results/)")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(run_benchmark(args.runs, args.modes, args.databases, args.database_url))
+    path = save_result(result, args.output)
+
+    print(f"{'scenario':<16} {'session p50 ms':>15} {'first msg p50 ms':>17} {'max ms':>8} {'warm-up ms':>11}")
+    for name, scenario in result["scenarios"].items():
+        print(f"{name:<16} {scenario['session_ms']['p50']:>15} {scenario['first_message_ms']['p50']:>17} "
+              f"{scenario['first_message_ms']['max']:>8} {str((scenario['warmup'] or {}).get('total_ms')):>11}")
+    print(f"saved       {path}")
+
+
+if __name__ == "__main__":
+    main()
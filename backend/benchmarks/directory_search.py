@@ -0,0 +1,133 @@
+"""
+Directory search benchmark: in-memory index versus a LIKE query.
+
+Fills a fresh SQLite database with --users staff, times building the index
+from it (one query), then times --searches @mention lookups of varying
+length, with and without a department filter, against the index and
+against the equivalent ``LIKE 'prefix%'`` query over the users table.
+
+    python -m benchmarks.directory_search
+    python -m benchmarks.directory_search --users 50000 --searches 2000
+"""
+import argparse
+import asyncio
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy import or_, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from benchmarks.ws_load import percentiles, save_result, _git_revision
+from config.database import Base
+from models.db_models import User
+from services.directory import DirectoryIndex
+
+FIRST = ["Alice", "Bilal", "Chen", "Dana", "Eamon", "Fatima", "Grace", "Hiro", "Ines", "José", "Kofi", "Lena",
+         "Mateo", "Nadia", "Omar", "Priya", "Quinn", "Rosa", "Sven", "Tariq", "Uma", "Vik", "Wen", "Yara", "Zoe"]
+LAST = ["Smith", "Okafor", "Nguyen", "García", "Kowalski", "Patel", "Haddad", "Schmidt", "Tanaka", "Murphy",
+        "Rossi", "Ivanova", "Mensah", "Larsen", "Cohen", "Silva", "Novak", "Ali", "Byrne", "Moreau"]
+DEPARTMENTS = ["ICU", "Cardiology", "Emergency", "Oncology", "Pediatrics", "Radiology", "Surgery", "Pharmacy"]
+QUERIES = {"1_char": 1, "2_chars": 2, "4_chars": 4, "full_word": 12}
+
+
+def _microseconds(values) -> dict:
+    # percentiles reports seconds in ms; scaled by 1000 first, the same figures read as us
+    return percentiles([value * 1000 for value in values])
+
+
+async def fill(factory, users: int):
+    rng = random.Random(7)
+    async with factory() as session:
+        session.add_all(
+            User(user_id=f"staff{index}", user_name=f"{rng.choice(FIRST)} {rng.choice(LAST)}",
+                 department=rng.choice(DEPARTMENTS), last_seen=datetime.utcnow())
+            for index in range(users)
+        )
+        await session.commit()
+
+
+async def like_search(factory, prefix: str, department: str = None, limit: int = 10):
+    pattern = f"{prefix}%"
+    query = select(User.user_id, User.user_name, User.department).where(
+        or_(User.user_name.ilike(pattern), User.user_name.ilike(f"% {pattern}"), User.user_id.ilike(pattern))
+    )
+    if department:
+        query = query.where(User.department == department)
+    async with factory() as session:
+        result = await session.execute(query.order_by(User.last_seen.desc()).limit(limit))
+        return result.all()
+
+
+async def run(workdir: str, users: int, searches: int) -> dict:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{workdir}/directory.db")
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    await fill(factory, users)
+
+    directory = DirectoryIndex(factory)
+    started = time.perf_counter()
+    await directory.load()
+    load_seconds = time.perf_counter() - started
+
+    rng = random.Random(11)
+    results = {}
+    for name, length in QUERIES.items():
+        for filtered in (False, True):
+            words = [rng.choice(FIRST + LAST)[:length] for _ in range(searches)]
+            departments = [rng.choice(DEPARTMENTS) if filtered else None for _ in range(searches)]
+            index_times, like_times = [], []
+            for word, department in zip(words, departments):
+                started = time.perf_counter()
+                directory.search(word, department=department)
+                index_times.append(time.perf_counter() - started)
+            for word, department in list(zip(words, departments))[:max(1, searches // 10)]:
+                started = time.perf_counter()
+                await like_search(factory, word, department)
+                like_times.append(time.perf_counter() - started)
+            results[f"{name}{'_department' if filtered else ''}"] = {
+                "index_us": _microseconds(index_times),
+                "like_query_us": _microseconds(like_times),
+            }
+
+    await engine.dispose()
+    return {"load_seconds": round(load_seconds, 3), "index": directory.get_stats(), "queries": results}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Directory search benchmark")
+    parser.add_argument("--users", type=int, default=20000, help="staff in the directory")
+    parser.add_argument("--searches", type=int, default=1000, help="index searches per query shape")
+    parser.add_argument("--output", help="result JSON path (default: benchmarks/results/)")
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix="directory-bench-")
+    try:
+        run_result = asyncio.run(run(workdir, args.users, args.searches))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "benchmark": "directory_search",
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "config": {"users": args.users, "searches": args.searches},
+        **run_result,
+    }
+    path = save_result(result, args.output)
+
+    print(f"load                 {args.users} users in {run_result['load_seconds']}s, {run_result['index']}")
+    for name, run_stats in run_result["queries"].items():
+        print(f"{name:20} index p50 {run_stats['index_us'].get('p50')} us p99 {run_stats['index_us'].get('p99')} us, "
+              f"LIKE p50 {run_stats['like_query_us'].get('p50')} us")
+    print(f"saved                {path}")
+
+
+if __name__ == "__main__":
+    main()
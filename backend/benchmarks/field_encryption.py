@@ -0,0 +1,136 @@
+"""
+Field encryption overhead on message insert and history reads.
+
+Runs the same workload against a fresh SQLite database twice, once with
+plaintext columns and once with FIELD_ENCRYPTION_KEYS set: --inserts calls
+of MessageService.create_message (as each broadcast makes), then --reads
+calls of ConnectionManager.get_recent_messages(limit) over users with bios.
+History reads bypass the response cache, so every call decrypts. Also
+reports the raw per-field encrypt/decrypt cost.
+
+    python -m benchmarks.field_encryption
+    python -m benchmarks.field_encryption --inserts 2000 --reads 500 --limit 100
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from benchmarks.ws_load import percentiles, save_result, _git_revision
+from config.database import Base
+from security import encryption
+from security.encryption import FieldCipher, generate_key
+from services import websocket_manager
+from services.database_service import MessageService, UserService
+from services.websocket_manager import ConnectionManager
+
+TEXT = "Pt in bed 4: BP 128/82, HR 76, SpO2 97% on RA. Next obs 14:00, call if MAP < 65."
+BIO = "Charge nurse, cardiac ICU. Night shifts Mon-Thu; bleep 4471 for escalations."
+
+
+async def run_mode(workdir: str, keys: str, inserts: int, reads: int, limit: int, users: int = 50) -> dict:
+    encryption.field_cipher = FieldCipher(keys)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{workdir}/{'encrypted' if keys else 'plain'}.db")
+    factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    async with factory() as session:
+        for index in range(users):
+            await UserService.create_or_update_user(session, f"user{index}", f"User {index}", "ICU", bio=BIO)
+
+    insert_times = []
+    for index in range(inserts):
+        started = time.perf_counter()
+        async with factory() as session:
+            await MessageService.create_message(session, f"user{index % users}", f"{TEXT} #{index}")
+        insert_times.append(time.perf_counter() - started)
+
+    # The manager reads through the app's session factory
+    websocket_manager.AsyncSessionLocal = factory
+    manager = ConnectionManager()
+    read_times = []
+    for _ in range(reads):
+        started = time.perf_counter()
+        recent = await manager.get_recent_messages(limit)
+        read_times.append(time.perf_counter() - started)
+    assert recent[0]["text"].startswith(TEXT) and recent[0]["bio"] == BIO
+
+    await engine.dispose()
+    return {"insert_ms": percentiles(insert_times), "get_recent_messages_ms": percentiles(read_times)}
+
+
+def field_costs(keys: str, count: int = 20000) -> dict:
+    cipher = FieldCipher(keys)
+    started = time.perf_counter()
+    sealed = [cipher.encrypt(TEXT, "messages.text") for _ in range(count)]
+    encrypt_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    for value in sealed:
+        cipher.decrypt(value, "messages.text")
+    decrypt_seconds = time.perf_counter() - started
+    return {
+        "encrypt_us": round(encrypt_seconds / count * 1e6, 2),
+        "decrypt_us": round(decrypt_seconds / count * 1e6, 2),
+        "stored_chars": len(sealed[0]),
+        "plaintext_chars": len(TEXT),
+    }
+
+
+def _overhead(plain: dict, encrypted: dict) -> dict:
+    return {
+        stat: round((encrypted[stat] / plain[stat] - 1) * 100, 1)
+        for stat in ("p50", "mean") if plain.get(stat)
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Field encryption overhead benchmark")
+    parser.add_argument("--inserts", type=int, default=1000, help="messages inserted per mode")
+    parser.add_argument("--reads", type=int, default=300, help="history reads per mode")
+    parser.add_argument("--limit", type=int, default=50, help="messages per history read")
+    parser.add_argument("--output", help="result JSON path (default: benchmarks/results/)")
+    args = parser.parse_args(argv)
+
+    keys = f"bench:{generate_key()}"
+    original = encryption.field_cipher, websocket_manager.AsyncSessionLocal
+    workdir = tempfile.mkdtemp(prefix="field-encryption-bench-")
+    try:
+        plain = asyncio.run(run_mode(workdir, "", args.inserts, args.reads, args.limit))
+        encrypted = asyncio.run(run_mode(workdir, keys, args.inserts, args.reads, args.limit))
+    finally:
+        encryption.field_cipher, websocket_manager.AsyncSessionLocal = original
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    result = {
+        "benchmark": "field_encryption",
+        "timestamp": datetime.now().isoformat(),
+        "git_revision": _git_revision(),
+        "python": sys.version.split()[0],
+        "config": {"inserts": args.inserts, "reads": args.reads, "limit": args.limit},
+        "plaintext": plain,
+        "encrypted": encrypted,
+        "overhead_percent": {
+            "insert": _overhead(plain["insert_ms"], encrypted["insert_ms"]),
+            "get_recent_messages": _overhead(plain["get_recent_messages_ms"], encrypted["get_recent_messages_ms"]),
+        },
+        "per_field": field_costs(keys),
+    }
+    path = save_result(result, args.output)
+
+    for name, key in (("insert", "insert_ms"), ("get_recent_messages", "get_recent_messages_ms")):
+        print(f"{name:20} plaintext p50 {plain[key]['p50']} ms, encrypted p50 {encrypted[key]['p50']} ms "
+              f"({result['overhead_percent'][name].get('p50')}%)")
+    per_field = result["per_field"]
+    print(f"per field            encrypt {per_field['encrypt_us']} us, decrypt {per_field['decrypt_us']} us, "
+          f"{per_field['plaintext_chars']} -> {per_field['stored_chars']} chars")
+    print(f"saved                {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Requests/sec through the security headers middleware, before and after.
+
+Compares the previous BaseHTTPMiddleware implementation with the pure ASGI
+SecurityHeadersMiddleware on /health and on a static asset served from the
+frontend directory. Requests are driven straight through the ASGI
+interface (no sockets), so the figures isolate app + middleware cost.
+
+    python -m benchmarks.http_middleware --requests 5000
+"""
+import argparse
+import asyncio
+import os
+import time
+
+from fastapi import FastAPI
+from fastapi.staticfiles import StaticFiles
+from starlette.middleware.base import BaseHTTPMiddleware
+
+from security.middleware import SecurityHeadersMiddleware
+
+FRONTEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "frontend")
+
+
+class LegacySecurityHeadersMiddleware(BaseHTTPMiddleware):
+    """The BaseHTTPMiddleware version this benchmark measures against"""
+
+    async def dispatch(self, request, call_next):
+        response = await call_next(request)
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        response.headers["X-Frame-Options"] = "DENY"
+        response.headers["X-XSS-Protection"] = "1; mode=block"
+        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+        response.headers["Content-Security-Policy"] = (
+            "default-src 'self'; "
+            "script-src 'self' 'unsafe-inline'; "
+            "style-src 'self' 'unsafe-inline'; "
+            "img-src 'self' data:; "
+            "connect-src 'self' wss: https:"
+        )
+        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
+        return response
+
+
+def build_app(middleware) -> FastAPI:
+    app = FastAPI()
+    if middleware is not None:
+        app.add_middleware(middleware)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy", "active_users": 0}
+
+    app.mount("/frontend", StaticFiles(directory=FRONTEND_DIR, html=True), name="static")
+    return app
+
+
+async def _request(app, path: str) -> int:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "https",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"medchat.example"), (b"accept-encoding", b"gzip")],
+        "client": ("10.0.0.1", 50000),
+        "server": ("10.0.0.2", 443),
+    }
+    status = 0
+    request_sent = False
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Only reached after the response is complete
+        await asyncio.sleep(3600)
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+
+    await app(scope, receive, send)
+    return status
+
+
+async def requests_per_second(app, path: str, count: int) -> float:
+    # Warm-up also runs the app's startup-time middleware stack build
+    assert await _request(app, path) == 200, f"{path} did not return 200"
+    started = time.perf_counter()
+    for _ in range(count):
+        await _request(app, path)
+    return count / (time.perf_counter() - started)
+
+
+async def run(count: int) -> dict:
+    paths = {"health": "/health", "static": "/frontend/sw.js"}
+    variants = {
+        "none": None,
+        "before (BaseHTTPMiddleware)": LegacySecurityHeadersMiddleware,
+        "after (pure ASGI)": SecurityHeadersMiddleware,
+    }
+    results = {}
+    for variant, middleware in variants.items():
+        app = build_app(middleware)
+        results[variant] = {name: await requests_per_second(app, path, count) for name, path in paths.items()}
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Security headers middleware throughput")
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args.requests))
+    print(f"{'middleware':<30} {'/health req/s':>14} {'static req/s':>14}")
+    for variant, figures in results.items():
+        print(f"{variant:<30} {figures['health']:>14.0f} {figures['static']:>14.0f}")
+    before = results["before (BaseHTTPMiddleware)"]
+    after = results["after (pure ASGI)"]
+    print(f"speedup: /health {after['health'] / before['health']:.2f}x, "
+          f"static {after['static'] / before['static']:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
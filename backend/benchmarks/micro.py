@@ -0,0 +1,150 @@
+"""
+Timing helpers and baseline comparison for the hot-path micro-benchmarks.
+
+The benchmarks themselves live in tests/benchmarks and are skipped unless
+selected with ``-m benchmark``:
+
+    pytest -m benchmark tests/benchmarks
+    BENCH_UPDATE_BASELINE=1 pytest -m benchmark tests/benchmarks   # re-record
+
+Each benchmark's best time per operation is compared with
+benchmarks/baseline.json and fails when it is more than BENCH_MAX_SLOWDOWN
+times slower. Timings are first scaled by a fixed reference workload timed
+in the same run, so a slower or busier machine doesn't read as a
+regression; re-record the baseline after changing machines anyway.
+"""
+import json
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+# Fail when a benchmark is this many times slower than its baseline
+MAX_SLOWDOWN = float(os.getenv("BENCH_MAX_SLOWDOWN", "1.5"))
+UPDATE_BASELINE = os.getenv("BENCH_UPDATE_BASELINE") == "1"
+
+# Each repeat runs for at least this long; the fastest repeat is reported, as
+# with timeit, since noise only ever makes a run slower
+MIN_REPEAT_SECONDS = float(os.getenv("BENCH_MIN_REPEAT_SECONDS", "0.1"))
+REPEATS = int(os.getenv("BENCH_REPEATS", "5"))
+
+# Rows seeded into the messages table for the DB benchmarks (part of their names,
+# so runs at different sizes are never compared with each other)
+BENCH_MESSAGE_ROWS = int(os.getenv("BENCH_MESSAGE_ROWS", "1000000"))
+
+CALIBRATION = "_calibration"
+
+
+class BenchResult:
+    """Timing of one benchmark"""
+
+    def __init__(self, name: str, per_op_seconds: float, iterations: int, repeats: int):
+        self.name = name
+        self.per_op_seconds = per_op_seconds
+        self.iterations = iterations
+        self.repeats = repeats
+
+    @property
+    def per_op_us(self) -> float:
+        return self.per_op_seconds * 1e6
+
+    def to_dict(self) -> dict:
+        return {
+            "per_op_us": round(self.per_op_us, 3),
+            "iterations": self.iterations,
+            "repeats": self.repeats,
+        }
+
+
+def _calibrate(elapsed_for_one: float) -> int:
+    return max(1, int(MIN_REPEAT_SECONDS / max(elapsed_for_one, 1e-9)))
+
+
+def measure(name: str, func: Callable[[], object], repeats: int = REPEATS) -> BenchResult:
+    """Time a synchronous callable"""
+    started = time.perf_counter()
+    func()
+    number = _calibrate(time.perf_counter() - started)
+
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(number):
+            func()
+        timings.append((time.perf_counter() - started) / number)
+    return BenchResult(name, min(timings), number, repeats)
+
+
+async def measure_async(name: str, func: Callable[[], Awaitable[object]], repeats: int = REPEATS) -> BenchResult:
+    """Time a coroutine function, awaited in the running loop"""
+    started = time.perf_counter()
+    await func()
+    number = _calibrate(time.perf_counter() - started)
+
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        for _ in range(number):
+            await func()
+        timings.append((time.perf_counter() - started) / number)
+    return BenchResult(name, min(timings), number, repeats)
+
+
+def _reference_workload():
+    # Interpreter-bound mix of dict, string and list work, unrelated to app code
+    table = {}
+    for index in range(2000):
+        key = f"key-{index % 97}"
+        table[key] = table.get(key, 0) + len(key)
+    return sorted(table.items())
+
+
+def calibrate() -> BenchResult:
+    """Time the reference workload; baselines store it as CALIBRATION"""
+    return measure(CALIBRATION, _reference_workload)
+
+
+def load_baseline(path: str = BASELINE_PATH) -> Dict[str, dict]:
+    try:
+        with open(path) as baseline_file:
+            return json.load(baseline_file)["benchmarks"]
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def save_baseline(results: Dict[str, BenchResult], path: str = BASELINE_PATH):
+    """Merge results into the baseline file"""
+    benchmarks = load_baseline(path)
+    benchmarks.update({name: result.to_dict() for name, result in results.items()})
+    with open(path, "w") as baseline_file:
+        json.dump({"benchmarks": dict(sorted(benchmarks.items()))}, baseline_file, indent=2)
+        baseline_file.write("\n")
+
+
+def machine_factor(calibration: Optional[BenchResult], baseline: Dict[str, dict]) -> float:
+    """How much slower this run's machine is than the one that recorded the baseline"""
+    recorded = baseline.get(CALIBRATION)
+    if calibration is None or recorded is None:
+        return 1.0
+    return calibration.per_op_us / recorded["per_op_us"]
+
+
+def slowdown(result: BenchResult, baseline: Dict[str, dict], factor: float = 1.0) -> Optional[float]:
+    """Result time relative to its baseline after scaling out machine speed; None without a baseline"""
+    recorded = baseline.get(result.name)
+    if recorded is None:
+        return None
+    return result.per_op_us / (recorded["per_op_us"] * factor)
+
+
+def check_regression(result: BenchResult, baseline: Dict[str, dict], factor: float = 1.0,
+                     max_slowdown: float = MAX_SLOWDOWN) -> Optional[str]:
+    """Failure message if ``result`` is too slow compared with its baseline, else None"""
+    ratio = slowdown(result, baseline, factor)
+    if ratio is None or ratio <= max_slowdown:
+        return None
+    return (
+        f"{result.name}: {result.per_op_us:.2f} us/op is {ratio:.2f}x its baseline of "
+        f"{baseline[result.name]['per_op_us']:.2f} us/op (machine factor {factor:.2f}, limit {max_slowdown}x)"
+    )
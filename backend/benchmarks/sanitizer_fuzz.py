@@ -0,0 +1,107 @@
+"""
+Fuzz-equivalence benchmark for SecurityUtils.sanitize_input.
+
+Generates a corpus of chat-like and hostile strings, checks that the fast
+path produces exactly what the original always-bleach implementation did,
+and times both. Exits non-zero on any mismatch.
+
+    python -m benchmarks.sanitizer_fuzz --size 200000
+"""
+import argparse
+import html
+import random
+import sys
+import time
+from typing import List
+
+import bleach
+
+from security import utils
+from security.utils import SecurityUtils
+
+WORDS = [
+    "bed", "12", "obs", "stable", "BP", "120/80", "review", "fluids", "ICU", "ward", "please",
+    "thanks", "ok", "Dr.", "Sister", "meds", "due", "at", "14:00", "pt", "NPO", "ASAP", "résumé",
+    "naïve", "Zoë", "Ærø", "日本語", "مرحبا", "🙂", "👩‍⚕️", "O'Brien", '"quoted"', "50%", "a+b=c",
+]
+MARKUP = [
+    "<", ">", "&", "<b>", "</b>", "<script>alert(1)</script>", "<img src=x onerror=alert(1)>",
+    "&amp;", "&lt;", "&#60;", "&#x3c;", "&nbsp;", "&bogus;", "&", "<!-- c -->", "<![CDATA[x]]>",
+    "<a href='javascript:x'>", "<<>>", "</", "<p", "a<b", "x > y", "<svg/onload=alert(1)>",
+    "&#0;", "&#xD800;", "<?xml?>", "<!DOCTYPE html>", "<style>*{}</style>", "<textarea>",
+]
+CONTROLS = ["\x00", "\x01", "\x07", "\x08", "\t", "\n", "\x0b", "\x0c", "\r", "\r\n", "\x1b", "\x1f", "\x7f",
+            "\x85", " ", " ", "﻿", "￾", "\U0010ffff"]
+
+
+def reference_sanitize(text: str, max_length: int = 1000) -> str:
+    """The original implementation: always bleach, then escape"""
+    if not text:
+        return ""
+    text = text[:max_length]
+    text = bleach.clean(text, tags=[], strip=True)
+    return html.escape(text).strip()
+
+
+def fuzz_corpus(size: int, seed: int = 0) -> List[str]:
+    """Mostly plain chat text, with markup, entities, controls and random code points mixed in"""
+    rng = random.Random(seed)
+    corpus = []
+    for _ in range(size):
+        kind = rng.random()
+        if kind < 0.5:
+            pieces = [rng.choice(WORDS) for _ in range(rng.randint(1, 25))]
+        elif kind < 0.8:
+            pieces = [rng.choice(WORDS + MARKUP + CONTROLS) for _ in range(rng.randint(1, 25))]
+        else:
+            pieces = [chr(rng.choice([rng.randint(0, 0x7f), rng.randint(0, 0xffff), rng.randint(0, 0x10ffff)]))
+                      for _ in range(rng.randint(1, 40))]
+            pieces = [piece for piece in pieces if not "\ud800" <= piece <= "\udfff"]
+        separator = rng.choice([" ", "", "  ", "\n"])
+        corpus.append(separator.join(pieces))
+    return corpus
+
+
+def mismatches(corpus: List[str], max_length: int = 1000) -> List[str]:
+    """Inputs for which the fast path and the reference disagree"""
+    return [
+        text for text in corpus
+        if SecurityUtils.sanitize_input(text, max_length) != reference_sanitize(text, max_length)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sanitizer fast-path equivalence and speed")
+    parser.add_argument("--size", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    corpus = fuzz_corpus(args.size, args.seed)
+    failures = mismatches(corpus)
+    # A short max_length exercises truncation in the middle of markup and entities
+    failures += mismatches(corpus, max_length=16)
+
+    utils._sanitize_cached.cache_clear()
+    started = time.perf_counter()
+    for text in corpus:
+        reference_sanitize(text)
+    reference_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for text in corpus:
+        SecurityUtils.sanitize_input(text)
+    fast_seconds = time.perf_counter() - started
+
+    bleach_skipped = sum(1 for text in corpus if not utils._BLEACH_SIGNIFICANT.search(text[:1000]))
+    print(f"corpus        {len(corpus)} strings, {bleach_skipped / len(corpus):.1%} skip bleach")
+    print(f"reference     {reference_seconds * 1e6 / len(corpus):.2f} us/string")
+    print(f"sanitize      {fast_seconds * 1e6 / len(corpus):.2f} us/string "
+          f"({reference_seconds / fast_seconds:.1f}x faster)")
+    print(f"mismatches    {len(failures)}")
+    for text in failures[:10]:
+        print(f"  {text!r}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
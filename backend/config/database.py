@@ -1,7 +1,12 @@
+import asyncio
+import logging
 import os
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
 from sqlalchemy.orm import DeclarativeBase
-from sqlalchemy import MetaData
+from sqlalchemy import Column, MetaData, String, Table, inspect, select, text
+from sqlalchemy.exc import DBAPIError
+
+logger = logging.getLogger(__name__)
 
 # Database URL configuration
 # Local development: SQLite
@@ -28,6 +33,24 @@ if os.getenv("PRODUCTION") == "true":
 # Sync URL for Alembic migrations (non-async)
 SYNC_DATABASE_URL = DATABASE_URL.replace("+aiosqlite", "").replace("+asyncpg", "+psycopg2")
 
+# Alembic head revision the models match; bump it with every new migration
+SCHEMA_REVISION = "b5d0e3f86a21"
+# First migration: what create_all built before databases were stamped
+INITIAL_REVISION = "1db304498d4a"
+# Tables and columns at INITIAL_REVISION, to recognize unstamped databases that can be migrated
+INITIAL_TABLES = {
+    "users": {"id", "user_id", "user_name", "department", "bio", "is_active", "created_at", "last_seen"},
+    "messages": {"id", "message_id", "text", "message_type", "user_id", "created_at"},
+    "user_sessions": {"id", "user_id", "connection_id", "connected_at", "disconnected_at", "is_active"},
+}
+ALEMBIC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic")
+
+# Alembic's bookkeeping table, used to stamp databases created by create_all
+alembic_version = Table(
+    "alembic_version", MetaData(),
+    Column("version_num", String(32), primary_key=True),
+)
+
 class Base(DeclarativeBase):
     """Base class for all database models"""
     metadata = MetaData(
@@ -63,10 +86,87 @@ async def get_db_session() -> AsyncSession:
         finally:
             await session.close()
 
-async def init_db():
-    """Initialize database tables"""
+async def schema_is_current() -> bool:
+    """One query: whether the database is stamped at SCHEMA_REVISION"""
+    try:
+        async with engine.connect() as conn:
+            version = (await conn.execute(text("SELECT version_num FROM alembic_version"))).scalar()
+    except DBAPIError:
+        # No alembic_version table yet
+        return False
+    return version == SCHEMA_REVISION
+
+def upgrade_schema(sync_conn, revision: str = "head"):
+    """``alembic upgrade`` on one of the app's own connections"""
+    # Only needed when a deploy brings new migrations, so kept off the cold start path
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config()
+    config.set_main_option("script_location", ALEMBIC_DIR)
+    config.attributes["connection"] = sync_conn
+    command.upgrade(config, revision)
+
+def _create_schema(sync_conn):
+    """Migrate a stamped database to SCHEMA_REVISION, or create_all and stamp an empty one.
+
+    Databases created by create_all before stamping are stamped at
+    INITIAL_REVISION and migrated when their tables match it; any other
+    unstamped schema is refused rather than served with missing columns.
+    """
+    inspector = inspect(sync_conn)
+    existing = set(inspector.get_table_names())
+    if alembic_version.name not in existing and existing & set(Base.metadata.tables):
+        found = {name: {column["name"] for column in inspector.get_columns(name)}
+                 for name in existing & set(Base.metadata.tables)}
+        if found != INITIAL_TABLES:
+            raise RuntimeError(
+                f"Database tables are not stamped with a schema revision and don't match revision "
+                f"{INITIAL_REVISION}, so they can't be migrated; bring them to a known revision, "
+                f"`alembic stamp` it and restart"
+            )
+        logger.info("Stamping unversioned database tables at %s", INITIAL_REVISION)
+        alembic_version.create(sync_conn)
+        sync_conn.execute(alembic_version.insert().values(version_num=INITIAL_REVISION))
+        existing.add(alembic_version.name)
+
+    if alembic_version.name in existing:
+        revision = sync_conn.execute(select(alembic_version.c.version_num)).scalar()
+        if revision != SCHEMA_REVISION:
+            # Before create_all, which would add new tables the migrations then fail to create
+            logger.info("Upgrading database schema from %s to %s", revision, SCHEMA_REVISION)
+            upgrade_schema(sync_conn)
+        Base.metadata.create_all(sync_conn)
+        return
+
+    Base.metadata.create_all(sync_conn)
+    alembic_version.create(sync_conn)
+    sync_conn.execute(alembic_version.insert().values(version_num=SCHEMA_REVISION))
+
+async def init_db(fast: bool = False):
+    """Initialize database tables.
+
+    A database stamped at an older revision, or created unstamped at
+    INITIAL_REVISION, is migrated to SCHEMA_REVISION first, so deploys that
+    add migrations need no separate upgrade step. In fast mode a database already stamped at SCHEMA_REVISION is trusted as
+    is, replacing create_all's per-table existence checks with one query.
+    """
+    if fast and await schema_is_current():
+        return
     async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(_create_schema)
+
+async def warm_pool(connections: int = 2):
+    """Open pool connections ahead of the first requests"""
+    async def open_one():
+        conn = await engine.connect()
+        await conn.execute(text("SELECT 1"))
+        return conn
+
+    opened = await asyncio.gather(*(open_one() for _ in range(connections)), return_exceptions=True)
+    for conn in opened:
+        if not isinstance(conn, BaseException):
+            await conn.close()
 
 async def close_db():
     """Close database connections"""
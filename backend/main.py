@@ -1,29 +1,109 @@
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException
+from fastapi import FastAPI, WebSocket, WebSocketDisconnect, HTTPException, Depends, Request, Body
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.requests import ClientDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from datetime import datetime
+from typing import Awaitable, Callable, Optional
+import asyncio
 import json
+import math
+import os
+import secrets
+import time
 import uuid
 from contextlib import asynccontextmanager
 
 # Import modular components
 from security.middleware import SecurityHeadersMiddleware
-from security.utils import SecurityUtils
-from services.websocket_manager import ConnectionManager
+from security.utils import SecurityUtils, load_bleach
+from security.admin import require_admin
+from services.websocket_manager import ConnectionManager, MESSAGES_RECEIVED, STAGE_LATENCY, RATE_LIMIT_REJECTIONS
+from services import metrics
+from services.query_stats import query_stats
+from services.loop_monitor import loop_monitor
+from services import profiler
+from services.executor import worker_pools
+from services.static_assets import StaticAssets
+from services.response_cache import response_cache
+from services.warmup import Warmup
+from services.typing_indicators import DEFAULT_CHANNEL, CHANNEL_PATTERN
+from services.send_dedupe import CLIENT_ID_PATTERN
+from services.transports import QueuedConnection, LONG_POLL_TIMEOUT, SSE_KEEPALIVE, SSE_REPLAY_FRAMES
+from services.attachments import AttachmentError, attachment_store, attachment_response
+from services import directory, export
+from services.audit import audit_log
+from services.admission import AdmissionController, PRIORITY_NEW, PRIORITY_RESUME, RETRY_LATER_CLOSE_CODE
 from services.database_service import MessageService, UserService
-from config.database import init_db, close_db, AsyncSessionLocal
+from config.database import init_db, close_db, warm_pool, AsyncSessionLocal, engine
 from models.db_models import Message
 
+# Per-user WebSocket limits (per minute); the load benchmark raises them
+WS_CONNECT_RATE_LIMIT = int(os.getenv("WS_CONNECT_RATE_LIMIT", "5"))
+WS_MESSAGE_RATE_LIMIT = int(os.getenv("WS_MESSAGE_RATE_LIMIT", "20"))
+
+# Attachment uploads a user may start per minute
+ATTACHMENT_RATE_LIMIT = int(os.getenv("ATTACHMENT_RATE_LIMIT", "10"))
+
+# Scale-to-zero mode: trust a stamped schema and warm up while already accepting traffic
+FAST_START = os.getenv("FAST_START", "false").lower() == "true"
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Initialize database on startup
-    await init_db()
+    await init_db(fast=FAST_START)
+    await manager.heartbeat.start()
+    await manager.typing.start()
+    await manager.read_receipts.start()
+    # Also removes uploads abandoned before a restart
+    await attachment_store.start()
+    await audit_log.start()
+    await loop_monitor.start()
+
+    # Close sessions left active by a previous process, then start batched session
+    # writes; sessions opened meanwhile stay buffered until it has run
+    warmup.add("sessions", manager.session_batcher.start)
+    # Read, fingerprint and precompress the frontend; requests arriving first wait for it
+    warmup.add("static_assets", lambda: asyncio.to_thread(static_assets.ensure_built))
+    warmup.add("db_pool", warm_pool)
+    warmup.add("sanitizer", lambda: asyncio.to_thread(load_bleach))
+    # Message counts per channel for unread badges; connects arriving first wait for it
+    warmup.add("read_receipts", manager.read_receipts.load)
+    # Names, ids and departments for @mention search, from one query
+    warmup.add("directory", manager.directory.load)
+    warmup.add("online_users", lambda: response_cache.get(
+        "users_online", manager.get_online_users, version=manager.presence_version
+    ))
+    if FAST_START:
+        warmup.start()
+    else:
+        await warmup.run()
+
+    snapshot_task = asyncio.create_task(metrics.snapshot_forever()) if metrics.MULTIPROC_DIR else None
     yield
+    # No-op if DrainingServer already drained on the shutdown signal
+    await manager.drain()
+    await warmup.stop()
+    await manager.heartbeat.stop()
+    await manager.typing.stop()
+    await attachment_store.stop()
+    await loop_monitor.stop()
+    if snapshot_task:
+        snapshot_task.cancel()
+        metrics.write_snapshot()
+    # Write any buffered session changes and read cursors before closing the pool
+    await manager.session_batcher.stop()
+    await manager.read_receipts.stop()
+    # Last, so the drain's disconnects are on the trail
+    await audit_log.stop()
+    worker_pools.shutdown()
     # Close database connections on shutdown
     await close_db()
 
 app = FastAPI(title="Nightingale-Chat API", version="1.0.0", lifespan=lifespan)
 
+# Innermost, so it labels the task that actually runs the endpoint
+app.add_middleware(profiler.ProfilerLabelMiddleware)
+
 # Add security middleware
 app.add_middleware(SecurityHeadersMiddleware)
 
@@ -32,51 +112,220 @@ app.add_middleware(
     CORSMiddleware,
     allow_origins=["https://localhost:3000", "http://localhost:3000"],
     allow_credentials=True,
-    allow_methods=["GET", "POST"],
+    allow_methods=["GET", "POST", "PATCH", "DELETE"],
     allow_headers=["*"],
 )
 
 # Initialize components
 security = SecurityUtils()
 manager = ConnectionManager()
+admission = AdmissionController()
+warmup = Warmup()
 message_service = MessageService()
 user_service = UserService()
 
+# Per-statement timings and slow-query log for every query on the app engine
+query_stats.install(engine)
+
+# Gauges read at scrape time
+metrics.gauge("medchat_ws_active_connections", "Open WebSocket connections",
+              callback=manager.get_connection_count)
+metrics.gauge("medchat_db_pool_size", "Configured DB pool size", callback=lambda: engine.pool.size())
+metrics.gauge("medchat_db_pool_checked_out", "DB connections in use", callback=lambda: engine.pool.checkedout())
+metrics.gauge("medchat_db_pool_checked_in", "Idle DB connections in the pool", callback=lambda: engine.pool.checkedin())
+metrics.gauge("medchat_db_pool_overflow", "DB connections beyond the pool size", callback=lambda: engine.pool.overflow())
+
 @app.get("/")
 async def root():
     return {"message": "Nightingale-Chat API is running"}
 
 @app.get("/health")
-async def health_check():
-    return {"status": "healthy", "active_users": manager.get_connection_count()}
+async def health_check(request: Request):
+    async def compute():
+        return {
+            "status": "draining" if manager.draining else "healthy",
+            "active_users": manager.get_connection_count(),
+            "heartbeat": manager.heartbeat.get_stats(),
+            "admission": admission.get_stats(),
+            "event_loop": loop_monitor.get_stats(),
+            "warmup": warmup.get_stats()
+        }
+
+    if manager.draining:
+        # Failing the check takes this machine out of Fly's routing during a deploy
+        return JSONResponse(status_code=503, content=await compute())
+    return await response_cache.respond(request, "health", compute)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.get("/admin/queries/top", dependencies=[Depends(require_admin)])
+async def top_queries(n: int = 10, order_by: str = "total"):
+    """Top-N normalized SQL statements by total (or mean/max/calls) time"""
+    return {"statements": query_stats.top(min(max(n, 1), 100), order_by)}
+
+@app.get("/admin/loop/stalls", dependencies=[Depends(require_admin)])
+async def loop_stalls():
+    """Recent event-loop stalls with the stack that was blocking the loop"""
+    return {"stats": loop_monitor.get_stats(), "stalls": list(loop_monitor.reports)}
+
+@app.get("/admin/profile", dependencies=[Depends(require_admin)])
+async def profile(seconds: float = 10.0, interval_ms: float = 5.0, format: str = "collapsed", threads: bool = False):
+    """Sample the running worker and return collapsed stacks (flamegraph.pl / speedscope input)"""
+    if profiler.profile_in_progress():
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    result = await profiler.run_profile(seconds, interval_ms / 1000, all_threads=threads)
+    if format == "json":
+        return {
+            "samples": result.samples,
+            "duration_seconds": round(result.duration, 3),
+            "by_label": result.by_label(),
+            "stacks": dict(result.stacks),
+        }
+    return PlainTextResponse(result.collapsed())
+
+@app.get("/admin/export/messages", dependencies=[Depends(require_admin)])
+async def export_messages(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    department: Optional[str] = None,
+    format: str = "ndjson",
+    gzip: bool = False,
+    after: int = 0
+):
+    """Stream messages created in [start, end) as NDJSON or CSV.
+
+    X-Export-Total is the number of messages that will follow; every row
+    carries its seq, so an interrupted download resumes with after=<last seq>.
+    """
+    if format not in export.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(export.FORMATS)}")
+    async with AsyncSessionLocal() as db:
+        total = await MessageService.count_for_export(db, start, end, department, after)
+
+    filename = f"messages.{format}" + (".gz" if gzip else "")
+    return StreamingResponse(
+        export.export_messages(AsyncSessionLocal, format, gzip, start, end, department, after_seq=after,
+                               header=not after),
+        media_type="application/gzip" if gzip else export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"', "X-Export-Total": str(total)}
+    )
+
+@app.get("/admin/audit/head", dependencies=[Depends(require_admin)])
+async def audit_head():
+    """Latest audit seq and chain hash; recording it elsewhere makes truncating the log detectable"""
+    await audit_log.flush()
+    return audit_log.get_stats()
 
 @app.get("/users/online")
-async def get_online_users():
-    return await manager.get_online_users()
+async def get_online_users(request: Request):
+    return await response_cache.respond(
+        request, "users_online", manager.get_online_users, version=manager.presence_version
+    )
+
+@app.get("/directory/search")
+async def search_directory(q: str = "", department: Optional[str] = None, limit: int = directory.DIRECTORY_SEARCH_LIMIT):
+    """Staff matching a name, id or department prefix, for @mention autocomplete"""
+    await manager.directory.load()
+    users = manager.directory.search(q[:100], department=department, limit=limit)
+    for user in users:
+        user["online"] = user["user_id"] in manager.active_connections
+    return {"users": users, "count": len(users)}
 
 @app.get("/messages/recent")
-async def get_recent_messages(limit: int = 50):
+async def get_recent_messages(request: Request, limit: int = 50):
     """Get recent messages from database"""
-    return await manager.get_recent_messages(limit)
+    return await response_cache.respond(
+        request, ("messages_recent", limit), lambda: manager.get_recent_messages(limit),
+        version=manager.message_version
+    )
 
-@app.websocket("/ws/{user_id}")
-async def websocket_endpoint(websocket: WebSocket, user_id: str):
-    # Validate user ID format
+@app.exception_handler(AttachmentError)
+async def attachment_error_handler(request: Request, exc: AttachmentError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail}, headers=exc.headers)
+
+def uploader_id(request: Request) -> str:
+    """The user an attachment upload belongs to, from the X-User-Id header"""
+    user_id = request.headers.get("x-user-id", "")
     if not security.validate_user_id(user_id):
-        await websocket.close(code=4000, reason="Invalid user ID format")
-        return
+        raise HTTPException(status_code=401, detail="Missing or invalid X-User-Id header")
+    return user_id
 
-    # Rate limiting check
-    client_host = websocket.client.host if websocket.client else "unknown"
-    if not security.check_rate_limit(f"ws_{client_host}_{user_id}", max_requests=5, time_window=60):
-        await websocket.close(code=4029, reason="Rate limit exceeded")
-        return
+@app.post("/attachments/uploads", status_code=201)
+async def create_attachment_upload(size: int = Body(..., embed=True), user_id: str = Depends(uploader_id)):
+    """Start a resumable upload of ``size`` bytes"""
+    if not security.check_rate_limit(f"upload_{user_id}", max_requests=ATTACHMENT_RATE_LIMIT, time_window=60):
+        RATE_LIMIT_REJECTIONS["upload"].inc()
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+    upload = await attachment_store.create_upload(user_id, size)
+    return JSONResponse(
+        status_code=201, content=upload.to_dict(),
+        headers={"Location": f"/attachments/uploads/{upload.upload_id}", "Upload-Offset": "0"}
+    )
+
+@app.get("/attachments/uploads/{upload_id}")
+async def get_attachment_upload(upload_id: str, user_id: str = Depends(uploader_id)):
+    """Bytes received so far, to resume an interrupted upload from"""
+    upload = await attachment_store.get_upload(upload_id, user_id)
+    return JSONResponse(content=upload.to_dict(), headers={"Upload-Offset": str(upload.offset)})
+
+@app.patch("/attachments/uploads/{upload_id}")
+async def append_attachment_upload(upload_id: str, request: Request, user_id: str = Depends(uploader_id)):
+    """Stream the next chunk, starting at the Upload-Offset header"""
+    upload = await attachment_store.get_upload(upload_id, user_id)
+    offset = request.headers.get("upload-offset", "")
+    if not offset.isdigit():
+        raise HTTPException(status_code=400, detail="Missing or invalid Upload-Offset header")
+    try:
+        attachment = await attachment_store.append(upload, int(offset), request.stream())
+    except ClientDisconnect:
+        # What arrived is kept; the client resumes from the offset it reads back
+        return Response(status_code=400)
+    return JSONResponse(
+        content={**upload.to_dict(), "complete": attachment is not None, "attachment": attachment},
+        headers={"Upload-Offset": str(upload.offset)}
+    )
 
+@app.delete("/attachments/uploads/{upload_id}", status_code=204)
+async def abort_attachment_upload(upload_id: str, user_id: str = Depends(uploader_id)):
+    await attachment_store.abort(await attachment_store.get_upload(upload_id, user_id))
+    return Response(status_code=204)
+
+@app.api_route("/attachments/{sha256}", methods=["GET", "HEAD"])
+async def download_attachment(sha256: str, request: Request):
+    """A stored attachment by content hash, with single byte-range support"""
+    return attachment_response(
+        attachment_store, sha256,
+        range_header=request.headers.get("range"),
+        if_none_match=request.headers.get("if-none-match"),
+        if_range=request.headers.get("if-range"),
+        method=request.method
+    )
+
+async def start_session(connection, user_id: str):
+    """Register an admitted connection, whatever its transport, send its first frames and announce it"""
     # Extract user info from first message or use defaults
     user_name = user_id  # Default to user_id
     department = "Unknown"  # Default department
 
-    await manager.connect(websocket, user_id, user_name, department)
+    try:
+        await manager.connect(connection, user_id, user_name, department)
+        # Token lets this client skip the queue when it reconnects
+        session = {"type": "session", "resume_token": admission.issue_resume_token(user_id)}
+        if isinstance(connection, QueuedConnection):
+            # Polls and sends over HTTP name the connection they belong to
+            session.update(connection=connection.token, transport=connection.transport)
+        await connection.send_text(json.dumps(session))
+    finally:
+        admission.release()
+
+    # Unread badges for every channel, from memory once the user's cursors are loaded
+    await connection.send_text(json.dumps({
+        "type": "unread",
+        "channels": await manager.read_receipts.badges(user_id)
+    }))
 
     # Send user joined notification
     join_message = {
@@ -88,103 +337,372 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
     }
     await manager.broadcast(json.dumps(join_message), exclude_user=user_id, save_to_db=False)
 
+async def end_session(connection, user_id: str):
+    if not await manager.disconnect(user_id, connection):
+        # Already reaped (and announced) or replaced by a newer connection
+        return
+
+    # Send user left notification
+    leave_message = {
+        "type": "user_left",
+        "user_id": user_id,
+        "text": f"User {user_id} left the chat",
+        "timestamp": datetime.now().isoformat(),
+        "message_id": str(uuid.uuid4())
+    }
+    await manager.broadcast(json.dumps(leave_message), save_to_db=False)
+
+async def handle_frame(user_id: str, data: str, reply: Callable[[str], Awaitable[None]]):
+    """One frame from a connected client, over any transport; ``reply`` sends a frame back to it alone"""
+    manager.heartbeat.touch(user_id)
+    MESSAGES_RECEIVED.inc()
+
+    started = time.perf_counter()
     try:
-        while True:
-            data = await websocket.receive_text()
-
-            # Rate limit messages
-            if not security.check_rate_limit(f"msg_{user_id}", max_requests=20, time_window=60):
-                await websocket.send_text(json.dumps({
-                    "type": "error",
-                    "message": "Rate limit exceeded. Please slow down."
-                }))
-                continue
-
-            try:
-                message_data = json.loads(data)
-            except json.JSONDecodeError:
-                await websocket.send_text(json.dumps({
-                    "type": "error",
-                    "message": "Invalid message format"
-                }))
-                continue
-
-            # Validate and sanitize message content
-            if "text" in message_data:
-                text = message_data["text"]
-
-                if not security.validate_message_length(text):
-                    await websocket.send_text(json.dumps({
-                        "type": "error",
-                        "message": "Message too long or empty"
-                    }))
-                    continue
-
-                # Sanitize message text
-                message_data["text"] = security.sanitize_input(text, 1000)
-
-            # Update user info if provided
-            if "user_name" in message_data or "department" in message_data:
-                async with AsyncSessionLocal() as session:
-                    user_name = security.sanitize_input(message_data.get("user_name", ""), 200) if "user_name" in message_data else None
-                    department = security.sanitize_input(message_data.get("department", ""), 200) if "department" in message_data else None
-
-                    if user_name or department:
-                        # Get current user data to avoid overwriting with None
-                        current_user = await user_service.get_user_by_id(session, user_id)
-                        if current_user:
-                            final_user_name = user_name if user_name else current_user.user_name
-                            final_department = department if department else current_user.department
-                            await user_service.create_or_update_user(session, user_id, final_user_name, final_department)
-                        else:
-                            # Create new user with provided info
-                            await user_service.create_or_update_user(session, user_id, user_name or user_id, department or "Unknown")
-                        await session.commit()
-
-            # Add server-side metadata
-            message_data.update({
-                "timestamp": datetime.now().isoformat(),
-                "message_id": str(uuid.uuid4()),
-                "user_id": user_id
-            })
-
-            # Broadcast message to all connected users (will be saved to DB in broadcast method)
-            await manager.broadcast(json.dumps(message_data), exclude_user=user_id)
+        message_data = json.loads(data)
+    except json.JSONDecodeError:
+        message_data = None
+    STAGE_LATENCY["parse"].observe(time.perf_counter() - started)
 
-    except WebSocketDisconnect:
-        await manager.disconnect(user_id)
+    # Profiler samples from here on count against this message type
+    message_type = message_data.get("type") if isinstance(message_data, dict) else None
+    if not isinstance(message_type, str):
+        message_type = "untyped"
+    profiler.label_task(f"WS message:{message_type[:32]}")
+
+    # Heartbeat replies are bookkeeping only, never broadcast
+    if message_type == "pong":
+        manager.heartbeat.record_pong(user_id)
+        return
+
+    # Typing is ephemeral and throttled by the tracker, so it doesn't spend the message budget
+    if message_type == "typing":
+        channel = message_data.get("channel", DEFAULT_CHANNEL)
+        if isinstance(channel, str) and CHANNEL_PATTERN.match(channel):
+            # The stored profile's name, so no one can show up typing under someone else's
+            profile = manager.directory.get(user_id)
+            manager.typing.record(
+                user_id, channel, typing=message_data.get("typing", True) is not False,
+                user_name=profile["user_name"] if profile else None
+            )
+        return
+
+    # Read cursors only move in memory; writes and receipt frames are batched
+    if message_type == "read":
+        channel = message_data.get("channel", DEFAULT_CHANNEL)
+        seq = message_data.get("seq")
+        if isinstance(channel, str) and CHANNEL_PATTERN.match(channel) \
+                and isinstance(seq, int) and not isinstance(seq, bool):
+            await manager.read_receipts.mark_read(user_id, channel, seq)
+        return
+
+    # Client message ID of the message being handled, until it is acknowledged or rejected
+    claimed = None
+
+    async def reject(error: str):
+        """Error frame for the message being handled; tagged with its client ID, which is released for a resend"""
+        nonlocal claimed
+        frame = {"type": "error", "message": error}
+        if claimed:
+            frame["client_id"] = claimed
+            manager.recent_sends.abandon(user_id, claimed)
+            claimed = None
+        await reply(json.dumps(frame))
+
+    # Resent messages the client never saw acknowledged get the original ack, not a second row
+    client_id = message_data.pop("client_id", None) if isinstance(message_data, dict) else None
+    if client_id is not None:
+        if not isinstance(client_id, str) or not CLIENT_ID_PATTERN.match(client_id):
+            await reject("Invalid client_id")
+            return
+        ack = await manager.recent_sends.claim(user_id, client_id)
+        if ack is not None:
+            await reply(json.dumps(ack))
+            return
+        claimed = client_id
+
+    try:
+        # Rate limit messages
+        started = time.perf_counter()
+        allowed = security.check_rate_limit(f"msg_{user_id}", max_requests=WS_MESSAGE_RATE_LIMIT, time_window=60)
+        STAGE_LATENCY["rate_limit"].observe(time.perf_counter() - started)
+        if not allowed:
+            RATE_LIMIT_REJECTIONS["message"].inc()
+            await reject("Rate limit exceeded. Please slow down.")
+            return
+
+        if not isinstance(message_data, dict):
+            await reject("Invalid message format")
+            return
 
-        # Send user left notification
-        leave_message = {
-            "type": "user_left",
-            "user_id": user_id,
-            "text": f"User {user_id} left the chat",
+        # Validate and sanitize message content
+        if "text" in message_data:
+            text = message_data["text"]
+
+            if not security.validate_message_length(text):
+                await reject("Message too long or empty")
+                return
+
+            # Sanitize message text
+            started = time.perf_counter()
+            message_data["text"] = security.sanitize_input(text, 1000)
+            STAGE_LATENCY["sanitize"].observe(time.perf_counter() - started)
+
+        channel = message_data.get("channel", DEFAULT_CHANNEL)
+        if not isinstance(channel, str) or not CHANNEL_PATTERN.match(channel):
+            await reject("Invalid channel")
+            return
+
+        # Files are referenced by the hash their finished upload returned
+        if "attachment" in message_data:
+            reference = message_data["attachment"]
+            sha256 = reference.get("sha256") if isinstance(reference, dict) else None
+            attachment = attachment_store.describe(sha256) if isinstance(sha256, str) else None
+            if attachment is None:
+                await reject("Unknown attachment")
+                return
+            name = reference.get("name")
+            attachment["name"] = security.sanitize_input(name, 255) if isinstance(name, str) and name else sha256[:12]
+            message_data["attachment"] = attachment
+
+        # Update user info if provided
+        if "user_name" in message_data or "department" in message_data:
+            async with AsyncSessionLocal() as session:
+                user_name = security.sanitize_input(message_data.get("user_name", ""), 200) if "user_name" in message_data else None
+                department = security.sanitize_input(message_data.get("department", ""), 200) if "department" in message_data else None
+
+                if user_name or department:
+                    # Get current user data to avoid overwriting with None
+                    current_user = await user_service.get_user_by_id(session, user_id)
+                    if current_user:
+                        final_user_name = user_name if user_name else current_user.user_name
+                        final_department = department if department else current_user.department
+                        # Clients resend their profile with every message; only a change matters
+                        profile_changed = (final_user_name, final_department) != (current_user.user_name, current_user.department)
+                        await user_service.create_or_update_user(session, user_id, final_user_name, final_department)
+                    else:
+                        # Create new user with provided info
+                        profile_changed = True
+                        final_user_name, final_department = user_name or user_id, department or "Unknown"
+                        await user_service.create_or_update_user(session, user_id, final_user_name, final_department)
+                    await session.commit()
+                    manager.directory.upsert(user_id, final_user_name, final_department, active=False)
+                    if profile_changed:
+                        # Names and departments are part of the cached online list, and of
+                        # the sender details history embeds in every message
+                        manager.presence_version += 1
+                        manager.message_version += 1
+                        audit_log.append("profile_change", user_id,
+                                         user_name=final_user_name, department=final_department)
+
+        # Add server-side metadata
+        message_data.update({
             "timestamp": datetime.now().isoformat(),
-            "message_id": str(uuid.uuid4())
-        }
-        await manager.broadcast(json.dumps(leave_message), save_to_db=False)
+            "message_id": str(uuid.uuid4()),
+            "user_id": user_id
+        })
+
+        # A sent message ends the sender's typing indicator
+        if message_type == "message":
+            manager.typing.clear_user(user_id, channel)
+
+        # Broadcast message to all connected users (will be saved to DB in broadcast method)
+        seq = await manager.broadcast(json.dumps(message_data), exclude_user=user_id)
+
+        if claimed:
+            # The sender is left out of the broadcast; this tells it the message is stored and where
+            ack = {"type": "ack", "client_id": claimed, "message_id": message_data["message_id"], "seq": seq}
+            manager.recent_sends.complete(user_id, claimed, ack)
+            claimed = None
+            await reply(json.dumps(ack))
+    finally:
+        if claimed:
+            # Failed or dropped mid-send: a resend is processed afresh
+            manager.recent_sends.abandon(user_id, claimed)
+
+@app.websocket("/ws/{user_id}")
+async def websocket_endpoint(websocket: WebSocket, user_id: str):
+    # Validate user ID format
+    if not security.validate_user_id(user_id):
+        await websocket.close(code=4000, reason="Invalid user ID format")
+        return
+
+    # Rate limiting check
+    client_host = websocket.client.host if websocket.client else "unknown"
+    if not security.check_rate_limit(f"ws_{client_host}_{user_id}", max_requests=WS_CONNECT_RATE_LIMIT, time_window=60):
+        RATE_LIMIT_REJECTIONS["connect"].inc()
+        await websocket.close(code=4029, reason="Rate limit exceeded")
+        return
+
+    # Shutting down: send the client elsewhere instead of accepting it here
+    if manager.draining:
+        await websocket.accept()
+        await websocket.close(
+            code=RETRY_LATER_CLOSE_CODE,
+            reason=f"retry_after_ms={admission.retry_after_ms()}"
+        )
+        return
+
+    # Admission control: bound concurrent connect setup, resumptions go first
+    resume_token = websocket.query_params.get("resume")
+    priority = PRIORITY_RESUME if admission.is_resumption(user_id, resume_token) else PRIORITY_NEW
+    if not await admission.acquire(priority):
+        # Accept so the client sees the close code and the jittered retry delay
+        await websocket.accept()
+        await websocket.close(
+            code=RETRY_LATER_CLOSE_CODE,
+            reason=f"retry_after_ms={admission.retry_after_ms()}"
+        )
+        return
+
+    await start_session(websocket, user_id)
+
+    try:
+        while True:
+            await handle_frame(user_id, await websocket.receive_text(), websocket.send_text)
+    except WebSocketDisconnect:
+        await end_session(websocket, user_id)
+
+async def admit_http(request: Request, user_id: str):
+    """The WebSocket connect checks for the SSE and long-poll transports, failing with an HTTP status instead of a close code"""
+    if not security.validate_user_id(user_id):
+        raise HTTPException(status_code=400, detail="Invalid user ID format")
+
+    # Shares the WebSocket budget, so falling back between transports can't multiply it
+    client_host = request.client.host if request.client else "unknown"
+    if not security.check_rate_limit(f"ws_{client_host}_{user_id}", max_requests=WS_CONNECT_RATE_LIMIT, time_window=60):
+        RATE_LIMIT_REJECTIONS["connect"].inc()
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+    priority = PRIORITY_RESUME if admission.is_resumption(user_id, request.query_params.get("resume")) else PRIORITY_NEW
+    if manager.draining or not await admission.acquire(priority):
+        retry_after_ms = admission.retry_after_ms()
+        raise HTTPException(
+            status_code=503, detail={"retry_after_ms": retry_after_ms},
+            headers={"Retry-After": str(math.ceil(retry_after_ms / 1000))}
+        )
+
+def queued_connection(user_id: str, token: Optional[str]) -> QueuedConnection:
+    """The user's live SSE or long-poll connection named by ``token``"""
+    connection = manager.active_connections.get(user_id)
+    if not isinstance(connection, QueuedConnection) or not token \
+            or not secrets.compare_digest(connection.token.encode(), token.encode()):
+        # Reaped, drained or replaced; the client opens a new one
+        raise HTTPException(status_code=410, detail="Connection closed")
+    return connection
+
+@app.get("/events/{user_id}")
+async def event_stream(request: Request, user_id: str, connection: Optional[str] = None, after: int = 0):
+    """Server-Sent Events transport for clients whose proxies break WebSockets; sends go to POST /send.
+
+    Without ``connection`` this opens a new connection, whose token arrives in
+    the session frame. With it, a dropped stream resumes after ``after`` (or
+    the ``Last-Event-ID`` header), replaying recently written frames.
+    """
+    if connection is None:
+        await admit_http(request, user_id)
+        queued = QueuedConnection(user_id, "sse")
+        await start_session(queued, user_id)
+    else:
+        queued = queued_connection(user_id, connection)
+        last_event_id = request.headers.get("last-event-id", "")
+        if last_event_id.isdigit():
+            after = int(last_event_id)
+
+    async def events():
+        cursor = after
+        while not queued.finished(cursor):
+            frames = await queued.receive(cursor, SSE_KEEPALIVE, keep=SSE_REPLAY_FRAMES)
+            if frames:
+                cursor = frames[-1][0]
+                # Frames were encoded once by the fan-out; only the event framing is per connection
+                yield "".join(f"id: {frame_id}\ndata: {text}\n\n" for frame_id, text in frames)
+            elif not queued.closed:
+                # Comment line: keeps proxies from timing the stream out
+                yield ": keepalive\n\n"
+            if manager.active_connections.get(user_id) is queued:
+                # The stream is only running while the client is there to read it
+                manager.heartbeat.record_pong(user_id)
+        yield f"event: close\ndata: {json.dumps({'code': queued.close_code, 'reason': queued.close_reason})}\n\n"
+
+    # Buffering proxies would hold events back until the response ends
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/poll/{user_id}")
+async def long_poll(request: Request, user_id: str, connection: Optional[str] = None, after: int = 0):
+    """Long-poll transport: frames after id ``after``, waiting for some if there are none yet.
+
+    Without ``connection`` this opens a new connection and returns its first
+    frames, the session frame with the token among them. Each poll both
+    fetches and acknowledges, and counts as the client's heartbeat.
+    """
+    if connection is None:
+        await admit_http(request, user_id)
+        queued = QueuedConnection(user_id, "poll")
+        await start_session(queued, user_id)
+    else:
+        queued = queued_connection(user_id, connection)
+        manager.heartbeat.record_pong(user_id)
+
+    frames = await queued.receive(after, LONG_POLL_TIMEOUT)
+    cursor = frames[-1][0] if frames else min(after, queued.last_id)
+    closed = {"code": queued.close_code, "reason": queued.close_reason} if queued.finished(cursor) else None
+    # Frames were encoded once by the fan-out and are spliced in as they are
+    body = '{"last_id":%d,"closed":%s,"frames":[%s]}' % (cursor, json.dumps(closed), ",".join(text for _, text in frames))
+    return Response(content=body, media_type="application/json", headers={"Cache-Control": "no-store"})
+
+@app.post("/send/{user_id}")
+async def send_frame(request: Request, user_id: str, connection: Optional[str] = None):
+    """A frame from an SSE or long-poll client, handled exactly as one arriving over its WebSocket.
+
+    Replies (acks, errors) come back in the response body as a list of frames.
+    """
+    queued_connection(user_id, connection)
+    try:
+        data = (await request.body()).decode("utf-8")
+    except (ClientDisconnect, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Invalid frame")
+
+    replies = []
+
+    async def reply(frame: str):
+        replies.append(frame)
+
+    await handle_frame(user_id, data, reply)
+    return Response(content=f"[{','.join(replies)}]", media_type="application/json")
+
+@app.delete("/connections/{user_id}")
+async def close_connection(user_id: str, connection: Optional[str] = None):
+    """End an SSE or long-poll connection now, as closing a WebSocket would, instead of when the heartbeat notices"""
+    queued = queued_connection(user_id, connection)
+    await end_session(queued, user_id)
+    await queued.close(1000, "Client disconnect")
+    return Response(status_code=204)
 
 # Mount static files - adjust path for Docker working directory
-app.mount("/frontend", StaticFiles(directory="../frontend", html=True), name="static")
+static_assets = StaticAssets(directory="../frontend")
+app.mount("/frontend", static_assets, name="static")
 
 if __name__ == "__main__":
     import uvicorn
-    import os
+    from services.drain import DrainingServer
+
+    host = os.getenv("HOST", "0.0.0.0")
+    port = int(os.getenv("PORT", "8000"))
 
     # For local development with HTTPS
     ssl_keyfile = "key.pem"
     ssl_certfile = "cert.pem"
+    ssl_options = {}
 
     # Check if SSL certificates exist
     if os.path.exists(ssl_keyfile) and os.path.exists(ssl_certfile):
         print("🔒 Starting with HTTPS/TLS")
-        uvicorn.run(
-            app,
-            host="0.0.0.0",
-            port=8000,
-            ssl_keyfile=ssl_keyfile,
-            ssl_certfile=ssl_certfile
-        )
+        ssl_options = {"ssl_keyfile": ssl_keyfile, "ssl_certfile": ssl_certfile}
     else:
         print("⚠️  Starting without HTTPS")
-        uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+
+    # Drain WebSockets on SIGINT/SIGTERM before uvicorn closes them all at once
+    config = uvicorn.Config(app, host=host, port=port, **ssl_options)
+    DrainingServer(config, drain=manager.drain).run()
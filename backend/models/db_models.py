@@ -1,7 +1,8 @@
-from sqlalchemy import Column, Integer, String, DateTime, Text, Boolean, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, Boolean, ForeignKey, Index
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from config.database import Base
+from security.encryption import EncryptedText
 import uuid
 
 class User(Base):
@@ -12,7 +13,8 @@ class User(Base):
     user_id = Column(String(100), unique=True, index=True, nullable=False)
     user_name = Column(String(200), nullable=False)
     department = Column(String(200), nullable=False)
-    bio = Column(Text, nullable=True)
+    # Encrypted at rest when FIELD_ENCRYPTION_KEYS is set, like message text
+    bio = Column(EncryptedText("users.bio"), nullable=True)
     is_active = Column(Boolean, default=True, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     last_seen = Column(DateTime(timezone=True), nullable=True)
@@ -29,8 +31,12 @@ class Message(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     message_id = Column(String(36), unique=True, index=True, nullable=False)
-    text = Column(Text, nullable=False)
+    text = Column(EncryptedText("messages.text"), nullable=False)
     message_type = Column(String(50), default="message", nullable=False)
+    channel = Column(String(64), default="general", server_default="general", nullable=False)
+    # Content hash of an attached file in the attachment store, and the name it was shared under
+    attachment_sha256 = Column(String(64), nullable=True, index=True)
+    attachment_name = Column(String(255), nullable=True)
 
     # Foreign key to user
     user_id = Column(String(100), ForeignKey("users.user_id"), nullable=False)
@@ -41,13 +47,18 @@ class Message(Base):
     # Relationship to user
     user = relationship("User", back_populates="messages")
 
+    # The id doubles as the message sequence number read cursors point at
+    __table_args__ = (Index("ix_messages_channel_id", "channel", "id"),)
+
     def __repr__(self):
         return f"<Message(message_id='{self.message_id}', user_id='{self.user_id}', type='{self.message_type}')>"
 
     def to_dict(self):
         """Convert message to dictionary for WebSocket transmission"""
-        return {
+        message = {
             "message_id": self.message_id,
+            "seq": self.id,
+            "channel": self.channel,
             "text": self.text,
             "type": self.message_type,
             "user_id": self.user_id,
@@ -56,6 +67,9 @@ class Message(Base):
             "bio": self.user.bio if self.user else None,
             "timestamp": self.created_at.isoformat()
         }
+        if self.attachment_sha256:
+            message["attachment"] = {"sha256": self.attachment_sha256, "name": self.attachment_name}
+        return message
 
 class UserSession(Base):
     """Database model for tracking active user sessions"""
@@ -72,4 +86,17 @@ class UserSession(Base):
     user = relationship("User")
 
     def __repr__(self):
-        return f"<UserSession(user_id='{self.user_id}', connection_id='{self.connection_id}', active={self.is_active})>"
\ No newline at end of file
+        return f"<UserSession(user_id='{self.user_id}', connection_id='{self.connection_id}', active={self.is_active})>"
+
+class ReadCursor(Base):
+    """Database model for how far a user has read in a channel"""
+    __tablename__ = "read_cursors"
+
+    user_id = Column(String(100), ForeignKey("users.user_id"), primary_key=True)
+    channel = Column(String(64), primary_key=True)
+    # Highest message id (sequence number) the user has read in the channel
+    last_read_seq = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<ReadCursor(user_id='{self.user_id}', channel='{self.channel}', last_read_seq={self.last_read_seq})>"
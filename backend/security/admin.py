@@ -0,0 +1,15 @@
+import hmac
+import os
+
+from fastapi import Header, HTTPException
+
+# Admin endpoints are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+def require_admin(x_admin_token: str = Header(None)):
+    """FastAPI dependency guarding admin/diagnostic endpoints with the X-Admin-Token header"""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="Admin API disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
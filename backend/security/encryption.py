@@ -0,0 +1,295 @@
+import argparse
+import asyncio
+import base64
+import binascii
+import importlib.util
+import logging
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from sqlalchemy.types import Text, TypeDecorator
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Key-encryption keys as comma-separated "id:base64 key" pairs; the first wraps new data keys,
+# the rest stay listed to read what they wrapped. Unset stores fields in plaintext (development).
+FIELD_ENCRYPTION_KEYS = os.getenv("FIELD_ENCRYPTION_KEYS", "")
+# A fresh data key is generated after this many encryptions or seconds
+DATA_KEY_MAX_USES = int(os.getenv("DATA_KEY_MAX_USES", "100000"))
+DATA_KEY_TTL = float(os.getenv("DATA_KEY_TTL", "86400"))
+# Unwrapped data keys kept in memory
+DATA_KEY_CACHE_SIZE = int(os.getenv("DATA_KEY_CACHE_SIZE", "1024"))
+
+# Optional: only imported when keys are configured
+CRYPTOGRAPHY_AVAILABLE = importlib.util.find_spec("cryptography") is not None
+
+# enc1:<key id>:<base64 nonce + wrapped data key>:<base64 nonce + ciphertext>
+PREFIX = "enc1:"
+# Stored in front of plaintext that starts with either prefix, so no written value looks encrypted
+PLAIN_PREFIX = "enc0:"
+KEY_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,32}$")
+NONCE_BYTES = 12
+
+DATA_KEYS_CREATED = metrics.counter("medchat_field_data_keys_created_total", "Data keys generated and wrapped")
+DATA_KEY_UNWRAPS = metrics.counter(
+    "medchat_field_data_key_unwraps_total", "Stored data keys unwrapped on a cache miss"
+)
+
+
+class FieldEncryptionError(Exception):
+    """An encrypted field could not be decrypted: unknown key, or altered ciphertext"""
+
+
+def parse_keys(spec: str) -> Dict[str, bytes]:
+    """``"id:base64key,..."`` -> {id: 32-byte key}, in the order given"""
+    keys: Dict[str, bytes] = {}
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        key_id, _, encoded = entry.partition(":")
+        try:
+            key = base64.b64decode(encoded, validate=True)
+        except binascii.Error:
+            key = b""
+        if not KEY_ID_PATTERN.match(key_id) or len(key) != 32:
+            raise ValueError(f"Invalid field encryption key {key_id!r}: expected id:<base64 of 32 bytes>")
+        keys[key_id] = key
+    return keys
+
+
+def generate_key() -> str:
+    return base64.b64encode(secrets.token_bytes(32)).decode("ascii")
+
+
+def _b64(data: bytes) -> str:
+    return base64.b64encode(data).decode("ascii")
+
+
+class _DataKey:
+    __slots__ = ("header", "aead", "created", "uses")
+
+    def __init__(self, header: str, aead):
+        self.header = header
+        self.aead = aead
+        self.created = time.monotonic()
+        self.uses = 0
+
+
+class FieldCipher:
+    """Envelope encryption for text columns.
+
+    Values are encrypted with AES-256-GCM under a random data key, which is
+    itself wrapped by the first configured key-encryption key and stored in
+    front of every ciphertext. The current data key is replaced after
+    ``max_uses`` encryptions or ``ttl`` seconds; unwrapped data keys are
+    cached, so reading rows costs one AES-GCM decryption each and an unwrap
+    only per data key. The column name is bound in as associated data, so a
+    ciphertext copied into another column fails to decrypt. Values without
+    the ``enc1:`` prefix are returned as stored, which keeps rows written
+    before encryption was turned on readable; plaintext written while it is
+    off is marked with ``enc0:`` when it starts with either prefix.
+    """
+
+    def __init__(
+        self,
+        keys: str = FIELD_ENCRYPTION_KEYS,
+        max_uses: int = DATA_KEY_MAX_USES,
+        ttl: float = DATA_KEY_TTL,
+        cache_size: int = DATA_KEY_CACHE_SIZE
+    ):
+        self.keks = parse_keys(keys)
+        self.enabled = bool(self.keks)
+        self.max_uses = max_uses
+        self.ttl = ttl
+        self.cache_size = cache_size
+        self._current: Optional[_DataKey] = None
+        # Data key header -> AESGCM, least recently used first
+        self._cache: "OrderedDict[str, object]" = OrderedDict()
+        # Encryption and decryption run on the event loop and in export worker threads
+        self._lock = threading.Lock()
+        self._aesgcm = None
+
+        if self.enabled:
+            if not CRYPTOGRAPHY_AVAILABLE:
+                raise RuntimeError("FIELD_ENCRYPTION_KEYS is set but the cryptography package is not installed")
+            from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+            from cryptography.exceptions import InvalidTag
+            self._aesgcm = AESGCM
+            self._invalid_tag = InvalidTag
+        elif os.getenv("ENVIRONMENT") == "production":
+            logger.warning("FIELD_ENCRYPTION_KEYS is not set; message text and bios are stored in plaintext")
+
+    def _data_key(self) -> _DataKey:
+        with self._lock:
+            current = self._current
+            if current is None or current.uses >= self.max_uses or time.monotonic() - current.created > self.ttl:
+                key_id, kek = next(iter(self.keks.items()))
+                data_key = self._aesgcm.generate_key(bit_length=256)
+                nonce = os.urandom(NONCE_BYTES)
+                wrapped = nonce + self._aesgcm(kek).encrypt(nonce, data_key, key_id.encode("ascii"))
+                current = _DataKey(f"{PREFIX}{key_id}:{_b64(wrapped)}:", self._aesgcm(data_key))
+                self._current = current
+                self._remember(current.header, current.aead)
+                DATA_KEYS_CREATED.inc()
+            current.uses += 1
+            return current
+
+    def _remember(self, header: str, aead):
+        self._cache[header] = aead
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _unwrap(self, header: str):
+        """The cipher for a data key header, unwrapping it on a cache miss"""
+        with self._lock:
+            aead = self._cache.get(header)
+            if aead is not None:
+                self._cache.move_to_end(header)
+                return aead
+        key_id, _, wrapped_text = header[len(PREFIX):-1].partition(":")
+        kek = self.keks.get(key_id)
+        if kek is None:
+            raise FieldEncryptionError(f"Field encrypted under unknown key {key_id!r}")
+        wrapped = base64.b64decode(wrapped_text)
+        try:
+            data_key = self._aesgcm(kek).decrypt(wrapped[:NONCE_BYTES], wrapped[NONCE_BYTES:], key_id.encode("ascii"))
+        except self._invalid_tag:
+            raise FieldEncryptionError(f"Data key wrapped under {key_id!r} failed authentication") from None
+        aead = self._aesgcm(data_key)
+        DATA_KEY_UNWRAPS.inc()
+        with self._lock:
+            self._remember(header, aead)
+        return aead
+
+    def encrypt(self, value: Optional[str], field: str) -> Optional[str]:
+        if value is None:
+            return value
+        if not self.enabled:
+            return PLAIN_PREFIX + value if value.startswith((PREFIX, PLAIN_PREFIX)) else value
+        data_key = self._data_key()
+        nonce = os.urandom(NONCE_BYTES)
+        sealed = data_key.aead.encrypt(nonce, value.encode("utf-8"), field.encode("ascii"))
+        return data_key.header + _b64(nonce + sealed)
+
+    def decrypt(self, value: Optional[str], field: str) -> Optional[str]:
+        if value is None:
+            return value
+        if value.startswith(PLAIN_PREFIX):
+            return value[len(PLAIN_PREFIX):]
+        if not value.startswith(PREFIX):
+            return value
+        split = value.rfind(":")
+        if value.count(":", len(PREFIX), split) != 1:
+            # Plaintext that happens to start with the prefix
+            return value
+        try:
+            payload = binascii.a2b_base64(value[split + 1:], strict_mode=True)
+        except binascii.Error:
+            return value
+        if len(payload) <= NONCE_BYTES:
+            return value
+        if not self.enabled:
+            raise FieldEncryptionError("Encrypted field found but FIELD_ENCRYPTION_KEYS is not set")
+
+        # Only the header up to the last colon identifies the data key; it is decoded on a cache miss only
+        aead = self._unwrap(value[:split + 1])
+        try:
+            return aead.decrypt(payload[:NONCE_BYTES], payload[NONCE_BYTES:], field.encode("ascii")).decode("utf-8")
+        except self._invalid_tag:
+            raise FieldEncryptionError(f"Encrypted {field} failed authentication") from None
+
+    def get_stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "active_key": next(iter(self.keks), None),
+            "cached_data_keys": len(self._cache),
+        }
+
+
+class EncryptedText(TypeDecorator):
+    """Text column stored through the process-wide field cipher; ``field`` is bound into each ciphertext.
+
+    Ciphertexts are randomized, so the column can't be compared or searched in SQL.
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, field: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.field = field
+
+    def process_bind_param(self, value, dialect):
+        return field_cipher.encrypt(value, self.field)
+
+    def process_result_value(self, value, dialect):
+        try:
+            return field_cipher.decrypt(value, self.field)
+        except FieldEncryptionError as error:
+            # One unreadable row must not fail every query that loads it
+            logger.error("Returning %s as stored: %s", self.field, error)
+            return value
+
+
+# Process-wide cipher, configured from FIELD_ENCRYPTION_KEYS
+field_cipher = FieldCipher()
+
+
+async def encrypt_existing(session_factory, batch_size: int = 500) -> Dict[str, int]:
+    """Encrypt rows written before encryption was enabled, in id-ordered batches"""
+    from sqlalchemy import bindparam, select, type_coerce, update
+    from models.db_models import Message, User
+
+    if not field_cipher.enabled:
+        raise RuntimeError("Set FIELD_ENCRYPTION_KEYS before encrypting existing rows")
+    counts = {}
+    for model, column in ((Message, Message.text), (User, User.bio)):
+        # The raw stored value, bypassing decryption, so the prefix test runs in SQL
+        raw = type_coerce(column, Text)
+        updated, last_id = 0, 0
+        while True:
+            async with session_factory() as db:
+                result = await db.execute(
+                    select(model.id, raw)
+                    .where(model.id > last_id, raw.is_not(None), ~raw.startswith(PREFIX))
+                    .order_by(model.id).limit(batch_size)
+                )
+                rows = result.all()
+                if not rows:
+                    break
+                await db.execute(
+                    update(model.__table__).where(model.__table__.c.id == bindparam("row_id"))
+                    .values({column.key: bindparam("value")}),
+                    # Plaintext marked with PLAIN_PREFIX is unmarked before it is encrypted
+                    [
+                        {"row_id": row_id, "value": field_cipher.decrypt(value, column.type.field)}
+                        for row_id, value in rows
+                    ]
+                )
+                await db.commit()
+            updated += len(rows)
+            last_id = rows[-1][0]
+        counts[f"{model.__tablename__}.{column.key}"] = updated
+    return counts
+
+
+if __name__ == "__main__":
+    #   python -m security.encryption generate-key            # value for FIELD_ENCRYPTION_KEYS=<id>:<key>
+    #   python -m security.encryption encrypt-existing        # after enabling, encrypt older rows
+    parser = argparse.ArgumentParser(description="Field encryption keys and backfill")
+    parser.add_argument("command", choices=("generate-key", "encrypt-existing"))
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args()
+
+    if args.command == "generate-key":
+        print(generate_key())
+    else:
+        from config.database import AsyncSessionLocal
+
+        logging.basicConfig(level=logging.INFO)
+        print(asyncio.run(encrypt_existing(AsyncSessionLocal, args.batch_size)))
@@ -1,23 +1,94 @@
-from starlette.middleware.base import BaseHTTPMiddleware
-from starlette.responses import Response
-
-class SecurityHeadersMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request, call_next):
-        response = await call_next(request)
-
-        # Security headers
-        response.headers["X-Content-Type-Options"] = "nosniff"
-        response.headers["X-Frame-Options"] = "DENY"
-        response.headers["X-XSS-Protection"] = "1; mode=block"
-        response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
-        # Allow WebSocket and HTTPS connections to same-origin
-        response.headers["Content-Security-Policy"] = (
-            "default-src 'self'; "
-            "script-src 'self' 'unsafe-inline'; "
-            "style-src 'self' 'unsafe-inline'; "
-            "img-src 'self' data:; "
-            "connect-src 'self' wss: https:"
-        )
-        response.headers["Referrer-Policy"] = "strict-origin-when-cross-origin"
-
-        return response
\ No newline at end of file
+from typing import Dict, List, Optional, Sequence, Tuple
+
+# Security headers sent on every HTTP response
+SECURITY_HEADERS: Dict[str, str] = {
+    "X-Content-Type-Options": "nosniff",
+    "X-Frame-Options": "DENY",
+    "X-XSS-Protection": "1; mode=block",
+    "Strict-Transport-Security": "max-age=31536000; includeSubDomains",
+    # Allow WebSocket and HTTPS connections to same-origin
+    "Content-Security-Policy": (
+        "default-src 'self'; "
+        "script-src 'self' 'unsafe-inline'; "
+        "style-src 'self' 'unsafe-inline'; "
+        "img-src 'self' data:; "
+        "connect-src 'self' wss: https:"
+    ),
+    "Referrer-Policy": "strict-origin-when-cross-origin",
+}
+
+# Path prefix -> header overrides; None removes a header for that prefix
+DEFAULT_PATH_POLICIES: Sequence[Tuple[str, Dict[str, Optional[str]]]] = (
+    ("/admin", {"Cache-Control": "no-store"}),
+    ("/metrics", {"Cache-Control": "no-store"}),
+)
+
+# HSTS on plain-http localhost would pin the dev browser to https for a year
+LOCAL_HOSTS = frozenset({b"localhost", b"127.0.0.1", b"[::1]"})
+
+Headers = List[Tuple[bytes, bytes]]
+# Encoded headers plus the set of their names, for replacing same-named endpoint headers
+HeaderBlock = Tuple[Headers, frozenset]
+
+_NO_HEADERS: HeaderBlock = ([], frozenset())
+
+
+def _encode(headers: Dict[str, Optional[str]]) -> HeaderBlock:
+    encoded = [
+        (name.lower().encode("latin-1"), value.encode("latin-1"))
+        for name, value in headers.items() if value is not None
+    ]
+    return encoded, frozenset(name for name, _ in encoded)
+
+
+def _request_host(scope) -> bytes:
+    for name, value in scope["headers"]:
+        if name == b"host":
+            # Strip the port, keeping bracketed IPv6 literals intact
+            if value.startswith(b"["):
+                return value.split(b"]", 1)[0] + b"]"
+            return value.split(b":", 1)[0]
+    return b""
+
+
+class SecurityHeadersMiddleware:
+    """Pure ASGI middleware that adds security headers at ``http.response.start``.
+
+    Header blocks are encoded once per (path policy, local/remote) pair at
+    startup, so a request only picks a list and merges it into the response
+    headers; no extra task or stream wraps the response.
+    """
+
+    def __init__(self, app, headers: Dict[str, str] = None,
+                 path_policies: Sequence[Tuple[str, Dict[str, Optional[str]]]] = DEFAULT_PATH_POLICIES):
+        self.app = app
+        base = dict(SECURITY_HEADERS if headers is None else headers)
+        self._policies: List[Tuple[str, HeaderBlock, HeaderBlock]] = []
+        for prefix, overrides in list(path_policies) + [("", {})]:
+            merged = {**base, **overrides}
+            local = {name: value for name, value in merged.items() if name != "Strict-Transport-Security"}
+            self._policies.append((prefix, _encode(merged), _encode(local)))
+
+    def _headers_for(self, scope) -> HeaderBlock:
+        path = scope["path"]
+        for prefix, remote_block, local_block in self._policies:
+            if path.startswith(prefix):
+                return local_block if _request_host(scope) in LOCAL_HOSTS else remote_block
+        return _NO_HEADERS
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        extra, names = self._headers_for(scope)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                # Ours replace any header of the same name set by the endpoint
+                message["headers"] = [
+                    (name, value) for name, value in message.get("headers", ()) if name.lower() not in names
+                ] + extra
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
@@ -2,19 +2,42 @@ import re
 import hashlib
 import secrets
 import html
+import functools
+import importlib.util
 from datetime import datetime
 from typing import Dict
 
-# Optional security imports
-try:
-    import bleach
-    BLEACH_AVAILABLE = True
-except ImportError:
-    BLEACH_AVAILABLE = False
+# Optional security imports; bleach (and its vendored html5lib) is imported on
+# first use, since most chat text never needs it and it slows down cold starts
+BLEACH_AVAILABLE = importlib.util.find_spec("bleach") is not None
+_bleach = None
+
+def load_bleach():
+    """Import bleach now (e.g. from a startup warm-up thread) rather than on the first message"""
+    global _bleach
+    if _bleach is None and BLEACH_AVAILABLE:
+        import bleach
+        _bleach = bleach
+    return _bleach
 
 # Rate limiting storage (in production, use Redis)
 rate_limit_storage: Dict[str, list] = {}
 
+# The only characters bleach.clean changes in text with no tags: &, <, > and the
+# C0 controls other than tab and newline (found by running every code point
+# through it). Text without them comes back from bleach unchanged.
+_BLEACH_SIGNIFICANT = re.compile(r"[\x00-\x08\x0b-\x1f&<>]")
+
+# Short strings (names, departments, "ok", "thanks") repeat a lot; cache those only
+SANITIZE_CACHE_MAX_LENGTH = 64
+
+def _sanitize(text: str) -> str:
+    if BLEACH_AVAILABLE and _BLEACH_SIGNIFICANT.search(text):
+        text = (_bleach or load_bleach()).clean(text, tags=[], strip=True)
+    return html.escape(text).strip()
+
+_sanitize_cached = functools.lru_cache(maxsize=4096)(_sanitize)
+
 class SecurityUtils:
     @staticmethod
     def sanitize_input(text: str, max_length: int = 1000) -> str:
@@ -25,13 +48,11 @@ class SecurityUtils:
         # Limit length
         text = text[:max_length]
 
-        # Remove HTML tags and escape special characters
-        if BLEACH_AVAILABLE:
-            text = bleach.clean(text, tags=[], strip=True)
-
-        text = html.escape(text)
-
-        return text.strip()
+        # Remove HTML tags and escape special characters; the parser only runs
+        # when the text contains something it would change
+        if len(text) <= SANITIZE_CACHE_MAX_LENGTH:
+            return _sanitize_cached(text)
+        return _sanitize(text)
 
     @staticmethod
     def validate_user_id(user_id: str) -> bool:
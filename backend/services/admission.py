@@ -0,0 +1,121 @@
+import asyncio
+import heapq
+import hashlib
+import hmac
+import itertools
+import os
+import random
+import secrets
+import time
+from typing import List, Tuple
+
+from services import metrics
+
+# Close code sent when the server is too busy; the reason carries the retry delay
+RETRY_LATER_CLOSE_CODE = 1013
+
+# Priorities: lower is served first
+PRIORITY_RESUME = 0
+PRIORITY_NEW = 1
+
+ADMITTED = metrics.counter("medchat_admission_admitted_total", "WebSocket connections admitted")
+REJECTED = metrics.counter("medchat_admission_rejected_total", "WebSocket connections told to retry later")
+QUEUE_WAIT = metrics.histogram("medchat_admission_queue_wait_seconds", "Time spent waiting for an admission slot")
+
+
+class AdmissionController:
+    """Concurrency-limited accept queue for WebSocket connects.
+
+    Only ``max_concurrent`` connects run their setup (accept, user upsert,
+    session bookkeeping) at once. Further connects wait in a priority queue
+    where resumptions go first; when the queue is full or the wait times out
+    the client is told to retry after a jittered delay.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 20,
+        max_queue: int = 200,
+        queue_timeout: float = 5.0,
+        retry_base: float = 1.0,
+        retry_cap: float = 30.0,
+        secret: str = None
+    ):
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_base = retry_base
+        self.retry_cap = retry_cap
+        # Without a configured secret, resume tokens are only valid for this process
+        self._secret = (secret or os.getenv("SECRET_KEY") or secrets.token_hex(32)).encode("utf-8")
+
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+
+    def issue_resume_token(self, user_id: str) -> str:
+        """Token proving this user was admitted before; presented on reconnect"""
+        return hmac.new(self._secret, user_id.encode("utf-8"), hashlib.sha256).hexdigest()[:32]
+
+    def is_resumption(self, user_id: str, token: str) -> bool:
+        if not token:
+            return False
+        return hmac.compare_digest(self.issue_resume_token(user_id), token)
+
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    async def acquire(self, priority: int = PRIORITY_NEW) -> bool:
+        """Wait for an admission slot; returns False if the client should retry later"""
+        if self._active < self.max_concurrent and self.queue_depth() == 0:
+            # Only timed-out waiters (if any) are left in the heap
+            self._waiters.clear()
+            self._active += 1
+            ADMITTED.inc()
+            return True
+
+        if self.queue_depth() >= self.max_queue:
+            REJECTED.inc()
+            return False
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(future, timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            if not (future.done() and not future.cancelled()):
+                REJECTED.inc()
+                return False
+            # The slot was handed over just as the wait timed out; keep it
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Don't leak a slot that was handed over to a cancelled connect
+                self.release()
+            raise
+        QUEUE_WAIT.observe(time.monotonic() - started)
+        ADMITTED.inc()
+        return True
+
+    def release(self):
+        """Hand the slot to the highest-priority waiter, or free it"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(True)
+                return
+        self._active -= 1
+
+    def retry_after_ms(self) -> int:
+        """Jittered retry delay that grows with the backlog"""
+        backlog = 1 + self.queue_depth() / max(1, self.max_concurrent)
+        ceiling = min(self.retry_cap, self.retry_base * backlog * 2)
+        return int(random.uniform(self.retry_base, max(self.retry_base, ceiling)) * 1000)
+
+    def get_stats(self) -> dict:
+        return {
+            "active": self._active,
+            "queued": self.queue_depth(),
+            "admitted_total": ADMITTED.value,
+            "rejected_total": REJECTED.value,
+        }
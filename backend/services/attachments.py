@@ -0,0 +1,458 @@
+import asyncio
+import hashlib
+import json
+import logging
+import mmap
+import os
+import re
+import secrets
+import shutil
+import time
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Optional, Tuple
+
+from starlette.responses import Response
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Uploads are assembled under uploads/ and stored by content hash under objects/;
+# production needs this on a persistent volume
+ATTACHMENT_DIR = os.getenv("ATTACHMENT_DIR", "./attachments")
+ATTACHMENT_MAX_BYTES = int(os.getenv("ATTACHMENT_MAX_BYTES", str(25 * 1024 * 1024)))
+# Unfinished uploads without a chunk for this long are removed
+ATTACHMENT_UPLOAD_TTL = float(os.getenv("ATTACHMENT_UPLOAD_TTL", str(24 * 3600)))
+# Disk space left free when accepting an upload
+ATTACHMENT_MIN_FREE_BYTES = int(os.getenv("ATTACHMENT_MIN_FREE_BYTES", str(256 * 1024 * 1024)))
+
+# Received bytes buffered per upload before they are hashed and written in a worker thread
+WRITE_BUFFER_BYTES = 256 * 1024
+# Suggested client chunk, and the slice size for downloads without zero-copy send
+CHUNK_BYTES = 4 * 1024 * 1024
+READ_BYTES = 256 * 1024
+
+SHA256_PATTERN = re.compile(r"^[0-9a-f]{64}$")
+UPLOAD_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{22}$")
+
+# Leading bytes -> content type; wound photos and documents only, anything else is refused
+SIGNATURES = (
+    (0, b"\xff\xd8\xff", "image/jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "image/png"),
+    (0, b"GIF87a", "image/gif"),
+    (0, b"GIF89a", "image/gif"),
+    (8, b"WEBP", "image/webp"),
+    (4, b"ftypheic", "image/heic"),
+    (4, b"ftypmif1", "image/heic"),
+    (0, b"%PDF-", "application/pdf"),
+)
+# Not on every platform (e.g. Windows)
+_MADV_SEQUENTIAL = getattr(mmap, "MADV_SEQUENTIAL", None)
+_MADV_DONTNEED = getattr(mmap, "MADV_DONTNEED", None)
+
+# Shown in the page; everything else downloads
+INLINE_TYPES = frozenset({"image/jpeg", "image/png", "image/gif", "image/webp"})
+
+UPLOAD_RESULTS = {
+    result: metrics.counter(
+        "medchat_attachment_uploads_total", "Finished attachment uploads by outcome", labels={"result": result}
+    )
+    for result in ("stored", "deduplicated", "rejected")
+}
+BYTES_RECEIVED = metrics.counter("medchat_attachment_bytes_received_total", "Attachment bytes received")
+BYTES_SENT = metrics.counter("medchat_attachment_bytes_sent_total", "Attachment bytes sent")
+
+
+class AttachmentError(Exception):
+    """Upload or download refused; ``status_code`` is the HTTP status to answer with"""
+
+    def __init__(self, status_code: int, detail: str, headers: Dict[str, str] = None):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.headers = headers
+
+
+def sniff(head: bytes) -> Optional[str]:
+    for position, signature, content_type in SIGNATURES:
+        if head[position:position + len(signature)] == signature:
+            return content_type
+    return None
+
+
+class Upload:
+    """An upload in progress: its part file, declared size and running hash"""
+
+    __slots__ = ("upload_id", "user_id", "size", "offset", "hasher", "updated", "lock")
+
+    def __init__(self, upload_id: str, user_id: str, size: int, offset: int = 0, hasher=None):
+        self.upload_id = upload_id
+        self.user_id = user_id
+        self.size = size
+        self.offset = offset
+        self.hasher = hasher or hashlib.sha256()
+        self.updated = time.time()
+        self.lock = asyncio.Lock()
+
+    def to_dict(self) -> dict:
+        return {"upload_id": self.upload_id, "offset": self.offset, "size": self.size, "chunk_size": CHUNK_BYTES}
+
+
+class AttachmentStore:
+    """Resumable chunked uploads into a SHA-256 content-addressed file store.
+
+    A client creates an upload with its size, then sends the bytes in any
+    number of PATCH requests, each starting at the current offset; after a
+    dropped connection it asks for the offset and carries on. Request bodies
+    are streamed: at most ``WRITE_BUFFER_BYTES`` per upload are held in
+    memory, and hashing and writing happen in a worker thread. The finished
+    file is typed by its leading bytes and moved to ``objects/<sha256>``,
+    so identical files are stored once.
+    """
+
+    def __init__(self, root: str = ATTACHMENT_DIR, max_bytes: int = ATTACHMENT_MAX_BYTES,
+                 upload_ttl: float = ATTACHMENT_UPLOAD_TTL, min_free_bytes: int = ATTACHMENT_MIN_FREE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.upload_ttl = upload_ttl
+        self.min_free_bytes = min_free_bytes
+        self.uploads_dir = os.path.join(root, "uploads")
+        self.objects_dir = os.path.join(root, "objects")
+        self._uploads: Dict[str, Upload] = {}
+        # sha256 -> (size, content type) of stored objects
+        self._described: "OrderedDict[str, Tuple[int, str]]" = OrderedDict()
+        self._task: Optional[asyncio.Task] = None
+
+    def _ensure_dirs(self):
+        os.makedirs(self.uploads_dir, exist_ok=True)
+        os.makedirs(self.objects_dir, exist_ok=True)
+
+    def _part_path(self, upload_id: str) -> str:
+        return os.path.join(self.uploads_dir, f"{upload_id}.part")
+
+    def _meta_path(self, upload_id: str) -> str:
+        return os.path.join(self.uploads_dir, f"{upload_id}.json")
+
+    def object_path(self, sha256: str) -> str:
+        return os.path.join(self.objects_dir, sha256[:2], sha256)
+
+    async def create_upload(self, user_id: str, size: int) -> Upload:
+        if not isinstance(size, int) or isinstance(size, bool) or size <= 0:
+            raise AttachmentError(400, "Upload size must be a positive number of bytes")
+        if size > self.max_bytes:
+            raise AttachmentError(413, f"Attachments are limited to {self.max_bytes} bytes")
+
+        upload = Upload(secrets.token_urlsafe(16), user_id, size)
+
+        def prepare():
+            self._ensure_dirs()
+            if shutil.disk_usage(self.root).free < size + self.min_free_bytes:
+                raise AttachmentError(507, "Not enough storage for this attachment")
+            open(self._part_path(upload.upload_id), "wb").close()
+            with open(self._meta_path(upload.upload_id), "w") as meta:
+                json.dump({"user_id": user_id, "size": size}, meta)
+
+        await asyncio.to_thread(prepare)
+        self._uploads[upload.upload_id] = upload
+        return upload
+
+    async def get_upload(self, upload_id: str, user_id: str) -> Upload:
+        """An upload owned by ``user_id``, restored from disk after a restart"""
+        upload = self._uploads.get(upload_id)
+        if upload is None and UPLOAD_ID_PATTERN.match(upload_id):
+            upload = await asyncio.to_thread(self._restore, upload_id)
+            if upload is not None:
+                upload = self._uploads.setdefault(upload_id, upload)
+        if upload is None or upload.user_id != user_id:
+            raise AttachmentError(404, "Upload not found")
+        return upload
+
+    def _restore(self, upload_id: str) -> Optional[Upload]:
+        try:
+            with open(self._meta_path(upload_id)) as meta:
+                info = json.load(meta)
+            # The running hash is not persisted, so rehash what was received
+            hasher = hashlib.sha256()
+            with open(self._part_path(upload_id), "rb") as part:
+                while True:
+                    block = part.read(CHUNK_BYTES)
+                    if not block:
+                        break
+                    hasher.update(block)
+                offset = part.tell()
+        except (OSError, ValueError):
+            return None
+        return Upload(upload_id, info["user_id"], info["size"], offset, hasher)
+
+    @staticmethod
+    def _write(path: str, hasher, data: bytes):
+        # hashlib releases the GIL for large buffers, so this stays off the event loop
+        hasher.update(data)
+        with open(path, "ab") as part:
+            part.write(data)
+
+    async def append(self, upload: Upload, offset: int, chunks: AsyncIterator[bytes]) -> Optional[dict]:
+        """Stream a chunk of the upload to disk.
+
+        ``offset`` must equal the bytes received so far. Returns the stored
+        attachment once the last byte arrived, otherwise None. If the client
+        disconnects mid-chunk, whatever arrived is kept for it to resume from.
+        """
+        if upload.lock.locked():
+            raise AttachmentError(409, "Another chunk of this upload is in progress",
+                                 {"Upload-Offset": str(upload.offset)})
+        async with upload.lock:
+            if offset != upload.offset:
+                raise AttachmentError(409, "Offset does not match the bytes received",
+                                     {"Upload-Offset": str(upload.offset)})
+
+            path = self._part_path(upload.upload_id)
+            start_offset, start_hasher = upload.offset, upload.hasher.copy()
+            buffer = bytearray()
+            try:
+                try:
+                    async for chunk in chunks:
+                        if upload.offset + len(buffer) + len(chunk) > upload.size:
+                            raise AttachmentError(413, "More bytes than the declared upload size")
+                        buffer += chunk
+                        if len(buffer) >= WRITE_BUFFER_BYTES:
+                            await self._flush(upload, path, buffer)
+                finally:
+                    # Also on a disconnect, so the client can resume after what arrived
+                    if buffer and upload.offset + len(buffer) <= upload.size:
+                        await self._flush(upload, path, buffer)
+            except AttachmentError:
+                await asyncio.to_thread(os.truncate, path, start_offset)
+                upload.offset, upload.hasher = start_offset, start_hasher
+                raise
+            upload.updated = time.time()
+
+            if upload.offset < upload.size:
+                return None
+            return await self._finish(upload)
+
+    async def _flush(self, upload: Upload, path: str, buffer: bytearray):
+        data = bytes(buffer)
+        buffer.clear()
+        await asyncio.to_thread(self._write, path, upload.hasher, data)
+        upload.offset += len(data)
+        BYTES_RECEIVED.inc(len(data))
+
+    async def _finish(self, upload: Upload) -> dict:
+        sha256 = upload.hasher.hexdigest()
+        part_path = self._part_path(upload.upload_id)
+
+        def store():
+            with open(part_path, "rb") as part:
+                content_type = sniff(part.read(16))
+            if content_type is None:
+                return None, False
+            target = self.object_path(sha256)
+            if os.path.exists(target):
+                os.remove(part_path)
+                return content_type, True
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(part_path, target)
+            return content_type, False
+
+        try:
+            content_type, duplicate = await asyncio.to_thread(store)
+        finally:
+            self._uploads.pop(upload.upload_id, None)
+            await asyncio.to_thread(self._discard, upload.upload_id)
+
+        if content_type is None:
+            UPLOAD_RESULTS["rejected"].inc()
+            raise AttachmentError(415, "Only JPEG, PNG, GIF, WebP, HEIC images and PDF documents can be attached")
+        UPLOAD_RESULTS["deduplicated" if duplicate else "stored"].inc()
+        self._remember(sha256, upload.size, content_type)
+        return {"sha256": sha256, "size": upload.size, "content_type": content_type, "deduplicated": duplicate}
+
+    def _discard(self, upload_id: str):
+        for path in (self._part_path(upload_id), self._meta_path(upload_id)):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    async def abort(self, upload: Upload):
+        async with upload.lock:
+            self._uploads.pop(upload.upload_id, None)
+            await asyncio.to_thread(self._discard, upload.upload_id)
+
+    def _remember(self, sha256: str, size: int, content_type: str):
+        self._described[sha256] = (size, content_type)
+        self._described.move_to_end(sha256)
+        while len(self._described) > 4096:
+            self._described.popitem(last=False)
+
+    def describe(self, sha256: str) -> Optional[dict]:
+        """Size and content type of a stored attachment, or None if there is none"""
+        if not SHA256_PATTERN.match(sha256):
+            return None
+        described = self._described.get(sha256)
+        if described is None:
+            try:
+                with open(self.object_path(sha256), "rb") as stored:
+                    content_type = sniff(stored.read(16))
+                    size = os.fstat(stored.fileno()).st_size
+            except OSError:
+                return None
+            self._remember(sha256, size, content_type)
+            described = (size, content_type)
+        return {"sha256": sha256, "size": described[0], "content_type": described[1]}
+
+    def sweep(self, now: float = None) -> int:
+        """Remove uploads that saw no chunk for ``upload_ttl`` seconds; returns how many"""
+        cutoff = (now or time.time()) - self.upload_ttl
+        removed = 0
+        try:
+            names = os.listdir(self.uploads_dir)
+        except FileNotFoundError:
+            return 0
+        for name in names:
+            upload_id, extension = os.path.splitext(name)
+            if extension != ".json":
+                continue
+            active = self._uploads.get(upload_id)
+            if active is not None and active.lock.locked():
+                continue
+            try:
+                # Left over from a previous process: the part file shows the last chunk
+                updated = active.updated if active is not None else os.path.getmtime(self._part_path(upload_id))
+            except FileNotFoundError:
+                updated = 0
+            if updated > cutoff:
+                continue
+            self._uploads.pop(upload_id, None)
+            self._discard(upload_id)
+            removed += 1
+        if removed:
+            logger.info("Removed %d abandoned attachment uploads", removed)
+        return removed
+
+    async def start(self, interval: float = 3600.0):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(interval))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self, interval: float):
+        while True:
+            try:
+                await asyncio.to_thread(self.sweep)
+            except Exception:
+                logger.exception("Attachment upload sweep failed")
+            await asyncio.sleep(interval)
+
+    def get_stats(self) -> dict:
+        return {"uploads_in_progress": len(self._uploads)}
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) of a single ``bytes=`` range; None for the whole file.
+
+    Raises AttachmentError(416) when the range lies outside the file. Multiple
+    ranges are answered with the whole file, which RFC 9110 allows.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[6:].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = min(int(last), size - 1) if last else size - 1
+        elif last:
+            start, end = max(size - int(last), 0), size - 1
+        else:
+            return None
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise AttachmentError(416, "Range not satisfiable", {"Content-Range": f"bytes */{size}"})
+    return start, end
+
+
+class AttachmentResponse(Response):
+    """Streams a byte range of a stored file.
+
+    Uses the ASGI zero-copy send extension (sendfile) when the server offers
+    it; otherwise it sends slices of an mmap of the file, so no read()
+    buffers are allocated and only ``READ_BYTES`` are in flight at a time.
+    Sent pages are released from the mapping as it goes, so concurrent large
+    downloads don't add whole files to the process's resident memory.
+    """
+
+    def __init__(self, path: str, start: int, end: int, status_code: int = 200, headers: dict = None,
+                 media_type: str = None, send_body: bool = True):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = path
+        self.start = start
+        self.end = end
+        self.send_body = send_body
+        self.headers["content-length"] = str(end - start + 1)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        if not self.send_body:
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        count = self.end - self.start + 1
+        with open(self.path, "rb") as stored:
+            if "http.response.zerocopysend" in scope.get("extensions", {}):
+                await send({"type": "http.response.zerocopysend", "file": stored,
+                            "offset": self.start, "count": count})
+            else:
+                with mmap.mmap(stored.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    if _MADV_SEQUENTIAL is not None:
+                        mapped.madvise(_MADV_SEQUENTIAL)
+                    for position in range(self.start, self.end + 1, READ_BYTES):
+                        stop = min(position + READ_BYTES, self.end + 1)
+                        await send({"type": "http.response.body", "body": mapped[position:stop],
+                                    "more_body": stop <= self.end})
+                        if _MADV_DONTNEED is not None:
+                            # The pages stay in the page cache for the next reader
+                            page = position - position % mmap.PAGESIZE
+                            mapped.madvise(_MADV_DONTNEED, page, stop - page)
+        BYTES_SENT.inc(count)
+
+
+def attachment_response(store: AttachmentStore, sha256: str, range_header: str = None,
+                        if_none_match: str = None, if_range: str = None, method: str = "GET") -> Response:
+    """Download response for a stored attachment, honouring Range and If-None-Match"""
+    described = store.describe(sha256)
+    if described is None:
+        raise AttachmentError(404, "Attachment not found")
+    size, content_type = described["size"], described["content_type"]
+    etag = f'"{sha256}"'
+    headers = {
+        "ETag": etag,
+        # Content-addressed: a URL's bytes never change
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+        "Content-Disposition": "inline" if content_type in INLINE_TYPES else "attachment",
+    }
+    if if_none_match and any(tag.strip().removeprefix("W/") in (etag, "*") for tag in if_none_match.split(",")):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None if if_range and if_range.strip() != etag else parse_range(range_header, size)
+    send_body = method != "HEAD"
+    path = store.object_path(sha256)
+    if byte_range is None:
+        return AttachmentResponse(path, 0, size - 1, headers=headers, media_type=content_type, send_body=send_body)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return AttachmentResponse(path, start, end, status_code=206, headers=headers, media_type=content_type,
+                              send_body=send_body)
+
+
+# Shared by the upload and download endpoints in main.py
+attachment_store = AttachmentStore()
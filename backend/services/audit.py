@@ -0,0 +1,460 @@
+import argparse
+import asyncio
+import glob
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Segment files live here; production needs it on a persistent volume. Empty disables auditing.
+AUDIT_DIR = os.getenv("AUDIT_DIR", "./audit")
+# The active segment is closed and gzipped once it would grow past this
+AUDIT_SEGMENT_BYTES = int(os.getenv("AUDIT_SEGMENT_BYTES", str(64 * 1024 * 1024)))
+# Seconds events wait for others to share their write and fsync
+AUDIT_COMMIT_INTERVAL = float(os.getenv("AUDIT_COMMIT_INTERVAL", "0.05"))
+# Events buffered while the disk is unavailable before new ones are dropped
+AUDIT_MAX_PENDING = int(os.getenv("AUDIT_MAX_PENDING", "100000"))
+
+# Chain seed for the first record
+GENESIS = "0" * 64
+SEGMENT_PREFIX = "audit-"
+
+RECORDS_WRITTEN = metrics.counter("medchat_audit_records_total", "Audit records written and fsynced")
+COMMITS = metrics.counter("medchat_audit_commits_total", "Audit group commits (one fsync each)")
+COMMIT_RECORDS = metrics.histogram(
+    "medchat_audit_commit_records", "Audit records per group commit", buckets=metrics.COUNT_BUCKETS
+)
+RECORDS_DROPPED = metrics.counter("medchat_audit_records_dropped_total", "Audit events dropped with the buffer full")
+
+
+def chain_hash(previous: bytes, body: bytes) -> bytes:
+    """Hex SHA-256 linking a record body to the hash of the record before it"""
+    return hashlib.sha256(previous + body).hexdigest().encode("ascii")
+
+
+def segment_paths(directory: str) -> List[str]:
+    """Segments in chain order; zero-padded first seqs sort by name"""
+    return sorted(
+        glob.glob(os.path.join(directory, SEGMENT_PREFIX + "*.log")) +
+        glob.glob(os.path.join(directory, SEGMENT_PREFIX + "*.log.gz"))
+    )
+
+
+def _open_segment(path: str):
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def _parse_line(line: bytes) -> Tuple[int, bytes, bytes]:
+    """(seq, body, hash) of one ``<json body>\\t<hex hash>\\n`` line"""
+    body, tab, digest = line.rstrip(b"\n").rpartition(b"\t")
+    if not tab or not line.endswith(b"\n") or not body.startswith(b'{"seq":'):
+        raise ValueError("malformed record")
+    return int(body[7:body.index(b",", 7)]), body, digest
+
+
+class AuditLog:
+    """Append-only, hash-chained audit trail with group commit.
+
+    Events are buffered in memory by ``append`` and written by a background
+    task: everything appended within ``commit_interval`` of the first
+    pending event goes out in one write and one fsync. Each record is a JSON
+    line followed by a tab and SHA-256(previous hash + line), so editing,
+    removing or reordering any record breaks every hash after it. The
+    active segment rotates at ``segment_bytes`` and closed segments are
+    gzipped; the chain continues across segments.
+    """
+
+    def __init__(
+        self,
+        directory: str = AUDIT_DIR,
+        segment_bytes: int = AUDIT_SEGMENT_BYTES,
+        commit_interval: float = AUDIT_COMMIT_INTERVAL,
+        max_pending: int = AUDIT_MAX_PENDING
+    ):
+        self.directory = directory
+        self.enabled = bool(directory)
+        self.segment_bytes = segment_bytes
+        self.commit_interval = commit_interval
+        self.max_pending = max_pending
+
+        self._pending: List[dict] = []
+        self._appended = 0
+        self._durable = 0
+        self.commits = 0
+        self._waiters: List[Tuple[int, asyncio.Future]] = []
+        self._wakeup = asyncio.Event()
+        self._commit_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._compressions: Set[asyncio.Task] = set()
+        self._dropping = False
+
+        # Chain state, only touched by the writer thread under the commit lock
+        self.seq = 0
+        self.head = GENESIS
+        self._file = None
+        self._path: Optional[str] = None
+        self._size = 0
+        self._recovered = False
+
+    def append(self, event: str, user_id: Optional[str] = None, **fields):
+        """Buffer an event for the next group commit; never blocks or touches the disk"""
+        if "seq" in fields or "ts" in fields:
+            raise ValueError("seq and ts are assigned by the audit log")
+        if not self.enabled:
+            return
+        if len(self._pending) >= self.max_pending:
+            RECORDS_DROPPED.inc()
+            if not self._dropping:
+                logger.error("Audit buffer full (%d events); dropping events until the disk catches up",
+                             self.max_pending)
+                self._dropping = True
+            return
+        self._pending.append({"ts": round(time.time(), 3), "event": event, "user_id": user_id, **fields})
+        self._appended += 1
+        self._wakeup.set()
+
+    async def flush(self):
+        """Wait until every event appended so far has been fsynced"""
+        target = self._appended
+        if self._durable >= target or not self.enabled:
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.append((target, future))
+        if self._task is None:
+            await self.commit()
+        await future
+
+    async def commit(self) -> int:
+        """Write and fsync everything pending as one group; returns the number of records"""
+        async with self._commit_lock:
+            self._wakeup.clear()
+            batch, self._pending = self._pending, []
+            if not batch:
+                return 0
+            # Cancelling the caller doesn't stop the writer thread, so hold the lock until it is
+            # done (nothing may write alongside it) and only take the batch back if it failed
+            write = asyncio.ensure_future(asyncio.to_thread(self._write, batch))
+            cancelled = False
+            while not write.done():
+                try:
+                    await asyncio.shield(write)
+                except asyncio.CancelledError:
+                    cancelled = True
+                except Exception:
+                    pass
+            error = write.exception()
+            if error is not None:
+                # Nothing was kept on disk; retry the same events, in order, next time
+                self._pending[:0] = batch
+            else:
+                self._committed(batch, write.result())
+            if cancelled:
+                raise asyncio.CancelledError()
+            if error is not None:
+                raise error
+            return len(batch)
+
+    def _committed(self, batch: List[dict], closed: List[str]):
+        self._dropping = False
+        self._durable += len(batch)
+        self.commits += 1
+        RECORDS_WRITTEN.inc(len(batch))
+        COMMITS.inc()
+        COMMIT_RECORDS.observe(len(batch))
+        for path in closed:
+            self._compress_later(path)
+
+        waiting = []
+        for target, future in self._waiters:
+            if target <= self._durable:
+                if not future.done():
+                    future.set_result(None)
+            else:
+                waiting.append((target, future))
+        self._waiters = waiting
+
+    def _write(self, batch: List[dict]) -> List[str]:
+        if not self._recovered:
+            self._recover()
+
+        seq, head = self.seq, self.head.encode("ascii")
+        lines = []
+        for record in batch:
+            seq += 1
+            body = json.dumps({"seq": seq, **record}, separators=(",", ":"), default=str).encode("ascii")
+            head = chain_hash(head, body)
+            lines.append(body + b"\t" + head + b"\n")
+        data = b"".join(lines)
+
+        closed = []
+        if self._file is not None and self._size and self._size + len(data) > self.segment_bytes:
+            closed.append(self._path)
+            self._close_segment()
+        if self._file is None:
+            self._open_segment(os.path.join(self.directory, f"{SEGMENT_PREFIX}{self.seq + 1:012d}.log"))
+
+        try:
+            self._file.write(data)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except BaseException:
+            # Cut off whatever part of the group reached the file
+            self._file.seek(self._size)
+            self._file.truncate()
+            raise
+        self._size += len(data)
+        self.seq, self.head = seq, head.decode("ascii")
+        return closed
+
+    def _open_segment(self, path: str):
+        self._file = open(path, "ab")
+        self._path = path
+        self._size = self._file.tell()
+
+    def _close_segment(self):
+        self._file.close()
+        logger.info("Audit segment %s closed at seq %d, head %s", os.path.basename(self._path), self.seq, self.head)
+        self._file = None
+        self._path = None
+        self._size = 0
+
+    def _recover(self):
+        """Continue the chain from the newest segment, dropping a record torn by a crash"""
+        os.makedirs(self.directory, exist_ok=True)
+        for leftover in glob.glob(os.path.join(self.directory, "*.tmp")):
+            os.remove(leftover)
+        paths = segment_paths(self.directory)
+
+        if paths and paths[-1].endswith(".log"):
+            active = paths[-1]
+            with open(active, "r+b") as file:
+                size = file.seek(0, os.SEEK_END)
+                keep = self._complete_length(file, size)
+                if keep < size:
+                    logger.warning("Truncating %d bytes of an unfinished audit record from %s", size - keep, active)
+                    file.truncate(keep)
+            if keep == 0:
+                os.remove(active)
+                paths.pop()
+            else:
+                self._open_segment(active)
+
+        last = self._last_record(paths[-1]) if paths else None
+        if last is not None:
+            self.seq, self.head = last[0], last[1].decode("ascii")
+
+        # Segments closed by a process that stopped before gzipping them
+        for path in paths:
+            if path.endswith(".log") and path != self._path:
+                self._compress(path)
+        self._recovered = True
+
+    @staticmethod
+    def _complete_length(file, size: int, block: int = 65536) -> int:
+        """Length of the file up to and including its last newline"""
+        position = size
+        while position > 0:
+            start = max(0, position - block)
+            file.seek(start)
+            index = file.read(position - start).rfind(b"\n")
+            if index >= 0:
+                return start + index + 1
+            position = start
+        return 0
+
+    @staticmethod
+    def _last_record(path: str) -> Optional[Tuple[int, bytes]]:
+        last = None
+        with _open_segment(path) as file:
+            if path.endswith(".gz"):
+                for last in file:
+                    pass
+            else:
+                size = file.seek(0, os.SEEK_END)
+                file.seek(max(0, size - 65536))
+                last = file.read().splitlines(keepends=True)[-1]
+        if not last:
+            return None
+        seq, _, digest = _parse_line(last)
+        return seq, digest
+
+    def _compress_later(self, path: str):
+        task = asyncio.create_task(asyncio.to_thread(self._compress, path))
+        self._compressions.add(task)
+        task.add_done_callback(self._compressions.discard)
+
+    @staticmethod
+    def _compress(path: str):
+        temporary = path + ".gz.tmp"
+        with open(path, "rb") as source, gzip.open(temporary, "wb", compresslevel=6) as target:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        os.replace(temporary, path + ".gz")
+        os.remove(path)
+
+    async def start(self):
+        if self.enabled and self._task is None:
+            await asyncio.to_thread(self._recover)
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Commit what is still buffered, then close the active segment"""
+        if self._task is not None:
+            # Not cancelled: that would leave its writer thread running next to the final commit
+            self._stopping.set()
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._stopping.clear()
+        if not self.enabled:
+            return
+        try:
+            await self.commit()
+        except Exception:
+            logger.exception("Final audit commit failed; %d events lost", len(self._pending))
+        if self._compressions:
+            await asyncio.gather(*self._compressions, return_exceptions=True)
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._recovered = False
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            await self._wakeup.wait()
+            # Let more events join the group before paying for the fsync; stop() commits the rest
+            if await self._stop_within(self.commit_interval):
+                return
+            try:
+                await self.commit()
+            except Exception:
+                logger.exception("Audit commit failed; %d events kept for retry", len(self._pending))
+                if await self._stop_within(1.0):
+                    return
+                self._wakeup.set()
+
+    async def _stop_within(self, seconds: float) -> bool:
+        try:
+            await asyncio.wait_for(self._stopping.wait(), seconds)
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    def get_stats(self) -> dict:
+        return {
+            "seq": self.seq, "head": self.head, "pending": len(self._pending),
+            "commits": self.commits, "segment": self._path,
+        }
+
+
+def _segment_lines(file, block: int = 4 * 1024 * 1024) -> Iterator[bytes]:
+    """Lines of a segment, newline included, read in large blocks"""
+    rest = b""
+    while True:
+        data = file.read(block)
+        if not data:
+            break
+        lines = (rest + data).split(b"\n")
+        rest = lines.pop()
+        for line in lines:
+            yield line + b"\n"
+    if rest:
+        # Torn final record; _parse_line rejects it
+        yield rest
+
+
+def _verify_segment(path: str) -> Dict:
+    """Check the chain inside one segment; its first record is linked by the caller"""
+    summary = {"path": path, "records": 0, "error": None}
+    previous = expected = None
+    sha256 = hashlib.sha256
+    try:
+        with _open_segment(path) as file:
+            lines = _segment_lines(file)
+            for line in lines:
+                seq, body, digest = _parse_line(line)
+                summary.update(first_seq=seq, first_body=body, first_hash=digest)
+                previous, expected = digest, seq + 1
+                summary["records"] = 1
+                break
+            # Hot loop over millions of records: hash and seq checks inlined
+            for line in lines:
+                body, _, digest = line.rpartition(b"\t")
+                if not body.startswith(b'{"seq":%d,' % expected):
+                    seq, _, _ = _parse_line(line)
+                    summary["error"] = f"seq {seq} follows {expected - 1}"
+                    break
+                if sha256(previous + body).hexdigest().encode("ascii") != digest[:-1]:
+                    summary["error"] = f"hash mismatch at seq {expected}"
+                    break
+                previous, expected = digest[:-1], expected + 1
+            summary["records"] = expected - summary["first_seq"] if expected else 0
+    except (ValueError, OSError, EOFError) as error:
+        summary["error"] = f"{error} at seq {expected}" if expected else str(error)
+    summary["last_seq"] = expected - 1 if expected else None
+    summary["last_hash"] = previous
+    return summary
+
+
+def verify(directory: str = AUDIT_DIR, workers: int = 1) -> Dict:
+    """Verify the whole chain; segments are checked in parallel with ``workers`` processes.
+
+    Returns ``ok``, the record count and the final seq and hash; on failure
+    ``error`` and ``segment`` say where the chain breaks. Segments verify
+    independently, then each one's first record is checked against the
+    last hash of the segment before it.
+    """
+    started = time.perf_counter()
+    paths = segment_paths(directory)
+    if workers > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            summaries = list(pool.map(_verify_segment, paths))
+    else:
+        summaries = [_verify_segment(path) for path in paths]
+
+    result = {"ok": True, "segments": len(paths), "records": 0, "last_seq": 0, "head": GENESIS, "error": None}
+    previous_seq, previous_hash = 0, GENESIS.encode("ascii")
+    for summary in summaries:
+        error = summary["error"]
+        if error is None and summary["records"]:
+            if summary["first_seq"] != previous_seq + 1:
+                error = f"segment starts at seq {summary['first_seq']}, expected {previous_seq + 1}"
+            elif chain_hash(previous_hash, summary["first_body"]) != summary["first_hash"]:
+                error = f"hash mismatch at seq {summary['first_seq']}"
+        if error is not None:
+            result.update(ok=False, error=error, segment=os.path.basename(summary["path"]))
+            break
+        if summary["records"]:
+            result["records"] += summary["records"]
+            previous_seq, previous_hash = summary["last_seq"], summary["last_hash"]
+
+    result.update(last_seq=previous_seq, head=previous_hash.decode("ascii"),
+                  seconds=round(time.perf_counter() - started, 3))
+    return result
+
+
+# Process-wide log, started and stopped in main.py's lifespan
+audit_log = AuditLog()
+
+
+if __name__ == "__main__":
+    # Check a copy of the audit directory, e.g.
+    #   python -m services.audit /data/audit --workers 4
+    parser = argparse.ArgumentParser(description="Verify the audit log's hash chain")
+    parser.add_argument("directory", nargs="?", default=AUDIT_DIR)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="segments verified in parallel")
+    args = parser.parse_args()
+
+    result = verify(args.directory, args.workers)
+    print(json.dumps(result, indent=2))
+    sys.exit(0 if result["ok"] else 1)
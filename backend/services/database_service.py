@@ -1,14 +1,15 @@
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, update, delete, func
+from sqlalchemy import select, update, delete, insert, func, bindparam
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import selectinload
-from typing import List, Optional
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 import uuid
 from datetime import datetime
 
-from models.db_models import User, Message, UserSession
-from models.message import MessageModel  # Keep Pydantic for validation
-from models.user import UserModel
+from models.db_models import User, Message, UserSession, ReadCursor
+from services.query_stats import track_operations
 
+@track_operations
 class UserService:
     """Service for user database operations"""
 
@@ -58,6 +59,14 @@ class UserService:
         result = await db.execute(select(User).where(User.is_active == True))
         return result.scalars().all()
 
+    @staticmethod
+    async def get_directory_entries(db: AsyncSession) -> List[Tuple[str, str, str, Optional[datetime]]]:
+        """(user_id, user_name, department, last_seen) of every active user, without loading bios"""
+        result = await db.execute(
+            select(User.user_id, User.user_name, User.department, User.last_seen).where(User.is_active == True)
+        )
+        return [tuple(row) for row in result.all()]
+
     @staticmethod
     async def update_last_seen(db: AsyncSession, user_id: str):
         """Update user's last seen timestamp"""
@@ -68,6 +77,7 @@ class UserService:
         )
         await db.commit()
 
+@track_operations
 class MessageService:
     """Service for message database operations"""
 
@@ -76,14 +86,23 @@ class MessageService:
         db: AsyncSession,
         user_id: str,
         text: str,
-        message_type: str = "message"
+        message_type: str = "message",
+        channel: str = "general",
+        attachment: Optional[Dict] = None,
+        message_id: Optional[str] = None
     ) -> Message:
-        """Create a new message"""
+        """Create a new message, optionally referencing a stored attachment by hash.
+
+        ``message_id`` is the id already sent to clients, when there is one.
+        """
         message = Message(
-            message_id=str(uuid.uuid4()),
+            message_id=message_id or str(uuid.uuid4()),
             text=text,
             message_type=message_type,
-            user_id=user_id
+            channel=channel,
+            user_id=user_id,
+            attachment_sha256=attachment["sha256"] if attachment else None,
+            attachment_name=attachment.get("name") if attachment else None
         )
         db.add(message)
         await db.commit()
@@ -131,6 +150,90 @@ class MessageService:
         result = await db.execute(select(func.count(Message.id)))
         return result.scalar()
 
+    @staticmethod
+    def _export_filter(
+        query,
+        start: Optional[datetime],
+        end: Optional[datetime],
+        department: Optional[str],
+        after_seq: int
+    ):
+        query = query.join(User, Message.user_id == User.user_id).where(Message.id > after_seq)
+        if start is not None:
+            query = query.where(Message.created_at >= start)
+        if end is not None:
+            query = query.where(Message.created_at < end)
+        if department is not None:
+            query = query.where(User.department == department)
+        return query
+
+    @staticmethod
+    async def count_for_export(
+        db: AsyncSession,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        department: Optional[str] = None,
+        after_seq: int = 0
+    ) -> int:
+        """Number of messages an export with the same filters would write"""
+        query = MessageService._export_filter(select(func.count(Message.id)), start, end, department, after_seq)
+        result = await db.execute(query)
+        return result.scalar()
+
+    @staticmethod
+    async def stream_for_export(
+        db: AsyncSession,
+        start: Optional[datetime] = None,
+        end: Optional[datetime] = None,
+        department: Optional[str] = None,
+        after_seq: int = 0,
+        batch_size: int = 1000
+    ) -> AsyncIterator[List[Dict]]:
+        """Messages created in [start, end) by a department's users, as flat rows in id order.
+
+        Yields lists of at most ``batch_size`` rows read through a server-side
+        cursor, so memory stays flat however large the range. On SQLite a long
+        read would hold off the chat's writers, so batches are fetched with
+        separate keyset queries instead. Department is the sender's current one.
+        """
+        columns = select(
+            Message.id.label("seq"),
+            Message.message_id,
+            Message.created_at.label("timestamp"),
+            Message.channel,
+            Message.message_type.label("type"),
+            Message.user_id,
+            User.user_name,
+            User.department,
+            Message.text,
+            Message.attachment_sha256,
+            Message.attachment_name,
+        )
+
+        def rows(batch):
+            return [
+                {**row, "timestamp": row["timestamp"].isoformat() if row["timestamp"] else None}
+                for row in batch
+            ]
+
+        if db.bind.dialect.name == "sqlite":
+            while True:
+                query = MessageService._export_filter(columns, start, end, department, after_seq)
+                result = await db.execute(query.order_by(Message.id).limit(batch_size))
+                batch = result.mappings().all()
+                # End the read transaction between batches
+                await db.commit()
+                if not batch:
+                    return
+                after_seq = batch[-1]["seq"]
+                yield rows(batch)
+
+        query = MessageService._export_filter(columns, start, end, department, after_seq).order_by(Message.id)
+        result = await db.stream(query.execution_options(yield_per=batch_size))
+        async for batch in result.mappings().partitions():
+            yield rows(batch)
+
+@track_operations
 class SessionService:
     """Service for user session management"""
 
@@ -166,6 +269,46 @@ class SessionService:
         )
         await db.commit()
 
+    @staticmethod
+    async def create_sessions(db: AsyncSession, rows: List[Dict]) -> int:
+        """Insert many session rows in a single statement; the caller commits"""
+        if not rows:
+            return 0
+        await db.execute(insert(UserSession), rows)
+        return len(rows)
+
+    @staticmethod
+    async def end_sessions(
+        db: AsyncSession,
+        closed: Dict[str, datetime]
+    ) -> int:
+        """End many sessions, keyed by connection_id with their disconnect time; the caller commits"""
+        if not closed:
+            return 0
+        # One executemany round trip for the whole batch (Core table, not ORM bulk-by-PK)
+        sessions_table = UserSession.__table__
+        await db.execute(
+            update(sessions_table)
+            .where(sessions_table.c.connection_id == bindparam("b_connection_id"))
+            .values(disconnected_at=bindparam("b_disconnected_at"), is_active=False),
+            [
+                {"b_connection_id": connection_id, "b_disconnected_at": disconnected_at}
+                for connection_id, disconnected_at in closed.items()
+            ],
+        )
+        return len(closed)
+
+    @staticmethod
+    async def close_stale_sessions(db: AsyncSession) -> int:
+        """Close every session still marked active, e.g. left over by a previous process"""
+        result = await db.execute(
+            update(UserSession)
+            .where(UserSession.is_active == True)
+            .values(disconnected_at=datetime.utcnow(), is_active=False)
+        )
+        await db.commit()
+        return result.rowcount or 0
+
     @staticmethod
     async def get_active_sessions(db: AsyncSession) -> List[UserSession]:
         """Get all active sessions"""
@@ -185,4 +328,61 @@ class SessionService:
             .where(UserSession.is_active == True)
             .distinct()
         )
-        return result.scalars().all()
\ No newline at end of file
+        return result.scalars().all()
+
+@track_operations
+class ReadCursorService:
+    """Service for per-user, per-channel read cursors"""
+
+    @staticmethod
+    async def get_channel_heads(db: AsyncSession) -> List[Tuple[str, int, int]]:
+        """(channel, message count, highest message id) for every channel"""
+        result = await db.execute(
+            select(Message.channel, func.count(Message.id), func.max(Message.id))
+            .group_by(Message.channel)
+        )
+        return [tuple(row) for row in result.all()]
+
+    @staticmethod
+    async def get_user_cursors(db: AsyncSession, user_id: str) -> List[Tuple[str, int, int]]:
+        """(channel, last read id, messages up to and including it) for each of a user's cursors"""
+        read_through = (
+            select(func.count(Message.id))
+            .where(Message.channel == ReadCursor.channel, Message.id <= ReadCursor.last_read_seq)
+            .correlate(ReadCursor)
+            .scalar_subquery()
+        )
+        result = await db.execute(
+            select(ReadCursor.channel, ReadCursor.last_read_seq, read_through)
+            .where(ReadCursor.user_id == user_id)
+        )
+        return [tuple(row) for row in result.all()]
+
+    @staticmethod
+    async def count_through(db: AsyncSession, channel: str, seq: int) -> int:
+        """Number of messages in a channel with an id up to and including ``seq``"""
+        result = await db.execute(
+            select(func.count(Message.id)).where(Message.channel == channel, Message.id <= seq)
+        )
+        return result.scalar()
+
+    @staticmethod
+    async def save_cursors(db: AsyncSession, cursors: Dict[Tuple[str, str], int]) -> int:
+        """Upsert many cursors, keyed by (user_id, channel); a cursor never moves backwards"""
+        if not cursors:
+            return 0
+        dialect = postgresql if db.bind.dialect.name == "postgresql" else sqlite
+        table = ReadCursor.__table__
+        statement = dialect.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[table.c.user_id, table.c.channel],
+            set_={"last_read_seq": statement.excluded.last_read_seq, "updated_at": func.now()},
+            where=table.c.last_read_seq < statement.excluded.last_read_seq,
+        )
+        # One executemany round trip for the whole batch
+        await db.execute(statement, [
+            {"user_id": user_id, "channel": channel, "last_read_seq": seq}
+            for (user_id, channel), seq in cursors.items()
+        ])
+        await db.commit()
+        return len(cursors)
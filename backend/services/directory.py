@@ -0,0 +1,304 @@
+import asyncio
+import heapq
+import logging
+import os
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from config.database import AsyncSessionLocal
+from services.database_service import UserService
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Longest prefix indexed per word; longer queries are checked against the candidates of this one
+DIRECTORY_MAX_PREFIX = int(os.getenv("DIRECTORY_MAX_PREFIX", "8"))
+# Results per search by default and at most
+DIRECTORY_SEARCH_LIMIT = int(os.getenv("DIRECTORY_SEARCH_LIMIT", "10"))
+DIRECTORY_MAX_LIMIT = int(os.getenv("DIRECTORY_MAX_LIMIT", "50"))
+# Ranked lists kept for searched prefixes, least recently searched dropped first
+DIRECTORY_RANKED_LISTS = int(os.getenv("DIRECTORY_RANKED_LISTS", "10000"))
+
+SEARCH_SECONDS = metrics.histogram(
+    "medchat_directory_search_seconds", "Time to answer a directory search from the in-memory index",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01)
+)
+INDEXED_USERS = metrics.gauge("medchat_directory_users", "Users in the in-memory directory index")
+
+_WORD = re.compile(r"\w+")
+
+
+def normalize(text: str) -> str:
+    """Case- and accent-folded text, so "josé" and "Jose" index the same"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+
+def words(text: str) -> List[str]:
+    return _WORD.findall(normalize(text))
+
+
+def trigrams(word: str) -> Set[str]:
+    return {word[index:index + 3] for index in range(len(word) - 2)}
+
+
+def _timestamp(value: Optional[datetime]) -> float:
+    if value is None:
+        return 0.0
+    if value.tzinfo is None:
+        # Stored naive, in UTC
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class _Entry:
+    __slots__ = ("user_id", "user_name", "department", "department_key", "active",
+                 "leading", "words", "prefixes", "leading_prefixes")
+
+    def __init__(self, user_id: str, user_name: str, department: str, active: float, max_prefix: int):
+        self.user_id = user_id
+        self.user_name = user_name
+        self.department = department
+        self.department_key = normalize(department)
+        self.active = active
+        name_words = words(user_name)
+        # The words a mention most likely starts with
+        self.leading = {normalize(user_id)}
+        if name_words:
+            self.leading.add(name_words[0])
+        self.words = self.leading | set(name_words) | set(words(user_id)) | set(words(department))
+        # "" is everyone's prefix, so an empty query is one more prefix
+        self.prefixes = {word[:length] for word in self.words for length in range(min(len(word), max_prefix) + 1)}
+        self.leading_prefixes = {word[:length] for word in self.leading for length in range(min(len(word), max_prefix) + 1)}
+
+    def to_dict(self) -> dict:
+        return {"user_id": self.user_id, "user_name": self.user_name, "department": self.department}
+
+
+def _recency(entry: _Entry) -> tuple:
+    return -entry.active, entry.user_name
+
+
+class DirectoryIndex:
+    """Staff directory kept in memory for @mention autocomplete.
+
+    Every user's name, id and department words are indexed by each of their
+    prefixes up to ``max_prefix`` characters and by their trigrams, so a
+    search is a few dictionary lookups instead of a LIKE scan over the users
+    table. The index is built from one query on first use and then follows
+    the users the server itself writes: upserts on connect and profile
+    changes, and activity as messages are sent.
+
+    Results are ranked by how a query matches (its first word starts the
+    name or id, every word starts some word, or only appears inside one),
+    then by most recent activity. The most recently active members of a
+    prefix, overall and per department, are kept as a short list once
+    searched for: activity moves the user to the front of their lists, so a
+    one-word search reads a list instead of sorting every match.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        max_prefix: int = DIRECTORY_MAX_PREFIX,
+        max_ranked_lists: int = DIRECTORY_RANKED_LISTS
+    ):
+        self.session_factory = session_factory
+        self.max_prefix = max_prefix
+        self.max_ranked_lists = max_ranked_lists
+        self._entries: Dict[str, _Entry] = {}
+        self._prefixes: Dict[str, Set[str]] = {}
+        # Prefixes of the first name word and the user id only
+        self._leading: Dict[str, Set[str]] = {}
+        self._trigrams: Dict[str, Set[str]] = {}
+        self._departments: Dict[str, Set[str]] = {}
+        # (index, prefix, department or "") -> up to DIRECTORY_MAX_LIMIT of its users, most recently active
+        # first; least recently searched list first
+        self._top: "OrderedDict[Tuple[str, str, str], List[str]]" = OrderedDict()
+        self._load_task: Optional[asyncio.Future] = None
+
+    async def load(self):
+        """Index every active user, once per process"""
+        if self._load_task is None:
+            self._load_task = asyncio.ensure_future(self._load())
+        try:
+            await asyncio.shield(self._load_task)
+        except Exception:
+            # Let the next caller retry
+            self._load_task = None
+            raise
+
+    async def _load(self):
+        started = time.perf_counter()
+        async with self.session_factory() as session:
+            rows = await UserService.get_directory_entries(session)
+        for user_id, user_name, department, last_seen in rows:
+            # Users upserted while the query ran are already newer than its rows
+            if user_id not in self._entries:
+                self._add(_Entry(user_id, user_name, department, _timestamp(last_seen), self.max_prefix))
+        INDEXED_USERS.set(len(self._entries))
+        logger.info("Indexed %d directory entries in %.1fms", len(rows), (time.perf_counter() - started) * 1000)
+
+    def upsert(self, user_id: str, user_name: str, department: str, active: bool = True):
+        """Index a user as just written to the database; ``active`` also counts it as activity"""
+        entry = self._entries.get(user_id)
+        if entry is None or (entry.user_name, entry.department) != (user_name, department):
+            if entry is not None:
+                self._remove(entry)
+            active = active or entry is None
+            self._add(_Entry(user_id, user_name, department, entry.active if entry else 0.0, self.max_prefix))
+            INDEXED_USERS.set(len(self._entries))
+        if active:
+            self.touch(user_id)
+
+    def touch(self, user_id: str):
+        """Move a user to the front of the ranking, e.g. after they sent a message"""
+        entry = self._entries.get(user_id)
+        if entry is None:
+            return
+        entry.active = time.time()
+        for key in self._top_keys(entry):
+            top = self._top.get(key)
+            if top is not None and (not top or top[0] != user_id):
+                if user_id in top:
+                    top.remove(user_id)
+                top.insert(0, user_id)
+                del top[DIRECTORY_MAX_LIMIT:]
+
+    def get(self, user_id: str) -> Optional[dict]:
+        """A user's indexed name and department, as last written to the database"""
+        entry = self._entries.get(user_id)
+        return entry.to_dict() if entry is not None else None
+
+    def _top_keys(self, entry: _Entry) -> Iterable[Tuple[str, str, str]]:
+        for name, prefixes in (("prefixes", entry.prefixes), ("leading", entry.leading_prefixes)):
+            for prefix in prefixes:
+                yield name, prefix, ""
+                yield name, prefix, entry.department_key
+
+    def _keys(self, entry: _Entry) -> Iterable[Tuple[Dict[str, Set[str]], str]]:
+        for prefix in entry.prefixes:
+            yield self._prefixes, prefix
+        for prefix in entry.leading_prefixes:
+            yield self._leading, prefix
+        for word in entry.words:
+            for trigram in trigrams(word):
+                yield self._trigrams, trigram
+        yield self._departments, entry.department_key
+
+    def _add(self, entry: _Entry):
+        self._entries[entry.user_id] = entry
+        for index, key in self._keys(entry):
+            index.setdefault(key, set()).add(entry.user_id)
+        # Lists this user might belong in are rebuilt on their next search
+        for key in self._top_keys(entry):
+            self._top.pop(key, None)
+
+    def _remove(self, entry: _Entry):
+        del self._entries[entry.user_id]
+        for index, key in self._keys(entry):
+            ids = index.get(key)
+            if ids is not None:
+                ids.discard(entry.user_id)
+                if not ids:
+                    del index[key]
+        for key in self._top_keys(entry):
+            self._top.pop(key, None)
+
+    def _most_active(self, name: str, prefix: str, department: str) -> List[str]:
+        """The most recently active users of a prefix, in a department or all of them"""
+        key = (name, prefix, department)
+        top = self._top.get(key)
+        if top is not None:
+            self._top.move_to_end(key)
+            return top
+        ids = getattr(self, f"_{name}").get(prefix)
+        if not ids:
+            # Searches anyone can make up must not leave a list behind
+            return []
+        if department:
+            ids = ids & self._departments.get(department, set())
+        top = [entry.user_id for entry in heapq.nsmallest(
+            DIRECTORY_MAX_LIMIT, (self._entries[user_id] for user_id in ids), key=_recency
+        )]
+        self._top[key] = top
+        if len(self._top) > self.max_ranked_lists:
+            self._top.popitem(last=False)
+        return top
+
+    def _substring_matches(self, word: str, within: Optional[Set[str]]) -> Set[str]:
+        candidates = within
+        for trigram in sorted(trigrams(word), key=lambda key: len(self._trigrams.get(key, ()))):
+            ids = self._trigrams.get(trigram)
+            if not ids:
+                return set()
+            candidates = set(ids) if candidates is None else candidates & ids
+        return {user_id for user_id in candidates if any(word in w for w in self._entries[user_id].words)}
+
+    def _match(self, query_words: List[str], department: str, limit: int, skip: Set[str], substrings: bool) -> List[str]:
+        """Users matching every word by prefix (or by substring too), ranked; for queries no list answers"""
+        matched = self._departments.get(department, set()) if department else None
+        for word in sorted(query_words, key=len, reverse=True):
+            ids = self._prefixes.get(word[:self.max_prefix], set())
+            if substrings and len(word) >= 3:
+                ids = ids | self._substring_matches(word, matched)
+            matched = ids if matched is None else matched & ids
+            if not matched:
+                return []
+
+        first = query_words[0]
+        if substrings:
+            def matches(entry):
+                return all(any(word in w for w in entry.words) for word in query_words)
+        else:
+            def matches(entry):
+                return all(any(w.startswith(word) for w in entry.words) for word in query_words)
+
+        candidates = (self._entries[user_id] for user_id in matched if user_id not in skip)
+        return [entry.user_id for entry in heapq.nsmallest(
+            limit, filter(matches, candidates),
+            key=lambda entry: (not any(w.startswith(first) for w in entry.leading), -entry.active, entry.user_name)
+        )]
+
+    def search(self, query: str, department: Optional[str] = None, limit: int = DIRECTORY_SEARCH_LIMIT) -> List[dict]:
+        """Users matching every word of ``query`` by prefix, or by substring for words of three or more
+        characters; an empty query lists the most recently active users"""
+        started = time.perf_counter()
+        limit = max(1, min(limit, DIRECTORY_MAX_LIMIT))
+        query_words = words(query)
+        department = normalize(department) if department else ""
+
+        if department and department not in self._departments:
+            found = []
+        elif not query_words:
+            found = self._most_active("prefixes", "", department)[:limit]
+        elif len(query_words) == 1 and len(query_words[0]) <= self.max_prefix:
+            word = query_words[0]
+            found = self._most_active("leading", word, department)[:limit]
+            if len(found) < limit:
+                # Found is every name/id match, so the list of all prefix matches has enough others
+                named = set(found)
+                found += [user_id for user_id in self._most_active("prefixes", word, department)
+                          if user_id not in named][:limit - len(found)]
+        else:
+            found = self._match(query_words, department, limit, set(), substrings=False)
+
+        if len(found) < limit and any(len(word) >= 3 for word in query_words):
+            # Prefix matches are all in found by now; skipping them leaves matches inside words
+            found += self._match(query_words, department, limit - len(found), set(found), substrings=True)
+
+        SEARCH_SECONDS.observe(time.perf_counter() - started)
+        return [self._entries[user_id].to_dict() for user_id in found]
+
+    def get_stats(self) -> dict:
+        return {
+            "users": len(self._entries),
+            "prefixes": len(self._prefixes),
+            "trigrams": len(self._trigrams),
+            "departments": len(self._departments),
+            "ranked_lists": len(self._top),
+        }
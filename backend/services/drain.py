@@ -0,0 +1,36 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import uvicorn
+
+logger = logging.getLogger(__name__)
+
+
+class DrainingServer(uvicorn.Server):
+    """Uvicorn server that drains the app before its own shutdown begins.
+
+    Uvicorn closes every WebSocket with 1012 as soon as it starts shutting
+    down, before the lifespan shutdown hook runs, so draining there is too
+    late to hand clients off gracefully. The first SIGINT/SIGTERM runs
+    ``drain`` and then lets uvicorn exit; a second signal exits immediately.
+    """
+
+    def __init__(self, config: uvicorn.Config, drain: Callable[[], Awaitable[None]]):
+        super().__init__(config)
+        self._drain = drain
+        self._drain_task = None
+
+    def handle_exit(self, sig, frame):
+        if self._drain_task is None and not self.should_exit:
+            logger.info("Shutdown signal received, draining connections")
+            self._drain_task = asyncio.get_event_loop().create_task(self._drain_then_exit(sig, frame))
+            return
+        super().handle_exit(sig, frame)
+
+    async def _drain_then_exit(self, sig, frame):
+        try:
+            await self._drain()
+        except Exception:
+            logger.exception("Drain failed, shutting down anyway")
+        super().handle_exit(sig, frame)
@@ -0,0 +1,171 @@
+import asyncio
+import csv
+import functools
+import io
+import gzip
+import json
+import logging
+import os
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from security.utils import SecurityUtils
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+THREAD = "thread"
+PROCESS = "process"
+
+# Pool sizes; 0 process workers sends "process" tasks to the thread pool instead
+EXECUTOR_THREAD_WORKERS = int(os.getenv("EXECUTOR_THREAD_WORKERS", str(min(8, (os.cpu_count() or 1) + 2))))
+EXECUTOR_PROCESS_WORKERS = int(os.getenv("EXECUTOR_PROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Task type -> (backend, max tasks of that type running at once)
+TASK_TYPES: Dict[str, Tuple[str, int]] = {
+    # hashlib releases the GIL inside PBKDF2, so threads already use several cores
+    "password": (THREAD, 4),
+    # bleach is pure Python and holds the GIL; only a process helps
+    "sanitize": (PROCESS, 2),
+    # zlib and json encoding of large exports; one at a time keeps memory bounded
+    "export": (THREAD, 1),
+}
+
+# Large bulk-sanitize jobs are split so several workers share them
+SANITIZE_CHUNK_SIZE = 500
+
+
+class WorkerPools:
+    """Thread and process pools for CPU-bound work, kept off the event loop.
+
+    Each task type has a backend and a concurrency limit; callers beyond the
+    limit wait on an asyncio semaphore instead of piling work into the
+    pool's queue, so a login storm can't starve exports and vice versa.
+    Pools are created on first use.
+    """
+
+    def __init__(
+        self,
+        thread_workers: int = EXECUTOR_THREAD_WORKERS,
+        process_workers: int = EXECUTOR_PROCESS_WORKERS,
+        task_types: Dict[str, Tuple[str, int]] = None
+    ):
+        self.thread_workers = max(1, thread_workers)
+        self.process_workers = max(0, process_workers)
+        self.task_types = dict(task_types or TASK_TYPES)
+        self._thread_pool: Optional[ThreadPoolExecutor] = None
+        self._process_pool: Optional[Executor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._running: Dict[str, int] = {}
+
+    def _pool(self, backend: str) -> Executor:
+        if backend == PROCESS and self.process_workers:
+            if self._process_pool is None:
+                # Imported here: most processes never start a worker process
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+                # spawn: forking a process that runs an event loop and helper threads is unsafe
+                self._process_pool = ProcessPoolExecutor(
+                    max_workers=self.process_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._process_pool
+        if self._thread_pool is None:
+            self._thread_pool = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix="cpu-worker")
+        return self._thread_pool
+
+    def _semaphore(self, task_type: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(task_type)
+        if semaphore is None:
+            _, limit = self.task_types[task_type]
+            semaphore = self._semaphores[task_type] = asyncio.Semaphore(limit)
+        return semaphore
+
+    async def run(self, task_type: str, func: Callable, *args, **kwargs):
+        """Run ``func(*args, **kwargs)`` on the pool for ``task_type`` (process tasks need picklable args)"""
+        if task_type not in self.task_types:
+            raise ValueError(f"Unknown task type: {task_type}")
+        backend, _ = self.task_types[task_type]
+
+        queued = time.perf_counter()
+        async with self._semaphore(task_type):
+            started = time.perf_counter()
+            metrics.histogram(
+                "medchat_executor_wait_seconds", "Time CPU tasks waited for their type's concurrency limit",
+                buckets=metrics.STAGE_BUCKETS, labels={"task_type": task_type}
+            ).observe(started - queued)
+            self._running[task_type] = self._running.get(task_type, 0) + 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(
+                    self._pool(backend), functools.partial(func, *args, **kwargs)
+                )
+            finally:
+                self._running[task_type] -= 1
+                metrics.histogram(
+                    "medchat_executor_task_seconds", "Run time of CPU tasks offloaded from the event loop",
+                    buckets=metrics.STAGE_BUCKETS, labels={"task_type": task_type}
+                ).observe(time.perf_counter() - started)
+
+    def shutdown(self, wait: bool = True):
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=wait, cancel_futures=not wait)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=wait, cancel_futures=not wait)
+            self._process_pool = None
+        self._semaphores.clear()
+
+    def get_stats(self) -> dict:
+        return {
+            "thread_workers": self.thread_workers,
+            "process_workers": self.process_workers,
+            "running": {task_type: count for task_type, count in self._running.items() if count},
+        }
+
+
+# Process-wide pools, shut down in main.py's lifespan
+worker_pools = WorkerPools()
+
+
+def _sanitize_chunk(texts: List[str], max_length: int) -> List[str]:
+    return [SecurityUtils.sanitize_input(text, max_length) for text in texts]
+
+
+def _encode_export(records: List[dict], compress: bool, fmt: str = "ndjson",
+                   columns: Optional[List[str]] = None, header: bool = False) -> bytes:
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=columns or list(records[0]), extrasaction="ignore")
+        if header:
+            writer.writeheader()
+        writer.writerows(records)
+        text = buffer.getvalue()
+    else:
+        text = "".join(json.dumps(record, default=str) + "\n" for record in records)
+    data = text.encode("utf-8")
+    return gzip.compress(data, compresslevel=6) if compress else data
+
+
+async def hash_password(password: str) -> str:
+    """SecurityUtils.hash_password off the event loop"""
+    return await worker_pools.run("password", SecurityUtils.hash_password, password)
+
+
+async def verify_password(stored_password: str, provided_password: str) -> bool:
+    """SecurityUtils.verify_password off the event loop"""
+    return await worker_pools.run("password", SecurityUtils.verify_password, stored_password, provided_password)
+
+
+async def sanitize_many(texts: List[str], max_length: int = 1000) -> List[str]:
+    """Sanitize a batch of strings in worker processes, chunked across workers"""
+    chunks = [texts[index:index + SANITIZE_CHUNK_SIZE] for index in range(0, len(texts), SANITIZE_CHUNK_SIZE)]
+    results = await asyncio.gather(
+        *(worker_pools.run("sanitize", _sanitize_chunk, chunk, max_length) for chunk in chunks)
+    )
+    return [text for chunk in results for text in chunk]
+
+
+async def encode_export(records: List[dict], compress: bool = False, fmt: str = "ndjson",
+                        columns: Optional[List[str]] = None, header: bool = False) -> bytes:
+    """Encode records as NDJSON or CSV (optionally gzipped) off the event loop"""
+    return await worker_pools.run("export", _encode_export, records, compress, fmt, columns, header)
@@ -0,0 +1,180 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from datetime import datetime
+from typing import AsyncIterator, Dict, Optional
+
+from config.database import AsyncSessionLocal
+from services.database_service import MessageService
+from services.executor import encode_export
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Messages fetched from the cursor and encoded per chunk
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+
+FORMATS = ("ndjson", "csv")
+COLUMNS = [
+    "seq", "message_id", "timestamp", "channel", "type", "user_id", "user_name", "department",
+    "text", "attachment_sha256", "attachment_name",
+]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+
+def rows_exported(fmt: str):
+    return metrics.counter("medchat_export_rows_total", "Messages written by compliance exports", labels={"format": fmt})
+
+
+class ExportProgress:
+    """How far an export has got; ``seq`` is the cursor to resume it from"""
+
+    def __init__(self, total: Optional[int] = None, seq: int = 0, rows: int = 0, bytes_written: int = 0):
+        self.total = total
+        self.seq = seq
+        self.rows = rows
+        self.bytes_written = bytes_written
+
+    def to_dict(self) -> Dict:
+        return {"total": self.total, "seq": self.seq, "rows": self.rows, "bytes": self.bytes_written}
+
+
+async def export_messages(
+    session_factory=AsyncSessionLocal,
+    fmt: str = "ndjson",
+    compress: bool = False,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    department: Optional[str] = None,
+    after_seq: int = 0,
+    header: bool = True,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    progress: Optional[ExportProgress] = None
+) -> AsyncIterator[bytes]:
+    """Encoded export chunks, one per batch of messages in id order.
+
+    Every chunk is whole rows (and a complete gzip member when compressing),
+    so output may stop after any chunk and continue with ``after_seq`` set to
+    the last ``seq`` written; concatenated gzip members read as one file.
+    Only one batch is held at a time.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    progress = progress or ExportProgress(seq=after_seq)
+    counter = rows_exported(fmt)
+
+    if fmt == "csv" and header:
+        chunk = await encode_export([], compress, fmt, COLUMNS, header=True)
+        progress.bytes_written += len(chunk)
+        yield chunk
+
+    async with session_factory() as db:
+        async for batch in MessageService.stream_for_export(db, start, end, department, after_seq, batch_size):
+            chunk = await encode_export(batch, compress, fmt, COLUMNS)
+            progress.seq = batch[-1]["seq"]
+            progress.rows += len(batch)
+            progress.bytes_written += len(chunk)
+            counter.inc(len(batch))
+            yield chunk
+
+    logger.info("Exported %d messages (%s%s) through seq %d",
+                progress.rows, fmt, ", gzip" if compress else "", progress.seq)
+
+
+async def export_to_file(
+    path: str,
+    fmt: str = "ndjson",
+    compress: bool = False,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    department: Optional[str] = None,
+    resume: bool = False,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    session_factory=AsyncSessionLocal,
+    on_progress=None
+) -> ExportProgress:
+    """Write an export to ``path``, checkpointing to ``path + '.progress'`` after every chunk.
+
+    With ``resume`` an interrupted export with the same filters continues
+    from its checkpoint: the file is cut back to the last checkpointed chunk
+    and appended to. The checkpoint is removed once the export completes.
+    """
+    checkpoint_path = path + ".progress"
+    query = {
+        "format": fmt, "gzip": compress, "department": department,
+        "start": start.isoformat() if start else None, "end": end.isoformat() if end else None,
+    }
+    progress = ExportProgress()
+
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as file:
+            checkpoint = json.load(file)
+        if checkpoint["query"] != query:
+            raise ValueError(f"{checkpoint_path} belongs to an export with different options: {checkpoint['query']}")
+        progress = ExportProgress(seq=checkpoint["seq"], rows=checkpoint["rows"], bytes_written=checkpoint["bytes"])
+        if os.path.getsize(path) < progress.bytes_written:
+            raise ValueError(f"{path} is shorter than its checkpoint; start the export again without resume")
+
+    async with session_factory() as db:
+        remaining = await MessageService.count_for_export(db, start, end, department, progress.seq)
+    progress.total = progress.rows + remaining
+
+    with open(path, "r+b" if progress.bytes_written else "wb") as output:
+        output.truncate(progress.bytes_written)
+        output.seek(progress.bytes_written)
+        chunks = export_messages(
+            session_factory, fmt, compress, start, end, department,
+            after_seq=progress.seq, header=not progress.bytes_written, batch_size=batch_size, progress=progress
+        )
+        async for chunk in chunks:
+            output.write(chunk)
+            output.flush()
+            # The checkpoint must never claim bytes that a crash could lose
+            await asyncio.to_thread(os.fsync, output.fileno())
+            _write_checkpoint(checkpoint_path, {**progress.to_dict(), "query": query})
+            if on_progress:
+                on_progress(progress)
+
+    if os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    return progress
+
+
+def _write_checkpoint(path: str, checkpoint: Dict):
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        json.dump(checkpoint, file)
+    os.replace(temporary, path)
+
+
+def _print_progress(progress: ExportProgress):
+    percent = 100 * progress.rows / progress.total if progress.total else 100.0
+    sys.stderr.write(f"\r{progress.rows}/{progress.total} messages ({percent:.0f}%), "
+                     f"{progress.bytes_written / 1024 / 1024:.1f} MB, seq {progress.seq}")
+    sys.stderr.flush()
+
+
+if __name__ == "__main__":
+    # Compliance export of one department's messages for a date range, e.g.
+    #   python -m services.export --start 2026-01-01 --end 2026-02-01 --department ICU --format csv --gzip icu.csv.gz
+    # Rerun with --resume after an interruption to continue where it stopped.
+    parser = argparse.ArgumentParser(description="Export chat messages as NDJSON or CSV")
+    parser.add_argument("output")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="first timestamp included (ISO 8601)")
+    parser.add_argument("--end", type=datetime.fromisoformat, help="first timestamp excluded (ISO 8601)")
+    parser.add_argument("--department", help="only messages from this department's users")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted export of the same file")
+    parser.add_argument("--batch-size", type=int, default=EXPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    result = asyncio.run(export_to_file(
+        args.output, args.format, args.gzip, args.start, args.end, args.department,
+        resume=args.resume, batch_size=args.batch_size, on_progress=_print_progress
+    ))
+    sys.stderr.write(f"\nwrote {result.rows} messages to {args.output}\n")
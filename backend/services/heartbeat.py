@@ -0,0 +1,199 @@
+import asyncio
+import json
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Set
+
+from fastapi import WebSocket
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Heartbeat metrics
+HEARTBEAT_RTT = metrics.histogram(
+    "medchat_heartbeat_rtt_seconds", "Round-trip time of heartbeat ping/pong"
+)
+HEARTBEAT_PINGS = metrics.counter(
+    "medchat_heartbeat_pings_total", "Heartbeat pings sent to idle connections"
+)
+HEARTBEAT_REAPED = metrics.counter(
+    "medchat_heartbeat_reaped_total", "Connections reaped as unresponsive"
+)
+
+
+class _Tracked:
+    """Heartbeat state for one connection"""
+
+    __slots__ = ("user_id", "websocket", "last_seen", "ping_sent_at", "slot", "active", "failed")
+
+    def __init__(self, user_id: str, websocket: WebSocket, now: float):
+        self.user_id = user_id
+        self.websocket = websocket
+        self.last_seen = now
+        self.ping_sent_at: Optional[float] = None
+        self.slot = -1
+        self.active = True
+        self.failed = False
+
+
+class HeartbeatScheduler:
+    """Single-task timer wheel that pings idle connections and reaps dead ones.
+
+    Every tracked connection sits in exactly one wheel slot. Activity only
+    updates ``last_seen``; the connection is re-slotted lazily when its slot
+    comes due, so touching a connection on every frame is O(1) and there is
+    no per-connection sleeping task.
+    """
+
+    def __init__(
+        self,
+        manager,
+        idle_timeout: float = 25.0,
+        pong_timeout: float = 10.0,
+        tick: float = 1.0,
+        send_timeout: float = 2.0
+    ):
+        self.manager = manager
+        self.idle_timeout = idle_timeout
+        self.pong_timeout = pong_timeout
+        self.tick = tick
+        self.send_timeout = send_timeout
+
+        self.wheel_size = int(math.ceil(max(idle_timeout, pong_timeout) / tick)) + 2
+        self.slots: List[Set[_Tracked]] = [set() for _ in range(self.wheel_size)]
+        self.cursor = 0
+        self.tracked: Dict[str, _Tracked] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def track(self, user_id: str, websocket: WebSocket):
+        """Start watching a newly connected socket"""
+        previous = self.tracked.get(user_id)
+        if previous is not None:
+            previous.active = False
+        entry = _Tracked(user_id, websocket, time.monotonic())
+        self.tracked[user_id] = entry
+        self._schedule(entry, self.idle_timeout)
+
+    def untrack(self, user_id: str, websocket: WebSocket = None):
+        """Stop watching a socket; its wheel slot entry is dropped lazily"""
+        entry = self.tracked.get(user_id)
+        if entry is None or (websocket is not None and entry.websocket is not websocket):
+            return
+        entry.active = False
+        del self.tracked[user_id]
+
+    def touch(self, user_id: str):
+        """Record inbound activity on a connection"""
+        entry = self.tracked.get(user_id)
+        if entry is not None:
+            entry.last_seen = time.monotonic()
+
+    def record_pong(self, user_id: str):
+        """Handle a pong frame and record the round-trip time"""
+        entry = self.tracked.get(user_id)
+        if entry is None:
+            return
+        now = time.monotonic()
+        if entry.ping_sent_at is not None:
+            HEARTBEAT_RTT.observe(now - entry.ping_sent_at)
+            entry.ping_sent_at = None
+            # The pong deadline slot is stale now; wait for the next idle period
+            self._schedule(entry, self.idle_timeout)
+        entry.last_seen = now
+
+    def mark_failed(self, user_id: str):
+        """Flag a connection whose send failed so the next tick reaps it"""
+        entry = self.tracked.get(user_id)
+        if entry is not None and not entry.failed:
+            entry.failed = True
+            self._schedule(entry, self.tick)
+
+    def _schedule(self, entry: _Tracked, delay: float):
+        ticks = min(max(1, int(math.ceil(delay / self.tick))), self.wheel_size - 1)
+        if entry.slot >= 0:
+            self.slots[entry.slot].discard(entry)
+        entry.slot = (self.cursor + ticks) % self.wheel_size
+        self.slots[entry.slot].add(entry)
+
+    async def advance(self):
+        """Process the next wheel slot: ping idle connections and reap dead ones"""
+        self.cursor = (self.cursor + 1) % self.wheel_size
+        due = self.slots[self.cursor]
+        self.slots[self.cursor] = set()
+
+        now = time.monotonic()
+        to_ping: List[_Tracked] = []
+        to_reap: List[_Tracked] = []
+
+        for entry in due:
+            entry.slot = -1
+            if not entry.active:
+                continue
+            if entry.failed or entry.ping_sent_at is not None:
+                # Send failed or no pong before the deadline
+                to_reap.append(entry)
+            elif now - entry.last_seen >= self.idle_timeout:
+                to_ping.append(entry)
+            else:
+                self._schedule(entry, self.idle_timeout - (now - entry.last_seen))
+
+        if to_ping:
+            results = await asyncio.gather(*(self._ping(entry, now) for entry in to_ping))
+            to_reap.extend(entry for entry, ok in zip(to_ping, results) if not ok)
+
+        if to_reap:
+            await self._reap(to_reap)
+
+    async def _ping(self, entry: _Tracked, now: float) -> bool:
+        entry.ping_sent_at = now
+        self._schedule(entry, self.pong_timeout)
+        try:
+            await asyncio.wait_for(
+                entry.websocket.send_text(json.dumps({"type": "ping", "ts": int(time.time() * 1000)})),
+                timeout=self.send_timeout
+            )
+        except Exception:
+            return False
+        HEARTBEAT_PINGS.inc()
+        return True
+
+    async def _reap(self, entries: List[_Tracked]):
+        entries = [entry for entry in entries if entry.active]
+        for entry in entries:
+            self.untrack(entry.user_id, entry.websocket)
+        if not entries:
+            return
+        HEARTBEAT_REAPED.inc(len(entries))
+        logger.info("Reaping %d unresponsive connections", len(entries))
+        await self.manager.reap([(entry.user_id, entry.websocket) for entry in entries])
+
+    def get_stats(self) -> dict:
+        return {
+            "tracked": len(self.tracked),
+            "pings_total": HEARTBEAT_PINGS.value,
+            "reaped_total": HEARTBEAT_REAPED.value,
+            "rtt_seconds": HEARTBEAT_RTT.snapshot(),
+        }
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick)
+            try:
+                await self.advance()
+            except Exception:
+                logger.exception("Heartbeat tick failed")
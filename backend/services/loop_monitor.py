@@ -0,0 +1,135 @@
+import asyncio
+import collections
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from typing import Deque, Optional
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# A stall is reported when the loop hasn't run the monitor for this long past its tick
+LOOP_STALL_THRESHOLD_MS = float(os.getenv("LOOP_STALL_THRESHOLD_MS", "100"))
+
+LOOP_LAG = metrics.histogram(
+    "medchat_event_loop_lag_seconds", "Delay between a scheduled wakeup and the loop running it",
+    buckets=metrics.STAGE_BUCKETS
+)
+LOOP_STALLS = metrics.counter("medchat_event_loop_stalls_total", "Event-loop stalls over the threshold")
+
+
+class LoopMonitor:
+    """Measures event-loop lag and captures the stack of whatever blocks the loop.
+
+    A coroutine sleeps for ``interval`` and records how late it wakes up. A
+    watchdog thread checks that those wakeups keep happening; if the loop
+    goes quiet for longer than the threshold it grabs the loop thread's
+    current stack (the synchronous code that is hogging it) while the stall
+    is still in progress.
+    """
+
+    def __init__(
+        self,
+        interval: float = 0.05,
+        stall_threshold_ms: float = LOOP_STALL_THRESHOLD_MS,
+        max_reports: int = 20,
+        log_interval: float = 10.0
+    ):
+        self.interval = interval
+        self.stall_threshold = stall_threshold_ms / 1000
+        self.log_interval = log_interval
+        self.reports: Deque[dict] = collections.deque(maxlen=max_reports)
+
+        self._last_beat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._last_log = 0.0
+        self.last_lag = 0.0
+
+    async def start(self):
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = asyncio.create_task(self._run())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._watchdog is not None:
+            self._watchdog.join(timeout=1.0)
+            self._watchdog = None
+
+    async def _run(self):
+        while True:
+            scheduled = time.monotonic()
+            await asyncio.sleep(self.interval)
+            now = time.monotonic()
+            self.last_lag = max(0.0, now - scheduled - self.interval)
+            LOOP_LAG.observe(self.last_lag)
+            self._last_beat = now
+
+    def _watch(self):
+        reported_beat = None
+        poll = min(self.interval, self.stall_threshold / 2)
+        while not self._stop.wait(poll):
+            beat = self._last_beat
+            stalled_for = time.monotonic() - beat - self.interval
+            # One report per stall: the beat doesn't move until the loop recovers
+            if stalled_for >= self.stall_threshold and beat != reported_beat:
+                reported_beat = beat
+                self._report_stall(stalled_for)
+
+    def _report_stall(self, stalled_for: float):
+        frame = sys._current_frames().get(self._loop_thread_id)
+        stack = traceback.format_stack(frame) if frame is not None else []
+        task_name = None
+        try:
+            task = asyncio.current_task(self._loop)
+            task_name = task.get_name() if task is not None else None
+        except RuntimeError:
+            pass
+
+        LOOP_STALLS.inc()
+        report = {
+            "detected_at": time.time(),
+            "stalled_ms": round(stalled_for * 1000, 1),
+            "task": task_name,
+            "stack": [line.rstrip() for line in stack],
+        }
+        self.reports.append(report)
+
+        now = time.monotonic()
+        if now - self._last_log >= self.log_interval:
+            self._last_log = now
+            logger.warning(
+                "Event loop blocked for %.0f ms+ in task %s:\n%s",
+                report["stalled_ms"], task_name, "".join(stack[-8:])
+            )
+
+    def get_stats(self) -> dict:
+        return {
+            "lag_ms": round(self.last_lag * 1000, 3),
+            "lag_p99_ms": LOOP_LAG.quantile(0.99) * 1000,
+            "stalls_total": LOOP_STALLS.value,
+        }
+
+
+loop_monitor = LoopMonitor()
@@ -0,0 +1,283 @@
+import asyncio
+import bisect
+import glob
+import json
+import os
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Default latency buckets in seconds (1ms .. 10s)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Finer buckets for per-stage latencies that are usually well under a millisecond
+STAGE_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005) + DEFAULT_BUCKETS
+
+# Buckets for counts such as broadcast recipients
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# All metrics created through counter()/histogram()/gauge(), keyed by (name, labels)
+REGISTRY: Dict[Tuple[str, Tuple], object] = {}
+
+# Set to a shared directory when running several worker processes; each
+# worker writes its snapshot there and /metrics sums them all
+MULTIPROC_DIR = os.getenv("METRICS_MULTIPROC_DIR")
+
+
+def _label_key(labels: Optional[Dict[str, str]]) -> Tuple:
+    return tuple(sorted((labels or {}).items()))
+
+
+class Counter:
+    """Monotonic counter. Updated from the event loop only, so no locking is needed."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str = "", labels: Dict[str, str] = None):
+        self.name = name
+        self.help = help_text
+        self.labels = dict(labels or {})
+        self.value = 0
+
+    def inc(self, amount: int = 1):
+        self.value += amount
+
+    def snapshot(self) -> dict:
+        return {"value": self.value}
+
+
+class Gauge:
+    """Point-in-time value, either set directly or read from a callback at render time"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str = "", labels: Dict[str, str] = None,
+                 callback: Callable[[], float] = None):
+        self.name = name
+        self.help = help_text
+        self.labels = dict(labels or {})
+        self.callback = callback
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        if self.callback is not None:
+            try:
+                return float(self.callback())
+            except Exception:
+                return 0.0
+        return self._value
+
+    def snapshot(self) -> dict:
+        return {"value": self.value}
+
+
+class Histogram:
+    """Fixed-bucket histogram; per-bucket counts can be summed across processes."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS,
+                 labels: Dict[str, str] = None):
+        self.name = name
+        self.help = help_text
+        self.labels = dict(labels or {})
+        self.buckets = tuple(sorted(buckets))
+        # One extra slot for observations above the last bound (+Inf)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper bound of the bucket that contains it"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= target:
+                return bound
+        return self.buckets[-1]
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "p50": self.quantile(0.5),
+            "p90": self.quantile(0.9),
+            "p99": self.quantile(0.99),
+        }
+
+
+def counter(name: str, help_text: str = "", labels: Dict[str, str] = None) -> Counter:
+    """Get or create a registered counter"""
+    key = (name, _label_key(labels))
+    if key not in REGISTRY:
+        REGISTRY[key] = Counter(name, help_text, labels)
+    return REGISTRY[key]
+
+
+def gauge(name: str, help_text: str = "", labels: Dict[str, str] = None,
+          callback: Callable[[], float] = None) -> Gauge:
+    """Get or create a registered gauge"""
+    key = (name, _label_key(labels))
+    if key not in REGISTRY:
+        REGISTRY[key] = Gauge(name, help_text, labels, callback)
+    elif callback is not None:
+        REGISTRY[key].callback = callback
+    return REGISTRY[key]
+
+
+def histogram(name: str, help_text: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS,
+              labels: Dict[str, str] = None) -> Histogram:
+    """Get or create a registered histogram"""
+    key = (name, _label_key(labels))
+    if key not in REGISTRY:
+        REGISTRY[key] = Histogram(name, help_text, buckets, labels)
+    return REGISTRY[key]
+
+
+def collect() -> List[dict]:
+    """Plain-data dump of every registered metric, suitable for merging across processes"""
+    samples = []
+    for metric in REGISTRY.values():
+        sample = {
+            "name": metric.name,
+            "help": metric.help,
+            "kind": metric.kind,
+            "labels": metric.labels,
+        }
+        if metric.kind == "histogram":
+            sample.update(buckets=list(metric.buckets), counts=list(metric.counts),
+                          sum=metric.sum, count=metric.count)
+        else:
+            sample["value"] = metric.value
+        samples.append(sample)
+    return samples
+
+
+def merge(snapshots: List[List[dict]]) -> List[dict]:
+    """Sum samples with the same name and labels from several processes"""
+    merged: Dict[Tuple[str, Tuple], dict] = {}
+    for samples in snapshots:
+        for sample in samples:
+            key = (sample["name"], _label_key(sample["labels"]))
+            current = merged.get(key)
+            if current is None:
+                merged[key] = json.loads(json.dumps(sample))
+            elif sample["kind"] == "histogram":
+                if current["buckets"] != sample["buckets"]:
+                    continue
+                current["counts"] = [a + b for a, b in zip(current["counts"], sample["counts"])]
+                current["sum"] += sample["sum"]
+                current["count"] += sample["count"]
+            else:
+                current["value"] += sample["value"]
+    return list(merged.values())
+
+
+def write_snapshot():
+    """Write this process's metrics to the shared multiprocess directory"""
+    if not MULTIPROC_DIR:
+        return
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+    path = os.path.join(MULTIPROC_DIR, f"metrics-{os.getpid()}.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as snapshot_file:
+        json.dump({"pid": os.getpid(), "written_at": time.time(), "samples": collect()}, snapshot_file)
+    # Atomic so readers never see a half-written file
+    os.replace(tmp_path, path)
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _gather() -> List[dict]:
+    if not MULTIPROC_DIR:
+        return collect()
+
+    write_snapshot()
+    snapshots = []
+    for path in glob.glob(os.path.join(MULTIPROC_DIR, "metrics-*.json")):
+        try:
+            with open(path) as snapshot_file:
+                data = json.load(snapshot_file)
+        except (OSError, ValueError):
+            continue
+        samples = data["samples"]
+        if not _pid_alive(data["pid"]):
+            # Counters of exited workers still count; their gauges no longer apply
+            samples = [sample for sample in samples if sample["kind"] != "gauge"]
+        snapshots.append(samples)
+    return merge(snapshots)
+
+
+def _escape_label_value(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str], extra: Tuple[str, str] = None) -> str:
+    items = list(labels.items())
+    if extra:
+        items.append(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in items) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus() -> str:
+    """Render all metrics in the Prometheus text exposition format (0.0.4)"""
+    samples = sorted(_gather(), key=lambda sample: (sample["name"], _label_key(sample["labels"])))
+    lines = []
+    current_name = None
+    for sample in samples:
+        name = sample["name"]
+        if name != current_name:
+            current_name = name
+            if sample["help"]:
+                lines.append(f"# HELP {name} {sample['help']}")
+            lines.append(f"# TYPE {name} {sample['kind']}")
+
+        labels = sample["labels"]
+        if sample["kind"] == "histogram":
+            cumulative = 0
+            for bound, bucket_count in zip(sample["buckets"] + [float("inf")], sample["counts"]):
+                cumulative += bucket_count
+                lines.append(
+                    f"{name}_bucket{_format_labels(labels, ('le', _format_value(bound)))} {cumulative}"
+                )
+            lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(sample['sum'])}")
+            lines.append(f"{name}_count{_format_labels(labels)} {sample['count']}")
+        else:
+            lines.append(f"{name}{_format_labels(labels)} {_format_value(sample['value'])}")
+    return "\n".join(lines) + "\n"
+
+
+async def snapshot_forever(interval: float = 5.0):
+    """Periodically write this worker's snapshot (multiprocess mode only)"""
+    while True:
+        await asyncio.sleep(interval)
+        write_snapshot()
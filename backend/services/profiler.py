@@ -0,0 +1,157 @@
+import asyncio
+import collections
+import os
+import sys
+import threading
+import time
+import weakref
+from typing import Dict, Optional
+
+# Upper bounds so an admin request can't leave a sampler running for long
+MAX_PROFILE_SECONDS = 60.0
+MIN_SAMPLE_INTERVAL = 0.001
+
+IDLE_LABEL = "idle"
+
+# What each running task is doing: the ASGI scope of its request, or an explicit label
+_task_labels: "weakref.WeakKeyDictionary[asyncio.Task, object]" = weakref.WeakKeyDictionary()
+
+
+def label_task(label) -> None:
+    """Attribute samples taken while the current task runs to ``label`` (a string or ASGI scope)"""
+    task = asyncio.current_task()
+    if task is not None:
+        _task_labels[task] = label
+
+
+def _describe(label) -> str:
+    if isinstance(label, str):
+        return label
+    # An ASGI scope; after routing FastAPI stores the matched route in it
+    route = label.get("route")
+    path = getattr(route, "path", None) or label.get("path", "?")
+    if label.get("type") == "websocket":
+        return f"WS {path}"
+    return f"{label.get('method', 'GET')} {path}"
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    names = []
+    while frame is not None:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    names.reverse()
+    return ";".join(names)
+
+
+class ProfilerLabelMiddleware:
+    """Pure ASGI middleware that labels each request's task for the profiler"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket"):
+            # The scope is updated in place by the router, so the route is known by sampling time
+            label_task(scope)
+        await self.app(scope, receive, send)
+
+
+class SamplingProfiler:
+    """Stack-sampling profiler for the running event loop.
+
+    A background thread reads the loop thread's current frame every
+    ``interval`` seconds via ``sys._current_frames()`` and counts collapsed
+    stacks, prefixed with the label of the task that was running. Nothing is
+    hooked into the interpreter, so the only cost to the app is the GIL time
+    of each sample.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, loop_thread_id: int,
+                 interval: float = 0.005, all_threads: bool = False):
+        self.loop = loop
+        self.loop_thread_id = loop_thread_id
+        self.interval = max(interval, MIN_SAMPLE_INTERVAL)
+        self.all_threads = all_threads
+        self.stacks: Dict[str, int] = collections.Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        started = time.monotonic()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            frame = frames.get(self.loop_thread_id)
+            if frame is not None:
+                self.stacks[f"{self._current_label()};{_collapse(frame)}"] += 1
+            if self.all_threads:
+                names = {thread.ident: thread.name for thread in threading.enumerate()}
+                for thread_id, thread_frame in frames.items():
+                    if thread_id not in (own_id, self.loop_thread_id):
+                        thread_name = names.get(thread_id, thread_id)
+                        self.stacks[f"thread:{thread_name};{_collapse(thread_frame)}"] += 1
+            self.samples += 1
+        self.duration = time.monotonic() - started
+
+    def _current_label(self) -> str:
+        try:
+            task = asyncio.current_task(self.loop)
+        except RuntimeError:
+            task = None
+        if task is None:
+            # Between tasks: waiting in the selector or running callbacks
+            return IDLE_LABEL
+        label = _task_labels.get(task)
+        if label is not None:
+            return _describe(label)
+        coro = task.get_coro()
+        return f"task:{getattr(coro, '__qualname__', task.get_name())}"
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format, one 'frame;frame;... count' line per stack"""
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+    def by_label(self) -> Dict[str, int]:
+        totals: Dict[str, int] = collections.Counter()
+        for stack, count in self.stacks.items():
+            totals[stack.split(";", 1)[0]] += count
+        return dict(totals.most_common())
+
+
+_profile_lock = asyncio.Lock()
+
+
+def profile_in_progress() -> bool:
+    return _profile_lock.locked()
+
+
+async def run_profile(seconds: float, interval: float = 0.005, all_threads: bool = False) -> SamplingProfiler:
+    """Sample the current event loop for ``seconds`` while it keeps serving traffic"""
+    async with _profile_lock:
+        profiler = SamplingProfiler(
+            asyncio.get_running_loop(), threading.get_ident(), interval=interval, all_threads=all_threads
+        )
+        profiler.start()
+        try:
+            await asyncio.sleep(min(max(seconds, 0.0), MAX_PROFILE_SECONDS))
+        finally:
+            profiler.stop()
+        return profiler
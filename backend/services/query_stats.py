@@ -0,0 +1,209 @@
+import contextvars
+import functools
+import inspect
+import logging
+import os
+import re
+import time
+from typing import Dict, List
+
+from sqlalchemy import event
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Statements slower than this are logged (parameters never are)
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "200"))
+# At most this many slow-query log lines per window; the rest are counted
+SLOW_QUERY_LOG_LIMIT = int(os.getenv("SLOW_QUERY_LOG_LIMIT", "10"))
+SLOW_QUERY_LOG_WINDOW = 60.0
+# Cap on distinct normalized statements tracked, so ad-hoc SQL can't grow memory
+MAX_TRACKED_STATEMENTS = 500
+
+# Service method currently running, e.g. "MessageService.create_message"
+current_operation: contextvars.ContextVar[str] = contextvars.ContextVar("current_operation", default="unattributed")
+
+QUERY_COUNT = metrics.counter("medchat_db_queries_total", "SQL statements executed")
+SLOW_QUERIES = metrics.counter("medchat_db_slow_queries_total", "SQL statements over the slow-query threshold")
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"\?|%\(\w+\)s|%s|\$\d+|:\w+")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=2048)
+def normalize_sql(statement: str) -> str:
+    """Reduce a statement to its shape: literals and placeholders become ?, IN lists collapse"""
+    normalized = _STRING_LITERAL.sub("?", statement)
+    normalized = _PLACEHOLDER.sub("?", normalized)
+    normalized = _NUMBER_LITERAL.sub("?", normalized)
+    normalized = _PLACEHOLDER_LIST.sub("(?)", normalized)
+    return _WHITESPACE.sub(" ", normalized).strip()
+
+
+class StatementStats:
+    """Latency statistics for one normalized statement"""
+
+    __slots__ = ("sql", "calls", "rows", "total", "max", "histogram", "operations")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.calls = 0
+        self.rows = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = metrics.Histogram("statement_seconds", buckets=metrics.STAGE_BUCKETS)
+        self.operations: Dict[str, int] = {}
+
+    def record(self, elapsed: float, rows: int, operation: str):
+        self.calls += 1
+        self.rows += max(rows, 0)
+        self.total += elapsed
+        if elapsed > self.max:
+            self.max = elapsed
+        self.histogram.observe(elapsed)
+        self.operations[operation] = self.operations.get(operation, 0) + 1
+
+    def to_dict(self) -> dict:
+        return {
+            "sql": self.sql,
+            "calls": self.calls,
+            "rows": self.rows,
+            "total_ms": round(self.total * 1000, 3),
+            "mean_ms": round(self.total * 1000 / self.calls, 3) if self.calls else 0.0,
+            "max_ms": round(self.max * 1000, 3),
+            "p50_ms": self.histogram.quantile(0.5) * 1000,
+            "p99_ms": self.histogram.quantile(0.99) * 1000,
+            "operations": dict(self.operations),
+        }
+
+
+class QueryStats:
+    """Collects per-statement and per-operation query timings from engine events"""
+
+    def __init__(self, slow_query_ms: float = SLOW_QUERY_MS, slow_log_limit: int = SLOW_QUERY_LOG_LIMIT):
+        self.slow_query_seconds = slow_query_ms / 1000
+        self.slow_log_limit = slow_log_limit
+        self.statements: Dict[str, StatementStats] = {}
+        self._slow_window_start = 0.0
+        self._slow_logged = 0
+        self._slow_suppressed = 0
+
+    def install(self, engine):
+        """Attach timing hooks to an engine (async engines use their sync_engine)"""
+        target = getattr(engine, "sync_engine", engine)
+        event.listen(target, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(target, "after_cursor_execute", self._after_cursor_execute)
+
+    def remove(self, engine):
+        target = getattr(engine, "sync_engine", engine)
+        event.remove(target, "before_cursor_execute", self._before_cursor_execute)
+        event.remove(target, "after_cursor_execute", self._after_cursor_execute)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_times", []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        start_times = conn.info.get("query_start_times")
+        if not start_times:
+            return
+        elapsed = time.perf_counter() - start_times.pop()
+        self.record(statement, elapsed, getattr(cursor, "rowcount", -1), parameters, executemany)
+
+    def record(self, statement: str, elapsed: float, rows: int = -1, parameters=None, executemany: bool = False):
+        sql = normalize_sql(statement)
+        operation = current_operation.get()
+
+        stats = self.statements.get(sql)
+        if stats is None:
+            if len(self.statements) >= MAX_TRACKED_STATEMENTS:
+                sql = "<other>"
+                stats = self.statements.get(sql)
+            if stats is None:
+                stats = self.statements[sql] = StatementStats(sql)
+        stats.record(elapsed, rows, operation)
+
+        QUERY_COUNT.inc()
+        metrics.histogram(
+            "medchat_db_query_seconds", "SQL latency by calling service method",
+            buckets=metrics.STAGE_BUCKETS, labels={"operation": operation}
+        ).observe(elapsed)
+
+        if elapsed >= self.slow_query_seconds:
+            SLOW_QUERIES.inc()
+            self._log_slow(sql, elapsed, operation, parameters, executemany)
+
+    def _log_slow(self, sql: str, elapsed: float, operation: str, parameters, executemany: bool):
+        now = time.monotonic()
+        if now - self._slow_window_start >= SLOW_QUERY_LOG_WINDOW:
+            if self._slow_suppressed:
+                logger.warning("Slow query log: %d more slow statements suppressed", self._slow_suppressed)
+            self._slow_window_start = now
+            self._slow_logged = 0
+            self._slow_suppressed = 0
+
+        if self._slow_logged >= self.slow_log_limit:
+            self._slow_suppressed += 1
+            return
+        self._slow_logged += 1
+        # Medical data: describe the parameters, never log their values
+        logger.warning(
+            "Slow query (%.1f ms) in %s: %s [params redacted: %s]",
+            elapsed * 1000, operation, sql, describe_parameters(parameters, executemany)
+        )
+
+    def top(self, n: int = 10, order_by: str = "total") -> List[dict]:
+        """Top-N statements by total, mean or max time, or by call count"""
+        keys = {
+            "total": lambda stats: stats.total,
+            "mean": lambda stats: stats.total / stats.calls if stats.calls else 0.0,
+            "max": lambda stats: stats.max,
+            "calls": lambda stats: stats.calls,
+        }
+        key = keys.get(order_by, keys["total"])
+        ranked = sorted(self.statements.values(), key=key, reverse=True)
+        return [stats.to_dict() for stats in ranked[:n]]
+
+    def reset(self):
+        self.statements.clear()
+
+
+def describe_parameters(parameters, executemany: bool = False) -> str:
+    """Shape of bound parameters (count and types) without their values"""
+    if parameters is None:
+        return "none"
+    if executemany:
+        rows = list(parameters)
+        return f"{len(rows)} rows x {describe_parameters(rows[0]) if rows else 'none'}"
+    if isinstance(parameters, dict):
+        return ", ".join(f"{key}:{type(value).__name__}" for key, value in parameters.items()) or "none"
+    if isinstance(parameters, (list, tuple)):
+        return ", ".join(type(value).__name__ for value in parameters) or "none"
+    return type(parameters).__name__
+
+
+def track_operations(cls):
+    """Class decorator: attribute queries run inside each async static method to 'Class.method'"""
+    for name, attribute in list(vars(cls).items()):
+        if not isinstance(attribute, staticmethod) or not inspect.iscoroutinefunction(attribute.__func__):
+            continue
+        setattr(cls, name, staticmethod(_with_operation(f"{cls.__name__}.{name}", attribute.__func__)))
+    return cls
+
+
+def _with_operation(operation: str, func):
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        token = current_operation.set(operation)
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            current_operation.reset(token)
+    return wrapper
+
+
+# Process-wide collector, installed on the app engine in main.py
+query_stats = QueryStats()
@@ -0,0 +1,258 @@
+import asyncio
+import bisect
+import json
+import logging
+import os
+from array import array
+from typing import Dict, Optional, Tuple
+
+from config.database import AsyncSessionLocal
+from services.database_service import ReadCursorService
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Seconds between batched cursor writes and coalesced receipt frames
+READ_RECEIPT_INTERVAL = float(os.getenv("READ_RECEIPT_INTERVAL", "1.0"))
+# Latest message ids kept per channel, so cursors a little behind the head are placed without a query
+READ_RECENT_SEQS = int(os.getenv("READ_RECENT_SEQS", "10000"))
+
+RECEIPT_FRAMES = metrics.counter("medchat_read_receipt_frames_total", "Coalesced read receipt frames fanned out")
+CURSOR_WRITES = metrics.counter("medchat_read_cursor_writes_total", "Read cursors written to the database")
+CURSOR_COUNT_QUERIES = metrics.counter(
+    "medchat_read_cursor_count_queries_total", "Read cursors placed with a COUNT query instead of from memory"
+)
+
+
+class _Channel:
+    """Message count, head and latest message ids of one channel"""
+
+    __slots__ = ("count", "head", "loaded_head", "recent", "recent_base")
+
+    def __init__(self, count: int = 0, head: int = 0):
+        self.count = count
+        self.head = head
+        # Messages up to here were counted by the cold-start query
+        self.loaded_head = head
+        # Ids of the latest messages in order; recent_base messages come before recent[0]
+        self.recent = array("q")
+        self.recent_base = count
+
+    def add(self, seq: int, max_recent: int):
+        if seq <= self.loaded_head:
+            return
+        self.count += 1
+        self.head = max(self.head, seq)
+        # Usually an append; concurrent commits may arrive slightly out of order
+        bisect.insort(self.recent, seq)
+        if len(self.recent) > 2 * max_recent:
+            dropped = len(self.recent) - max_recent
+            del self.recent[:dropped]
+            self.recent_base += dropped
+
+    def read_through(self, seq: int) -> Optional[int]:
+        """Messages with an id up to ``seq``, or None if only the database knows"""
+        if seq >= self.head:
+            return self.count
+        if self.recent and seq >= self.recent[0]:
+            return self.recent_base + bisect.bisect_right(self.recent, seq)
+        if self.recent_base == 0:
+            return 0
+        return None
+
+
+class ReadReceipts:
+    """Per-user, per-channel read cursors with unread counts kept in memory.
+
+    A cursor is the highest message id (sequence number) a user has read in
+    a channel, stored with the number of messages up to it. A channel keeps
+    its message count, so a user's unread badge for it is one subtraction
+    and badges for every channel cost O(channels), never a COUNT over
+    messages. Counts are loaded once per process (channel heads on start,
+    a user's cursors on first use) and maintained as messages arrive.
+
+    Cursor moves are batched into one upsert per interval and announced as
+    one coalesced "read" frame per channel.
+    """
+
+    def __init__(
+        self,
+        manager,
+        session_factory=AsyncSessionLocal,
+        interval: float = READ_RECEIPT_INTERVAL,
+        max_recent: int = READ_RECENT_SEQS
+    ):
+        self.manager = manager
+        self.session_factory = session_factory
+        self.interval = interval
+        self.max_recent = max_recent
+        self.cursor_service = ReadCursorService()
+
+        self._channels: Dict[str, _Channel] = {}
+        # user_id -> channel -> (last read seq, messages read through it)
+        self._cursors: Dict[str, Dict[str, Tuple[int, int]]] = {}
+        # (user_id, channel) -> seq still to be written
+        self._unsaved: Dict[Tuple[str, str], int] = {}
+        # channel -> user_id -> seq still to be announced
+        self._receipts: Dict[str, Dict[str, int]] = {}
+
+        self._heads_task: Optional[asyncio.Future] = None
+        self._user_loads: Dict[str, asyncio.Future] = {}
+        self._save_lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+
+    async def load(self):
+        """Load every channel's message count and head, once per process"""
+        if self._heads_task is None:
+            self._heads_task = asyncio.ensure_future(self._load_heads())
+        try:
+            await asyncio.shield(self._heads_task)
+        except Exception:
+            # Let the next caller retry
+            self._heads_task = None
+            raise
+
+    async def _load_heads(self):
+        async with self.session_factory() as session:
+            heads = await self.cursor_service.get_channel_heads(session)
+        # Messages are only recorded after this ran; any it already counted are skipped by id
+        self._channels = {channel: _Channel(count, head) for channel, count, head in heads}
+
+    async def ensure_user(self, user_id: str):
+        """Load a user's cursors, once per process"""
+        if user_id in self._cursors:
+            return
+        await self.load()
+        pending = self._user_loads.get(user_id)
+        if pending is None:
+            pending = asyncio.ensure_future(self._load_user(user_id))
+            self._user_loads[user_id] = pending
+            pending.add_done_callback(lambda _: self._user_loads.pop(user_id, None))
+        await asyncio.shield(pending)
+
+    async def _load_user(self, user_id: str):
+        async with self.session_factory() as session:
+            rows = await self.cursor_service.get_user_cursors(session, user_id)
+        self._cursors[user_id] = {channel: (seq, read) for channel, seq, read in rows}
+
+    async def record_message(self, channel: str, seq: int, sender: str = None):
+        """Count a stored message; its sender has read it"""
+        await self.load()
+        state = self._channels.setdefault(channel, _Channel())
+        state.add(seq, self.max_recent)
+        if sender:
+            await self.ensure_user(sender)
+            # Sending implies reading; the message itself tells the others, so no receipt frame
+            self._advance(sender, channel, seq, state.read_through(seq), announce=False)
+
+    async def mark_read(self, user_id: str, channel: str, seq: int) -> bool:
+        """Move a user's cursor forward; False if it was already there"""
+        await self.ensure_user(user_id)
+        state = self._channels.get(channel)
+        if state is None:
+            return False
+        seq = min(seq, state.head)
+        if seq <= self._cursor(user_id, channel)[0]:
+            return False
+
+        read = state.read_through(seq)
+        if read is None:
+            # A cursor far behind the head, older than the ids kept in memory
+            CURSOR_COUNT_QUERIES.inc()
+            async with self.session_factory() as session:
+                read = await self.cursor_service.count_through(session, channel, seq)
+            if seq <= self._cursor(user_id, channel)[0]:
+                return False
+        self._advance(user_id, channel, seq, read, announce=True)
+        return True
+
+    def _cursor(self, user_id: str, channel: str) -> Tuple[int, int]:
+        return self._cursors.get(user_id, {}).get(channel, (0, 0))
+
+    def _advance(self, user_id: str, channel: str, seq: int, read: Optional[int], announce: bool):
+        cursors = self._cursors.setdefault(user_id, {})
+        if seq <= cursors.get(channel, (0, 0))[0]:
+            return
+        cursors[channel] = (seq, read if read is not None else cursors.get(channel, (0, 0))[1])
+        self._unsaved[(user_id, channel)] = seq
+        if announce:
+            self._receipts.setdefault(channel, {})[user_id] = seq
+
+    def unread(self, user_id: str) -> Dict[str, dict]:
+        """Unread count and head of every channel for a loaded user, without touching the database"""
+        cursors = self._cursors.get(user_id, {})
+        return {
+            channel: {"unread": max(0, state.count - cursors.get(channel, (0, 0))[1]), "head": state.head}
+            for channel, state in self._channels.items()
+        }
+
+    async def badges(self, user_id: str) -> Dict[str, dict]:
+        await self.ensure_user(user_id)
+        return self.unread(user_id)
+
+    async def save(self) -> int:
+        """Write every moved cursor in one upsert; returns the number written"""
+        async with self._save_lock:
+            unsaved, self._unsaved = self._unsaved, {}
+            if not unsaved:
+                return 0
+            try:
+                async with self.session_factory() as session:
+                    written = await self.cursor_service.save_cursors(session, unsaved)
+                CURSOR_WRITES.inc(written)
+                return written
+            except Exception:
+                logger.exception("Failed to save %d read cursors, will retry", len(unsaved))
+                # Put the batch back without moving anything recorded meanwhile backwards
+                for key, seq in unsaved.items():
+                    if self._unsaved.get(key, 0) < seq:
+                        self._unsaved[key] = seq
+                return 0
+
+    async def flush(self) -> int:
+        """Send one receipt frame per channel with new reads and save cursors; returns frames sent"""
+        receipts, self._receipts = self._receipts, {}
+        for channel, readers in sorted(receipts.items()):
+            frame = json.dumps({
+                "type": "read",
+                "channel": channel,
+                "readers": [{"user_id": user_id, "seq": seq} for user_id, seq in sorted(readers.items())],
+            })
+            await self.manager.send_ephemeral(frame)
+        RECEIPT_FRAMES.inc(len(receipts))
+        await self.save()
+        return len(receipts)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still buffered"""
+        if self._task is not None:
+            # Not cancelled: a save in progress has already taken its batch out of _unsaved
+            self._stopping.set()
+            await self._task
+            self._task = None
+            self._stopping.clear()
+        await self.save()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.interval)
+                return
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Read receipt flush failed")
+
+    def get_stats(self) -> dict:
+        return {
+            "channels": len(self._channels),
+            "users": len(self._cursors),
+            "unsaved": len(self._unsaved),
+        }
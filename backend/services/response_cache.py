@@ -0,0 +1,136 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Hashable, Optional, Tuple
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from services import metrics
+
+# How long a computed response is shared before it is recomputed
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "1.0"))
+
+# Differs per process, so version ETags from a previous run never match
+EPOCH = uuid.uuid4().hex[:8]
+
+CACHE_RESULTS = {
+    result: metrics.counter(
+        "medchat_response_cache_total", "Read API responses by cache outcome", labels={"result": result}
+    )
+    for result in ("hit", "miss", "coalesced", "not_modified")
+}
+
+
+class CachedResponse:
+    """A JSON body encoded once, with its ETag"""
+
+    __slots__ = ("body", "etag", "version", "created")
+
+    def __init__(self, body: bytes, etag: str, version: Optional[int], created: float):
+        self.body = body
+        self.etag = etag
+        self.version = version
+        self.created = created
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+class ResponseCache:
+    """Shared micro-TTL cache with single-flight computation for read endpoints.
+
+    Entries are keyed by endpoint and parameters and tagged with the data
+    version they were computed at (e.g. the presence or message counter).
+    An entry is reused while its version is current and it is younger than
+    ``ttl``; concurrent requests for a missing entry await one computation.
+    Versioned ETags let unchanged polls get a 304 without any computation;
+    unversioned ones hash the body.
+    """
+
+    def __init__(self, ttl: float = RESPONSE_CACHE_TTL, max_entries: int = 256):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, CachedResponse]" = OrderedDict()
+        self._inflight: Dict[Tuple[Hashable, Optional[int]], asyncio.Future] = {}
+
+    @staticmethod
+    def version_etag(key: Hashable, version: int) -> str:
+        return f'"{EPOCH}-{hashlib.blake2b(repr(key).encode(), digest_size=6).hexdigest()}-{version}"'
+
+    async def get(self, key: Hashable, compute: Callable[[], Awaitable], version: int = None) -> CachedResponse:
+        """Cached response for ``key``, computing it at most once at a time"""
+        entry = self._entries.get(key)
+        if entry is not None and entry.version == version and time.monotonic() - entry.created < self.ttl:
+            self._entries.move_to_end(key)
+            CACHE_RESULTS["hit"].inc()
+            return entry
+
+        flight = (key, version)
+        pending = self._inflight.get(flight)
+        if pending is None:
+            CACHE_RESULTS["miss"].inc()
+            pending = asyncio.ensure_future(self._fill(key, compute, version))
+            self._inflight[flight] = pending
+            pending.add_done_callback(lambda _: self._inflight.pop(flight, None))
+        else:
+            CACHE_RESULTS["coalesced"].inc()
+        # One caller disconnecting must not cancel the computation the others wait on
+        return await asyncio.shield(pending)
+
+    async def _fill(self, key: Hashable, compute: Callable[[], Awaitable], version: Optional[int]) -> CachedResponse:
+        content = await compute()
+        body = json.dumps(
+            jsonable_encoder(content), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+        ).encode("utf-8")
+        if version is None:
+            etag = f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"'
+        else:
+            etag = self.version_etag(key, version)
+        entry = CachedResponse(body, etag, version, time.monotonic())
+
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return entry
+
+    async def respond(self, request: Request, key: Hashable, compute: Callable[[], Awaitable],
+                      version: int = None) -> Response:
+        """JSON response for a read endpoint, or 304 if the client's copy is current"""
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match and version is not None and _etag_matches(if_none_match, self.version_etag(key, version)):
+            CACHE_RESULTS["not_modified"].inc()
+            return self._not_modified(self.version_etag(key, version))
+
+        entry = await self.get(key, compute, version)
+        if if_none_match and _etag_matches(if_none_match, entry.etag):
+            CACHE_RESULTS["not_modified"].inc()
+            return self._not_modified(entry.etag)
+        return Response(
+            content=entry.body, media_type="application/json",
+            headers={"ETag": entry.etag, "Cache-Control": "no-cache"}
+        )
+
+    @staticmethod
+    def _not_modified(etag: str) -> Response:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "no-cache"})
+
+    def clear(self):
+        self._entries.clear()
+
+    def get_stats(self) -> dict:
+        return {"entries": len(self._entries), "inflight": len(self._inflight), "ttl_seconds": self.ttl}
+
+
+# Shared by the read endpoints in main.py
+response_cache = ResponseCache()
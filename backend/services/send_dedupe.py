@@ -0,0 +1,89 @@
+import asyncio
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from services import metrics
+
+# Seconds a client message ID is remembered; resends later than this are stored again
+SEND_DEDUPE_TTL = float(os.getenv("SEND_DEDUPE_TTL", "600"))
+# Client message IDs remembered at most, across all users
+SEND_DEDUPE_MAX_ENTRIES = int(os.getenv("SEND_DEDUPE_MAX_ENTRIES", "200000"))
+
+# UUIDs and similar opaque tokens
+CLIENT_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+DUPLICATE_SENDS = metrics.counter(
+    "medchat_ws_duplicate_sends_total", "Resent client messages answered from the dedupe set instead of stored again"
+)
+DEDUPE_EVICTIONS = metrics.counter(
+    "medchat_ws_dedupe_evictions_total", "Client message IDs forgotten before their TTL because the set was full"
+)
+
+
+class SendDedupe:
+    """Recently seen client message IDs, so a resent message is acknowledged instead of stored twice.
+
+    Clients tag each message with an ID of their own and resend anything
+    not yet acknowledged after a reconnect. The first send of an ID claims
+    it; its ack (server message ID and sequence) is kept for ``ttl``
+    seconds, and a resend in that window gets the same ack again. A resend
+    arriving while the first is still being stored waits for its ack.
+
+    Entries are held in arrival order with a fixed TTL, so expiry pops from
+    the front; ``max_entries`` bounds memory if a flood outpaces expiry.
+    """
+
+    def __init__(self, ttl: float = SEND_DEDUPE_TTL, max_entries: int = SEND_DEDUPE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # (user_id, client_id) -> (expiry, future of the ack)
+        self._seen: "OrderedDict[Tuple[str, str], Tuple[float, asyncio.Future]]" = OrderedDict()
+
+    def _expire(self, now: float):
+        while self._seen:
+            key, (expires, _) = next(iter(self._seen.items()))
+            if expires > now:
+                break
+            self._forget(key)
+        while len(self._seen) >= self.max_entries:
+            self._forget(next(iter(self._seen)))
+            DEDUPE_EVICTIONS.inc()
+
+    def _forget(self, key: Tuple[str, str]):
+        _, ack = self._seen.pop(key)
+        if not ack.done():
+            # Resends waiting on it take over rather than wait on an entry nothing will complete
+            ack.set_result(None)
+
+    async def claim(self, user_id: str, client_id: str) -> Optional[dict]:
+        """None if this send is new and the caller must store it and call ``complete`` or ``abandon``;
+        otherwise the ack of the earlier send, waiting for it if that send is still in flight"""
+        key = (user_id, client_id)
+        while True:
+            now = time.monotonic()
+            self._expire(now)
+            seen = self._seen.get(key)
+            if seen is None:
+                self._seen[key] = (now + self.ttl, asyncio.get_running_loop().create_future())
+                return None
+            ack = await asyncio.shield(seen[1])
+            if ack is not None:
+                DUPLICATE_SENDS.inc()
+                return ack
+            # The earlier send failed and gave up its claim; try to take it over
+
+    def complete(self, user_id: str, client_id: str, ack: dict):
+        seen = self._seen.get((user_id, client_id))
+        if seen is not None and not seen[1].done():
+            seen[1].set_result(ack)
+
+    def abandon(self, user_id: str, client_id: str):
+        """Forget a send that failed, so a resend is processed afresh"""
+        if (user_id, client_id) in self._seen:
+            self._forget((user_id, client_id))
+
+    def __len__(self) -> int:
+        return len(self._seen)
@@ -0,0 +1,139 @@
+import asyncio
+import logging
+from datetime import datetime
+from typing import Dict, Optional
+
+from config.database import AsyncSessionLocal
+from services.database_service import SessionService
+
+logger = logging.getLogger(__name__)
+
+
+class SessionBatcher:
+    """Buffers session opens and closes and writes them to the database in batches.
+
+    A reconnect storm produces one INSERT and one UPDATE per flush instead of a
+    transaction per connect/disconnect. A session that opens and closes within
+    the same flush window is inserted already closed.
+    """
+
+    def __init__(
+        self,
+        session_factory=AsyncSessionLocal,
+        flush_interval: float = 1.0,
+        max_batch: int = 500
+    ):
+        self.session_factory = session_factory
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.session_service = SessionService()
+
+        # connection_id -> pending insert row
+        self._pending_opens: Dict[str, dict] = {}
+        # connection_id -> disconnect time for sessions already written
+        self._pending_closes: Dict[str, datetime] = {}
+
+        self._flush_lock = asyncio.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+    def record_open(self, user_id: str, connection_id: str):
+        """Queue a new active session"""
+        self._pending_opens[connection_id] = {
+            "user_id": user_id,
+            "connection_id": connection_id,
+            "connected_at": datetime.utcnow(),
+            "disconnected_at": None,
+            "is_active": True,
+        }
+        self._maybe_wake()
+
+    def record_close(self, connection_id: str):
+        """Queue the end of a session"""
+        now = datetime.utcnow()
+        row = self._pending_opens.get(connection_id)
+        if row is not None:
+            # Never written yet: insert it already closed
+            row["disconnected_at"] = now
+            row["is_active"] = False
+        else:
+            self._pending_closes[connection_id] = now
+        self._maybe_wake()
+
+    def pending_count(self) -> int:
+        return len(self._pending_opens) + len(self._pending_closes)
+
+    def _maybe_wake(self):
+        if self._wakeup is not None and self.pending_count() >= self.max_batch:
+            self._wakeup.set()
+
+    async def flush(self) -> int:
+        """Write all buffered opens and closes; returns the number of rows affected"""
+        async with self._flush_lock:
+            opens = list(self._pending_opens.values())
+            closes = self._pending_closes
+            if not opens and not closes:
+                return 0
+            self._pending_opens = {}
+            self._pending_closes = {}
+
+            try:
+                async with self.session_factory() as session:
+                    # Opens first so closes in the same batch find their rows
+                    written = await self.session_service.create_sessions(session, opens)
+                    written += await self.session_service.end_sessions(session, closes)
+                    # One transaction, so a failure leaves nothing half-written to re-queue
+                    await session.commit()
+                return written
+            except Exception:
+                logger.exception("Failed to flush %d session writes, will retry", len(opens) + len(closes))
+                # Put the batch back without clobbering anything recorded meanwhile
+                for row in opens:
+                    connection_id = row["connection_id"]
+                    if connection_id in self._pending_closes:
+                        row["disconnected_at"] = self._pending_closes.pop(connection_id)
+                        row["is_active"] = False
+                    self._pending_opens.setdefault(connection_id, row)
+                for connection_id, disconnected_at in closes.items():
+                    self._pending_closes.setdefault(connection_id, disconnected_at)
+                return 0
+
+    async def reconcile(self) -> int:
+        """Close every session left active by a previous process in one bulk UPDATE"""
+        async with self.session_factory() as session:
+            closed = await self.session_service.close_stale_sessions(session)
+        if closed:
+            logger.info("Closed %d stale sessions from a previous run", closed)
+        return closed
+
+    async def start(self):
+        """Reconcile stale sessions and start the background flush loop"""
+        await self.reconcile()
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the flush loop and write whatever is still buffered"""
+        if self._task is not None:
+            # Not cancelled: a flush in progress has already taken its batch out of the buffers
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+            self._wakeup = None
+            self._stopping = False
+        await self.flush()
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping:
+                # stop() flushes the rest
+                return
+            self._wakeup.clear()
+            await self.flush()
@@ -0,0 +1,314 @@
+import asyncio
+import gzip
+import hashlib
+import importlib.util
+import json
+import logging
+import mimetypes
+import os
+import posixpath
+import re
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# Optional brotli support, imported when assets are built
+BROTLI_AVAILABLE = importlib.util.find_spec("brotli") is not None
+
+logger = logging.getLogger(__name__)
+
+# Compressed variants are kept here by content hash, so they are computed once per
+# file version (e.g. at image build time) rather than on every start
+STATIC_CACHE_DIR = os.getenv("STATIC_CACHE_DIR")
+
+# Generated script the service worker imports to learn what to precache
+PRECACHE_MANIFEST = "precache-manifest.js"
+
+IMMUTABLE = b"public, max-age=31536000, immutable"
+REVALIDATE = b"no-cache"
+
+_COMPRESSIBLE = ("text/", "application/javascript", "application/json", "application/manifest+json", "image/svg+xml")
+# Rewritten to fingerprinted URLs in HTML pages
+_HTML_REFERENCE = re.compile(r'(\b(?:src|href)=")([^"#?:]+)(")')
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+class _Variant:
+    """One encoding of an asset, with its response headers encoded up front"""
+
+    __slots__ = ("body", "etag", "headers")
+
+    def __init__(self, body: bytes, etag: bytes, headers: Headers):
+        self.body = body
+        self.etag = etag
+        self.headers = headers
+
+
+def _compress(body: bytes, digest: str, encoding: str, cache_dir: Optional[str]) -> bytes:
+    cache_path = os.path.join(cache_dir, f"{digest}.{encoding}") if cache_dir else None
+    if cache_path:
+        try:
+            with open(cache_path, "rb") as cached:
+                return cached.read()
+        except FileNotFoundError:
+            pass
+
+    if encoding == "br":
+        import brotli
+        data = brotli.compress(body, quality=11)
+    else:
+        data = gzip.compress(body, compresslevel=9, mtime=0)
+
+    if cache_path:
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            partial = f"{cache_path}.{os.getpid()}.tmp"
+            with open(partial, "wb") as cached:
+                cached.write(data)
+            os.replace(partial, cache_path)
+        except OSError:
+            logger.warning("Could not write static asset cache %s", cache_path)
+    return data
+
+
+class Asset:
+    """A file held in memory with its precompressed variants"""
+
+    def __init__(self, path: str, body: bytes, cache_dir: Optional[str] = None):
+        self.path = path
+        self.content_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+        self.digest = hashlib.sha256(body).hexdigest()
+        stem, extension = posixpath.splitext(path)
+        self.fingerprinted_path = f"{stem}.{self.digest[:12]}{extension}"
+
+        self.encodings: Dict[str, bytes] = {"identity": body}
+        if self.content_type.startswith(_COMPRESSIBLE):
+            for encoding in ("gzip", "br") if BROTLI_AVAILABLE else ("gzip",):
+                compressed = _compress(body, self.digest, encoding, cache_dir)
+                if len(compressed) < len(body):
+                    self.encodings[encoding] = compressed
+
+        # (encoding, immutable) -> variant
+        self.variants: Dict[Tuple[str, bool], _Variant] = {}
+        for encoding, data in self.encodings.items():
+            # Strong ETags must differ between representations
+            etag = f'"{self.digest[:32]}{"" if encoding == "identity" else "-" + encoding}"'.encode("latin-1")
+            for immutable in (True, False):
+                headers = [
+                    (b"content-type", self._content_type_header()),
+                    (b"content-length", str(len(data)).encode("latin-1")),
+                    (b"etag", etag),
+                    (b"cache-control", IMMUTABLE if immutable else REVALIDATE),
+                    (b"vary", b"accept-encoding"),
+                ]
+                if encoding != "identity":
+                    headers.append((b"content-encoding", encoding.encode("latin-1")))
+                self.variants[(encoding, immutable)] = _Variant(data, etag, headers)
+
+    def _content_type_header(self) -> bytes:
+        if self.content_type.startswith("text/") or self.content_type == "application/javascript":
+            return f"{self.content_type}; charset=utf-8".encode("latin-1")
+        return self.content_type.encode("latin-1")
+
+    @property
+    def size(self) -> int:
+        return sum(len(data) for data in self.encodings.values())
+
+
+def _accepted_encodings(header: bytes) -> set:
+    accepted = set()
+    for part in header.decode("latin-1").lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            accepted.add(name.strip())
+    if "*" in accepted:
+        accepted.update({"br", "gzip"})
+    return accepted
+
+
+def _etag_matches(header: bytes, etag: bytes) -> bool:
+    for candidate in header.split(b","):
+        candidate = candidate.strip()
+        if candidate == b"*" or candidate.removeprefix(b"W/") == etag:
+            return True
+    return False
+
+
+class StaticAssets:
+    """ASGI app serving a directory from memory with precompressed, fingerprinted assets.
+
+    ``build()`` reads every file once, computes a content hash, gzip and
+    brotli variants and the response headers. HTML pages have their local
+    src/href references rewritten to fingerprinted URLs, which are served
+    as immutable; everything else (HTML, sw.js, direct file URLs)
+    revalidates with a strong ETag. The service worker's precache list is
+    generated as ``precache-manifest.js`` from what the index page loads.
+    """
+
+    def __init__(self, directory: str, index: str = "index.html", cache_dir: Optional[str] = STATIC_CACHE_DIR):
+        self.directory = directory
+        self.index = index
+        self.cache_dir = cache_dir
+        self.assets: Optional[Dict[str, Asset]] = None
+        self.fingerprinted: Dict[str, Asset] = {}
+        self.version = ""
+        self._build_lock = threading.RLock()
+
+    def build(self):
+        """Load and precompress every file; safe to call again to pick up changes"""
+        with self._build_lock:
+            # Reading the system MIME tables is deferred to here, off the import path
+            mimetypes.add_type("application/manifest+json", ".webmanifest")
+            mimetypes.add_type("application/javascript", ".js")
+
+            sources: Dict[str, bytes] = {}
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    full_path = os.path.join(root, name)
+                    relative = os.path.relpath(full_path, self.directory).replace(os.sep, "/")
+                    with open(full_path, "rb") as asset_file:
+                        sources[relative] = asset_file.read()
+
+            assets = {path: Asset(path, body, self.cache_dir) for path, body in sources.items() if not path.endswith(".html")}
+            precache = ["./"]
+            for path, body in sources.items():
+                if path.endswith(".html"):
+                    body, references = self._rewrite_html(path, body, assets)
+                    assets[path] = Asset(path, body, self.cache_dir)
+                    if path == self.index:
+                        precache += [path] + list(dict.fromkeys(references))
+
+            self.version = hashlib.sha256(
+                "".join(sorted(asset.digest for asset in assets.values())).encode("ascii")
+            ).hexdigest()[:16]
+            manifest = {"version": self.version, "urls": precache}
+            assets[PRECACHE_MANIFEST] = Asset(
+                PRECACHE_MANIFEST, f"self.__PRECACHE_MANIFEST = {json.dumps(manifest)};\n".encode("utf-8"), self.cache_dir
+            )
+
+            self.fingerprinted = {asset.fingerprinted_path: asset for asset in assets.values()}
+            self.assets = assets
+            logger.info(
+                "Static assets: %d files, %d KB cached (brotli %s)",
+                len(assets), sum(asset.size for asset in assets.values()) // 1024,
+                "on" if BROTLI_AVAILABLE else "off"
+            )
+
+    def ensure_built(self):
+        """Build unless already built (or built by a concurrent caller while waiting)"""
+        with self._build_lock:
+            if self.assets is None:
+                self.build()
+
+    def _rewrite_html(self, path: str, body: bytes, assets: Dict[str, Asset]) -> Tuple[bytes, List[str]]:
+        base = posixpath.dirname(path)
+        references = []
+
+        def fingerprint(match):
+            target = posixpath.normpath(posixpath.join(base, match.group(2)))
+            asset = assets.get(target)
+            if asset is None or match.group(2).startswith("/"):
+                return match.group(0)
+            url = posixpath.relpath(asset.fingerprinted_path, base or ".")
+            references.append(asset.fingerprinted_path)
+            return f"{match.group(1)}{url}{match.group(3)}"
+
+        rewritten = _HTML_REFERENCE.sub(fingerprint, body.decode("utf-8"))
+        return rewritten.encode("utf-8"), references
+
+    def get_stats(self) -> dict:
+        assets = self.assets or {}
+        return {
+            "files": len(assets),
+            "cached_bytes": sum(asset.size for asset in assets.values()),
+            "version": self.version,
+        }
+
+    def _lookup(self, path: str) -> Tuple[Optional[Asset], bool]:
+        """Asset for a request path and whether the URL is fingerprinted (immutable)"""
+        relative = path.lstrip("/")
+        if relative == "" or relative.endswith("/"):
+            relative += self.index
+        asset = self.fingerprinted.get(relative)
+        if asset is not None and asset.fingerprinted_path != asset.path:
+            return asset, True
+        return self.assets.get(relative), False
+
+    async def __call__(self, scope, receive, send):
+        assert scope["type"] == "http"
+        if self.assets is None:
+            # Startup warm-up still building; wait for it off the event loop
+            await asyncio.to_thread(self.ensure_built)
+
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+
+        if scope["method"] not in ("GET", "HEAD"):
+            await self._respond(send, 405, b"Method Not Allowed", [(b"allow", b"GET, HEAD")])
+            return
+
+        asset, immutable = self._lookup(path)
+        if asset is None:
+            await self._respond(send, 404, b"Not Found")
+            return
+
+        accept_encoding = b""
+        if_none_match = None
+        for name, value in scope["headers"]:
+            if name == b"accept-encoding":
+                accept_encoding = value
+            elif name == b"if-none-match":
+                if_none_match = value
+
+        encoding = "identity"
+        if len(asset.encodings) > 1 and accept_encoding:
+            accepted = _accepted_encodings(accept_encoding)
+            for candidate in ("br", "gzip"):
+                if candidate in asset.encodings and candidate in accepted:
+                    encoding = candidate
+                    break
+        variant = asset.variants[(encoding, immutable)]
+
+        if if_none_match is not None and _etag_matches(if_none_match, variant.etag):
+            # 304 carries the validators and caching headers, not the body's
+            headers = [header for header in variant.headers if header[0] in (b"etag", b"cache-control", b"vary")]
+            await send({"type": "http.response.start", "status": 304, "headers": headers})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        await send({"type": "http.response.start", "status": 200, "headers": variant.headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else variant.body})
+
+    @staticmethod
+    async def _respond(send, status: int, body: bytes, headers: Headers = None):
+        await send({
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"text/plain; charset=utf-8"),
+                        (b"content-length", str(len(body)).encode("latin-1"))] + (headers or []),
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+if __name__ == "__main__":
+    # Fill the compression cache ahead of time, e.g. while building the image:
+    #   STATIC_CACHE_DIR=/app/static-cache python -m services.static_assets ../frontend
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Precompress static assets into STATIC_CACHE_DIR")
+    parser.add_argument("directory")
+    parser.add_argument("--cache-dir", default=STATIC_CACHE_DIR, required=STATIC_CACHE_DIR is None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    StaticAssets(args.directory, cache_dir=args.cache_dir).build()
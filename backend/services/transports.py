@@ -0,0 +1,101 @@
+import asyncio
+import os
+import secrets
+from collections import deque
+from typing import Deque, List, Optional, Tuple
+
+from services import metrics
+
+# Frames an SSE or long-poll client may fall behind by before it is dropped as too slow
+TRANSPORT_MAX_QUEUED = int(os.getenv("TRANSPORT_MAX_QUEUED", "1000"))
+# Frames an SSE stream keeps after writing them, replayed if the client resumes a dropped stream
+SSE_REPLAY_FRAMES = int(os.getenv("SSE_REPLAY_FRAMES", "256"))
+# Seconds between SSE keepalive comments; proxies close streams that go quiet
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))
+# Seconds a long poll is held open waiting for frames; below the heartbeat idle timeout
+LONG_POLL_TIMEOUT = float(os.getenv("LONG_POLL_TIMEOUT", "20"))
+
+QUEUE_OVERFLOWS = metrics.counter(
+    "medchat_transport_queue_overflows_total", "SSE and long-poll connections dropped for falling too far behind"
+)
+
+
+class QueueOverflow(Exception):
+    pass
+
+
+class QueuedConnection:
+    """A live connection over SSE or long polling, registered with the manager in place of a WebSocket.
+
+    The fan-out hands every connection the same encoded frame through
+    ``send_text``; here it is queued, numbered, until the client's stream or
+    next poll fetches it. A client acknowledges frames by asking for those
+    after the last id it saw, so a poll whose response was lost, or a stream
+    resumed with ``Last-Event-ID``, gets the frames again. ``close`` ends the
+    connection once what is queued has been fetched.
+
+    A client that falls ``max_queued`` frames behind fails its next send and
+    is reaped by the heartbeat like any dead socket.
+    """
+
+    def __init__(self, user_id: str, transport: str, max_queued: int = TRANSPORT_MAX_QUEUED):
+        self.user_id = user_id
+        self.transport = transport
+        self.max_queued = max_queued
+        # Presented with every poll and send, so only this client can use the connection
+        self.token = secrets.token_urlsafe(16)
+        self.last_id = 0
+        self.close_code: Optional[int] = None
+        self.close_reason: Optional[str] = None
+        self._frames: Deque[Tuple[int, str]] = deque()
+        # Highest id handed to the client; frames past it are still waiting
+        self._fetched = 0
+        self._changed = asyncio.Event()
+
+    @property
+    def closed(self) -> bool:
+        return self.close_code is not None
+
+    async def accept(self):
+        pass
+
+    async def send_text(self, text: str):
+        if self.closed:
+            raise RuntimeError("Connection closed")
+        if self.last_id - self._fetched >= self.max_queued:
+            QUEUE_OVERFLOWS.inc()
+            raise QueueOverflow(f"{self.max_queued} frames waiting for {self.user_id}")
+        self.last_id += 1
+        self._frames.append((self.last_id, text))
+        self._changed.set()
+
+    async def close(self, code: int = 1000, reason: Optional[str] = None):
+        if not self.closed:
+            self.close_code, self.close_reason = code, reason or ""
+            self._changed.set()
+
+    async def receive(self, after: int, timeout: float, keep: int = 0) -> List[Tuple[int, str]]:
+        """Frames after id ``after``, waiting up to ``timeout`` seconds for one unless closed.
+
+        Frames up to ``after`` are acknowledged and let go, except the newest
+        ``keep`` of them, which a resumed stream may ask for again.
+        """
+        after = min(after, self.last_id)
+        self._fetched = max(self._fetched, after)
+        acknowledged = sum(1 for frame_id, _ in self._frames if frame_id <= after)
+        for _ in range(max(0, acknowledged - keep)):
+            self._frames.popleft()
+        if after >= self.last_id and not self.closed:
+            self._changed.clear()
+            try:
+                await asyncio.wait_for(self._changed.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        frames = [frame for frame in self._frames if frame[0] > after]
+        if frames:
+            self._fetched = max(self._fetched, frames[-1][0])
+        return frames
+
+    def finished(self, after: int) -> bool:
+        """Closed, with everything up to ``after`` fetched"""
+        return self.closed and after >= self.last_id
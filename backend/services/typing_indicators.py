@@ -0,0 +1,167 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+from services import metrics
+
+logger = logging.getLogger(__name__)
+
+# Everyone is in one room until clients name another channel
+DEFAULT_CHANNEL = "general"
+CHANNEL_PATTERN = re.compile(r"^[a-zA-Z0-9_-]{1,64}$")
+
+# Seconds between coalesced frames, per-user refresh throttle and typer expiry
+TYPING_INTERVAL = float(os.getenv("TYPING_INTERVAL", "0.5"))
+TYPING_THROTTLE = float(os.getenv("TYPING_THROTTLE", "2.0"))
+TYPING_TTL = float(os.getenv("TYPING_TTL", "6.0"))
+# Channels one user can be shown typing in at once; each is a frame to everyone per interval
+TYPING_MAX_CHANNELS = int(os.getenv("TYPING_MAX_CHANNELS", "3"))
+
+TYPING_EVENTS = {
+    result: metrics.counter(
+        "medchat_typing_events_total", "Typing events received from clients", labels={"result": result}
+    )
+    for result in ("accepted", "throttled", "limited")
+}
+TYPING_FRAMES = metrics.counter("medchat_typing_frames_total", "Coalesced typing frames fanned out")
+
+
+class TypingTracker:
+    """Ephemeral "is typing" state, fanned out as one frame per channel per interval.
+
+    Typing events only touch in-memory state: refreshes from the same user
+    within ``throttle`` seconds are dropped, and a single timer task expires
+    typers after ``ttl`` and sends every channel whose set of typers changed
+    one frame listing everyone still typing. Nothing is persisted and
+    nothing goes through ConnectionManager.broadcast.
+
+    Any valid name is a channel here, so a user typing in more than
+    ``max_channels`` at once is ignored in the rest; otherwise one client
+    cycling through names would cost every connection a frame per name.
+    """
+
+    def __init__(
+        self,
+        manager,
+        interval: float = TYPING_INTERVAL,
+        throttle: float = TYPING_THROTTLE,
+        ttl: float = TYPING_TTL,
+        max_channels: int = TYPING_MAX_CHANNELS
+    ):
+        self.manager = manager
+        self.interval = interval
+        self.throttle = throttle
+        self.ttl = ttl
+        self.max_channels = max_channels
+
+        # channel -> user_id -> (expires_at, user_name)
+        self._typers: Dict[str, Dict[str, Tuple[float, str]]] = {}
+        # user_id -> channels they are shown typing in
+        self._channels: Dict[str, Set[str]] = {}
+        # (user_id, channel) -> time of the last accepted event
+        self._last_event: Dict[Tuple[str, str], float] = {}
+        # Channels whose typers changed since the last frame
+        self._dirty: Set[str] = set()
+        self._task: Optional[asyncio.Task] = None
+
+    def record(self, user_id: str, channel: str = DEFAULT_CHANNEL, typing: bool = True,
+               user_name: str = None) -> bool:
+        """Note that a user started (or stopped) typing; False if throttled or over the channel limit"""
+        now = time.monotonic()
+        key = (user_id, channel)
+
+        if not typing:
+            self._last_event.pop(key, None)
+            if self._typers.get(channel, {}).pop(user_id, None) is not None:
+                self._forget(user_id, channel)
+                self._dirty.add(channel)
+            return True
+
+        channels = self._channels.setdefault(user_id, set())
+        if channel not in channels and len(channels) >= self.max_channels:
+            TYPING_EVENTS["limited"].inc()
+            return False
+        typers = self._typers.setdefault(channel, {})
+
+        last = self._last_event.get(key)
+        if last is not None and now - last < self.throttle and user_id in typers:
+            TYPING_EVENTS["throttled"].inc()
+            return False
+        TYPING_EVENTS["accepted"].inc()
+        self._last_event[key] = now
+        if user_id not in typers:
+            self._dirty.add(channel)
+        typers[user_id] = (now + self.ttl, user_name or user_id)
+        channels.add(channel)
+        return True
+
+    def _forget(self, user_id: str, channel: str):
+        channels = self._channels.get(user_id)
+        if channels is not None:
+            channels.discard(channel)
+            if not channels:
+                del self._channels[user_id]
+
+    def clear_user(self, user_id: str, channel: str = None):
+        """Stop showing a user as typing (they sent a message or left)"""
+        for name in [channel] if channel is not None else list(self._channels.get(user_id, ())):
+            self.record(user_id, name, typing=False)
+
+    def typers(self, channel: str = DEFAULT_CHANNEL) -> List[dict]:
+        return [
+            {"user_id": user_id, "user_name": user_name}
+            for user_id, (_, user_name) in sorted(self._typers.get(channel, {}).items())
+        ]
+
+    def _expire(self, now: float):
+        for channel, typers in list(self._typers.items()):
+            expired = [user_id for user_id, (expires_at, _) in typers.items() if expires_at <= now]
+            for user_id in expired:
+                del typers[user_id]
+                self._last_event.pop((user_id, channel), None)
+                self._forget(user_id, channel)
+            if expired:
+                self._dirty.add(channel)
+            if not typers:
+                del self._typers[channel]
+
+    async def flush(self) -> int:
+        """Expire stale typers and send one frame per changed channel; returns frames sent"""
+        self._expire(time.monotonic())
+        dirty, self._dirty = self._dirty, set()
+        for channel in sorted(dirty):
+            frame = json.dumps({"type": "typing", "channel": channel, "typers": self.typers(channel)})
+            await self.manager.send_ephemeral(frame)
+        TYPING_FRAMES.inc(len(dirty))
+        return len(dirty)
+
+    async def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Typing flush failed")
+
+    def get_stats(self) -> dict:
+        return {
+            "channels": len(self._typers),
+            "typing": sum(len(typers) for typers in self._typers.values()),
+        }
@@ -0,0 +1,72 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Warmup:
+    """Startup steps that can run while the server already accepts traffic.
+
+    Steps run concurrently; a failing step is logged and does not stop the
+    others, since each one only makes the first requests faster. ``run()``
+    awaits them all, ``start()`` leaves them running in the background.
+    """
+
+    def __init__(self):
+        self.steps: Dict[str, Callable[[], Awaitable]] = {}
+        self.durations: Dict[str, float] = {}
+        self.errors: Dict[str, str] = {}
+        self.total: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, name: str, step: Callable[[], Awaitable]):
+        self.steps[name] = step
+
+    async def _step(self, name: str, step: Callable[[], Awaitable]):
+        started = time.perf_counter()
+        try:
+            await step()
+        except asyncio.CancelledError:
+            raise
+        except Exception as exc:
+            self.errors[name] = repr(exc)
+            logger.exception("Warm-up step %s failed", name)
+        finally:
+            self.durations[name] = time.perf_counter() - started
+
+    async def run(self):
+        started = time.perf_counter()
+        await asyncio.gather(*(self._step(name, step) for name, step in self.steps.items()))
+        self.total = time.perf_counter() - started
+        logger.info("Warm-up finished in %.0f ms (%s)", self.total * 1000,
+                    ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in self.durations.items()))
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self.run())
+
+    async def wait(self):
+        if self._task is not None:
+            await asyncio.shield(self._task)
+
+    async def stop(self):
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    @property
+    def done(self) -> bool:
+        return self.total is not None
+
+    def get_stats(self) -> dict:
+        return {
+            "done": self.done,
+            "total_ms": round(self.total * 1000, 1) if self.done else None,
+            "steps_ms": {name: round(seconds * 1000, 1) for name, seconds in self.durations.items()},
+            "errors": dict(self.errors),
+        }
@@ -1,71 +1,283 @@
 from fastapi import WebSocket
-from typing import Dict
+from typing import Dict, List, Optional, Tuple
+from datetime import datetime
+import asyncio
+import hashlib
 import json
+import logging
+import random
+import time
+import uuid
 from sqlalchemy.ext.asyncio import AsyncSession
 from services.database_service import UserService, MessageService, SessionService
+from services.session_batcher import SessionBatcher
+from services.heartbeat import HeartbeatScheduler
+from services.typing_indicators import TypingTracker, DEFAULT_CHANNEL
+from services.read_receipts import ReadReceipts
+from services.directory import DirectoryIndex
+from services.send_dedupe import SendDedupe
+from services.attachments import attachment_store
+from services.audit import audit_log
+from services import metrics
 from config.database import AsyncSessionLocal
 
+logger = logging.getLogger(__name__)
+
+# WebSocket pipeline metrics
+MESSAGES_RECEIVED = metrics.counter("medchat_ws_messages_received_total", "Frames received from clients")
+MESSAGES_SENT = metrics.counter("medchat_ws_messages_sent_total", "Frames sent to clients")
+SEND_FAILURES = metrics.counter("medchat_ws_send_failures_total", "Failed sends to client sockets")
+BROADCAST_RECIPIENTS = metrics.histogram(
+    "medchat_ws_broadcast_recipients", "Recipients per broadcast", buckets=metrics.COUNT_BUCKETS
+)
+STAGE_LATENCY = {
+    stage: metrics.histogram(
+        "medchat_ws_stage_seconds", "Per-stage latency of the WebSocket message pipeline",
+        buckets=metrics.STAGE_BUCKETS, labels={"stage": stage}
+    )
+    for stage in ("parse", "rate_limit", "sanitize", "persist", "fanout")
+}
+RATE_LIMIT_REJECTIONS = {
+    scope: metrics.counter(
+        "medchat_rate_limit_rejections_total", "Requests rejected by the rate limiter",
+        labels={"scope": scope}
+    )
+    for scope in ("connect", "message", "upload")
+}
+
+# Close code telling clients the server is restarting and they should reconnect
+SERVICE_RESTART_CLOSE_CODE = 1012
+
 class ConnectionManager:
     def __init__(self):
         self.active_connections: Dict[str, WebSocket] = {}
+        # user_id -> connection_id of the session row for the active socket
+        self.connection_ids: Dict[str, str] = {}
         self.user_service = UserService()
         self.message_service = MessageService()
         self.session_service = SessionService()
+        self.session_batcher = SessionBatcher()
+        self.heartbeat = HeartbeatScheduler(self)
+        self.typing = TypingTracker(self)
+        self.read_receipts = ReadReceipts(self)
+        self.directory = DirectoryIndex()
+        self.recent_sends = SendDedupe()
+
+        # Bumped whenever the online list or the stored messages change; read APIs use them as ETags
+        self.presence_version = 0
+        self.message_version = 0
+
+        # Drain state: set on shutdown, new sockets are turned away
+        self.draining = False
+        self._drained = False
+        self._inflight_broadcasts = 0
+        self._broadcasts_idle = asyncio.Event()
+        self._broadcasts_idle.set()
 
     async def connect(self, websocket: WebSocket, user_id: str, user_name: str = None, department: str = None):
         await websocket.accept()
         self.active_connections[user_id] = websocket
+        self.heartbeat.track(user_id, websocket)
 
         # Create or update user in database
         async with AsyncSessionLocal() as session:
             await self.user_service.create_or_update_user(
                 session, user_id, user_name or user_id, department or "Unknown"
             )
+        self.directory.upsert(user_id, user_name or user_id, department or "Unknown")
 
-            # Create user session
-            connection_id = f"ws_{id(websocket)}"
-            await self.session_service.create_session(session, user_id, connection_id)
-            await session.commit()
+        # A new socket for the same user replaces the old one, so close its session
+        previous_connection_id = self.connection_ids.get(user_id)
+        if previous_connection_id:
+            self.session_batcher.record_close(previous_connection_id)
 
-    async def disconnect(self, user_id: str):
-        if user_id in self.active_connections:
-            connection_id = f"ws_{id(self.active_connections[user_id])}"
-            del self.active_connections[user_id]
+        # Session rows are written in batches by the session batcher
+        connection_id = f"ws_{uuid.uuid4().hex}"
+        self.connection_ids[user_id] = connection_id
+        self.session_batcher.record_open(user_id, connection_id)
+        self.presence_version += 1
+        audit_log.append("connect", user_id, connection_id=connection_id)
+
+    async def disconnect(self, user_id: str, websocket: WebSocket = None) -> bool:
+        """Remove a user's connection; returns False if it was already gone or replaced"""
+        current = self.active_connections.get(user_id)
+        if current is None or (websocket is not None and current is not websocket):
+            # Already reaped, or the user has since reconnected on a new socket
+            return False
+
+        del self.active_connections[user_id]
+        self.heartbeat.untrack(user_id)
+        self.typing.clear_user(user_id)
+        self.presence_version += 1
+
+        connection_id = self.connection_ids.pop(user_id, None)
+        if connection_id:
+            self.session_batcher.record_close(connection_id)
+        audit_log.append("disconnect", user_id, connection_id=connection_id)
+        return True
+
+    async def reap(self, connections: List[Tuple[str, WebSocket]]):
+        """Drop a batch of unresponsive connections and tell everyone they left"""
+        reaped = []
+        for user_id, websocket in connections:
+            if await self.disconnect(user_id, websocket):
+                reaped.append((user_id, websocket))
+        if not reaped:
+            return
+
+        # Best-effort close; a half-open socket may never answer
+        await asyncio.gather(
+            *(self._close_quietly(websocket, 4408, "Heartbeat timeout") for _, websocket in reaped)
+        )
+
+        for user_id, _ in reaped:
+            leave_message = {
+                "type": "user_left",
+                "user_id": user_id,
+                "text": f"User {user_id} left the chat",
+                "timestamp": datetime.now().isoformat(),
+                "message_id": str(uuid.uuid4())
+            }
+            await self.broadcast(json.dumps(leave_message), save_to_db=False)
 
-            # End user session in database
-            async with AsyncSessionLocal() as session:
-                await self.session_service.end_session(session, user_id, connection_id)
-                await session.commit()
+    @staticmethod
+    async def _close_quietly(websocket: WebSocket, code: int, reason: str):
+        try:
+            await asyncio.wait_for(websocket.close(code=code, reason=reason), timeout=1.0)
+        except Exception:
+            pass
 
     async def send_personal_message(self, message: str, user_id: str):
         if user_id in self.active_connections:
             websocket = self.active_connections[user_id]
             await websocket.send_text(message)
+            MESSAGES_SENT.inc()
 
-    async def broadcast(self, message: str, exclude_user: str = None, save_to_db: bool = True):
+    async def broadcast(self, message: str, exclude_user: str = None, save_to_db: bool = True) -> Optional[int]:
+        """Fan a frame out, storing chat messages first; returns the stored message's sequence number"""
+        # Track in-flight broadcasts so a drain can wait for their DB writes
+        self._inflight_broadcasts += 1
+        self._broadcasts_idle.clear()
+        try:
+            return await self._broadcast(message, exclude_user, save_to_db)
+        finally:
+            self._inflight_broadcasts -= 1
+            if self._inflight_broadcasts == 0:
+                self._broadcasts_idle.set()
+
+    async def _broadcast(self, message: str, exclude_user: str = None, save_to_db: bool = True) -> Optional[int]:
+        seq = None
         # Save message to database if requested
         if save_to_db:
+            started = time.perf_counter()
             try:
                 message_data = json.loads(message)
                 if message_data.get("type") == "message" and "text" in message_data:
+                    channel = message_data.get("channel", DEFAULT_CHANNEL)
                     async with AsyncSessionLocal() as session:
-                        await self.message_service.create_message(
+                        stored = await self.message_service.create_message(
                             session,
                             text=message_data["text"],
                             message_type=message_data.get("message_type", "text"),
-                            user_id=message_data.get("user_id", "system")
+                            user_id=message_data.get("user_id", "system"),
+                            channel=channel,
+                            attachment=message_data.get("attachment"),
+                            message_id=message_data.get("message_id")
                         )
                         await session.commit()
+                    self.message_version += 1
+                    # Recent senders rank first in @mention suggestions
+                    self.directory.touch(stored.user_id)
+                    # The trail proves what was said without keeping a second copy of it
+                    audit_log.append(
+                        "message", stored.user_id, message_id=stored.message_id, message_seq=stored.id, channel=channel,
+                        text_sha256=hashlib.sha256(stored.text.encode("utf-8")).hexdigest(),
+                        attachment_sha256=stored.attachment_sha256
+                    )
+                    # Clients point their read cursors at the stored id
+                    seq = stored.id
+                    message_data.update(seq=seq, channel=channel)
+                    message = json.dumps(message_data)
+                    try:
+                        await self.read_receipts.record_message(channel, stored.id, message_data.get("user_id"))
+                    except Exception:
+                        logger.exception("Failed to count message %s for unread badges", stored.id)
             except (json.JSONDecodeError, KeyError):
                 pass
+            STAGE_LATENCY["persist"].observe(time.perf_counter() - started)
 
         # Broadcast to all connected users
-        for user_id, connection in self.active_connections.items():
+        started = time.perf_counter()
+        sent = await self._fan_out(message, exclude_user)
+        BROADCAST_RECIPIENTS.observe(sent)
+        STAGE_LATENCY["fanout"].observe(time.perf_counter() - started)
+        return seq
+
+    async def send_ephemeral(self, message: str, exclude_user: str = None) -> int:
+        """Fan a frame out to every connection without persisting it (e.g. typing indicators)"""
+        return await self._fan_out(message, exclude_user)
+
+    async def _fan_out(self, message: str, exclude_user: str = None) -> int:
+        # Snapshot, since sends yield to the loop
+        sent = 0
+        for user_id, connection in list(self.active_connections.items()):
             if user_id != exclude_user:
                 try:
                     await connection.send_text(message)
+                    sent += 1
                 except:
-                    pass
+                    SEND_FAILURES.inc()
+                    # Let the heartbeat scheduler reap it in its next batch
+                    self.heartbeat.mark_failed(user_id)
+        MESSAGES_SENT.inc(sent)
+        return sent
+
+    async def drain(self, reconnect_window: float = 10.0, flush_timeout: float = 2.0):
+        """Gracefully hand all clients off before shutdown.
+
+        Stops admitting sockets, waits for in-flight broadcasts to persist,
+        tells every client to reconnect after a staggered delay spread over
+        ``reconnect_window`` seconds, closes the sockets and flushes session
+        writes. Safe to call more than once.
+        """
+        if self._drained:
+            return
+        self.draining = True
+        started = time.monotonic()
+
+        try:
+            await asyncio.wait_for(self._broadcasts_idle.wait(), timeout=flush_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Drain: %d broadcasts still in flight", self._inflight_broadcasts)
+
+        connections = list(self.active_connections.items())
+        random.shuffle(connections)
+        count = len(connections)
+
+        async def hand_off(index: int, user_id: str, websocket: WebSocket):
+            # Evenly spread slots with jitter inside each slot
+            delay_ms = int(reconnect_window * 1000 * (index + random.random()) / max(1, count))
+            try:
+                await asyncio.wait_for(websocket.send_text(json.dumps({
+                    "type": "reconnect",
+                    "reason": "server_restart",
+                    "delay_ms": delay_ms
+                })), timeout=1.0)
+            except Exception:
+                pass
+            await self._close_quietly(websocket, SERVICE_RESTART_CLOSE_CODE, "Server restarting")
+
+        # Unregister first so the endpoints don't announce each close as user_left
+        for user_id, websocket in connections:
+            await self.disconnect(user_id, websocket)
+        await asyncio.gather(
+            *(hand_off(index, user_id, websocket) for index, (user_id, websocket) in enumerate(connections))
+        )
+
+        await self.session_batcher.flush()
+        await self.read_receipts.save()
+        self._drained = True
+        logger.info("Drained %d connections in %.2fs", count, time.monotonic() - started)
 
     async def get_online_users(self):
         # Get detailed user info from database
@@ -96,4 +308,9 @@ class ConnectionManager:
         """Get recent messages from database"""
         async with AsyncSessionLocal() as session:
             messages = await self.message_service.get_recent_messages(session, limit)
-            return [message.to_dict() for message in messages]
\ No newline at end of file
+            recent = [message.to_dict() for message in messages]
+        # Size and type come from the store, as in live frames
+        for message in recent:
+            if "attachment" in message:
+                message["attachment"].update(attachment_store.describe(message["attachment"]["sha256"]) or {})
+        return recent
\ No newline at end of file
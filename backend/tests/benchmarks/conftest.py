@@ -0,0 +1,114 @@
+"""
+Fixtures for the hot-path micro-benchmarks.
+
+These are skipped unless selected with ``-m benchmark``; see benchmarks/micro.py.
+"""
+import random
+import sqlite3
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict
+
+import pytest
+from sqlalchemy import create_engine
+
+from benchmarks import micro
+from config.database import Base
+
+BENCH_USERS = 1000
+
+RESULTS: Dict[str, micro.BenchResult] = {}
+# Machine speed relative to the baseline, measured once per session
+FACTOR = [1.0]
+
+
+def pytest_collection_modifyitems(config, items):
+    if "benchmark" in (config.getoption("markexpr") or ""):
+        return
+    skip = pytest.mark.skip(reason="micro-benchmark; select with -m benchmark")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip)
+
+
+def pytest_terminal_summary(terminalreporter):
+    if not RESULTS:
+        return
+    terminalreporter.section(f"micro-benchmarks (machine factor {FACTOR[0]:.2f})")
+    baseline = micro.load_baseline()
+    for name, result in sorted(RESULTS.items()):
+        if name == micro.CALIBRATION:
+            continue
+        ratio = micro.slowdown(result, baseline, FACTOR[0])
+        summary = f"{ratio:.2f}x baseline" if ratio is not None else "no baseline"
+        terminalreporter.write_line(f"{name:<48} {result.per_op_us:>14.2f} us/op  {summary}")
+
+
+class BenchRecorder:
+    """Records results and fails a benchmark that regressed past its baseline"""
+
+    def __init__(self):
+        self.baseline = micro.load_baseline()
+        calibration = micro.calibrate()
+        RESULTS[micro.CALIBRATION] = calibration
+        if not micro.UPDATE_BASELINE:
+            FACTOR[0] = micro.machine_factor(calibration, self.baseline)
+
+    def check(self, result: micro.BenchResult):
+        RESULTS[result.name] = result
+        if micro.UPDATE_BASELINE:
+            return
+        failure = micro.check_regression(result, self.baseline, FACTOR[0])
+        if failure:
+            pytest.fail(failure)
+
+
+@pytest.fixture(scope="session")
+def bench():
+    """Session-wide recorder; rewrites the baseline at the end when BENCH_UPDATE_BASELINE=1"""
+    recorder = BenchRecorder()
+    yield recorder
+    if micro.UPDATE_BASELINE and RESULTS:
+        micro.save_baseline(RESULTS)
+
+
+@pytest.fixture(scope="session")
+def seeded_message_db(tmp_path_factory):
+    """SQLite file with BENCH_USERS users and BENCH_MESSAGE_ROWS messages"""
+    path = tmp_path_factory.mktemp("bench-db") / "messages.db"
+    schema_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(schema_engine)
+    schema_engine.dispose()
+
+    # Raw sqlite3 inserts: seeding through the ORM would dominate the run time
+    connection = sqlite3.connect(path)
+    connection.execute("PRAGMA journal_mode=WAL")
+    connection.execute("PRAGMA synchronous=OFF")
+    started = datetime(2025, 1, 1)
+    connection.executemany(
+        "INSERT INTO users (user_id, user_name, department, bio, is_active, created_at) "
+        "VALUES (?, ?, ?, ?, 1, ?)",
+        [
+            (f"user_{index}", f"Nurse {index}", "Emergency", "Bench user", started.isoformat(" "))
+            for index in range(BENCH_USERS)
+        ]
+    )
+    random.seed(1234)
+    batch_size = 50_000
+    for batch_start in range(0, micro.BENCH_MESSAGE_ROWS, batch_size):
+        connection.executemany(
+            "INSERT INTO messages (message_id, text, message_type, user_id, created_at) VALUES (?, ?, ?, ?, ?)",
+            [
+                (
+                    str(uuid.UUID(int=random.getrandbits(128))),
+                    f"Patient in bed {index % 40} needs review, obs stable #{index}",
+                    "text",
+                    f"user_{index % BENCH_USERS}",
+                    (started + timedelta(seconds=index)).isoformat(" ")
+                )
+                for index in range(batch_start, min(batch_start + batch_size, micro.BENCH_MESSAGE_ROWS))
+            ]
+        )
+    connection.commit()
+    connection.close()
+    return path
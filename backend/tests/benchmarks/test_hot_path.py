@@ -0,0 +1,130 @@
+"""
+Micro-benchmarks for the per-message hot path.
+
+Run with ``pytest -m benchmark tests/benchmarks``; each test fails if its
+best time per operation regressed past benchmarks/baseline.json.
+"""
+import json
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from benchmarks.micro import BENCH_MESSAGE_ROWS, measure, measure_async
+from models.db_models import Message, User
+from security.utils import SecurityUtils, rate_limit_storage
+from services.database_service import MessageService
+from services.websocket_manager import ConnectionManager
+
+pytestmark = [pytest.mark.benchmark, pytest.mark.slow]
+
+PLAIN_TEXT = "Bed 12 obs stable, BP 120/80, can you review the fluid chart before 14:00?"
+MARKUP_TEXT = "Bed 12 <b>urgent</b> review & <script>alert('x')</script> fluids > 2L"
+
+CHAT_FRAME = {
+    "type": "message",
+    "text": PLAIN_TEXT,
+    "user_id": "nurse_0042",
+    "user_name": "Sister Ndlovu",
+    "department": "ICU",
+    "timestamp": "2025-01-01T12:00:00.000000",
+    "message_id": "8c4f7a5e-1f0b-4a0c-9a44-5f8e2c1d9b10",
+}
+
+
+class FakeSocket:
+    """Cheapest possible socket so the benchmark measures the fan-out loop itself"""
+
+    async def send_text(self, message: str):
+        pass
+
+
+class TestSecurityHotPath:
+
+    def test_sanitize_plain_text(self, bench):
+        bench.check(measure("sanitize_input.plain", lambda: SecurityUtils.sanitize_input(PLAIN_TEXT, 1000)))
+
+    def test_sanitize_markup(self, bench):
+        bench.check(measure("sanitize_input.markup", lambda: SecurityUtils.sanitize_input(MARKUP_TEXT, 1000)))
+
+    def test_sanitize_short_repeated(self, bench):
+        bench.check(measure("sanitize_input.short_repeated", lambda: SecurityUtils.sanitize_input("Emergency", 200)))
+
+    def test_validate_user_id(self, bench):
+        bench.check(measure("validate_user_id", lambda: SecurityUtils.validate_user_id("nurse_0042-icu")))
+
+    def test_check_rate_limit_10k_keys(self, bench):
+        keys = [f"msg_user_{index}" for index in range(10_000)]
+        for key in keys:
+            SecurityUtils.check_rate_limit(key, max_requests=20, time_window=60)
+        position = [0]
+
+        def check_next():
+            key = keys[position[0] % len(keys)]
+            position[0] += 1
+            SecurityUtils.check_rate_limit(key, max_requests=20, time_window=60)
+
+        bench.check(measure("check_rate_limit.10k_keys", check_next))
+        assert len(rate_limit_storage) >= 10_000
+
+
+class TestSerializationHotPath:
+
+    def test_json_encode_frame(self, bench):
+        bench.check(measure("json.dumps.frame", lambda: json.dumps(CHAT_FRAME)))
+
+    def test_json_decode_frame(self, bench):
+        encoded = json.dumps(CHAT_FRAME)
+        bench.check(measure("json.loads.frame", lambda: json.loads(encoded)))
+
+    def test_message_to_dict_1000_rows(self, bench):
+        user = User(user_id="nurse_0042", user_name="Sister Ndlovu", department="ICU", bio="Night shift")
+        created_at = datetime(2025, 1, 1, 12, 0, 0)
+        messages = [
+            Message(message_id=f"m-{index}", text=PLAIN_TEXT, message_type="text",
+                    user_id=user.user_id, user=user, created_at=created_at)
+            for index in range(1000)
+        ]
+        bench.check(measure("Message.to_dict.1000_rows", lambda: [message.to_dict() for message in messages]))
+
+
+class TestDatabaseHotPath:
+
+    @pytest_asyncio.fixture
+    async def session_factory(self, seeded_message_db):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{seeded_message_db}")
+        yield async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        await engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_create_message(self, bench, session_factory):
+        async with session_factory() as session:
+            async def create():
+                await MessageService.create_message(session, user_id="user_7", text=PLAIN_TEXT)
+
+            bench.check(await measure_async(f"MessageService.create_message.{BENCH_MESSAGE_ROWS}_rows", create, repeats=5))
+
+    @pytest.mark.asyncio
+    async def test_get_recent_messages(self, bench, session_factory):
+        async with session_factory() as session:
+            async def recent():
+                session.expunge_all()
+                await MessageService.get_recent_messages(session, limit=50)
+
+            bench.check(await measure_async(f"MessageService.get_recent_messages.{BENCH_MESSAGE_ROWS}_rows", recent, repeats=5))
+
+
+class TestBroadcastHotPath:
+
+    @pytest.mark.asyncio
+    async def test_broadcast_100_connections(self, bench):
+        manager = ConnectionManager()
+        for index in range(100):
+            manager.active_connections[f"user_{index}"] = FakeSocket()
+        message = json.dumps(CHAT_FRAME)
+
+        async def fan_out():
+            await manager.broadcast(message, exclude_user="user_0", save_to_db=False)
+
+        bench.check(await measure_async("ConnectionManager.broadcast.100_sockets", fan_out))
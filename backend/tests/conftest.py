@@ -2,6 +2,7 @@
 Pytest configuration file with shared fixtures and test setup.
 """
 import pytest
+import pytest_asyncio
 import sys
 import os
 from datetime import datetime
@@ -10,6 +11,9 @@ from datetime import datetime
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../'))
 
 # Import modules for testing
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+
+from config.database import Base
 from security.utils import rate_limit_storage
 from services.websocket_manager import ConnectionManager
 
@@ -29,6 +33,25 @@ def reset_global_state():
     rate_limit_storage.clear()
 
 
+@pytest_asyncio.fixture
+async def db_engine():
+    """Provide an in-memory SQLite engine with every table created"""
+    engine = create_async_engine("sqlite+aiosqlite:///:memory:", echo=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    yield engine
+
+    await engine.dispose()
+
+
+@pytest.fixture
+def session_factory(db_engine):
+    """Provide a session factory on the in-memory database; test classes override it to seed rows"""
+    return async_sessionmaker(db_engine, class_=AsyncSession, expire_on_commit=False)
+
+
 @pytest.fixture
 def sample_user_data():
     """Provide sample user data for testing"""
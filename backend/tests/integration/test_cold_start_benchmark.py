@@ -0,0 +1,17 @@
+"""
+Smoke test for the cold-start benchmark (spawns real servers on localhost)
+"""
+import pytest
+
+from benchmarks.cold_start import run_benchmark
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_fast_start_reaches_first_message():
+    """Test that a fast start against an existing database delivers the first message"""
+    result = await run_benchmark(runs=1, modes=["fast"], databases=["existing"])
+
+    scenario = result["scenarios"]["fast/existing"]
+    assert scenario["first_message_ms"]["p50"] >= scenario["session_ms"]["p50"] > 0
+    assert scenario["warmup"]["errors"] == {}
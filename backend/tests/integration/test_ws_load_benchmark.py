@@ -0,0 +1,35 @@
+"""
+Smoke test for the WebSocket load benchmark (spawns a real server on localhost)
+"""
+import json
+import pytest
+
+from benchmarks.ws_load import percentiles, run_benchmark, save_result
+
+
+@pytest.mark.slow
+@pytest.mark.asyncio
+async def test_small_load_run_reports_results(tmp_path):
+    """Test that a short run delivers messages and produces a complete result"""
+    result = await run_benchmark(clients=4, message_rate=4.0, duration=1.5, settle=0.5)
+
+    assert result["connections"]["connected"] == 4
+    assert result["messages"]["sent"] > 0
+    assert result["messages"]["deliveries"] > 0
+    assert result["latency_ms"]["p99"] >= result["latency_ms"]["p50"] > 0
+    assert result["db"]["queries_per_message"] > 0
+    assert sum(result["errors"].values()) == 0
+
+    path = save_result(result, str(tmp_path / "result.json"))
+    with open(path) as result_file:
+        assert json.load(result_file)["benchmark"] == "ws_load"
+
+
+def test_percentiles():
+    """Test percentile summary in milliseconds"""
+    summary = percentiles([i / 1000 for i in range(1, 101)])
+    assert summary["count"] == 100
+    assert summary["p50"] == 51.0
+    assert summary["p99"] == 100.0
+    assert summary["max"] == 100.0
+    assert percentiles([]) == {"count": 0}
@@ -0,0 +1,80 @@
+"""
+Unit tests for WebSocket admission control
+"""
+import asyncio
+import pytest
+
+from services.admission import AdmissionController, PRIORITY_NEW, PRIORITY_RESUME
+
+
+class TestAdmissionController:
+
+    @pytest.mark.asyncio
+    async def test_admits_up_to_limit_immediately(self):
+        """Test that connects below the concurrency limit are not queued"""
+        admission = AdmissionController(max_concurrent=2)
+
+        assert await admission.acquire() is True
+        assert await admission.acquire() is True
+        assert admission.get_stats()["active"] == 2
+
+    @pytest.mark.asyncio
+    async def test_rejects_when_queue_full(self):
+        """Test that connects beyond the queue bound are told to retry"""
+        admission = AdmissionController(max_concurrent=1, max_queue=0)
+
+        assert await admission.acquire() is True
+        assert await admission.acquire() is False
+
+    @pytest.mark.asyncio
+    async def test_queue_timeout_rejects(self):
+        """Test that a waiter gives up after the queue timeout"""
+        admission = AdmissionController(max_concurrent=1, queue_timeout=0.01)
+
+        await admission.acquire()
+        assert await admission.acquire() is False
+
+        # The stale waiter must not block the next connect once the slot frees
+        admission.release()
+        assert await admission.acquire() is True
+
+    @pytest.mark.asyncio
+    async def test_resumptions_served_first(self):
+        """Test that a queued resumption gets the freed slot before a new session"""
+        admission = AdmissionController(max_concurrent=1)
+        await admission.acquire()
+
+        order = []
+
+        async def connect(name, priority):
+            await admission.acquire(priority)
+            order.append(name)
+
+        new_task = asyncio.create_task(connect("new", PRIORITY_NEW))
+        await asyncio.sleep(0)
+        resume_task = asyncio.create_task(connect("resume", PRIORITY_RESUME))
+        await asyncio.sleep(0)
+
+        admission.release()
+        await asyncio.sleep(0)
+        admission.release()
+        await asyncio.gather(new_task, resume_task)
+
+        assert order == ["resume", "new"]
+
+    def test_resume_token_round_trip(self):
+        """Test that only tokens issued for the same user count as resumptions"""
+        admission = AdmissionController(secret="test-secret")
+        token = admission.issue_resume_token("user1")
+
+        assert admission.is_resumption("user1", token) is True
+        assert admission.is_resumption("user2", token) is False
+        assert admission.is_resumption("user1", None) is False
+
+    def test_retry_after_is_jittered_within_bounds(self):
+        """Test that retry delays stay between the base and the cap"""
+        admission = AdmissionController(retry_base=1.0, retry_cap=30.0)
+        delays = {admission.retry_after_ms() for _ in range(50)}
+
+        assert all(1000 <= delay <= 30000 for delay in delays)
+        assert len(delays) > 1
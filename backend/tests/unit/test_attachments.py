@@ -0,0 +1,217 @@
+"""
+Unit tests for resumable, content-addressed attachment uploads and ranged downloads
+"""
+import hashlib
+import os
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.requests import ClientDisconnect
+
+import main
+from services.attachments import AttachmentError, AttachmentResponse, AttachmentStore, parse_range
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 4096
+PDF = b"%PDF-1.7\n" + b"0123456789" * 1000
+
+
+async def chunks_of(data: bytes, size: int = 65536):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def disconnect_after(data: bytes):
+    yield data
+    raise ClientDisconnect()
+
+
+@pytest.fixture
+def store(tmp_path):
+    return AttachmentStore(root=str(tmp_path), min_free_bytes=0)
+
+
+class TestAttachmentStore:
+
+    @pytest.mark.asyncio
+    async def test_chunked_upload_stored_by_hash(self, store):
+        """Test that chunks are appended in order and the file lands under its SHA-256"""
+        upload = await store.create_upload("alice", len(PNG))
+        half = len(PNG) // 2
+
+        assert await store.append(upload, 0, chunks_of(PNG[:half])) is None
+        assert upload.offset == half
+        attachment = await store.append(upload, half, chunks_of(PNG[half:]))
+
+        sha256 = hashlib.sha256(PNG).hexdigest()
+        assert attachment == {"sha256": sha256, "size": len(PNG), "content_type": "image/png", "deduplicated": False}
+        with open(store.object_path(sha256), "rb") as stored:
+            assert stored.read() == PNG
+        assert os.listdir(store.uploads_dir) == []
+
+    @pytest.mark.asyncio
+    async def test_identical_files_stored_once(self, store):
+        """Test that uploading the same bytes again reuses the stored object"""
+        for user_id in ("alice", "bob"):
+            upload = await store.create_upload(user_id, len(PDF))
+            attachment = await store.append(upload, 0, chunks_of(PDF))
+
+        assert attachment["deduplicated"] is True
+        assert attachment["content_type"] == "application/pdf"
+        assert os.listdir(os.path.dirname(store.object_path(attachment["sha256"]))) == [attachment["sha256"]]
+
+    @pytest.mark.asyncio
+    async def test_resume_after_disconnect_and_restart(self, store):
+        """Test that bytes received before a dropped connection survive a process restart"""
+        upload = await store.create_upload("alice", len(PNG))
+        with pytest.raises(ClientDisconnect):
+            await store.append(upload, 0, disconnect_after(PNG[:1000]))
+        assert upload.offset == 1000
+
+        restarted = AttachmentStore(root=store.root, min_free_bytes=0)
+        resumed = await restarted.get_upload(upload.upload_id, "alice")
+        assert resumed.offset == 1000
+
+        attachment = await restarted.append(resumed, 1000, chunks_of(PNG[1000:]))
+        assert attachment["sha256"] == hashlib.sha256(PNG).hexdigest()
+
+    @pytest.mark.asyncio
+    async def test_wrong_offset_and_owner(self, store):
+        """Test that chunks must continue where the upload stopped and uploads are private"""
+        upload = await store.create_upload("alice", len(PNG))
+
+        with pytest.raises(AttachmentError) as error:
+            await store.append(upload, 10, chunks_of(PNG))
+        assert error.value.status_code == 409
+        assert error.value.headers == {"Upload-Offset": "0"}
+
+        with pytest.raises(AttachmentError) as error:
+            await store.get_upload(upload.upload_id, "mallory")
+        assert error.value.status_code == 404
+
+    @pytest.mark.asyncio
+    async def test_oversized_chunk_rolled_back(self, store):
+        """Test that a chunk overrunning the declared size is discarded entirely"""
+        upload = await store.create_upload("alice", 1000)
+        await store.append(upload, 0, chunks_of(PNG[:400]))
+
+        with pytest.raises(AttachmentError) as error:
+            await store.append(upload, 400, chunks_of(PNG[400:2000], size=300))
+        assert error.value.status_code == 413
+        assert upload.offset == 400
+        assert os.path.getsize(store._part_path(upload.upload_id)) == 400
+
+    @pytest.mark.asyncio
+    async def test_limits(self, store):
+        """Test size limits and that only allow-listed file types are kept"""
+        store.max_bytes = 100
+        with pytest.raises(AttachmentError) as error:
+            await store.create_upload("alice", 101)
+        assert error.value.status_code == 413
+
+        upload = await store.create_upload("alice", 12)
+        with pytest.raises(AttachmentError) as error:
+            await store.append(upload, 0, chunks_of(b"<script>x();"))
+        assert error.value.status_code == 415
+        assert os.listdir(store.uploads_dir) == []
+
+    @pytest.mark.asyncio
+    async def test_sweep_removes_abandoned_uploads(self, store):
+        """Test that uploads idle past the TTL are removed and fresh ones kept"""
+        stale = await store.create_upload("alice", 100)
+        fresh = await store.create_upload("bob", 100)
+        stale.updated -= store.upload_ttl + 1
+
+        assert store.sweep() == 1
+        assert sorted(os.listdir(store.uploads_dir)) == [f"{fresh.upload_id}.json", f"{fresh.upload_id}.part"]
+
+    def test_parse_range(self):
+        """Test single byte ranges, suffix ranges and unsatisfiable ones"""
+        assert parse_range("bytes=0-99", 1000) == (0, 99)
+        assert parse_range("bytes=900-", 1000) == (900, 999)
+        assert parse_range("bytes=-100", 1000) == (900, 999)
+        assert parse_range("bytes=990-2000", 1000) == (990, 999)
+        assert parse_range("bytes=0-1,5-9", 1000) is None
+        assert parse_range("items=0-1", 1000) is None
+        with pytest.raises(AttachmentError) as error:
+            parse_range("bytes=1000-", 1000)
+        assert error.value.headers == {"Content-Range": "bytes */1000"}
+
+    @pytest.mark.asyncio
+    async def test_zero_copy_send_used_when_offered(self, tmp_path):
+        """Test that servers with the zero-copy extension get the file handle instead of slices"""
+        path = tmp_path / "object"
+        path.write_bytes(PDF)
+        sent = []
+
+        async def send(message):
+            sent.append(message)
+
+        response = AttachmentResponse(str(path), 10, 19, status_code=206)
+        await response({"type": "http", "extensions": {"http.response.zerocopysend": {}}}, None, send)
+
+        assert sent[1]["type"] == "http.response.zerocopysend"
+        assert (sent[1]["offset"], sent[1]["count"]) == (10, 10)
+
+
+class TestAttachmentEndpoints:
+
+    @pytest.fixture
+    def client(self, store, monkeypatch):
+        monkeypatch.setattr(main, "attachment_store", store)
+        return TestClient(main.app)
+
+    def _upload(self, client, data, user_id="alice", chunk=100_000):
+        headers = {"X-User-Id": user_id}
+        created = client.post("/attachments/uploads", json={"size": len(data)}, headers=headers)
+        assert created.status_code == 201
+        location = created.headers["location"]
+        for start in range(0, len(data), chunk):
+            response = client.patch(location, content=data[start:start + chunk],
+                                    headers={**headers, "Upload-Offset": str(start)})
+            assert response.status_code == 200
+        return location, response.json()
+
+    def test_upload_resume_and_download(self, client):
+        """Test the HTTP round trip: chunks, offset query and ranged, cacheable download"""
+        location, finished = self._upload(client, PNG)
+        assert finished["complete"] is True
+        sha256 = finished["attachment"]["sha256"]
+
+        full = client.get(f"/attachments/{sha256}")
+        assert full.status_code == 200
+        assert full.content == PNG
+        assert full.headers["content-type"] == "image/png"
+        assert full.headers["accept-ranges"] == "bytes"
+
+        partial = client.get(f"/attachments/{sha256}", headers={"Range": "bytes=100-199"})
+        assert partial.status_code == 206
+        assert partial.content == PNG[100:200]
+        assert partial.headers["content-range"] == f"bytes 100-199/{len(PNG)}"
+
+        assert client.get(f"/attachments/{sha256}", headers={"If-None-Match": f'"{sha256}"'}).status_code == 304
+        assert client.get(f"/attachments/{sha256}", headers={"Range": f"bytes={len(PNG)}-"}).status_code == 416
+
+        head = client.head(f"/attachments/{sha256}")
+        assert head.content == b""
+        assert int(head.headers["content-length"]) == len(PNG)
+
+    def test_offset_query_and_errors(self, client):
+        """Test resuming from the reported offset and the error responses"""
+        headers = {"X-User-Id": "alice"}
+        location = client.post("/attachments/uploads", json={"size": len(PDF)}, headers=headers).headers["location"]
+        client.patch(location, content=PDF[:500], headers={**headers, "Upload-Offset": "0"})
+
+        status = client.get(location, headers=headers)
+        assert status.json()["offset"] == 500
+        assert status.headers["upload-offset"] == "500"
+
+        conflict = client.patch(location, content=PDF[100:], headers={**headers, "Upload-Offset": "100"})
+        assert conflict.status_code == 409
+        assert conflict.headers["upload-offset"] == "500"
+
+        assert client.get(location, headers={"X-User-Id": "bob"}).status_code == 404
+        assert client.post("/attachments/uploads", json={"size": 10}).status_code == 401
+        assert client.get("/attachments/" + "0" * 64).status_code == 404
+
+        assert client.delete(location, headers=headers).status_code == 204
+        assert client.get(location, headers=headers).status_code == 404
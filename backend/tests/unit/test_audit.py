@@ -0,0 +1,176 @@
+"""
+Unit tests for the hash-chained, group-committed audit log and its verifier
+"""
+import asyncio
+import gzip
+import os
+import threading
+import time
+
+import pytest
+
+from services import audit
+from services.audit import AuditLog, segment_paths, verify
+
+
+@pytest.fixture
+def audit_dir(tmp_path):
+    return str(tmp_path / "audit")
+
+
+def read_lines(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as file:
+        return file.readlines()
+
+
+class TestAuditLog:
+
+    @pytest.mark.asyncio
+    async def test_group_commit_one_fsync(self, audit_dir, monkeypatch):
+        """Test that events appended together share one write and one fsync"""
+        fsyncs = []
+        real_fsync = os.fsync
+        monkeypatch.setattr(audit.os, "fsync", lambda fd: fsyncs.append(fd) or real_fsync(fd))
+        log = AuditLog(audit_dir)
+
+        for index in range(500):
+            log.append("message", f"user{index % 7}", message_seq=index)
+        await log.flush()
+
+        assert len(fsyncs) == 1
+        assert log.seq == 500
+        result = verify(audit_dir)
+        assert (result["ok"], result["records"], result["head"]) == (True, 500, log.head)
+
+    @pytest.mark.asyncio
+    async def test_background_commits(self, audit_dir):
+        """Test that the writer task commits on its own and stop writes what is left"""
+        log = AuditLog(audit_dir, commit_interval=0.01)
+        await log.start()
+        log.append("connect", "alice", connection_id="ws_1")
+        await log.flush()
+        log.append("disconnect", "alice", connection_id="ws_1")
+        await log.stop()
+
+        lines = read_lines(segment_paths(audit_dir)[0])
+        assert [line.split(b'"event":"')[1].split(b'"')[0] for line in lines] == [b"connect", b"disconnect"]
+
+    @pytest.mark.asyncio
+    async def test_tampering_detected(self, audit_dir):
+        """Test that edited, removed and reordered records break the chain"""
+        log = AuditLog(audit_dir)
+        for index in range(10):
+            log.append("profile_change", "alice", department=f"ward {index}")
+        await log.stop()
+        path = segment_paths(audit_dir)[0]
+        original = read_lines(path)
+
+        def write(lines):
+            with open(path, "wb") as file:
+                file.writelines(lines)
+
+        write(original[:4] + [original[4].replace(b"ward 4", b"ward 9")] + original[5:])
+        assert verify(audit_dir)["error"] == "hash mismatch at seq 5"
+
+        write(original[:4] + original[5:])
+        assert verify(audit_dir)["error"] == "seq 6 follows 4"
+
+        write(original[:4] + [original[5], original[4]] + original[6:])
+        assert not verify(audit_dir)["ok"]
+
+        write(original)
+        assert verify(audit_dir)["ok"]
+
+    @pytest.mark.asyncio
+    async def test_rotation_compresses_and_chains_segments(self, audit_dir):
+        """Test that rotated segments are gzipped and verified as one chain, also in parallel"""
+        log = AuditLog(audit_dir, segment_bytes=2000)
+        for batch in range(6):
+            for index in range(10):
+                log.append("message", "bob", message_seq=batch * 10 + index)
+            await log.commit()
+        await log.stop()
+
+        paths = segment_paths(audit_dir)
+        assert len(paths) > 2
+        assert all(path.endswith(".log.gz") for path in paths[:-1])
+        assert paths[-1].endswith(".log")
+        for workers in (1, 2):
+            result = verify(audit_dir, workers=workers)
+            assert (result["ok"], result["records"], result["segments"]) == (True, 60, len(paths))
+
+        # A whole segment going missing is caught at the boundary
+        os.remove(paths[1])
+        assert "expected" in verify(audit_dir)["error"]
+
+    @pytest.mark.asyncio
+    async def test_restart_drops_torn_record_and_continues(self, audit_dir):
+        """Test that a new process truncates a half-written record and extends the same chain"""
+        log = AuditLog(audit_dir)
+        log.append("connect", "alice")
+        log.append("message", "alice")
+        await log.stop()
+        with open(segment_paths(audit_dir)[0], "ab") as file:
+            file.write(b'{"seq":3,"ts":1.0,"event":"mess')
+
+        restarted = AuditLog(audit_dir)
+        restarted.append("disconnect", "alice")
+        await restarted.stop()
+
+        assert restarted.seq == 3
+        result = verify(audit_dir)
+        assert (result["ok"], result["records"], result["last_seq"]) == (True, 3, 3)
+
+    @pytest.mark.asyncio
+    async def test_failed_write_retried_without_duplicates(self, audit_dir, monkeypatch):
+        """Test that a failed fsync leaves nothing behind and the events are written next time"""
+        log = AuditLog(audit_dir)
+        log.append("connect", "alice")
+        await log.commit()
+
+        monkeypatch.setattr(audit.os, "fsync", lambda fd: (_ for _ in ()).throw(OSError("disk gone")))
+        log.append("message", "alice")
+        with pytest.raises(OSError):
+            await log.commit()
+        assert log.get_stats()["pending"] == 1
+
+        monkeypatch.undo()
+        assert await log.commit() == 1
+        await log.stop()
+        assert verify(audit_dir)["records"] == 2
+
+    @pytest.mark.asyncio
+    async def test_stop_during_slow_commit(self, audit_dir, monkeypatch):
+        """Test that stopping while the writer is mid-fsync writes every event exactly once"""
+        writing = threading.Event()
+        real_fsync = os.fsync
+
+        def slow_fsync(fd):
+            writing.set()
+            time.sleep(0.2)
+            real_fsync(fd)
+
+        monkeypatch.setattr(audit.os, "fsync", slow_fsync)
+        log = AuditLog(audit_dir, commit_interval=0)
+        await log.start()
+        for index in range(5):
+            log.append("message", "alice", message_seq=index)
+        assert await asyncio.to_thread(writing.wait, 5)
+
+        log.append("message", "alice", message_seq=5)
+        await log.stop()
+
+        result = verify(audit_dir)
+        assert (result["ok"], result["records"]) == (True, 6)
+        assert log.commits == 2
+
+    def test_full_buffer_drops(self, audit_dir):
+        """Test that events beyond the buffer bound are dropped instead of growing memory"""
+        log = AuditLog(audit_dir, max_pending=3)
+        for _ in range(5):
+            log.append("connect", "alice")
+        assert log.get_stats()["pending"] == 3
+
+        with pytest.raises(ValueError):
+            log.append("message", "alice", seq=1)
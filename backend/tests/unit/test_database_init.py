@@ -0,0 +1,120 @@
+"""
+Unit tests for the startup schema check
+"""
+import os
+import re
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from config import database
+from config.database import SCHEMA_REVISION
+from services.database_service import MessageService, UserService
+
+VERSIONS_DIR = os.path.join(os.path.dirname(__file__), "../../alembic/versions")
+
+
+@pytest_asyncio.fixture
+async def engine(tmp_path, monkeypatch):
+    """Point config.database at a fresh SQLite file"""
+    test_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'init.db'}")
+    monkeypatch.setattr(database, "engine", test_engine)
+    yield test_engine
+    await test_engine.dispose()
+
+
+async def _tables(engine):
+    async with engine.connect() as conn:
+        rows = await conn.execute(text("SELECT name FROM sqlite_master WHERE type = 'table'"))
+        return {row[0] for row in rows}
+
+
+class TestSchemaCheck:
+
+    @pytest.mark.asyncio
+    async def test_new_database_created_and_stamped(self, engine):
+        """Test that an empty database gets the tables and is stamped at the head revision"""
+        assert await database.schema_is_current() is False
+
+        await database.init_db(fast=True)
+
+        assert {"users", "messages", "user_sessions", "alembic_version"} <= await _tables(engine)
+        assert await database.schema_is_current() is True
+
+    @pytest.mark.asyncio
+    async def test_fast_start_skips_create_all(self, engine, monkeypatch):
+        """Test that a stamped database is trusted without running create_all"""
+        await database.init_db()
+
+        def fail(sync_conn):
+            raise AssertionError("create_all ran")
+
+        monkeypatch.setattr(database, "_create_schema", fail)
+        await database.init_db(fast=True)
+
+    @pytest.mark.asyncio
+    async def test_unknown_unstamped_database_refused(self, engine):
+        """Test that tables from an unknown revision stop startup instead of being served or stamped"""
+        async with engine.begin() as conn:
+            await conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY)"))
+
+        with pytest.raises(RuntimeError, match="not stamped"):
+            await database.init_db(fast=True)
+
+        assert await database.schema_is_current() is False
+
+    @pytest.mark.asyncio
+    async def test_unstamped_initial_database_migrated(self, engine):
+        """Test that tables create_all built before stamping are stamped, migrated and take new messages"""
+        async with engine.begin() as conn:
+            await conn.run_sync(database.upgrade_schema, database.INITIAL_REVISION)
+            await conn.execute(text("DROP TABLE alembic_version"))
+
+        await database.init_db(fast=True)
+
+        assert await database.schema_is_current() is True
+        factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        async with factory() as session:
+            await UserService.create_or_update_user(session, "alice", "Alice", "ICU")
+            await MessageService.create_message(session, "alice", "Bed 4 stable", channel="icu")
+            messages = await MessageService.get_recent_messages(session)
+        assert [(message.text, message.channel) for message in messages] == [("Bed 4 stable", "icu")]
+
+    @pytest.mark.asyncio
+    async def test_stamped_database_upgraded(self, engine):
+        """Test that a database stamped at an older revision is migrated on start, keeping its rows"""
+        async with engine.begin() as conn:
+            await conn.run_sync(database.upgrade_schema, database.INITIAL_REVISION)
+            await conn.execute(text(
+                "INSERT INTO messages (message_id, user_id, text, message_type) VALUES ('m1', 'alice', 'hello', 'message')"
+            ))
+        assert "read_cursors" not in await _tables(engine)
+
+        await database.init_db(fast=True)
+
+        assert "read_cursors" in await _tables(engine)
+        assert await database.schema_is_current() is True
+        async with engine.connect() as conn:
+            assert (await conn.execute(text("SELECT channel FROM messages"))).scalar() == "general"
+
+    @pytest.mark.asyncio
+    async def test_warm_pool(self, engine):
+        """Test that warming opens and returns connections without error"""
+        await database.warm_pool(connections=2)
+
+        assert engine.pool.checkedout() == 0
+
+
+def test_schema_revision_is_alembic_head():
+    """Test that SCHEMA_REVISION was bumped along with the latest migration"""
+    revisions, parents = set(), set()
+    for name in os.listdir(VERSIONS_DIR):
+        if name.endswith(".py"):
+            with open(os.path.join(VERSIONS_DIR, name)) as migration:
+                source = migration.read()
+            revisions.add(re.search(r"^revision: str = '(\w+)'", source, re.M).group(1))
+            parents.update(re.findall(r"'(\w+)'", re.search(r"^down_revision.*$", source, re.M).group(0)))
+
+    assert revisions - parents == {SCHEMA_REVISION}
@@ -317,4 +317,39 @@ class TestSessionService:
 
         assert len(active_sessions) == 1
         assert active_sessions[0].user_id == "user2"
-        assert active_sessions[0].is_active is True
\ No newline at end of file
+        assert active_sessions[0].is_active is True
+    @pytest.mark.asyncio
+    async def test_create_and_end_sessions_in_bulk(self, async_session):
+        """Test writing many session opens and closes at once"""
+        session_service = SessionService()
+
+        await session_service.create_sessions(async_session, [
+            {"user_id": f"user{i}", "connection_id": f"connection_{i}", "is_active": True}
+            for i in range(5)
+        ])
+        assert len(await session_service.get_active_sessions(async_session)) == 5
+
+        ended = await session_service.end_sessions(async_session, {
+            "connection_1": datetime.utcnow(),
+            "connection_3": datetime.utcnow(),
+        })
+        await async_session.commit()
+
+        assert ended == 2
+        active_sessions = await session_service.get_active_sessions(async_session)
+        assert sorted(s.connection_id for s in active_sessions) == [
+            "connection_0", "connection_2", "connection_4"
+        ]
+
+    @pytest.mark.asyncio
+    async def test_close_stale_sessions(self, async_session):
+        """Test closing every session left active by a previous process"""
+        session_service = SessionService()
+
+        await session_service.create_session(async_session, "user1", "connection_1")
+        await session_service.create_session(async_session, "user2", "connection_2")
+
+        closed = await session_service.close_stale_sessions(async_session)
+
+        assert closed == 2
+        assert await session_service.get_active_sessions(async_session) == []
@@ -0,0 +1,136 @@
+"""
+Unit tests for the in-memory staff directory index behind @mention search
+"""
+import pytest
+import pytest_asyncio
+
+from services.database_service import UserService
+from services.directory import DirectoryIndex
+
+
+def ids(results):
+    return [user["user_id"] for user in results]
+
+
+class TestDirectoryIndex:
+    """Test loading, incremental updates, matching and ranking"""
+
+    @pytest_asyncio.fixture
+    async def session_factory(self, session_factory):
+        """The in-memory database with a few staff"""
+        async with session_factory() as session:
+            for user_id, name, department in (
+                ("asmith", "Alice Smith", "Cardiology"),
+                ("bsmithers", "Bob Smithers", "ICU"),
+                ("jnunez", "José Núñez", "Emergency"),
+                ("kgoldsmith", "Kim Goldsmith", "ICU"),
+            ):
+                await UserService.create_or_update_user(session, user_id, name, department, bio="on call")
+        return session_factory
+
+    @pytest.mark.asyncio
+    async def test_load_and_prefix_search(self, session_factory):
+        """Test that one load indexes names, ids and departments by prefix, case- and accent-insensitively"""
+        directory = DirectoryIndex(session_factory)
+        await directory.load()
+
+        assert directory.get_stats()["users"] == 4
+        assert set(ids(directory.search("smi"))) == {"asmith", "bsmithers", "kgoldsmith"}
+        assert ids(directory.search("jose nu")) == ["jnunez"]
+        assert ids(directory.search("BSMI")) == ["bsmithers"]
+        assert ids(directory.search("cardio")) == ["asmith"]
+        assert directory.search("zed") == []
+
+    @pytest.mark.asyncio
+    async def test_department_filter_and_limit(self, session_factory):
+        """Test that the department filter is exact and case-insensitive and limits are applied"""
+        directory = DirectoryIndex(session_factory)
+        await directory.load()
+
+        assert set(ids(directory.search("", department="icu"))) == {"bsmithers", "kgoldsmith"}
+        assert ids(directory.search("smi", department="Cardiology")) == ["asmith"]
+        assert directory.search("smi", department="Radiology") == []
+        assert len(directory.search("", limit=2)) == 2
+
+    @pytest.mark.asyncio
+    async def test_ranking(self, session_factory):
+        """Test that name starts beat word starts beat substrings, then recent activity decides"""
+        directory = DirectoryIndex(session_factory)
+        await directory.load()
+
+        # "Goldsmith" only contains "smith"
+        assert ids(directory.search("smith"))[-1] == "kgoldsmith"
+        directory.touch("bsmithers")
+        assert ids(directory.search("smith")) == ["bsmithers", "asmith", "kgoldsmith"]
+        # Every word has to match
+        assert ids(directory.search("b smith")) == ["bsmithers"]
+
+    @pytest.mark.asyncio
+    async def test_upsert_reindexes(self, session_factory):
+        """Test that renames and department moves replace the old index entries"""
+        directory = DirectoryIndex(session_factory)
+        await directory.load()
+
+        directory.upsert("asmith", "Alice Jones", "Oncology")
+        assert directory.search("alice sm") == []
+        assert ids(directory.search("jon")) == ["asmith"]
+        assert ids(directory.search("", department="oncology")) == ["asmith"]
+        assert directory.search("", department="cardiology") == []
+
+        directory.upsert("dnew", "Dana New", "ICU")
+        assert ids(directory.search("", department="ICU"))[0] == "dnew"
+        assert directory.get_stats()["users"] == 5
+
+    @pytest.mark.asyncio
+    async def test_upsert_during_load_is_kept(self, session_factory):
+        """Test that a user written while the index loads isn't overwritten by the older row"""
+        directory = DirectoryIndex(session_factory)
+        directory.upsert("asmith", "Alice Jones", "Oncology")
+        await directory.load()
+
+        assert ids(directory.search("alice")) == ["asmith"]
+        assert directory.search("alice")[0]["department"] == "Oncology"
+
+    def test_long_queries_and_substrings(self):
+        """Test that words past the indexed prefix length are checked, and substrings fill remaining places"""
+        directory = DirectoryIndex(max_prefix=4)
+        for index in range(2000):
+            directory.upsert(f"user{index}", f"Staff Member{index}", f"Ward {index % 20}", active=False)
+
+        assert ids(directory.search("member1999")) == ["user1999"]
+        assert set(ids(directory.search("member19 staff", department="ward 19"))) == {
+            "user19", "user199", "user1919", "user1939", "user1959", "user1979", "user1999"
+        }
+        assert ids(directory.search("mber1999")) == ["user1999"]
+
+    def test_ranked_lists_follow_activity(self):
+        """Test that cached most-active lists are reordered by activity and rebuilt after a rename"""
+        directory = DirectoryIndex()
+        for index in range(100):
+            directory.upsert(f"user{index}", f"Nurse {index}", "ICU" if index % 2 else "Surgery")
+
+        assert ids(directory.search("nurse", limit=3)) == ["user99", "user98", "user97"]
+        assert ids(directory.search("nur", department="surgery", limit=2)) == ["user98", "user96"]
+        lists = directory.get_stats()["ranked_lists"]
+
+        directory.touch("user10")
+        assert ids(directory.search("nurse", limit=2)) == ["user10", "user99"]
+        assert ids(directory.search("nur", department="surgery", limit=2)) == ["user10", "user98"]
+        assert directory.get_stats()["ranked_lists"] == lists
+
+        directory.upsert("user10", "Matron 10", "Surgery", active=False)
+        assert ids(directory.search("nurse", limit=1)) == ["user99"]
+        assert ids(directory.search("matron")) == ["user10"]
+
+    def test_ranked_lists_bounded(self):
+        """Test that searches matching nobody keep no list and searched lists are capped, least recent first"""
+        directory = DirectoryIndex(max_ranked_lists=4)
+        directory.upsert("asmith", "Alice Smith", "Cardiology")
+
+        for index in range(1000):
+            assert directory.search(f"zq{index}") == []
+        assert directory.get_stats()["ranked_lists"] == 0
+
+        for query in ("a", "al", "ali", "alic", "alice", "s"):
+            assert ids(directory.search(query)) == ["asmith"]
+        assert directory.get_stats()["ranked_lists"] == 4
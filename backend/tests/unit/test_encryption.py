@@ -0,0 +1,172 @@
+"""
+Unit tests for envelope encryption of message text and bios
+"""
+import base64
+
+import pytest
+from sqlalchemy import text
+
+from security import encryption
+from security.encryption import (
+    DATA_KEY_UNWRAPS, FieldCipher, FieldEncryptionError, PLAIN_PREFIX, PREFIX, encrypt_existing
+)
+from services.database_service import MessageService, UserService
+
+KEY_1 = base64.b64encode(b"1" * 32).decode()
+KEY_2 = base64.b64encode(b"2" * 32).decode()
+
+
+class TestFieldCipher:
+
+    def test_round_trip_bound_to_field(self):
+        """Test that values round-trip, are randomized and only decrypt for their own column"""
+        cipher = FieldCipher(f"k1:{KEY_1}")
+        first = cipher.encrypt("BP 120/80, bed 4", "messages.text")
+        second = cipher.encrypt("BP 120/80, bed 4", "messages.text")
+
+        assert first.startswith(PREFIX + "k1:")
+        assert "BP 120/80" not in first
+        assert first != second
+        assert cipher.decrypt(first, "messages.text") == "BP 120/80, bed 4"
+        assert cipher.encrypt(None, "users.bio") is None
+        with pytest.raises(FieldEncryptionError):
+            cipher.decrypt(first, "users.bio")
+
+    def test_tampering_detected(self):
+        """Test that an altered ciphertext or wrapped data key fails authentication"""
+        cipher = FieldCipher(f"k1:{KEY_1}")
+        value = cipher.encrypt("hello", "messages.text")
+        header, payload = value.rsplit(":", 1)
+        raw = bytearray(base64.b64decode(payload))
+        raw[-1] ^= 1
+        with pytest.raises(FieldEncryptionError):
+            cipher.decrypt(f"{header}:{base64.b64encode(raw).decode()}", "messages.text")
+
+        # Another process: the wrapped key must be unwrapped, not found in the cache
+        fresh = FieldCipher(f"k1:{KEY_1}")
+        key_id, wrapped = header[len(PREFIX):].split(":", 1)
+        raw = bytearray(base64.b64decode(wrapped))
+        raw[0] ^= 1
+        with pytest.raises(FieldEncryptionError):
+            fresh.decrypt(f"{PREFIX}{key_id}:{base64.b64encode(raw).decode()}:{payload}", "messages.text")
+
+    def test_data_key_rotation_and_cache(self):
+        """Test that data keys rotate after max uses and each is unwrapped once per process"""
+        cipher = FieldCipher(f"k1:{KEY_1}", max_uses=10)
+        values = [cipher.encrypt(f"note {index}", "messages.text") for index in range(25)]
+        assert len({value.rsplit(":", 1)[0] for value in values}) == 3
+
+        reader = FieldCipher(f"k1:{KEY_1}")
+        unwraps = DATA_KEY_UNWRAPS.value
+        assert [reader.decrypt(value, "messages.text") for value in values] == [f"note {i}" for i in range(25)]
+        assert DATA_KEY_UNWRAPS.value - unwraps == 3
+
+    def test_key_rotation(self):
+        """Test that a new key wraps new data keys while older ones still decrypt"""
+        old = FieldCipher(f"k1:{KEY_1}").encrypt("old", "users.bio")
+        rotated = FieldCipher(f"k2:{KEY_2},k1:{KEY_1}")
+
+        assert rotated.encrypt("new", "users.bio").startswith(PREFIX + "k2:")
+        assert rotated.decrypt(old, "users.bio") == "old"
+        with pytest.raises(FieldEncryptionError):
+            FieldCipher(f"k2:{KEY_2}").decrypt(old, "users.bio")
+
+    def test_plaintext_and_disabled(self):
+        """Test that legacy plaintext passes through and ciphertext without keys is an error"""
+        cipher = FieldCipher(f"k1:{KEY_1}")
+        assert cipher.decrypt("plain text", "messages.text") == "plain text"
+        assert cipher.decrypt("enc1: not really", "messages.text") == "enc1: not really"
+
+        disabled = FieldCipher("")
+        assert disabled.encrypt("hello", "messages.text") == "hello"
+        with pytest.raises(FieldEncryptionError):
+            disabled.decrypt(cipher.encrypt("hello", "messages.text"), "messages.text")
+        with pytest.raises(ValueError):
+            FieldCipher("k1:short")
+
+    def test_plaintext_shaped_like_ciphertext_marked(self):
+        """Test that plaintext starting with a prefix is marked on write and comes back unchanged"""
+        lookalike = FieldCipher(f"k1:{KEY_1}").encrypt("hello", "messages.text")
+        disabled = FieldCipher("")
+        for value in (lookalike, PLAIN_PREFIX + "x", "enc1: spaced"):
+            stored = disabled.encrypt(value, "messages.text")
+            assert stored == PLAIN_PREFIX + value
+            assert disabled.decrypt(stored, "messages.text") == value
+            assert FieldCipher(f"k2:{KEY_2}").decrypt(stored, "messages.text") == value
+
+
+class TestEncryptedColumns:
+
+    @pytest.fixture(autouse=True)
+    def cipher(self, monkeypatch):
+        monkeypatch.setattr(encryption, "field_cipher", FieldCipher(f"k1:{KEY_1}"))
+
+    async def _raw(self, session_factory, query):
+        async with session_factory() as session:
+            return (await session.execute(text(query))).scalars().all()
+
+    @pytest.mark.asyncio
+    async def test_stored_encrypted_read_transparently(self, session_factory):
+        """Test that text and bio are ciphertext in the database and plaintext through the models"""
+        async with session_factory() as session:
+            await UserService.create_or_update_user(session, "alice", "Alice", "ICU", bio="Night shift lead")
+            await MessageService.create_message(session, "alice", "Patient in bed 4 stable")
+            messages = await MessageService.get_recent_messages(session)
+
+        assert messages[0].text == "Patient in bed 4 stable"
+        assert messages[0].to_dict()["bio"] == "Night shift lead"
+        stored_text, = await self._raw(session_factory, "SELECT text FROM messages")
+        stored_bio, = await self._raw(session_factory, "SELECT bio FROM users")
+        assert stored_text.startswith(PREFIX) and "bed" not in stored_text
+        assert stored_bio.startswith(PREFIX) and "shift" not in stored_bio
+
+    @pytest.mark.asyncio
+    async def test_encrypt_existing_rows(self, session_factory):
+        """Test that rows written in plaintext are encrypted in place by the backfill"""
+        async with session_factory() as session:
+            await session.execute(text(
+                "INSERT INTO users (user_id, user_name, department, bio, is_active) "
+                "VALUES ('bob', 'Bob', 'ER', 'legacy bio', 1)"
+            ))
+            for index in range(3):
+                await session.execute(text(
+                    "INSERT INTO messages (message_id, text, message_type, channel, user_id) "
+                    f"VALUES ('m{index}', 'legacy {index}', 'text', 'general', 'bob')"
+                ))
+            await session.commit()
+            await MessageService.create_message(session, "bob", "already encrypted")
+
+        assert await encrypt_existing(session_factory, batch_size=2) == {"messages.text": 3, "users.bio": 1}
+        assert all(value.startswith(PREFIX) for value in await self._raw(session_factory, "SELECT text FROM messages"))
+
+        async with session_factory() as session:
+            messages = await MessageService.get_recent_messages(session)
+        assert sorted(message.text for message in messages) == ["already encrypted", "legacy 0", "legacy 1", "legacy 2"]
+        assert messages[0].user.bio == "legacy bio"
+
+    @pytest.mark.asyncio
+    async def test_lookalike_plaintext_readable_and_backfilled(self, session_factory, monkeypatch):
+        """Test that ciphertext-shaped plaintext neither breaks reads nor escapes the backfill"""
+        lookalike = FieldCipher(f"k2:{KEY_2}").encrypt("hello", "messages.text")
+        enabled = encryption.field_cipher
+        monkeypatch.setattr(encryption, "field_cipher", FieldCipher(""))
+        async with session_factory() as session:
+            await UserService.create_or_update_user(session, "mallory", "Mallory", "ER")
+            await MessageService.create_message(session, "mallory", lookalike)
+            # Written before plaintext was marked
+            await session.execute(text(
+                "INSERT INTO messages (message_id, text, message_type, channel, user_id) "
+                "VALUES ('legacy', :text, 'text', 'general', 'mallory')"
+            ), {"text": lookalike})
+            await session.commit()
+            messages = await MessageService.get_recent_messages(session)
+        assert [message.text for message in messages] == [lookalike, lookalike]
+
+        monkeypatch.setattr(encryption, "field_cipher", enabled)
+        assert (await encrypt_existing(session_factory))["messages.text"] == 1
+        async with session_factory() as session:
+            messages = await MessageService.get_recent_messages(session)
+        # Under k1 the legacy row fails to decrypt and is returned as stored instead of failing the query
+        assert [message.text for message in messages] == [lookalike, lookalike]
+        stored = await self._raw(session_factory, "SELECT text FROM messages WHERE message_id != 'legacy'")
+        assert stored[0].startswith(PREFIX + "k1:")
@@ -0,0 +1,105 @@
+"""
+Unit tests for the CPU worker pools
+"""
+import asyncio
+import gzip
+import json
+import time
+import pytest
+
+from security.utils import SecurityUtils
+from services import executor
+from services.executor import WorkerPools, THREAD
+
+
+def _slow_identity(value, seconds=0.05):
+    time.sleep(seconds)
+    return value
+
+
+class TestWorkerPools:
+
+    @pytest.mark.asyncio
+    async def test_run_returns_result(self):
+        """Test that a task runs on the pool and its result comes back"""
+        pools = WorkerPools(thread_workers=2, process_workers=0, task_types={"cpu": (THREAD, 2)})
+        try:
+            assert await pools.run("cpu", _slow_identity, 42, seconds=0) == 42
+        finally:
+            pools.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_per_type_concurrency_limit(self):
+        """Test that a task type never runs more tasks than its limit"""
+        pools = WorkerPools(thread_workers=4, process_workers=0, task_types={"cpu": (THREAD, 1)})
+        running = []
+        peak = []
+
+        def tracked(index):
+            running.append(index)
+            peak.append(len(running))
+            time.sleep(0.02)
+            running.remove(index)
+            return index
+
+        try:
+            results = await asyncio.gather(*(pools.run("cpu", tracked, index) for index in range(4)))
+        finally:
+            pools.shutdown()
+        assert results == [0, 1, 2, 3]
+        assert max(peak) == 1
+
+    @pytest.mark.asyncio
+    async def test_unknown_task_type(self):
+        """Test that an unregistered task type is rejected"""
+        pools = WorkerPools(process_workers=0)
+        with pytest.raises(ValueError):
+            await pools.run("nope", _slow_identity, 1)
+
+    @pytest.mark.asyncio
+    async def test_process_tasks_fall_back_to_threads(self):
+        """Test that process tasks run on threads when process workers are disabled"""
+        pools = WorkerPools(thread_workers=1, process_workers=0)
+        try:
+            assert await pools.run("sanitize", executor._sanitize_chunk, ["<b>hi</b>"], 100) == ["hi"]
+            assert pools._process_pool is None
+        finally:
+            pools.shutdown()
+
+    @pytest.mark.asyncio
+    async def test_loop_keeps_running_during_password_hash(self):
+        """Test that PBKDF2 no longer blocks the event loop"""
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.001)
+                ticks += 1
+
+        ticker_task = asyncio.create_task(ticker())
+        stored = await executor.hash_password("correct horse")
+        ticker_task.cancel()
+
+        assert ticks > 0
+        assert await executor.verify_password(stored, "correct horse")
+        assert not await executor.verify_password(stored, "wrong")
+        assert SecurityUtils.verify_password(stored, "correct horse")
+
+    @pytest.mark.asyncio
+    async def test_sanitize_many_matches_sanitize_input(self):
+        """Test that bulk sanitization in worker processes matches the inline result"""
+        texts = [f"<i>note {index}</i> & done" for index in range(executor.SANITIZE_CHUNK_SIZE + 10)]
+        try:
+            result = await executor.sanitize_many(texts, 200)
+        finally:
+            executor.worker_pools.shutdown()
+        assert result == [SecurityUtils.sanitize_input(text, 200) for text in texts]
+
+    @pytest.mark.asyncio
+    async def test_encode_export_gzip(self):
+        """Test NDJSON export encoding with compression"""
+        records = [{"id": 1, "text": "a"}, {"id": 2, "text": "b"}]
+        data = await executor.encode_export(records, compress=True)
+        lines = gzip.decompress(data).decode("utf-8").splitlines()
+        assert [json.loads(line) for line in lines] == records
@@ -0,0 +1,142 @@
+"""
+Unit tests for the streaming, resumable compliance export
+"""
+import asyncio
+import csv
+import gzip
+import io
+import json
+from datetime import datetime
+
+import pytest
+import pytest_asyncio
+from fastapi.testclient import TestClient
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+import main
+from config.database import Base
+from models.db_models import Message
+from security import admin
+from services import export
+from services.database_service import MessageService, UserService
+
+
+async def populate(factory, count=10):
+    """alice (ICU) and bob (ER) alternate messages, one per day from 2026-01-01"""
+    async with factory() as session:
+        await UserService.create_or_update_user(session, "alice", "Alice", "ICU")
+        await UserService.create_or_update_user(session, "bob", "Bob", "ER")
+        for index in range(count):
+            message = await MessageService.create_message(session, ("alice", "bob")[index % 2], f"note {index}")
+            await session.execute(
+                update(Message).where(Message.id == message.id).values(created_at=datetime(2026, 1, 1 + index))
+            )
+        await session.commit()
+
+
+async def collect(chunks):
+    return b"".join([chunk async for chunk in chunks])
+
+
+def ndjson(data: bytes):
+    return [json.loads(line) for line in data.decode("utf-8").splitlines()]
+
+
+class TestExport:
+
+    @pytest_asyncio.fixture
+    async def session_factory(self, tmp_path):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/export.db", poolclass=NullPool)
+        async with engine.begin() as conn:
+            await conn.run_sync(Base.metadata.create_all)
+        factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+        await populate(factory)
+        yield factory
+        await engine.dispose()
+
+    @pytest.mark.asyncio
+    async def test_filters_and_batches(self, session_factory):
+        """Test date range and department filters, id order and the batch size bound"""
+        start, end = datetime(2026, 1, 2), datetime(2026, 1, 8)
+        async with session_factory() as session:
+            batches = [
+                batch async for batch in
+                MessageService.stream_for_export(session, start, end, "ICU", batch_size=2)
+            ]
+            total = await MessageService.count_for_export(session, start, end, "ICU")
+
+        rows = [row for batch in batches for row in batch]
+        assert [len(batch) for batch in batches] == [2, 1]
+        assert [row["text"] for row in rows] == ["note 2", "note 4", "note 6"]
+        assert {row["department"] for row in rows} == {"ICU"}
+        assert rows[0]["timestamp"].startswith("2026-01-03")
+        assert total == 3
+
+    @pytest.mark.asyncio
+    async def test_gzip_chunks_resume_from_cursor(self, session_factory):
+        """Test that gzipped chunks concatenate into one stream and resume after a seq"""
+        progress = export.ExportProgress()
+        data = await collect(export.export_messages(session_factory, compress=True, batch_size=3, progress=progress))
+        rows = ndjson(gzip.decompress(data))
+
+        assert [row["text"] for row in rows] == [f"note {index}" for index in range(10)]
+        assert progress.rows == 10
+        assert progress.seq == rows[-1]["seq"]
+
+        rest = await collect(export.export_messages(session_factory, after_seq=rows[6]["seq"]))
+        assert ndjson(rest) == rows[7:]
+
+    @pytest.mark.asyncio
+    async def test_file_export_resumes_after_interruption(self, session_factory, tmp_path):
+        """Test that an interrupted CSV export continues from its checkpoint without duplicates"""
+        path = str(tmp_path / "messages.csv")
+
+        def interrupt(progress):
+            if progress.rows >= 4:
+                raise KeyboardInterrupt
+
+        with pytest.raises(KeyboardInterrupt):
+            await export.export_to_file(path, "csv", batch_size=4, session_factory=session_factory,
+                                        on_progress=interrupt)
+        # A partly written chunk after the checkpoint is cut off on resume
+        with open(path, "ab") as output:
+            output.write(b"7,torn")
+
+        with pytest.raises(ValueError):
+            await export.export_to_file(path, "ndjson", resume=True, session_factory=session_factory)
+        result = await export.export_to_file(path, "csv", resume=True, batch_size=4, session_factory=session_factory)
+
+        with open(path, newline="") as output:
+            rows = list(csv.DictReader(output))
+        assert [row["text"] for row in rows] == [f"note {index}" for index in range(10)]
+        assert list(rows[0]) == export.COLUMNS
+        assert (result.rows, result.total) == (10, 10)
+        assert not (tmp_path / "messages.csv.progress").exists()
+
+    def test_admin_endpoint(self, tmp_path, monkeypatch):
+        """Test the streamed HTTP export, its total header and the admin guard"""
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/http.db", poolclass=NullPool)
+        factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        async def setup():
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+            await populate(factory, count=4)
+
+        asyncio.run(setup())
+        monkeypatch.setattr(main, "AsyncSessionLocal", factory)
+        monkeypatch.setattr(admin, "ADMIN_TOKEN", "secret")
+        client = TestClient(main.app)
+
+        response = client.get("/admin/export/messages", params={"format": "csv", "department": "ER"},
+                              headers={"X-Admin-Token": "secret"})
+        assert response.status_code == 200
+        assert response.headers["x-export-total"] == "2"
+        assert response.headers["content-type"].startswith("text/csv")
+        assert [row["user_id"] for row in csv.DictReader(io.StringIO(response.text))] == ["bob", "bob"]
+
+        assert client.get("/admin/export/messages").status_code == 403
+        assert client.get("/admin/export/messages", params={"format": "xml"},
+                          headers={"X-Admin-Token": "secret"}).status_code == 400
@@ -0,0 +1,97 @@
+"""
+Unit tests for the heartbeat timer wheel
+"""
+import json
+import pytest
+from unittest.mock import AsyncMock, Mock
+
+from services.heartbeat import HeartbeatScheduler, HEARTBEAT_RTT, HEARTBEAT_REAPED
+
+
+class TestHeartbeatScheduler:
+
+    def setup_method(self):
+        """Create a scheduler with a fake manager and a short wheel"""
+        self.manager = Mock()
+        self.manager.reap = AsyncMock()
+        self.scheduler = HeartbeatScheduler(self.manager, idle_timeout=2.0, pong_timeout=1.0, tick=1.0)
+
+    async def _advance(self, ticks):
+        for _ in range(ticks):
+            await self.scheduler.advance()
+
+    def _make_idle(self, user_id):
+        self.scheduler.tracked[user_id].last_seen -= 60
+
+    @pytest.mark.asyncio
+    async def test_active_connection_not_pinged(self):
+        """Test that a connection with recent traffic is only re-slotted"""
+        websocket = AsyncMock()
+        self.scheduler.track("user1", websocket)
+
+        await self._advance(2)
+
+        websocket.send_text.assert_not_called()
+        assert "user1" in self.scheduler.tracked
+
+    @pytest.mark.asyncio
+    async def test_idle_connection_pinged_and_pong_records_rtt(self):
+        """Test that an idle connection gets a ping and its pong is timed"""
+        websocket = AsyncMock()
+        self.scheduler.track("user1", websocket)
+        self._make_idle("user1")
+        rtt_count = HEARTBEAT_RTT.count
+
+        await self._advance(2)
+
+        websocket.send_text.assert_called_once()
+        assert json.loads(websocket.send_text.call_args[0][0])["type"] == "ping"
+
+        self.scheduler.record_pong("user1")
+        assert HEARTBEAT_RTT.count == rtt_count + 1
+
+        # Pong cleared the deadline, so nothing is reaped
+        await self._advance(self.scheduler.wheel_size)
+        self.manager.reap.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_unanswered_ping_reaped_in_batch(self):
+        """Test that connections missing their pong are reaped together"""
+        websockets = {f"user{i}": AsyncMock() for i in range(3)}
+        for user_id, websocket in websockets.items():
+            self.scheduler.track(user_id, websocket)
+            self._make_idle(user_id)
+        reaped_before = HEARTBEAT_REAPED.value
+
+        await self._advance(2)   # pings go out
+        await self._advance(1)   # pong deadline passes
+
+        self.manager.reap.assert_called_once()
+        reaped = self.manager.reap.call_args[0][0]
+        assert sorted(user_id for user_id, _ in reaped) == ["user0", "user1", "user2"]
+        assert HEARTBEAT_REAPED.value == reaped_before + 3
+        assert self.scheduler.tracked == {}
+
+    @pytest.mark.asyncio
+    async def test_failed_send_reaped_on_next_tick(self):
+        """Test that a connection flagged by a failed broadcast is reaped"""
+        websocket = AsyncMock()
+        self.scheduler.track("user1", websocket)
+
+        self.scheduler.mark_failed("user1")
+        await self._advance(1)
+
+        self.manager.reap.assert_called_once_with([("user1", websocket)])
+
+    @pytest.mark.asyncio
+    async def test_untracked_connection_ignored(self):
+        """Test that a disconnected socket is dropped from the wheel lazily"""
+        websocket = AsyncMock()
+        self.scheduler.track("user1", websocket)
+        self._make_idle("user1")
+        self.scheduler.untrack("user1")
+
+        await self._advance(self.scheduler.wheel_size)
+
+        websocket.send_text.assert_not_called()
+        self.manager.reap.assert_not_called()
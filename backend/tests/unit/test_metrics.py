@@ -0,0 +1,83 @@
+"""
+Unit tests for in-process metrics and Prometheus rendering
+"""
+import json
+import pytest
+
+from services import metrics
+
+
+class TestMetrics:
+
+    def setup_method(self):
+        """Isolate the registry and multiprocess setting for each test"""
+        self.saved_registry = dict(metrics.REGISTRY)
+        self.saved_dir = metrics.MULTIPROC_DIR
+        metrics.REGISTRY.clear()
+        metrics.MULTIPROC_DIR = None
+
+    def teardown_method(self):
+        metrics.REGISTRY.clear()
+        metrics.REGISTRY.update(self.saved_registry)
+        metrics.MULTIPROC_DIR = self.saved_dir
+
+    def test_counter_get_or_create(self):
+        """Test that the same name and labels return the same counter"""
+        first = metrics.counter("test_total", labels={"scope": "a"})
+        first.inc(2)
+
+        assert metrics.counter("test_total", labels={"scope": "a"}) is first
+        assert metrics.counter("test_total", labels={"scope": "b"}) is not first
+        assert first.value == 2
+
+    def test_histogram_buckets_and_quantiles(self):
+        """Test bucket placement and bucket-bound quantile estimates"""
+        hist = metrics.histogram("test_seconds", buckets=(0.1, 1.0))
+        for value in (0.05, 0.05, 0.5, 5.0):
+            hist.observe(value)
+
+        assert hist.counts == [2, 1, 1]
+        assert hist.count == 4
+        assert hist.quantile(0.5) == 0.1
+        assert hist.quantile(0.75) == 1.0
+
+    def test_render_prometheus_text(self):
+        """Test the exposition format for counters, gauges and histograms"""
+        metrics.counter("test_total", "A counter", labels={"scope": "message"}).inc(3)
+        metrics.gauge("test_gauge", "A gauge", callback=lambda: 7)
+        metrics.histogram("test_seconds", "A histogram", buckets=(0.1, 1.0)).observe(0.5)
+
+        text = metrics.render_prometheus()
+
+        assert "# TYPE test_total counter" in text
+        assert 'test_total{scope="message"} 3' in text
+        assert "test_gauge 7" in text
+        assert 'test_seconds_bucket{le="0.1"} 0' in text
+        assert 'test_seconds_bucket{le="1"} 1' in text
+        assert 'test_seconds_bucket{le="+Inf"} 1' in text
+        assert "test_seconds_count 1" in text
+
+    def test_merge_sums_across_processes(self):
+        """Test that snapshots from several workers add up"""
+        metrics.counter("test_total").inc(2)
+        metrics.histogram("test_seconds", buckets=(0.1, 1.0)).observe(0.05)
+        snapshot = metrics.collect()
+
+        merged = {sample["name"]: sample for sample in metrics.merge([snapshot, snapshot])}
+
+        assert merged["test_total"]["value"] == 4
+        assert merged["test_seconds"]["counts"] == [2, 0, 0]
+        assert merged["test_seconds"]["count"] == 2
+
+    def test_multiprocess_snapshots_are_aggregated(self, tmp_path):
+        """Test that /metrics output includes other workers' snapshot files"""
+        metrics.MULTIPROC_DIR = str(tmp_path)
+        metrics.counter("test_total").inc(1)
+
+        # A snapshot left by an exited worker: its counters still count
+        other = [{"name": "test_total", "help": "", "kind": "counter", "labels": {}, "value": 5}]
+        (tmp_path / "metrics-999999999.json").write_text(
+            json.dumps({"pid": 999999999, "written_at": 0, "samples": other})
+        )
+
+        assert "test_total 6" in metrics.render_prometheus()
@@ -0,0 +1,62 @@
+"""
+Unit tests for the sampling profiler
+"""
+import asyncio
+import time
+import pytest
+
+from services import profiler
+
+
+def busy_for_test(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestSamplingProfiler:
+
+    @pytest.mark.asyncio
+    async def test_samples_attributed_to_task_label(self):
+        """Test that busy work shows up under the label of the task doing it"""
+        async def handler():
+            profiler.label_task("WS message:message")
+            await asyncio.sleep(0.02)
+            busy_for_test(0.2)
+
+        profile_task = asyncio.create_task(profiler.run_profile(0.4, interval=0.002))
+        await asyncio.sleep(0.01)
+        await handler()
+        result = await profile_task
+
+        assert result.samples > 0
+        labelled = [stack for stack in result.stacks if stack.startswith("WS message:message;")]
+        assert any("busy_for_test" in stack for stack in labelled)
+        assert result.by_label()["WS message:message"] > 0
+
+    @pytest.mark.asyncio
+    async def test_collapsed_output_format(self):
+        """Test that every collapsed line is 'frames count'"""
+        result = await profiler.run_profile(0.05, interval=0.002)
+
+        lines = result.collapsed().splitlines()
+        assert lines
+        for line in lines:
+            stack, count = line.rsplit(" ", 1)
+            assert int(count) > 0
+            assert stack.split(";")[0]
+
+    @pytest.mark.asyncio
+    async def test_only_one_profile_at_a_time(self):
+        """Test that the in-progress flag is set while a profile runs"""
+        profile_task = asyncio.create_task(profiler.run_profile(0.05))
+        await asyncio.sleep(0)
+        assert profiler.profile_in_progress()
+        await profile_task
+        assert not profiler.profile_in_progress()
+
+    def test_describe_scope(self):
+        """Test route labels from ASGI scopes"""
+        route = type("Route", (), {"path": "/ws/{user_id}"})()
+        assert profiler._describe({"type": "websocket", "path": "/ws/nurse1", "route": route}) == "WS /ws/{user_id}"
+        assert profiler._describe({"type": "http", "method": "GET", "path": "/health"}) == "GET /health"
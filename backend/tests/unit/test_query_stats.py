@@ -0,0 +1,90 @@
+"""
+Unit tests for SQL query instrumentation
+"""
+import logging
+import pytest
+import pytest_asyncio
+
+from services.database_service import UserService, MessageService
+from services.query_stats import QueryStats, normalize_sql, describe_parameters
+
+
+class TestNormalizeSql:
+
+    def test_literals_and_placeholders_collapse(self):
+        """Test that statements differing only in values share one key"""
+        first = normalize_sql("SELECT * FROM users WHERE user_id = 'alice' AND id > 10")
+        second = normalize_sql("SELECT *  FROM users\n WHERE user_id = ? AND id > ?")
+
+        assert first == second == "SELECT * FROM users WHERE user_id = ? AND id > ?"
+
+    def test_in_lists_collapse(self):
+        """Test that IN lists of any length normalize the same"""
+        assert normalize_sql("DELETE FROM t WHERE id IN (?, ?, ?)") == "DELETE FROM t WHERE id IN (?)"
+        assert normalize_sql("DELETE FROM t WHERE id IN ($1, $2)") == "DELETE FROM t WHERE id IN (?)"
+
+    def test_describe_parameters_hides_values(self):
+        """Test that only parameter types are described"""
+        described = describe_parameters(("Patient has sepsis", 42))
+
+        assert described == "str, int"
+        assert "sepsis" not in described
+
+
+class TestQueryStats:
+
+    @pytest_asyncio.fixture
+    async def instrumented(self, db_engine, session_factory):
+        """In-memory database with a private QueryStats collector attached"""
+        stats = QueryStats(slow_query_ms=10_000)
+        stats.install(db_engine)
+
+        async with session_factory() as session:
+            yield stats, session
+
+        stats.remove(db_engine)
+
+    @pytest.mark.asyncio
+    async def test_statements_attributed_to_service_methods(self, instrumented):
+        """Test that queries are keyed by normalized SQL and calling service method"""
+        stats, session = instrumented
+
+        await UserService.create_or_update_user(session, "user1", "User One", "ICU")
+        await MessageService.create_message(session, "user1", "hello")
+        await MessageService.create_message(session, "user1", "hello again")
+
+        inserts = [s for s in stats.top(50) if s["sql"].startswith("INSERT INTO messages")]
+        assert len(inserts) == 1
+        assert inserts[0]["calls"] == 2
+        assert inserts[0]["operations"] == {"MessageService.create_message": 2}
+
+        operations = set()
+        for statement in stats.top(50):
+            operations.update(statement["operations"])
+        assert "UserService.create_or_update_user" in operations
+
+    @pytest.mark.asyncio
+    async def test_top_orders_by_total_time(self, instrumented):
+        """Test the top-N ranking"""
+        stats, _ = instrumented
+        stats.record("SELECT * FROM users", 0.5)
+        stats.record("SELECT * FROM messages", 0.1)
+        stats.record("SELECT * FROM messages", 0.1)
+
+        top = stats.top(2)
+        assert [s["total_ms"] for s in top] == [500.0, 200.0]
+        assert stats.top(1, order_by="calls")[0]["calls"] == 2
+
+    def test_slow_query_log_is_redacted_and_rate_limited(self, caplog):
+        """Test that slow queries log without values and stop after the limit"""
+        stats = QueryStats(slow_query_ms=1, slow_log_limit=2)
+
+        with caplog.at_level(logging.WARNING, logger="services.query_stats"):
+            for _ in range(5):
+                stats.record("SELECT * FROM messages WHERE text = ?", 0.5, parameters=("wound photo",))
+
+        slow_lines = [r.getMessage() for r in caplog.records if r.getMessage().startswith("Slow query")]
+        assert len(slow_lines) == 2
+        assert all("wound photo" not in line for line in slow_lines)
+        assert "params redacted: str" in slow_lines[0]
+        assert stats._slow_suppressed == 3
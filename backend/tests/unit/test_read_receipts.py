@@ -0,0 +1,165 @@
+"""
+Unit tests for read cursors and incrementally maintained unread counts
+"""
+import asyncio
+import json
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+import pytest_asyncio
+from sqlalchemy import select
+
+from models.db_models import ReadCursor
+from services.database_service import MessageService, ReadCursorService, UserService
+from services.read_receipts import ReadReceipts
+
+
+class TestReadReceipts:
+    """Test cursor loading, unread counting, batching and receipt frames"""
+
+    @pytest_asyncio.fixture
+    async def session_factory(self, session_factory):
+        """The in-memory database with two users"""
+        async with session_factory() as session:
+            for user_id in ("alice", "bob"):
+                await UserService.create_or_update_user(session, user_id, user_id, "ICU")
+        return session_factory
+
+    @pytest.fixture
+    def manager(self):
+        manager = Mock()
+        manager.send_ephemeral = AsyncMock(return_value=0)
+        return manager
+
+    async def _store(self, session_factory, user_id, channel="general", count=1):
+        ids = []
+        async with session_factory() as session:
+            for _ in range(count):
+                message = await MessageService.create_message(session, user_id, "hello", channel=channel)
+                ids.append(message.id)
+        return ids
+
+    async def _saved(self, session_factory):
+        async with session_factory() as session:
+            result = await session.execute(select(ReadCursor).order_by(ReadCursor.user_id, ReadCursor.channel))
+            return {(cursor.user_id, cursor.channel): cursor.last_read_seq for cursor in result.scalars()}
+
+    @pytest.mark.asyncio
+    async def test_cold_start_counts_from_cursors(self, session_factory, manager):
+        """Test that unread counts are recomputed from stored cursors on a fresh process"""
+        general = await self._store(session_factory, "alice", count=5)
+        await self._store(session_factory, "alice", channel="icu", count=2)
+        async with session_factory() as session:
+            await ReadCursorService.save_cursors(session, {("bob", "general"): general[2]})
+
+        receipts = ReadReceipts(manager, session_factory=session_factory)
+
+        assert await receipts.badges("bob") == {
+            "general": {"unread": 2, "head": general[-1]},
+            "icu": {"unread": 2, "head": general[-1] + 2},
+        }
+
+    @pytest.mark.asyncio
+    async def test_counts_maintained_without_queries(self, session_factory, manager):
+        """Test that new messages update badges in memory; the sender has read their own"""
+        receipts = ReadReceipts(manager, session_factory=session_factory)
+        await receipts.badges("alice")
+        await receipts.badges("bob")
+
+        for seq in await self._store(session_factory, "alice", count=3):
+            await receipts.record_message("general", seq, sender="alice")
+
+        # Badges must not touch the database any more
+        receipts.session_factory = Mock(side_effect=AssertionError("queried"))
+        assert receipts.unread("bob")["general"]["unread"] == 3
+        assert receipts.unread("alice")["general"]["unread"] == 0
+
+    @pytest.mark.asyncio
+    async def test_cursor_only_moves_forward(self, session_factory, manager):
+        """Test marking read, moving backwards and reading past the head"""
+        receipts = ReadReceipts(manager, session_factory=session_factory)
+        seqs = await self._store(session_factory, "alice", count=4)
+        await receipts.load()
+
+        assert await receipts.mark_read("bob", "general", seqs[1]) is True
+        assert receipts.unread("bob")["general"]["unread"] == 2
+        assert await receipts.mark_read("bob", "general", seqs[0]) is False
+        assert await receipts.mark_read("bob", "general", seqs[-1] + 100) is True
+        assert receipts.unread("bob")["general"]["unread"] == 0
+        assert await receipts.mark_read("bob", "nowhere", 1) is False
+
+    @pytest.mark.asyncio
+    async def test_old_cursor_placed_with_count_query(self, session_factory, manager):
+        """Test that a cursor older than the ids kept in memory is placed by the database"""
+        receipts = ReadReceipts(manager, session_factory=session_factory, max_recent=2)
+        await receipts.load()
+        seqs = await self._store(session_factory, "alice", count=8)
+        for seq in seqs:
+            await receipts.record_message("general", seq)
+
+        assert await receipts.mark_read("bob", "general", seqs[1]) is True
+        assert receipts.unread("bob")["general"]["unread"] == 6
+
+    @pytest.mark.asyncio
+    async def test_flush_coalesces_frames_and_writes(self, session_factory, manager):
+        """Test one receipt frame per channel with each reader's latest cursor, saved in one batch"""
+        receipts = ReadReceipts(manager, session_factory=session_factory)
+        seqs = await self._store(session_factory, "alice", count=3)
+        await receipts.load()
+
+        for seq in seqs:
+            await receipts.mark_read("bob", "general", seq)
+        await receipts.record_message("general", seqs[-1], sender="alice")
+
+        assert await receipts.flush() == 1
+        frame = json.loads(manager.send_ephemeral.call_args.args[0])
+        assert frame == {"type": "read", "channel": "general", "readers": [{"user_id": "bob", "seq": seqs[-1]}]}
+        assert await self._saved(session_factory) == {("alice", "general"): seqs[-1], ("bob", "general"): seqs[-1]}
+
+        assert await receipts.flush() == 0
+        assert manager.send_ephemeral.call_count == 1
+
+    @pytest.mark.asyncio
+    async def test_saved_cursor_never_moves_backwards(self, session_factory):
+        """Test that a stale batch cannot rewind a cursor already stored further on"""
+        async with session_factory() as session:
+            await ReadCursorService.save_cursors(session, {("bob", "general"): 10})
+            await ReadCursorService.save_cursors(session, {("bob", "general"): 4})
+
+        assert await self._saved(session_factory) == {("bob", "general"): 10}
+
+    @pytest.mark.asyncio
+    async def test_failed_save_is_retried(self, session_factory, manager):
+        """Test that cursors stay buffered when the database write fails"""
+        receipts = ReadReceipts(manager, session_factory=session_factory)
+        seqs = await self._store(session_factory, "alice", count=1)
+        await receipts.mark_read("bob", "general", seqs[0])
+
+        receipts.cursor_service = Mock(save_cursors=AsyncMock(side_effect=RuntimeError("down")))
+        assert await receipts.save() == 0
+        assert receipts.get_stats()["unsaved"] == 1
+
+        receipts.cursor_service = ReadCursorService()
+        assert await receipts.save() == 1
+        assert await self._saved(session_factory) == {("bob", "general"): seqs[0]}
+
+    @pytest.mark.asyncio
+    async def test_stop_during_save_keeps_batch(self, session_factory, manager):
+        """Test that stopping while the flush loop is mid-save still writes the cursors it took"""
+        receipts = ReadReceipts(manager, session_factory=session_factory, interval=0.01)
+        seqs = await self._store(session_factory, "alice", count=1)
+        saving = asyncio.Event()
+
+        async def slow_save(session, cursors):
+            saving.set()
+            await asyncio.sleep(0.1)
+            return await ReadCursorService.save_cursors(session, cursors)
+
+        await receipts.mark_read("bob", "general", seqs[0])
+        receipts.cursor_service = Mock(save_cursors=slow_save)
+        await receipts.start()
+        await asyncio.wait_for(saving.wait(), 5)
+        await receipts.stop()
+
+        assert await self._saved(session_factory) == {("bob", "general"): seqs[0]}
+        assert receipts.get_stats()["unsaved"] == 0
@@ -0,0 +1,144 @@
+"""
+Unit tests for the read API response cache
+"""
+import asyncio
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from services.response_cache import ResponseCache
+
+
+class TestResponseCache:
+
+    @pytest.mark.asyncio
+    async def test_concurrent_requests_computed_once(self):
+        """Test that identical concurrent requests share one computation"""
+        cache = ResponseCache(ttl=10)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"value": len(calls)}
+
+        entries = await asyncio.gather(*(cache.get("key", compute, version=1) for _ in range(20)))
+
+        assert len(calls) == 1
+        assert {entry.body for entry in entries} == {b'{"value":1}'}
+
+    @pytest.mark.asyncio
+    async def test_recomputed_on_version_change_and_expiry(self):
+        """Test that a new version or an expired TTL recomputes"""
+        cache = ResponseCache(ttl=10)
+        calls = []
+
+        async def compute():
+            calls.append(1)
+            return len(calls)
+
+        await cache.get("key", compute, version=1)
+        await cache.get("key", compute, version=1)
+        assert len(calls) == 1
+
+        await cache.get("key", compute, version=2)
+        assert len(calls) == 2
+
+        cache.ttl = 0
+        await cache.get("key", compute, version=2)
+        assert len(calls) == 3
+
+    @pytest.mark.asyncio
+    async def test_cancelled_caller_does_not_cancel_computation(self):
+        """Test that a client going away leaves the shared computation running for others"""
+        cache = ResponseCache(ttl=10)
+
+        async def compute():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        first = asyncio.create_task(cache.get("key", compute))
+        second = asyncio.create_task(cache.get("key", compute))
+        await asyncio.sleep(0)
+        first.cancel()
+
+        assert (await second).body == b'"done"'
+
+    @pytest.mark.asyncio
+    async def test_entries_bounded(self):
+        """Test that the least recently used entries are evicted"""
+        cache = ResponseCache(ttl=10, max_entries=3)
+
+        async def compute():
+            return {}
+
+        for limit in range(10):
+            await cache.get(("messages", limit), compute)
+
+        assert cache.get_stats()["entries"] == 3
+
+
+class TestConditionalRequests:
+
+    def setup_method(self):
+        self.cache = ResponseCache(ttl=10)
+        self.version = 1
+        self.calls = 0
+        app = FastAPI()
+
+        @app.get("/versioned")
+        async def versioned(request: Request):
+            return await self.cache.respond(request, "versioned", self._compute, version=self.version)
+
+        @app.get("/unversioned")
+        async def unversioned(request: Request):
+            return await self.cache.respond(request, "unversioned", self._compute)
+
+        self.client = TestClient(app)
+
+    async def _compute(self):
+        self.calls += 1
+        return {"items": ["a", "b"]}
+
+    def test_unchanged_version_gets_304_without_computing(self):
+        """Test that a poll with the current version ETag skips the computation"""
+        response = self.client.get("/versioned")
+        assert response.status_code == 200
+        assert response.json() == {"items": ["a", "b"]}
+        assert response.headers["cache-control"] == "no-cache"
+
+        self.cache.clear()
+        revalidated = self.client.get("/versioned", headers={"If-None-Match": response.headers["etag"]})
+
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert self.calls == 1
+
+    def test_new_version_returns_full_response(self):
+        """Test that a version bump changes the ETag"""
+        etag = self.client.get("/versioned").headers["etag"]
+        self.version += 1
+
+        response = self.client.get("/versioned", headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+
+    def test_unversioned_etag_from_body(self):
+        """Test that unversioned endpoints revalidate against a hash of the body"""
+        etag = self.client.get("/unversioned").headers["etag"]
+        self.cache.clear()
+
+        response = self.client.get("/unversioned", headers={"If-None-Match": etag})
+
+        assert response.status_code == 304
+        assert self.calls == 2
+
+    def test_body_matches_json_response(self):
+        """Test that the cached body is what FastAPI would have returned"""
+        response = self.client.get("/versioned")
+
+        assert response.headers["content-type"] == "application/json"
+        assert json.loads(response.content) == {"items": ["a", "b"]}
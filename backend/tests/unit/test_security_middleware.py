@@ -0,0 +1,79 @@
+"""
+Unit tests for the pure ASGI security headers middleware
+"""
+from fastapi import FastAPI, WebSocket
+from fastapi.responses import PlainTextResponse
+from fastapi.testclient import TestClient
+
+from security.middleware import SecurityHeadersMiddleware
+
+
+def build_client(**middleware_options) -> TestClient:
+    app = FastAPI()
+    app.add_middleware(SecurityHeadersMiddleware, **middleware_options)
+
+    @app.get("/health")
+    async def health():
+        return {"status": "healthy"}
+
+    @app.get("/admin/queries/top")
+    async def admin():
+        return {}
+
+    @app.get("/framed")
+    async def framed():
+        return PlainTextResponse("ok", headers={"X-Frame-Options": "SAMEORIGIN"})
+
+    @app.websocket("/ws")
+    async def ws(websocket: WebSocket):
+        await websocket.accept()
+        await websocket.send_text("hello")
+        await websocket.close()
+
+    return TestClient(app)
+
+
+class TestSecurityHeadersMiddleware:
+
+    def test_headers_added(self):
+        """Test that every security header is present on a normal response"""
+        response = build_client().get("/health")
+
+        assert response.status_code == 200
+        assert response.json() == {"status": "healthy"}
+        assert response.headers["X-Content-Type-Options"] == "nosniff"
+        assert response.headers["X-Frame-Options"] == "DENY"
+        assert response.headers["Strict-Transport-Security"] == "max-age=31536000; includeSubDomains"
+        assert "connect-src 'self' wss: https:" in response.headers["Content-Security-Policy"]
+        assert response.headers["Referrer-Policy"] == "strict-origin-when-cross-origin"
+
+    def test_no_hsts_on_localhost(self):
+        """Test that localhost (with or without a port) gets no HSTS header"""
+        client = build_client()
+        for host in ("localhost", "localhost:8000", "127.0.0.1:8000", "[::1]:8000"):
+            response = client.get("/health", headers={"Host": host})
+            assert "Strict-Transport-Security" not in response.headers, host
+            assert response.headers["X-Frame-Options"] == "DENY"
+
+    def test_path_policy_overrides(self):
+        """Test per-path header overrides and removals"""
+        client = build_client(path_policies=[("/admin", {"Cache-Control": "no-store", "X-Frame-Options": None})])
+
+        admin = client.get("/admin/queries/top")
+        assert admin.headers["Cache-Control"] == "no-store"
+        assert "X-Frame-Options" not in admin.headers
+
+        health = client.get("/health")
+        assert "Cache-Control" not in health.headers
+        assert health.headers["X-Frame-Options"] == "DENY"
+
+    def test_replaces_endpoint_header(self):
+        """Test that a header set by the endpoint is replaced, not duplicated"""
+        response = build_client().get("/framed")
+
+        assert response.headers.get_list("X-Frame-Options") == ["DENY"]
+
+    def test_websocket_passes_through(self):
+        """Test that WebSocket connections are untouched"""
+        with build_client().websocket_connect("/ws") as websocket:
+            assert websocket.receive_text() == "hello"
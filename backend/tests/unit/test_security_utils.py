@@ -6,7 +6,9 @@ import os
 # Add backend directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../'))
 
+from security import utils
 from security.utils import SecurityUtils, rate_limit_storage
+from benchmarks.sanitizer_fuzz import fuzz_corpus, reference_sanitize
 
 
 class TestSecurityUtils:
@@ -43,6 +45,29 @@ class TestSecurityUtils:
         result = SecurityUtils.sanitize_input(None)
         assert result == ""
 
+    def test_sanitize_fast_path_matches_bleach(self):
+        """Test that skipping bleach never changes the output"""
+        for max_length in (1000, 16):
+            for text in fuzz_corpus(3000, seed=7):
+                assert SecurityUtils.sanitize_input(text, max_length) == reference_sanitize(text, max_length), repr(text)
+
+    def test_sanitize_control_characters_still_cleaned(self):
+        """Test that text with control characters still goes through bleach"""
+        assert SecurityUtils.sanitize_input("a\x01b") == reference_sanitize("a\x01b")
+        assert SecurityUtils.sanitize_input("a\r\nb") == "a\nb"
+        assert SecurityUtils.sanitize_input("Tom & Jerry's") == "Tom &amp;amp; Jerry&#x27;s"
+
+    def test_sanitize_caches_short_strings(self):
+        """Test that short repeated strings are served from the cache"""
+        utils._sanitize_cached.cache_clear()
+        SecurityUtils.sanitize_input("thanks")
+        SecurityUtils.sanitize_input("thanks")
+        assert utils._sanitize_cached.cache_info().hits == 1
+
+        long_text = "x" * (utils.SANITIZE_CACHE_MAX_LENGTH + 1)
+        SecurityUtils.sanitize_input(long_text)
+        assert utils._sanitize_cached.cache_info().currsize == 1
+
     def test_validate_user_id_valid(self):
         """Test valid user ID formats"""
         assert SecurityUtils.validate_user_id("user123") == True
@@ -0,0 +1,69 @@
+"""
+Unit tests for client message ID deduplication of resent messages
+"""
+import asyncio
+
+import pytest
+
+from services.send_dedupe import SendDedupe, DUPLICATE_SENDS
+
+ACK = {"type": "ack", "client_id": "c1", "message_id": "m1", "seq": 7}
+
+
+class TestSendDedupe:
+
+    @pytest.mark.asyncio
+    async def test_resend_gets_original_ack(self):
+        """Test that a client ID is claimed once and resends get the stored ack"""
+        dedupe = SendDedupe()
+        duplicates = DUPLICATE_SENDS.value
+
+        assert await dedupe.claim("alice", "c1") is None
+        dedupe.complete("alice", "c1", ACK)
+
+        assert await dedupe.claim("alice", "c1") == ACK
+        assert DUPLICATE_SENDS.value == duplicates + 1
+        # IDs are per user
+        assert await dedupe.claim("bob", "c1") is None
+
+    @pytest.mark.asyncio
+    async def test_resend_waits_for_send_in_flight(self):
+        """Test that a resend arriving while the original is stored waits for its ack"""
+        dedupe = SendDedupe()
+        assert await dedupe.claim("alice", "c1") is None
+
+        resend = asyncio.create_task(dedupe.claim("alice", "c1"))
+        await asyncio.sleep(0)
+        assert not resend.done()
+
+        dedupe.complete("alice", "c1", ACK)
+        assert await resend == ACK
+
+    @pytest.mark.asyncio
+    async def test_abandoned_send_is_taken_over(self):
+        """Test that after a failed send, a waiting resend claims the ID itself"""
+        dedupe = SendDedupe()
+        assert await dedupe.claim("alice", "c1") is None
+        resend = asyncio.create_task(dedupe.claim("alice", "c1"))
+        await asyncio.sleep(0)
+
+        dedupe.abandon("alice", "c1")
+        assert await resend is None
+        dedupe.complete("alice", "c1", ACK)
+        assert await dedupe.claim("alice", "c1") == ACK
+
+    @pytest.mark.asyncio
+    async def test_expiry_and_bound(self):
+        """Test that IDs are forgotten after the TTL and the oldest go first when the set is full"""
+        dedupe = SendDedupe(ttl=0.05, max_entries=3)
+        for client_id in ("c1", "c2", "c3", "c4"):
+            assert await dedupe.claim("alice", client_id) is None
+            dedupe.complete("alice", client_id, dict(ACK, client_id=client_id))
+        assert len(dedupe) == 3
+        # c1 was evicted, so it counts as new again
+        assert await dedupe.claim("alice", "c1") is None
+        assert (await dedupe.claim("alice", "c4"))["client_id"] == "c4"
+
+        await asyncio.sleep(0.06)
+        assert await dedupe.claim("alice", "c4") is None
+        assert len(dedupe) == 1
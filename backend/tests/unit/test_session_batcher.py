@@ -0,0 +1,130 @@
+"""
+Unit tests for batched session lifecycle writes
+"""
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+from sqlalchemy import select
+
+from models.db_models import UserSession
+from services.database_service import SessionService
+from services.session_batcher import SessionBatcher
+
+
+class TestSessionBatcher:
+    """Test SessionBatcher buffering and flushing"""
+
+    async def _all_sessions(self, session_factory):
+        async with session_factory() as session:
+            result = await session.execute(select(UserSession).order_by(UserSession.connection_id))
+            return result.scalars().all()
+
+    @pytest.mark.asyncio
+    async def test_nothing_written_until_flush(self, session_factory):
+        """Test that opens are buffered rather than written immediately"""
+        batcher = SessionBatcher(session_factory=session_factory)
+
+        batcher.record_open("user1", "connection_1")
+        batcher.record_open("user2", "connection_2")
+
+        assert batcher.pending_count() == 2
+        assert await self._all_sessions(session_factory) == []
+
+        assert await batcher.flush() == 2
+        assert batcher.pending_count() == 0
+
+        sessions = await self._all_sessions(session_factory)
+        assert [s.connection_id for s in sessions] == ["connection_1", "connection_2"]
+        assert all(s.is_active for s in sessions)
+
+    @pytest.mark.asyncio
+    async def test_close_after_flush_ends_session(self, session_factory):
+        """Test that a close of an already written session becomes an update"""
+        batcher = SessionBatcher(session_factory=session_factory)
+
+        batcher.record_open("user1", "connection_1")
+        await batcher.flush()
+
+        batcher.record_close("connection_1")
+        await batcher.flush()
+
+        sessions = await self._all_sessions(session_factory)
+        assert len(sessions) == 1
+        assert sessions[0].is_active is False
+        assert sessions[0].disconnected_at is not None
+
+    @pytest.mark.asyncio
+    async def test_open_and_close_in_same_window(self, session_factory):
+        """Test that a short-lived session is inserted already closed"""
+        batcher = SessionBatcher(session_factory=session_factory)
+
+        batcher.record_open("user1", "connection_1")
+        batcher.record_close("connection_1")
+        assert batcher.pending_count() == 1
+
+        await batcher.flush()
+
+        sessions = await self._all_sessions(session_factory)
+        assert len(sessions) == 1
+        assert sessions[0].is_active is False
+
+    @pytest.mark.asyncio
+    async def test_failed_flush_writes_nothing(self, session_factory):
+        """Test that a batch failing part-way is retried whole without inserting its opens twice"""
+        batcher = SessionBatcher(session_factory=session_factory)
+        batcher.record_open("user1", "connection_1")
+        await batcher.flush()
+
+        batcher.record_open("user2", "connection_2")
+        batcher.record_close("connection_1")
+        end_sessions = batcher.session_service.end_sessions
+        batcher.session_service.end_sessions = AsyncMock(side_effect=RuntimeError("database is locked"))
+        assert await batcher.flush() == 0
+        assert batcher.pending_count() == 2
+        assert [s.connection_id for s in await self._all_sessions(session_factory)] == ["connection_1"]
+
+        batcher.session_service.end_sessions = end_sessions
+        assert await batcher.flush() == 2
+        sessions = await self._all_sessions(session_factory)
+        assert [(s.connection_id, s.is_active) for s in sessions] == [("connection_1", False), ("connection_2", True)]
+
+    @pytest.mark.asyncio
+    async def test_start_reconciles_stale_sessions(self, session_factory):
+        """Test that starting closes sessions left active by a previous process"""
+        async with session_factory() as session:
+            await SessionService.create_session(session, "user1", "old_connection")
+
+        batcher = SessionBatcher(session_factory=session_factory)
+        await batcher.start()
+        batcher.record_open("user1", "new_connection")
+        await batcher.stop()
+
+        async with session_factory() as session:
+            active = await SessionService.get_active_sessions(session)
+        assert [s.connection_id for s in active] == ["new_connection"]
+
+    @pytest.mark.asyncio
+    async def test_stop_during_flush_keeps_batch(self, session_factory):
+        """Test that stopping while the flush loop is mid-write still writes the opens and closes it took"""
+        batcher = SessionBatcher(session_factory=session_factory, flush_interval=0.01)
+        batcher.record_open("user1", "connection_1")
+        await batcher.flush()
+        await batcher.start()
+
+        writing = asyncio.Event()
+        end_sessions = batcher.session_service.end_sessions
+
+        async def slow_end_sessions(session, closes):
+            writing.set()
+            await asyncio.sleep(0.1)
+            return await end_sessions(session, closes)
+
+        batcher.session_service.end_sessions = slow_end_sessions
+        batcher.record_open("user2", "connection_2")
+        batcher.record_close("connection_1")
+        await asyncio.wait_for(writing.wait(), 5)
+        await batcher.stop()
+
+        sessions = await self._all_sessions(session_factory)
+        assert [(s.connection_id, s.is_active) for s in sessions] == [("connection_1", False), ("connection_2", True)]
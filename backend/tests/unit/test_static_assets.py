@@ -0,0 +1,148 @@
+"""
+Unit tests for the in-memory, precompressed static asset app
+"""
+import gzip
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from services import static_assets
+from services.static_assets import StaticAssets, PRECACHE_MANIFEST, IMMUTABLE, REVALIDATE
+
+SCRIPT = "function greet() { return 'hello'; }\n" * 50
+INDEX = '<html><head><link href="style.css"></head><body><script src="js/app.js"></script>' \
+        '<a href="https://example.com/">x</a><img src="missing.png"></body></html>'
+
+
+@pytest.fixture
+def assets(tmp_path):
+    (tmp_path / "js").mkdir()
+    (tmp_path / "js" / "app.js").write_text(SCRIPT)
+    (tmp_path / "style.css").write_text("body { color: red; }\n" * 20)
+    (tmp_path / "logo.png").write_bytes(b"\x89PNG" + bytes(range(256)) * 4)
+    (tmp_path / "index.html").write_text(INDEX)
+    app_assets = StaticAssets(directory=str(tmp_path))
+    app_assets.build()
+    return app_assets
+
+
+@pytest.fixture
+def client(assets):
+    app = FastAPI()
+    app.mount("/frontend", assets, name="static")
+    return TestClient(app)
+
+
+class TestStaticAssets:
+
+    def test_index_rewritten_to_fingerprinted_urls(self, assets, client):
+        """Test that local references in HTML point at fingerprinted files"""
+        script = assets.assets["js/app.js"]
+        response = client.get("/frontend/", headers={"Accept-Encoding": "identity"})
+
+        assert response.status_code == 200
+        assert f'src="{script.fingerprinted_path}"' in response.text
+        assert 'href="https://example.com/"' in response.text
+        assert 'src="missing.png"' in response.text
+        assert response.headers["cache-control"] == REVALIDATE.decode()
+
+    def test_fingerprinted_url_is_immutable(self, assets, client):
+        """Test that fingerprinted URLs are cacheable forever and plain URLs revalidate"""
+        script = assets.assets["js/app.js"]
+
+        fingerprinted = client.get(f"/frontend/{script.fingerprinted_path}")
+        plain = client.get("/frontend/js/app.js")
+
+        assert fingerprinted.headers["cache-control"] == IMMUTABLE.decode()
+        assert plain.headers["cache-control"] == REVALIDATE.decode()
+        assert fingerprinted.text == plain.text == SCRIPT
+
+    def test_gzip_negotiated(self, assets, client):
+        """Test that the precompressed gzip variant is served when accepted"""
+        response = client.get("/frontend/js/app.js", headers={"Accept-Encoding": "gzip"})
+
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["vary"] == "accept-encoding"
+        assert int(response.headers["content-length"]) == len(assets.assets["js/app.js"].encodings["gzip"])
+        assert gzip.decompress(assets.assets["js/app.js"].encodings["gzip"]).decode() == SCRIPT
+
+    @pytest.mark.skipif(not static_assets.BROTLI_AVAILABLE, reason="brotli not installed")
+    def test_brotli_preferred(self, client):
+        """Test that brotli wins over gzip and q=0 disables an encoding"""
+        assert client.get("/frontend/js/app.js", headers={"Accept-Encoding": "gzip, br"}) \
+            .headers["content-encoding"] == "br"
+        assert client.get("/frontend/js/app.js", headers={"Accept-Encoding": "gzip, br;q=0"}) \
+            .headers["content-encoding"] == "gzip"
+
+    def test_identity_when_not_accepted(self, client):
+        """Test that images and clients without compression get the raw bytes"""
+        assert "content-encoding" not in client.get("/frontend/js/app.js", headers={"Accept-Encoding": "identity"}).headers
+        assert "content-encoding" not in client.get("/frontend/logo.png", headers={"Accept-Encoding": "gzip"}).headers
+
+    def test_etag_differs_per_encoding_and_304(self, client):
+        """Test strong ETags per representation and conditional requests"""
+        plain = client.get("/frontend/js/app.js", headers={"Accept-Encoding": "identity"})
+        gzipped = client.get("/frontend/js/app.js", headers={"Accept-Encoding": "gzip"})
+        assert plain.headers["etag"] != gzipped.headers["etag"]
+        assert not plain.headers["etag"].startswith("W/")
+
+        revalidated = client.get(
+            "/frontend/js/app.js", headers={"Accept-Encoding": "gzip", "If-None-Match": gzipped.headers["etag"]}
+        )
+        assert revalidated.status_code == 304
+        assert revalidated.content == b""
+        assert revalidated.headers["etag"] == gzipped.headers["etag"]
+
+        stale = client.get("/frontend/js/app.js", headers={"Accept-Encoding": "gzip", "If-None-Match": '"other"'})
+        assert stale.status_code == 200
+
+    def test_precache_manifest(self, assets, client):
+        """Test that the service worker manifest lists the index and its fingerprinted assets"""
+        response = client.get(f"/frontend/{PRECACHE_MANIFEST}", headers={"Accept-Encoding": "identity"})
+        manifest = json.loads(response.text.split("=", 1)[1].rstrip(";\n"))
+
+        assert manifest["version"] == assets.version
+        assert manifest["urls"] == [
+            "./", "index.html",
+            assets.assets["style.css"].fingerprinted_path,
+            assets.assets["js/app.js"].fingerprinted_path,
+        ]
+
+    def test_version_changes_with_content(self, assets, tmp_path):
+        """Test that editing any asset changes the cache version on rebuild"""
+        version = assets.version
+        (tmp_path / "style.css").write_text("body { color: blue; }\n")
+        assets.build()
+
+        assert assets.version != version
+
+    def test_missing_and_methods(self, client):
+        """Test 404 for unknown files, HEAD without a body and 405 for writes"""
+        assert client.get("/frontend/nope.js").status_code == 404
+        assert client.get("/frontend/../main.py").status_code == 404
+
+        head = client.head("/frontend/js/app.js", headers={"Accept-Encoding": "identity"})
+        assert head.status_code == 200
+        assert head.content == b""
+        assert int(head.headers["content-length"]) == len(SCRIPT)
+
+        assert client.post("/frontend/js/app.js").status_code == 405
+
+    def test_compression_cache_reused(self, tmp_path):
+        """Test that compressed variants are written once and read back on the next build"""
+        site = tmp_path / "site"
+        site.mkdir()
+        (site / "app.js").write_text(SCRIPT)
+        cache_dir = tmp_path / "cache"
+
+        first = StaticAssets(directory=str(site), cache_dir=str(cache_dir))
+        first.build()
+        cached = {path.name for path in cache_dir.iterdir()}
+        assert f"{first.assets['app.js'].digest}.gzip" in cached
+
+        second = StaticAssets(directory=str(site), cache_dir=str(cache_dir))
+        second.build()
+        assert second.assets["app.js"].encodings == first.assets["app.js"].encodings
+        assert {path.name for path in cache_dir.iterdir()} == cached
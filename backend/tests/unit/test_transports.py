@@ -0,0 +1,188 @@
+"""
+Unit tests for the queued connections behind the SSE and long-poll transports
+"""
+import asyncio
+import json
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.pool import NullPool
+
+import main
+from config.database import Base
+from services import websocket_manager
+from services.transports import QueuedConnection, QueueOverflow, QUEUE_OVERFLOWS
+from services.websocket_manager import ConnectionManager
+
+
+def sse_events(body: str):
+    """(id, event, data) for each event in an SSE body, keepalive comments left out"""
+    events = []
+    for block in body.strip().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if fields:
+            events.append((fields.get("id"), fields.get("event", "message"), json.loads(fields["data"])))
+    return events
+
+
+class TestQueuedConnection:
+
+    @pytest.mark.asyncio
+    async def test_frames_numbered_and_acknowledged(self):
+        """Test that frames stay queued until a fetch after them acknowledges them"""
+        connection = QueuedConnection("alice", "poll")
+        for text in ("a", "b", "c"):
+            await connection.send_text(text)
+
+        assert await connection.receive(0, timeout=1) == [(1, "a"), (2, "b"), (3, "c")]
+        # A poll whose response was lost asks again from the same place
+        assert await connection.receive(1, timeout=1) == [(2, "b"), (3, "c")]
+        await connection.send_text("d")
+        assert await connection.receive(3, timeout=1) == [(4, "d")]
+        assert await connection.receive(0, timeout=1) == [(4, "d")]
+
+    @pytest.mark.asyncio
+    async def test_receive_waits_for_a_frame(self):
+        """Test that a fetch with nothing queued is woken by the next frame or returns empty on timeout"""
+        connection = QueuedConnection("alice", "sse")
+        assert await connection.receive(0, timeout=0.01) == []
+
+        fetch = asyncio.create_task(connection.receive(0, timeout=5))
+        await asyncio.sleep(0)
+        assert not fetch.done()
+        await connection.send_text("a")
+        assert await fetch == [(1, "a")]
+
+    @pytest.mark.asyncio
+    async def test_stream_keeps_replay_window(self):
+        """Test that a stream keeps the newest frames it wrote so a resume can replay them"""
+        connection = QueuedConnection("alice", "sse")
+        for index in range(5):
+            await connection.send_text(str(index))
+
+        assert len(await connection.receive(0, timeout=1, keep=2)) == 5
+        await connection.send_text("5")
+        assert await connection.receive(5, timeout=1, keep=2) == [(6, "5")]
+        # Resumed after frame 3: 4 and 5 were kept, along with the new one
+        assert [frame_id for frame_id, _ in await connection.receive(3, timeout=1, keep=2)] == [4, 5, 6]
+
+    @pytest.mark.asyncio
+    async def test_overflow_and_close(self):
+        """Test that a client too far behind fails the send, and a closed connection finishes once drained"""
+        connection = QueuedConnection("alice", "poll", max_queued=2)
+        overflows = QUEUE_OVERFLOWS.value
+        await connection.send_text("a")
+        await connection.send_text("b")
+        with pytest.raises(QueueOverflow):
+            await connection.send_text("c")
+        assert QUEUE_OVERFLOWS.value == overflows + 1
+
+        # Fetching makes room
+        await connection.receive(0, timeout=1)
+        await connection.send_text("c")
+
+        await connection.close(1012, "Server restarting")
+        with pytest.raises(RuntimeError):
+            await connection.send_text("d")
+        assert not connection.finished(2)
+        # No waiting once closed
+        assert await connection.receive(2, timeout=5) == [(3, "c")]
+        assert connection.finished(3)
+        assert (connection.close_code, connection.close_reason) == (1012, "Server restarting")
+
+
+class TestHttpTransports:
+
+    @pytest.fixture
+    def client(self, tmp_path, monkeypatch):
+        engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path}/transports.db", poolclass=NullPool)
+        factory = async_sessionmaker(engine, class_=AsyncSession, expire_on_commit=False)
+
+        async def setup():
+            async with engine.begin() as conn:
+                await conn.run_sync(Base.metadata.create_all)
+
+        asyncio.run(setup())
+        manager = ConnectionManager()
+        for component in (manager.read_receipts, manager.session_batcher, manager.directory):
+            component.session_factory = factory
+        monkeypatch.setattr(main, "manager", manager)
+        monkeypatch.setattr(main, "AsyncSessionLocal", factory)
+        monkeypatch.setattr(websocket_manager, "AsyncSessionLocal", factory)
+
+        # Background services stay off; requests share one event loop
+        @asynccontextmanager
+        async def lifespan(app):
+            yield
+
+        monkeypatch.setattr(main.app.router, "lifespan_context", lifespan)
+        with TestClient(main.app) as client:
+            yield client
+
+    def test_poll_send_ack_and_fetch(self, client):
+        """Test that a poll opens a connection, sends over it are acknowledged and the next poll fetches frames"""
+        opened = client.get("/poll/alice").json()
+        session, unread = opened["frames"]
+        assert (session["type"], session["transport"], unread["type"]) == ("session", "poll", "unread")
+        assert (opened["last_id"], opened["closed"]) == (2, None)
+        token = session["connection"]
+
+        frame = {"type": "message", "text": "Bed 4 stable", "client_id": "c1"}
+        sent = client.post("/send/alice", params={"connection": token}, json=frame)
+        assert sent.status_code == 200
+        ack, = sent.json()
+        assert (ack["type"], ack["client_id"]) == ("ack", "c1")
+        # A resend after a lost response gets the same ack back, not a second message
+        assert client.post("/send/alice", params={"connection": token}, json=frame).json() == [ack]
+
+        bob = client.get("/poll/bob").json()["frames"][0]["connection"]
+        client.post("/send/bob", params={"connection": bob}, json={"type": "message", "text": "On my way"})
+
+        fetched = client.get("/poll/alice", params={"connection": token, "after": 2}).json()
+        assert [(frame["type"], frame["user_id"]) for frame in fetched["frames"]] == [
+            ("user_joined", "bob"), ("message", "bob")
+        ]
+        assert fetched["last_id"] == 4
+
+    def test_sse_resume_with_last_event_id(self, client):
+        """Test that a resumed stream replays the frames after Last-Event-ID and ends once the connection closes"""
+        responses = []
+        stream = threading.Thread(target=lambda: responses.append(client.get("/events/alice")))
+        stream.start()
+        deadline = time.monotonic() + 5
+        while not (isinstance(main.manager.active_connections.get("alice"), QueuedConnection)
+                   and main.manager.active_connections["alice"].last_id >= 2):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+        queued = main.manager.active_connections["alice"]
+        client.portal.call(queued.close, 1012, "Server restarting")
+        stream.join(5)
+
+        first = sse_events(responses[0].text)
+        assert responses[0].headers["content-type"].startswith("text/event-stream")
+        assert [(event_id, data.get("type")) for event_id, _, data in first[:2]] == [("1", "session"), ("2", "unread")]
+        assert first[0][2]["connection"] == queued.token
+        assert first[-1][1:] == ("close", {"code": 1012, "reason": "Server restarting"})
+
+        # The header wins over the query cursor, as EventSource sends it on its own reconnects
+        resumed = client.get("/events/alice", params={"connection": queued.token, "after": 0},
+                             headers={"Last-Event-ID": "1"})
+        assert [(event_id, event) for event_id, event, _ in sse_events(resumed.text)] == [
+            ("2", "message"), (None, "close")
+        ]
+
+    def test_wrong_connection_token_gone(self, client):
+        """Test that requests naming a connection that isn't the user's live one get 410"""
+        token = client.get("/poll/alice").json()["frames"][0]["connection"]
+
+        assert client.get("/poll/alice", params={"connection": "wrong"}).status_code == 410
+        assert client.get("/events/alice", params={"connection": "wrong"}).status_code == 410
+        assert client.post("/send/alice", params={"connection": "wrong"}, json={"type": "pong"}).status_code == 410
+        assert client.get("/poll/bob", params={"connection": token}).status_code == 410
+
+        assert client.delete("/connections/alice", params={"connection": token}).status_code == 204
+        assert client.post("/send/alice", params={"connection": token}, json={"type": "pong"}).status_code == 410
@@ -0,0 +1,109 @@
+"""
+Unit tests for coalesced, throttled typing indicators
+"""
+import json
+from unittest.mock import AsyncMock, Mock
+
+import pytest
+
+from services.typing_indicators import TypingTracker
+
+
+def build_tracker(**options):
+    manager = Mock()
+    manager.send_ephemeral = AsyncMock(return_value=0)
+    return TypingTracker(manager, **options), manager
+
+
+def sent_frames(manager):
+    return [json.loads(call.args[0]) for call in manager.send_ephemeral.call_args_list]
+
+
+class TestTypingTracker:
+
+    @pytest.mark.asyncio
+    async def test_typers_coalesced_into_one_frame_per_channel(self):
+        """Test that several users typing produce a single frame listing all of them"""
+        tracker, manager = build_tracker()
+        tracker.record("alice", "general", user_name="Alice")
+        tracker.record("bob", "general", user_name="Bob")
+        tracker.record("carol", "icu")
+
+        assert await tracker.flush() == 2
+
+        frames = {frame["channel"]: frame for frame in sent_frames(manager)}
+        assert frames["general"]["type"] == "typing"
+        assert [typer["user_id"] for typer in frames["general"]["typers"]] == ["alice", "bob"]
+        assert frames["general"]["typers"][0]["user_name"] == "Alice"
+        assert frames["icu"]["typers"] == [{"user_id": "carol", "user_name": "carol"}]
+
+    @pytest.mark.asyncio
+    async def test_unchanged_typers_send_nothing(self):
+        """Test that refreshes from users already shown typing cause no new frame"""
+        tracker, manager = build_tracker(throttle=0)
+        tracker.record("alice")
+        await tracker.flush()
+
+        tracker.record("alice")
+        assert await tracker.flush() == 0
+        assert manager.send_ephemeral.call_count == 1
+
+    def test_refreshes_throttled_per_user(self):
+        """Test that a user's repeated typing events inside the throttle window are dropped"""
+        tracker, _ = build_tracker(throttle=60)
+
+        assert tracker.record("alice") is True
+        assert tracker.record("alice") is False
+        assert tracker.record("bob") is True
+
+    @pytest.mark.asyncio
+    async def test_channels_per_user_limited(self):
+        """Test that one user can't fan out a frame per channel name they make up"""
+        tracker, manager = build_tracker(max_channels=2)
+        assert tracker.record("alice", "a") is True
+        assert tracker.record("alice", "b") is True
+        assert tracker.record("alice", "c") is False
+        assert tracker.record("bob", "c") is True
+        assert await tracker.flush() == 3
+
+        # Stopping in one channel frees a place
+        tracker.record("alice", "a", typing=False)
+        assert tracker.record("alice", "c") is True
+        tracker.clear_user("alice")
+        assert tracker.typers("b") == [] and tracker.typers("c") == [{"user_id": "bob", "user_name": "bob"}]
+        assert tracker.record("alice", "d") is True
+
+    @pytest.mark.asyncio
+    async def test_typers_expire(self):
+        """Test that the shared timer drops typers who went quiet and announces it"""
+        tracker, manager = build_tracker(ttl=0)
+        tracker.record("alice")
+        await tracker.flush()
+
+        assert tracker.typers() == []
+        assert sent_frames(manager)[-1]["typers"] == []
+        assert tracker.get_stats() == {"channels": 0, "typing": 0}
+
+    @pytest.mark.asyncio
+    async def test_stop_and_clear(self):
+        """Test explicit stops and clearing a user from every channel"""
+        tracker, manager = build_tracker()
+        tracker.record("alice", "general")
+        tracker.record("alice", "icu")
+        tracker.record("bob", "general")
+        await tracker.flush()
+
+        tracker.record("bob", "general", typing=False)
+        tracker.clear_user("alice")
+        assert await tracker.flush() == 2
+        assert all(frame["typers"] == [] for frame in sent_frames(manager)[-2:])
+
+    @pytest.mark.asyncio
+    async def test_typing_never_persisted(self):
+        """Test that typing frames go through the ephemeral path, not broadcast"""
+        tracker, manager = build_tracker()
+        tracker.record("alice")
+        await tracker.flush()
+
+        manager.send_ephemeral.assert_called_once()
+        manager.broadcast.assert_not_called()
@@ -0,0 +1,59 @@
+"""
+Unit tests for the startup warm-up runner
+"""
+import asyncio
+import time
+
+import pytest
+
+from services.warmup import Warmup
+
+
+class TestWarmup:
+
+    @pytest.mark.asyncio
+    async def test_steps_run_concurrently(self):
+        """Test that steps overlap rather than run one after another"""
+        warmup = Warmup()
+        for name in ("a", "b", "c"):
+            warmup.add(name, lambda: asyncio.sleep(0.05))
+
+        started = time.perf_counter()
+        await warmup.run()
+
+        assert time.perf_counter() - started < 0.12
+        assert warmup.done
+        assert set(warmup.get_stats()["steps_ms"]) == {"a", "b", "c"}
+
+    @pytest.mark.asyncio
+    async def test_failing_step_does_not_stop_others(self):
+        """Test that an error is recorded and the remaining steps still finish"""
+        warmup = Warmup()
+        finished = []
+
+        async def broken():
+            raise RuntimeError("no database")
+
+        async def fine():
+            await asyncio.sleep(0.01)
+            finished.append(True)
+
+        warmup.add("broken", broken)
+        warmup.add("fine", fine)
+        await warmup.run()
+
+        assert finished == [True]
+        assert "no database" in warmup.get_stats()["errors"]["broken"]
+
+    @pytest.mark.asyncio
+    async def test_background_start_and_stop(self):
+        """Test that start() returns at once and stop() cancels unfinished steps"""
+        warmup = Warmup()
+        warmup.add("slow", lambda: asyncio.sleep(10))
+
+        warmup.start()
+        await asyncio.sleep(0)
+        assert not warmup.get_stats()["done"]
+
+        await warmup.stop()
+        assert not warmup.done
@@ -1,4 +1,5 @@
 import pytest
+import json
 from unittest.mock import Mock, AsyncMock
 import sys
 import os
@@ -6,6 +7,7 @@ import os
 # Add backend directory to path for imports
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '../../'))
 
+from services import websocket_manager
 from services.websocket_manager import ConnectionManager
 
 
@@ -164,4 +166,130 @@ class TestConnectionManager:
         for i in range(5):
             self.manager.active_connections[f"user{i}"] = Mock()
 
-        assert self.manager.get_connection_count() == 5
\ No newline at end of file
+        assert self.manager.get_connection_count() == 5
+
+    @pytest.mark.asyncio
+    async def test_drain_hands_off_clients_with_staggered_delays(self):
+        """Test that draining tells every client to reconnect later and closes it"""
+        self.manager.session_batcher.flush = AsyncMock()
+        mock_websockets = {}
+        for i in range(4):
+            mock_websocket = AsyncMock()
+            mock_websockets[f"user{i}"] = mock_websocket
+            self.manager.active_connections[f"user{i}"] = mock_websocket
+
+        await self.manager.drain(reconnect_window=8.0)
+
+        assert self.manager.draining is True
+        assert self.manager.get_connection_count() == 0
+        delays = []
+        for mock_websocket in mock_websockets.values():
+            frame = json.loads(mock_websocket.send_text.call_args[0][0])
+            assert frame["type"] == "reconnect"
+            delays.append(frame["delay_ms"])
+            mock_websocket.close.assert_called_once()
+            assert mock_websocket.close.call_args.kwargs["code"] == 1012
+
+        # One client per 2s slot of the window
+        assert sorted(delay // 2000 for delay in delays) == [0, 1, 2, 3]
+        self.manager.session_batcher.flush.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_drain_is_idempotent(self):
+        """Test that a second drain (e.g. from lifespan shutdown) does nothing"""
+        self.manager.session_batcher.flush = AsyncMock()
+
+        await self.manager.drain()
+        await self.manager.drain()
+
+        self.manager.session_batcher.flush.assert_called_once()
+
+    @pytest.mark.asyncio
+    async def test_disconnect_bumps_presence_version(self):
+        """Test that removing a connection invalidates cached online lists, but a stale one doesn't"""
+        mock_websocket = AsyncMock()
+        self.manager.active_connections["user1"] = mock_websocket
+        version = self.manager.presence_version
+
+        assert await self.manager.disconnect("user1", mock_websocket) is True
+        assert self.manager.presence_version == version + 1
+
+        assert await self.manager.disconnect("user1", mock_websocket) is False
+        assert self.manager.presence_version == version + 1
+
+    @pytest.mark.asyncio
+    async def test_send_ephemeral_skips_persistence(self):
+        """Test that ephemeral frames reach every socket without touching the database"""
+        self.manager.message_service.create_message = AsyncMock()
+        sockets = {f"user{i}": AsyncMock() for i in range(3)}
+        self.manager.active_connections.update(sockets)
+
+        sent = await self.manager.send_ephemeral('{"type": "typing"}', exclude_user="user0")
+
+        assert sent == 2
+        sockets["user0"].send_text.assert_not_called()
+        sockets["user1"].send_text.assert_called_once_with('{"type": "typing"}')
+        self.manager.message_service.create_message.assert_not_called()
+
+    @pytest.mark.asyncio
+    async def test_disconnect_clears_typing(self):
+        """Test that a user who leaves stops being shown as typing"""
+        mock_websocket = AsyncMock()
+        self.manager.active_connections["user1"] = mock_websocket
+        self.manager.typing.record("user1")
+
+        await self.manager.disconnect("user1", mock_websocket)
+
+        assert self.manager.typing.typers() == []
+
+    @pytest.mark.asyncio
+    async def test_disconnect_audited(self, monkeypatch):
+        """Test that leaving is recorded on the audit trail with the session's connection id"""
+        audit_log = Mock()
+        monkeypatch.setattr(websocket_manager, "audit_log", audit_log)
+        mock_websocket = AsyncMock()
+        self.manager.active_connections["user1"] = mock_websocket
+        self.manager.connection_ids["user1"] = "ws_abc"
+
+        await self.manager.disconnect("user1", mock_websocket)
+
+        audit_log.append.assert_called_once_with("disconnect", "user1", connection_id="ws_abc")
+
+    @pytest.mark.asyncio
+    async def test_broadcast_returns_stored_seq(self, monkeypatch):
+        """Test that a stored message keeps the frame's message id and its sequence number is returned"""
+        session = AsyncMock()
+        session_factory = Mock(return_value=Mock(
+            __aenter__=AsyncMock(return_value=session), __aexit__=AsyncMock(return_value=False)
+        ))
+        monkeypatch.setattr(websocket_manager, "AsyncSessionLocal", session_factory)
+        monkeypatch.setattr(websocket_manager, "audit_log", Mock())
+        stored = Mock(id=42, user_id="user1", message_id="m-1", text="hi", attachment_sha256=None)
+        self.manager.message_service.create_message = AsyncMock(return_value=stored)
+        self.manager.read_receipts.record_message = AsyncMock()
+
+        seq = await self.manager.broadcast(json.dumps(
+            {"type": "message", "text": "hi", "user_id": "user1", "message_id": "m-1"}
+        ), exclude_user="user1")
+
+        assert seq == 42
+        assert self.manager.message_service.create_message.call_args.kwargs["message_id"] == "m-1"
+        assert await self.manager.broadcast('{"type": "user_joined"}', save_to_db=False) is None
+
+    @pytest.mark.asyncio
+    async def test_fan_out_mixes_transports(self):
+        """Test that SSE and long-poll connections get the same encoded frame as sockets, and a full queue is reaped"""
+        from services.transports import QueuedConnection
+
+        socket = AsyncMock()
+        queued = QueuedConnection("user2", "sse")
+        full = QueuedConnection("user3", "poll", max_queued=0)
+        self.manager.active_connections.update(user1=socket, user2=queued, user3=full)
+        for user_id, connection in self.manager.active_connections.items():
+            self.manager.heartbeat.track(user_id, connection)
+
+        assert await self.manager.send_ephemeral('{"type": "typing"}') == 2
+
+        socket.send_text.assert_called_once_with('{"type": "typing"}')
+        assert await queued.receive(0, timeout=1) == [(1, '{"type": "typing"}')]
+        assert self.manager.heartbeat.tracked["user3"].failed
@@ -4,8 +4,14 @@ class NightingaleChat {
         this.userName = null;
         this.department = null;
 
+        // Unread badge for the chat tab and the last read frame sent
+        this.unreadCount = 0;
+        this.readSentSeq = 0;
+        this.readTimer = null;
+
         // Initialize modular components
         this.websocketService = new WebSocketService();
+        this.attachmentUploader = new AttachmentUploader();
         this.chatUI = null;
         this.navigationUI = new NavigationUI();
         this.profileUI = new ProfileUI();
@@ -28,6 +34,8 @@ class NightingaleChat {
         this.sendBtn = document.getElementById('sendBtn');
         this.connectionStatus = document.getElementById('connectionStatus');
         this.onlineCount = document.getElementById('onlineCount');
+        this.attachBtn = document.getElementById('attachBtn');
+        this.attachmentInput = document.getElementById('attachmentInput');
 
         // Initialize UI components
         this.chatUI = new ChatUI(this.messagesContainer, this.messageInput, this.sendBtn);
@@ -37,6 +45,14 @@ class NightingaleChat {
 
         // Set up UI event handlers
         this.chatUI.setSendHandler((text) => this.sendMessage(text));
+        this.chatUI.setTypingHandler((typing) => this.websocketService.sendMessage({
+            type: 'typing',
+            typing: typing
+        }));
+        this.chatUI.setMentionSearchHandler(async (query) => {
+            const response = await fetch(`/directory/search?q=${encodeURIComponent(query)}&limit=8`);
+            return response.ok ? (await response.json()).users : [];
+        });
         this.navigationUI.setPageChangeHandler((page) => this.onPageChanged(page));
     }
 
@@ -46,6 +62,13 @@ class NightingaleChat {
             this.login();
         });
 
+        this.attachBtn.addEventListener('click', () => this.attachmentInput.click());
+        this.attachmentInput.addEventListener('change', () => {
+            const file = this.attachmentInput.files[0];
+            this.attachmentInput.value = '';
+            if (file) this.sendAttachment(file);
+        });
+
         // WebSocket event handlers
         this.websocketService.on('connected', () => {
             this.chatUI.updateConnectionStatus('Connected');
@@ -69,6 +92,11 @@ class NightingaleChat {
             Utils.showNotification('Failed to reconnect. Please refresh the page.', 'error');
         });
 
+        // Catch up on whatever arrived while the tab was in the background
+        document.addEventListener('visibilitychange', () => {
+            if (this.isReading()) this.markRead();
+        });
+
         // Install prompt handling
         window.addEventListener('beforeinstallprompt', (e) => {
             e.preventDefault();
@@ -157,16 +185,46 @@ class NightingaleChat {
             bio: this.bioInput.value.trim()
         };
 
-        if (this.websocketService.sendMessage(message)) {
-            // Add message to UI with "sending" status
+        // Queued while offline and resent until the server acknowledges it
+        const clientId = this.websocketService.sendReliable(message);
+        this.chatUI.addMessage({
+            ...message,
+            client_id: clientId,
+            user_id: this.userId,
+            timestamp: new Date().toISOString(),
+            sending: true
+        });
+    }
+
+    async sendAttachment(file) {
+        this.attachBtn.disabled = true;
+        try {
+            const stored = await this.attachmentUploader.upload(file, this.userId, (progress) => {
+                this.attachBtn.title = `Uploading ${Math.round(progress * 100)}%`;
+            });
+            const name = file.name.substring(0, 255);
+            const message = {
+                type: 'message',
+                text: Utils.sanitizeInput(name),
+                attachment: { sha256: stored.sha256, name: name },
+                user_name: this.userName,
+                department: this.department,
+                bio: this.bioInput.value.trim()
+            };
+            const clientId = this.websocketService.sendReliable(message);
             this.chatUI.addMessage({
                 ...message,
+                client_id: clientId,
+                attachment: { ...stored, name: name },
                 user_id: this.userId,
                 timestamp: new Date().toISOString(),
                 sending: true
             });
-        } else {
-            Utils.showNotification('Failed to send message. Check connection.', 'error');
+        } catch (error) {
+            Utils.showNotification(error.message, 'error');
+        } finally {
+            this.attachBtn.disabled = false;
+            this.attachBtn.title = 'Attach a photo or PDF';
         }
     }
 
@@ -174,12 +232,38 @@ class NightingaleChat {
         switch (data.type) {
             case 'message':
                 this.chatUI.addMessage(data);
+                if (data.seq) {
+                    if (this.isReading()) {
+                        this.markRead();
+                    } else {
+                        this.setUnread(this.unreadCount + 1);
+                    }
+                }
+                break;
+            case 'unread': {
+                const channel = data.channels.general;
+                if (channel) {
+                    this.chatUI.lastSeq = Math.max(this.chatUI.lastSeq, channel.head);
+                    this.setUnread(channel.unread);
+                    if (this.isReading()) this.markRead();
+                }
+                break;
+            }
+            case 'read':
+                this.chatUI.showReadReceipts(data.readers);
+                break;
+            case 'typing':
+                this.chatUI.showTyping(data.typers.filter(typer => typer.user_id !== this.userId));
                 break;
             case 'user_joined':
             case 'user_left':
                 this.chatUI.addSystemMessage(data);
                 break;
+            case 'ack':
+                this.chatUI.markSent(data.client_id, data.seq);
+                break;
             case 'error':
+                if (data.client_id) this.chatUI.markFailed(data.client_id);
                 Utils.showNotification(data.message, 'error');
                 break;
             default:
@@ -187,8 +271,33 @@ class NightingaleChat {
         }
     }
 
+    isReading() {
+        return !document.hidden && this.navigationUI.getCurrentPage() === 'chat';
+    }
+
+    setUnread(count) {
+        this.unreadCount = count;
+        this.navigationUI.setBadge('chat', count);
+    }
+
+    markRead() {
+        this.setUnread(0);
+        if (this.readTimer || this.chatUI.lastSeq <= this.readSentSeq) return;
+        // One read frame for a burst of messages; the server batches the rest
+        this.readTimer = setTimeout(() => {
+            this.readTimer = null;
+            const seq = this.chatUI.lastSeq;
+            if (this.websocketService.sendMessage({ type: 'read', channel: 'general', seq: seq })) {
+                this.readSentSeq = seq;
+            }
+        }, 500);
+    }
+
     onPageChanged(page) {
         // Handle page-specific logic
+        if (page === 'chat') {
+            this.markRead();
+        }
         if (page === 'admin') {
             this.loadAdminData();
         }
@@ -0,0 +1,53 @@
+class AttachmentUploader {
+    constructor() {
+        // Consecutive failed chunks before giving up
+        this.maxRetries = 5;
+    }
+
+    // Resumable upload: after a failed chunk, ask the server how much it kept and continue from there
+    async upload(file, userId, onProgress) {
+        const headers = { 'X-User-Id': userId };
+        const created = await this.request('/attachments/uploads', {
+            method: 'POST',
+            headers: { ...headers, 'Content-Type': 'application/json' },
+            body: JSON.stringify({ size: file.size })
+        });
+        const location = `/attachments/uploads/${created.upload_id}`;
+        let offset = created.offset;
+        let failures = 0;
+
+        while (true) {
+            try {
+                const end = Math.min(offset + created.chunk_size, file.size);
+                const result = await this.request(location, {
+                    method: 'PATCH',
+                    headers: { ...headers, 'Upload-Offset': String(offset) },
+                    body: file.slice(offset, end)
+                });
+                offset = result.offset;
+                failures = 0;
+                if (onProgress) onProgress(offset / file.size);
+                if (result.complete) return result.attachment;
+            } catch (error) {
+                // Refusals (too large, wrong type) won't succeed on retry
+                if (error.status && error.status !== 409 && error.status < 500) throw error;
+                if (++failures > this.maxRetries) throw error;
+                await new Promise(resolve => setTimeout(resolve, 1000 * 2 ** (failures - 1)));
+                offset = (await this.request(location, { headers })).offset;
+            }
+        }
+    }
+
+    async request(url, options) {
+        const response = await fetch(url, options);
+        const body = await response.json().catch(() => ({}));
+        if (!response.ok) {
+            const error = new Error(body.detail || `Upload failed (${response.status})`);
+            error.status = response.status;
+            throw error;
+        }
+        return body;
+    }
+}
+
+window.AttachmentUploader = AttachmentUploader;
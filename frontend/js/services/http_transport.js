@@ -0,0 +1,152 @@
+// Live connection over Server-Sent Events or long polling, for networks whose proxies break
+// WebSockets. It offers the parts of the WebSocket interface WebSocketService uses (send,
+// close, onopen, onclose), except that frames arrive already parsed through onframe.
+// Frames are sent with POST /send; the server numbers what it sends, and every stream
+// resume or poll says which frame it got last, so nothing is lost when a request drops.
+class HttpTransport {
+    constructor(userId, mode, resumeToken) {
+        this.userId = userId;
+        // 'sse' or 'poll'
+        this.mode = mode;
+        this.resumeToken = resumeToken;
+        // Names this connection in every request, from the session frame
+        this.connection = null;
+        this.lastId = 0;
+        this.failures = 0;
+        this.closed = false;
+        this.source = null;
+        this.abort = new AbortController();
+        this.onopen = null;
+        this.onframe = null;
+        this.onclose = null;
+
+        if (mode === 'sse') {
+            this.openStream();
+        } else {
+            this.poll();
+        }
+    }
+
+    url(path) {
+        const params = new URLSearchParams();
+        if (this.connection) {
+            params.set('connection', this.connection);
+            params.set('after', this.lastId);
+        } else if (this.resumeToken) {
+            params.set('resume', this.resumeToken);
+        }
+        return `${path}/${encodeURIComponent(this.userId)}?${params}`;
+    }
+
+    receive(data) {
+        this.failures = 0;
+        if (data.type === 'session' && data.connection && !this.connection) {
+            this.connection = data.connection;
+            if (this.onopen) this.onopen();
+        }
+        if (this.onframe) this.onframe(data);
+    }
+
+    openStream() {
+        const source = new EventSource(this.url('/events'));
+        this.source = source;
+
+        source.onmessage = (event) => {
+            this.lastId = parseInt(event.lastEventId, 10) || this.lastId;
+            try {
+                this.receive(JSON.parse(event.data));
+            } catch (error) {
+                console.error('Failed to parse event:', error);
+            }
+        };
+
+        source.addEventListener('close', (event) => {
+            const { code, reason } = JSON.parse(event.data);
+            this.finish(code, reason);
+        });
+
+        source.onerror = () => {
+            // EventSource would reconnect on its own, but without the connection and cursor
+            source.close();
+            if (this.closed) return;
+            if (!this.connection || ++this.failures > 3) {
+                this.finish(1006, '');
+                return;
+            }
+            setTimeout(() => {
+                if (!this.closed) this.openStream();
+            }, 1000 * this.failures);
+        };
+    }
+
+    async poll() {
+        while (!this.closed) {
+            let body;
+            try {
+                const response = await fetch(this.url('/poll'), { cache: 'no-store', signal: this.abort.signal });
+                if (response.status === 503) {
+                    // Busy or restarting, as a WebSocket would be told with close code 1013
+                    const { detail } = await response.json();
+                    this.finish(1013, `retry_after_ms=${(detail && detail.retry_after_ms) || 0}`);
+                    return;
+                }
+                if (!response.ok) {
+                    this.finish(response.status === 429 ? 4029 : 1006, response.statusText);
+                    return;
+                }
+                body = await response.json();
+            } catch (error) {
+                if (this.closed) return;
+                if (!this.connection || ++this.failures > 3) {
+                    this.finish(1006, '');
+                    return;
+                }
+                // Asking again with the same cursor gets anything the failed poll carried
+                await new Promise(resolve => setTimeout(resolve, 1000 * this.failures));
+                continue;
+            }
+
+            body.frames.forEach(frame => this.receive(frame));
+            this.lastId = body.last_id;
+            if (body.closed) {
+                this.finish(body.closed.code, body.closed.reason);
+                return;
+            }
+        }
+    }
+
+    send(text) {
+        fetch(`/send/${encodeURIComponent(this.userId)}?connection=${encodeURIComponent(this.connection)}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: text
+        })
+            .then(response => (response.ok ? response.json() : []))
+            // Acks and errors for this send
+            .then(replies => replies.forEach(reply => this.receive(reply)))
+            // Unacknowledged messages are resent after the reconnect a failure leads to
+            .catch(error => console.error('Send failed:', error));
+    }
+
+    close(code = 1000, reason = '') {
+        if (this.closed) return;
+        if (this.connection) {
+            // Ends the session now rather than when the heartbeat notices
+            fetch(`/connections/${encodeURIComponent(this.userId)}?connection=${encodeURIComponent(this.connection)}`, {
+                method: 'DELETE',
+                keepalive: true
+            }).catch(() => {});
+        }
+        this.finish(code, reason);
+    }
+
+    finish(code, reason) {
+        if (this.closed) return;
+        this.closed = true;
+        if (this.source) this.source.close();
+        this.abort.abort();
+        if (this.onclose) this.onclose({ code, reason });
+    }
+}
+
+window.HttpTransport = HttpTransport;
@@ -5,51 +5,117 @@ class WebSocketService {
         this.reconnectAttempts = 0;
         this.maxReconnectAttempts = 5;
         this.reconnectDelay = 1000;
+        this.maxReconnectDelay = 30000;
+        this.lastReconnectDelay = this.reconnectDelay;
+        this.retryAfterMs = 0;
+        this.resumeToken = null;
+        // 'websocket', or 'sse' / 'poll' after WebSockets repeatedly fail to connect
+        this.transport = 'websocket';
+        this.failedOpens = 0;
         this.eventHandlers = {};
+        // Sent messages awaiting an ack, by client message ID, oldest first
+        this.unacked = new Map();
     }
 
     connect(userId) {
         return new Promise((resolve, reject) => {
-            const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
-            const wsUrl = `${protocol}//${window.location.host}/ws/${userId}`;
+            let opened = false;
+
+            if (this.transport === 'websocket') {
+                const protocol = window.location.protocol === 'https:' ? 'wss:' : 'ws:';
+                let wsUrl = `${protocol}//${window.location.host}/ws/${userId}`;
+                if (this.resumeToken) {
+                    // Lets the server admit this reconnect ahead of new sessions
+                    wsUrl += `?resume=${encodeURIComponent(this.resumeToken)}`;
+                }
 
-            this.socket = new WebSocket(wsUrl);
+                this.socket = new WebSocket(wsUrl);
+
+                this.socket.onmessage = (event) => {
+                    try {
+                        this.handleFrame(JSON.parse(event.data));
+                    } catch (error) {
+                        console.error('Failed to parse WebSocket message:', error);
+                    }
+                };
+
+                this.socket.onerror = (error) => {
+                    console.error('WebSocket error:', error);
+                    this.trigger('error', error);
+                    reject(error);
+                };
+            } else {
+                this.socket = new HttpTransport(userId, this.transport, this.resumeToken);
+                this.socket.onframe = (data) => this.handleFrame(data);
+            }
 
             this.socket.onopen = () => {
-                console.log('WebSocket connected');
+                console.log(`Connected over ${this.transport}`);
+                opened = true;
+                this.failedOpens = 0;
                 this.isConnected = true;
                 this.reconnectAttempts = 0;
+                this.lastReconnectDelay = this.reconnectDelay;
+                // Whatever may have been lost with the old connection; the server drops ones it already stored
+                this.unacked.forEach(message => this.sendMessage(message));
                 this.trigger('connected');
                 resolve();
             };
 
-            this.socket.onmessage = (event) => {
-                try {
-                    const data = JSON.parse(event.data);
-                    this.trigger('message', data);
-                } catch (error) {
-                    console.error('Failed to parse WebSocket message:', error);
-                }
-            };
-
             this.socket.onclose = (event) => {
-                console.log('WebSocket disconnected:', event.code, event.reason);
+                console.log('Disconnected:', event.code, event.reason);
                 this.isConnected = false;
                 this.trigger('disconnected', { code: event.code, reason: event.reason });
 
+                if (!opened && this.transport !== 'poll' && ++this.failedOpens >= 2) {
+                    // Never got through twice running, as when a proxy breaks WebSockets: step down a transport
+                    this.transport = this.transport === 'websocket' && window.EventSource ? 'sse' : 'poll';
+                    this.failedOpens = 0;
+                    this.reconnectAttempts = 0;
+                    console.log(`Falling back to ${this.transport}`);
+                }
+
+                if (event.code === 1013) {
+                    // Server is busy: honor its jittered retry-after without using up an attempt
+                    const match = /retry_after_ms=(\d+)/.exec(event.reason || '');
+                    this.retryAfterMs = match ? parseInt(match[1], 10) : 0;
+                    this.reconnectAttempts = Math.max(0, this.reconnectAttempts - 1);
+                } else if (event.code === 1012) {
+                    // Server restart: the delay came in the preceding 'reconnect' frame
+                    this.reconnectAttempts = Math.max(0, this.reconnectAttempts - 1);
+                }
+
                 if (event.code !== 1000 && this.reconnectAttempts < this.maxReconnectAttempts) {
                     this.attemptReconnect(userId);
+                } else if (!opened) {
+                    reject(new Error(`Connection closed: ${event.code}`));
                 }
             };
-
-            this.socket.onerror = (error) => {
-                console.error('WebSocket error:', error);
-                this.trigger('error', error);
-                reject(error);
-            };
         });
     }
 
+    handleFrame(data) {
+        if (data.type === 'ping') {
+            // Answer server heartbeats so the connection isn't reaped
+            this.sendMessage({ type: 'pong', ts: data.ts });
+            return;
+        }
+        if (data.type === 'session') {
+            this.resumeToken = data.resume_token;
+            return;
+        }
+        if (data.client_id && (data.type === 'ack' || data.type === 'error')) {
+            // Stored, or refused for good: either way not to be sent again
+            this.unacked.delete(data.client_id);
+        }
+        if (data.type === 'reconnect') {
+            // Server is draining: wait our assigned slot so clients don't all return at once
+            this.retryAfterMs = data.delay_ms || 0;
+            return;
+        }
+        this.trigger('message', data);
+    }
+
     disconnect() {
         if (this.socket) {
             this.socket.close(1000, 'Client disconnect');
@@ -66,9 +132,29 @@ class WebSocketService {
         return false;
     }
 
+    // Tags a message with a client message ID and keeps it until acknowledged, resending
+    // after reconnects; any number can be outstanding. Returns the ID.
+    sendReliable(message) {
+        const clientId = window.crypto && crypto.randomUUID
+            ? crypto.randomUUID()
+            : `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`;
+        const tagged = { ...message, client_id: clientId };
+        this.unacked.set(clientId, tagged);
+        this.sendMessage(tagged);
+        return clientId;
+    }
+
+    nextReconnectDelay() {
+        // Decorrelated jitter: random between the base delay and 3x the previous delay, capped
+        const upper = Math.min(this.maxReconnectDelay, this.lastReconnectDelay * 3);
+        this.lastReconnectDelay = this.reconnectDelay + Math.random() * Math.max(0, upper - this.reconnectDelay);
+        return Math.round(this.lastReconnectDelay);
+    }
+
     attemptReconnect(userId) {
         this.reconnectAttempts++;
-        const delay = this.reconnectDelay * Math.pow(2, this.reconnectAttempts - 1);
+        const delay = Math.max(this.nextReconnectDelay(), this.retryAfterMs);
+        this.retryAfterMs = 0;
 
         console.log(`Attempting to reconnect (${this.reconnectAttempts}/${this.maxReconnectAttempts}) in ${delay}ms`);
 
@@ -5,10 +5,24 @@ class ChatUI {
         this.sendButton = sendButton;
         this.messages = [];
         this.onSendMessage = null;
+        this.onTyping = null;
+        // The server drops refreshes sent more often than this
+        this.typingRefreshMs = 2000;
+        this.lastTypingSent = 0;
+        // Highest message sequence number seen, and each other user's read cursor
+        this.lastSeq = 0;
+        this.readers = {};
+        // @mention suggestions: the search handler, pending lookup and highlighted entry
+        this.onMentionSearch = null;
+        this.mentionTimer = null;
+        this.mentionQuery = null;
+        this.mentionUsers = [];
+        this.mentionIndex = 0;
     }
 
     init() {
         this.messageInput.addEventListener('keydown', (e) => {
+            if (this.handleMentionKey(e)) return;
             if (e.key === 'Enter' && !e.shiftKey) {
                 e.preventDefault();
                 this.sendMessage();
@@ -20,8 +34,111 @@ class ChatUI {
         });
 
         this.messageInput.addEventListener('input', () => {
-            this.sendButton.disabled = !this.messageInput.value.trim();
+            const hasText = !!this.messageInput.value.trim();
+            this.sendButton.disabled = !hasText;
+            this.notifyTyping(hasText);
+            this.updateMentions();
         });
+
+        this.messageInput.addEventListener('blur', () => setTimeout(() => this.hideMentions(), 150));
+    }
+
+    // The "@partial name" right before the caret, if any
+    currentMention() {
+        const beforeCaret = this.messageInput.value.slice(0, this.messageInput.selectionStart);
+        const match = beforeCaret.match(/(?:^|\s)@([^\s@]{0,30})$/);
+        return match ? { query: match[1], start: beforeCaret.length - match[1].length - 1 } : null;
+    }
+
+    updateMentions() {
+        const mention = this.currentMention();
+        clearTimeout(this.mentionTimer);
+        if (!mention || !this.onMentionSearch) {
+            this.hideMentions();
+            return;
+        }
+        // Searches are cheap on the server; the delay only skips keystrokes typed in a burst
+        this.mentionTimer = setTimeout(async () => {
+            this.mentionQuery = mention.query;
+            const users = await this.onMentionSearch(mention.query).catch(() => []);
+            const current = this.currentMention();
+            if (current && current.query === mention.query) this.showMentions(users);
+        }, 80);
+    }
+
+    showMentions(users) {
+        const list = document.getElementById('mentionList');
+        if (!list) return;
+        this.mentionUsers = users.filter(user => user.user_id !== this.currentUserId);
+        this.mentionIndex = 0;
+        if (this.mentionUsers.length === 0) {
+            this.hideMentions();
+            return;
+        }
+        list.innerHTML = this.mentionUsers.map((user, index) => `
+            <li role="option" data-index="${index}" class="${index === 0 ? 'active' : ''}">
+                <span class="mention-name">${user.online ? '🟢 ' : ''}${this.escapeHtml(user.user_name)}</span>
+                <span class="mention-department">${this.escapeHtml(user.department)}</span>
+            </li>
+        `).join('');
+        list.querySelectorAll('li').forEach(item => {
+            item.addEventListener('mousedown', (e) => {
+                e.preventDefault();
+                this.insertMention(this.mentionUsers[Number(item.dataset.index)]);
+            });
+        });
+        list.hidden = false;
+    }
+
+    hideMentions() {
+        const list = document.getElementById('mentionList');
+        if (list) list.hidden = true;
+        this.mentionUsers = [];
+    }
+
+    // Arrow keys move through the suggestions, Enter or Tab picks one, Escape closes them
+    handleMentionKey(e) {
+        if (this.mentionUsers.length === 0) return false;
+        if (e.key === 'ArrowDown' || e.key === 'ArrowUp') {
+            const count = this.mentionUsers.length;
+            this.mentionIndex = (this.mentionIndex + (e.key === 'ArrowDown' ? 1 : count - 1)) % count;
+            document.querySelectorAll('#mentionList li').forEach((item, index) => {
+                item.classList.toggle('active', index === this.mentionIndex);
+            });
+        } else if (e.key === 'Enter' || e.key === 'Tab') {
+            this.insertMention(this.mentionUsers[this.mentionIndex]);
+        } else if (e.key === 'Escape') {
+            this.hideMentions();
+        } else {
+            return false;
+        }
+        e.preventDefault();
+        return true;
+    }
+
+    insertMention(user) {
+        const mention = this.currentMention();
+        if (!user || !mention) return;
+        const value = this.messageInput.value;
+        const caret = this.messageInput.selectionStart;
+        const inserted = `@${user.user_name} `;
+        this.messageInput.value = value.slice(0, mention.start) + inserted + value.slice(caret);
+        const position = mention.start + inserted.length;
+        this.messageInput.setSelectionRange(position, position);
+        this.sendButton.disabled = false;
+        this.hideMentions();
+    }
+
+    notifyTyping(hasText) {
+        if (!this.onTyping) return;
+        const now = Date.now();
+        if (hasText && now - this.lastTypingSent >= this.typingRefreshMs) {
+            this.lastTypingSent = now;
+            this.onTyping(true);
+        } else if (!hasText && this.lastTypingSent) {
+            this.lastTypingSent = 0;
+            this.onTyping(false);
+        }
     }
 
     sendMessage() {
@@ -30,10 +147,16 @@ class ChatUI {
             this.onSendMessage(text);
             this.messageInput.value = '';
             this.sendButton.disabled = true;
+            // The server clears our indicator when the message arrives
+            this.lastTypingSent = 0;
         }
     }
 
     addMessage(message) {
+        if (message.seq) {
+            this.lastSeq = Math.max(this.lastSeq, message.seq);
+            this.renderReadReceipts();
+        }
         this.messages.push(message);
         this.renderMessage(message);
         this.scrollToBottom();
@@ -45,17 +168,57 @@ class ChatUI {
         const time = new Date(message.timestamp).toLocaleTimeString([], { hour: '2-digit', minute: '2-digit' });
 
         messageDiv.className = `message ${isOwn ? 'own' : ''}`;
+        if (message.client_id) messageDiv.dataset.clientId = message.client_id;
         messageDiv.innerHTML = `
             <div class="message-bubble">
                 ${!isOwn ? `<div class="message-sender clickable-user" data-bio="${this.escapeHtml(message.bio || '')}" data-name="${message.user_name}" data-department="${message.department}">${message.user_name} • ${message.department}</div>` : ''}
-                <div class="message-text">${this.escapeHtml(message.text)}</div>
-                <div class="message-time">${time}</div>
+                ${this.renderAttachment(message.attachment)}
+                ${message.attachment && message.text === message.attachment.name ? '' : `<div class="message-text">${this.escapeHtml(message.text)}</div>`}
+                <div class="message-time">${time}${message.sending ? ' <span class="message-status" title="Sending">🕓</span>' : ''}</div>
             </div>
         `;
 
         this.messageContainer.appendChild(messageDiv);
     }
 
+    // The server stored one of our messages: show it as sent and count it as read
+    markSent(clientId, seq) {
+        const message = this.messages.find(m => m.client_id === clientId);
+        if (!message || !message.sending) return;
+        message.sending = false;
+        if (seq) {
+            message.seq = seq;
+            this.lastSeq = Math.max(this.lastSeq, seq);
+            this.renderReadReceipts();
+        }
+        this.setMessageStatus(clientId, '✓', 'Sent');
+    }
+
+    markFailed(clientId) {
+        const message = this.messages.find(m => m.client_id === clientId);
+        if (message) message.sending = false;
+        this.setMessageStatus(clientId, '⚠️', 'Not sent');
+    }
+
+    setMessageStatus(clientId, symbol, title) {
+        const element = this.messageContainer.querySelector(`[data-client-id="${CSS.escape(clientId)}"] .message-status`);
+        if (element) {
+            element.textContent = symbol;
+            element.title = title;
+        }
+    }
+
+    renderAttachment(attachment) {
+        if (!attachment || !/^[0-9a-f]{64}$/.test(attachment.sha256)) return '';
+        const url = `/attachments/${attachment.sha256}`;
+        const name = this.escapeHtml(attachment.name || 'attachment');
+        // Browsers can't display HEIC, so it is offered as a download like PDFs
+        if ((attachment.content_type || '').startsWith('image/') && attachment.content_type !== 'image/heic') {
+            return `<div class="message-attachment"><a href="${url}" target="_blank" rel="noopener"><img src="${url}" alt="${name}" loading="lazy"></a></div>`;
+        }
+        return `<div class="message-attachment"><a href="${url}" target="_blank" rel="noopener" download="${name}">📄 ${name}</a></div>`;
+    }
+
     addSystemMessage(message) {
         const messageDiv = document.createElement('div');
         messageDiv.className = 'system-message';
@@ -86,6 +249,52 @@ class ChatUI {
         this.onSendMessage = handler;
     }
 
+    setTypingHandler(handler) {
+        this.onTyping = handler;
+    }
+
+    setMentionSearchHandler(handler) {
+        this.onMentionSearch = handler;
+    }
+
+    showTyping(typers) {
+        const indicator = document.getElementById('typingIndicator');
+        if (!indicator) return;
+        const names = typers.map(typer => typer.user_name || typer.user_id);
+        if (names.length === 0) {
+            indicator.textContent = '';
+        } else if (names.length === 1) {
+            indicator.textContent = `${names[0]} is typing…`;
+        } else if (names.length <= 3) {
+            indicator.textContent = `${names.slice(0, -1).join(', ')} and ${names[names.length - 1]} are typing…`;
+        } else {
+            indicator.textContent = `${names.length} people are typing…`;
+        }
+    }
+
+    showReadReceipts(readers) {
+        readers.forEach(reader => {
+            if (reader.user_id !== this.currentUserId) {
+                this.readers[reader.user_id] = Math.max(this.readers[reader.user_id] || 0, reader.seq);
+            }
+        });
+        this.renderReadReceipts();
+    }
+
+    renderReadReceipts() {
+        const element = document.getElementById('readReceipts');
+        if (!element) return;
+        // Caught up with everything this client has seen
+        const caughtUp = Object.keys(this.readers).filter(userId => this.lastSeq && this.readers[userId] >= this.lastSeq);
+        if (caughtUp.length === 0) {
+            element.textContent = '';
+        } else if (caughtUp.length <= 3) {
+            element.textContent = `Seen by ${caughtUp.join(', ')}`;
+        } else {
+            element.textContent = `Seen by ${caughtUp.length} people`;
+        }
+    }
+
     updateConnectionStatus(status) {
         // Implementation for connection status updates
         const statusElement = document.getElementById('connectionStatus');
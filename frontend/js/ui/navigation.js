@@ -66,6 +66,19 @@ class NavigationUI {
         return this.currentPage;
     }
 
+    setBadge(pageName, count) {
+        const item = this.navItems[pageName];
+        if (!item) return;
+        let badge = item.querySelector('.nav-badge');
+        if (!badge) {
+            badge = document.createElement('span');
+            badge.className = 'nav-badge';
+            item.querySelector('.nav-icon').appendChild(badge);
+        }
+        badge.textContent = count > 99 ? '99+' : String(count);
+        badge.hidden = count === 0;
+    }
+
     showAdminNav(show = true) {
         const adminNavItem = document.getElementById('adminNavItem');
         if (adminNavItem) {
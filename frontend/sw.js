@@ -1,12 +1,8 @@
-const CACHE_NAME = 'medchat-v1';
-const urlsToCache = [
-  '/',
-  '/index.html',
-  '/app.js',
-  '/manifest.json',
-  '/icons/icon-192x192.png',
-  '/icons/icon-512x512.png'
-];
+// Generated by the server from the current build: cache version and fingerprinted assets
+importScripts('precache-manifest.js');
+const PRECACHE = self.__PRECACHE_MANIFEST;
+const CACHE_NAME = `medchat-${PRECACHE.version}`;
+const urlsToCache = PRECACHE.urls;
 
 // Install event - cache resources
 self.addEventListener('install', (event) => {
@@ -26,6 +22,22 @@ self.addEventListener('fetch', (event) => {
     return;
   }
 
+  // Uploads and other writes always go to the network
+  if (event.request.method !== 'GET') {
+    return;
+  }
+
+  // Directory lookups change as staff connect and rename; caching them would serve stale suggestions
+  const path = new URL(event.request.url).pathname;
+  if (path.startsWith('/directory/')) {
+    return;
+  }
+
+  // SSE streams and long polls are live transports, never cacheable
+  if (path.startsWith('/events/') || path.startsWith('/poll/')) {
+    return;
+  }
+
   event.respondWith(
     caches.match(event.request)
       .then((response) => {